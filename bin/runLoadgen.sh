@@ -0,0 +1,5 @@
+#!/bin/bash
+
+export PYTHONPATH="${PYTHONPATH}":"$(dirname "$0")"/../src/main/python
+
+python -m maverick.tools.loadgen "${@}"
@@ -6,4 +6,6 @@
 """maverick: A system for playing chess and testing out AI concepts"""
 
 # Submodules to be imported on "from maverick import *"
-__all__ = ["data", "server", "client", "players"]
+__all__ = ["data", "server", "client", "players", "wire", "matchmaking",
+           "registry", "archive", "journal", "sharding",
+           "metrics", "broadcast", "tools", "uci"]
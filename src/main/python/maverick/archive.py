@@ -0,0 +1,328 @@
+#!/usr/bin/python
+
+"""archive.py: Compact on-disk storage of finished Maverick matches"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import collections
+import logging
+import os
+import struct
+
+from maverick.data import pgn
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessMatch
+from maverick.data.structs import ChessPosn
+from maverick.wire import BOARD_ENCODING_SIZE
+from maverick.wire import FRAME_HEADER
+from maverick.wire import decodeBoard
+from maverick.wire import decodeMove
+from maverick.wire import encodeBoard
+from maverick.wire import encodeMove
+
+__all__ = ["GameArchive",
+           "MaverickArchiveException",
+           "encodeMatch",
+           "decodeMatch"]
+
+# Overview of the archive file format
+#
+# The archive is an append-only sequence of records, each made up of a 4-byte
+# big-endian unsigned length followed by that many bytes of payload (the same
+# framing as maverick.wire).
+#
+# A record payload is a fixed header (see _RECORD_HEADER), then, if the match
+# had a board, its final 32-byte layout and 3 bytes of flags (as encoded by
+# maverick.wire), then a 4-byte ply count and 2 bytes per ply, then a 2-byte
+# length and the FEN of the board the match started with (length 0 if none).
+# Records written before starting boards were archived end after the plies.
+#
+# Player IDs of empty seats are stored as 0 (IDs are allocated from 1).
+
+
+class MaverickArchiveException(Exception):
+    """Raised when the archive file is corrupt"""
+    pass
+
+
+# Struct for gameID, white and black playerIDs, status code, whether the
+# match has a board, the board's draw counter, the match's state version,
+# and its start and finish times (NaN if not set)
+_RECORD_HEADER = struct.Struct("!IIIBBBIdd")
+
+_PLY_COUNT = struct.Struct("!I")
+
+_MOVE = struct.Struct("!H")
+
+_FEN_LENGTH = struct.Struct("!H")
+
+_STATUS_CODES = {ChessMatch.STATUS_PENDING: 0,
+                 ChessMatch.STATUS_ONGOING: 1,
+                 ChessMatch.STATUS_BLACK_WON: 2,
+                 ChessMatch.STATUS_WHITE_WON: 3,
+                 ChessMatch.STATUS_DRAWN: 4,
+                 ChessMatch.STATUS_CANCELLED: 5}
+_STATUS_NAMES = dict((v, k) for (k, v) in _STATUS_CODES.iteritems())
+
+def _encodeTime(t):
+    """Encode an optional timestamp as a float (NaN for None)"""
+    return float("nan") if t is None else t
+
+
+def _decodeTime(t):
+    """Decode a timestamp encoded by _encodeTime"""
+    return None if t != t else t
+
+
+def encodeMatch(gameID, match):
+    """Return the archive record payload for the given match"""
+    white = match.players[ChessBoard.WHITE]
+    black = match.players[ChessBoard.BLACK]
+    board = match.board
+
+    header = _RECORD_HEADER.pack(gameID,
+                                 white or 0,
+                                 black or 0,
+                                 _STATUS_CODES[match.status],
+                                 board is not None,
+                                 board.drawCounter if board else 0,
+                                 match.stateVersion,
+                                 _encodeTime(match.startedAt),
+                                 _encodeTime(match.finishedAt))
+
+    parts = [header]
+    if board is not None:
+        parts.append(encodeBoard(board))
+
+    parts.append(_PLY_COUNT.pack(len(match.history)))
+    for (fromPosn, toPosn) in match.history:
+        parts.append(_MOVE.pack(encodeMove(fromPosn.rankN, fromPosn.fileN,
+                                           toPosn.rankN, toPosn.fileN)))
+
+    startFEN = match.startFEN or ""
+    parts.append(_FEN_LENGTH.pack(len(startFEN)))
+    parts.append(startFEN)
+    return "".join(parts)
+
+
+def decodeMatch(payload):
+    """Rebuild a match from an archive record payload
+
+    The rebuilt match never offers deltas (its boardVersion is None), since
+    the state versions of its plies are not archived.
+
+    @return: a tuple of form (gameID, ChessMatch)"""
+
+    try:
+        (gameID, white, black, statusCode, hasBoardP, drawCounter,
+         stateVersion, startedAt, finishedAt) = \
+            _RECORD_HEADER.unpack_from(payload, 0)
+        offset = _RECORD_HEADER.size
+
+        match = ChessMatch()
+        match.players = {ChessBoard.WHITE: white or None,
+                         ChessBoard.BLACK: black or None}
+        match.status = _STATUS_NAMES[statusCode]
+        match.stateVersion = stateVersion
+        match.startedAt = _decodeTime(startedAt)
+        match.finishedAt = _decodeTime(finishedAt)
+
+        if hasBoardP:
+            match.board = decodeBoard(payload, offset, drawCounter)
+            offset += BOARD_ENCODING_SIZE
+
+        (numPlies,) = _PLY_COUNT.unpack_from(payload, offset)
+        offset += _PLY_COUNT.size
+        for _ in xrange(numPlies):
+            (move,) = _MOVE.unpack_from(payload, offset)
+            offset += _MOVE.size
+            (fromRank, fromFile, toRank, toFile) = decodeMove(move)
+            match.history.append((ChessPosn(fromRank, fromFile),
+                                  ChessPosn(toRank, toFile)))
+
+        if offset < len(payload):
+            (fenLength,) = _FEN_LENGTH.unpack_from(payload, offset)
+            offset += _FEN_LENGTH.size
+            if offset + fenLength > len(payload):
+                raise IndexError("FEN runs past the end of the record")
+            match.startFEN = payload[offset:offset + fenLength] or None
+    except (struct.error, KeyError, IndexError), e:
+        raise MaverickArchiveException("Corrupt archive record: " + str(e))
+
+    return (gameID, match)
+
+
+class GameArchive(object):
+    """Append-only log of finished matches, with a cached random-access reader
+
+    Only the file offset of each archived match is kept in memory. Matches
+    are rebuilt from disk on demand and the most recently read ones are kept
+    in an LRU cache."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.archive.GameArchive")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    DEFAULT_CACHE_SIZE = 256
+    """Default number of rebuilt matches to keep in memory"""
+
+    def __init__(self, path, cacheSize=DEFAULT_CACHE_SIZE):
+        """Open (creating if needed) the archive at the given path
+
+        @param path: the path of the archive file
+        @param cacheSize: the number of rebuilt matches to keep in memory"""
+
+        self.path = path
+        self.cacheSize = cacheSize
+
+        # Dict from gameID to the offset of its record in the archive file
+        # (None until the archive file has been scanned)
+        self._offsets = None
+
+        # Rebuilt matches, least recently used first
+        self._cache = collections.OrderedDict()
+
+        self._appendFD = None
+        self._readFD = None
+
+    def __getIndex(self):
+        """Return the dict of record offsets, scanning the file on first use"""
+        if self._offsets is None:
+            self._offsets = {}
+            if os.path.exists(self.path):
+                self.__loadIndex()
+        return self._offsets
+
+    def __loadIndex(self):
+        """Scan the archive file, recording the offset of each record
+
+        A truncated final record (left by a crash mid-write) is discarded."""
+        with open(self.path, "rb") as fd:
+            data = fd.read()
+
+        offset = 0
+        while offset + FRAME_HEADER.size <= len(data):
+            (length,) = FRAME_HEADER.unpack_from(data, offset)
+            end = offset + FRAME_HEADER.size + length
+            if end > len(data) or length < _RECORD_HEADER.size:
+                break
+            (gameID,) = struct.unpack_from("!I", data,
+                                           offset + FRAME_HEADER.size)
+            self._offsets[gameID] = offset
+            offset = end
+
+        if offset != len(data):
+            GameArchive._logger.warning("Discarding %d trailing bytes of %s",
+                                        len(data) - offset, self.path)
+            with open(self.path, "r+b") as fd:
+                fd.truncate(offset)
+
+        GameArchive._logger.debug("Indexed %d archived games in %s",
+                                  len(self._offsets), self.path)
+
+    def __getstate__(self):
+        """Pickle only the path and settings (files and cache are reopened)"""
+        return {"path": self.path, "cacheSize": self.cacheSize}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], cacheSize=state["cacheSize"])
+
+    def __contains__(self, gameID):
+        return gameID in self.__getIndex()
+
+    def __len__(self):
+        return len(self.__getIndex())
+
+    def getGameIDs(self):
+        """Return a list of the IDs of all archived games"""
+        return self.__getIndex().keys()
+
+    def append(self, gameID, match):
+        """Write the given finished match to the end of the archive
+
+        Call flush to make sure the record has reached the file."""
+        offsets = self.__getIndex()  # Scan (and repair) before appending
+        if self._appendFD is None:
+            self._appendFD = open(self.path, "ab")
+
+        payload = encodeMatch(gameID, match)
+        self._appendFD.seek(0, os.SEEK_END)
+        offsets[gameID] = self._appendFD.tell()
+        self._appendFD.write(FRAME_HEADER.pack(len(payload)) + payload)
+        self._cache.pop(gameID, None)
+
+    def flush(self):
+        """Flush appended records to the archive file"""
+        if self._appendFD is not None:
+            self._appendFD.flush()
+
+    def sync(self):
+        """Write appended records to disk
+
+        Games must be synced to the archive before the journal records that
+        they were archived, or a crash could lose them from both"""
+        if self._appendFD is not None:
+            self.flush()
+            os.fsync(self._appendFD.fileno())
+
+    def get(self, gameID):
+        """Return the archived match with the given ID, or None
+
+        The returned match is shared with the cache and must not be changed"""
+
+        if gameID in self._cache:
+            match = self._cache.pop(gameID)
+            self._cache[gameID] = match  # Mark as most recently used
+            return match
+
+        offset = self.__getIndex().get(gameID)
+        if offset is None:
+            return None
+
+        self.flush()
+        if self._readFD is None:
+            self._readFD = open(self.path, "rb")
+        self._readFD.seek(offset)
+        (length,) = FRAME_HEADER.unpack(self._readFD.read(FRAME_HEADER.size))
+        (_, match) = decodeMatch(self._readFD.read(length))
+
+        self._cache[gameID] = match
+        if len(self._cache) > self.cacheSize:
+            self._cache.popitem(last=False)
+        return match
+
+    def exportPGN(self, fd):
+        """Write every archived game to the given file as PGN, in ID order
+
+        Games are replayed from the board they started with (the standard
+        initial board for records that predate starting boards). Games that
+        cannot be replayed are logged and skipped.
+
+        @return: the number of games written"""
+        written = 0
+        for gameID in sorted(self.getGameIDs()):
+            match = self.get(gameID)
+            if not match.history and match.board is None:
+                continue  # Never started
+            try:
+                pgn.writeMatch(fd, match, tags={"GameId": str(gameID)})
+                written += 1
+            except pgn.MaverickPGNException, e:
+                GameArchive._logger.warning("Cannot export game %d: %s",
+                                            gameID, e)
+        return written
+
+    def close(self):
+        """Close the archive's files"""
+        for fd in [self._appendFD, self._readFD]:
+            if fd is not None:
+                fd.close()
+        self._appendFD = None
+        self._readFD = None
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+
+"""broadcast.py: Streaming of live game events to spectators"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import json
+import logging
+
+from twisted.internet import interfaces
+from zope.interface import implementer
+
+__all__ = ["GameBroadcaster",
+           "WatchSubscription"]
+
+# Overview of the event stream
+#
+# A spectator connection sends WATCH (see maverick.server) and then receives
+# one line per event, of the form:
+#  EVENT {JSON of event}
+#
+# Events are dictionaries of form
+#  {"gameID": gameID,
+#   "status": status of the game after the event,
+#   "stateVersion": state version of the game after the event,
+#   "plyNumber": index of the ply in the game's history (ply events only),
+#   "ply": {"fromRank": ..., "fromFile": ..., "toRank": ..., "toFile": ...}
+#          (ply events only)}
+#
+# Each event is serialized once, however many spectators receive it.
+
+
+@implementer(interfaces.IPushProducer)
+class WatchSubscription(object):
+    """The games watched by one spectator connection
+
+    Registered as a streaming producer with the connection's transport, so
+    that events are held back (rather than piling up in the transport) while
+    the spectator is not reading. A spectator that falls too far behind is
+    disconnected."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.broadcast.WatchSubscription")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    DEFAULT_MAX_PENDING = 1000
+    """Default number of events held back before a spectator is dropped"""
+
+    def __init__(self, transport, maxPending=DEFAULT_MAX_PENDING):
+        """Initialize a subscription writing to the given transport
+
+        @param maxPending: the number of events that may be held back while
+                           the transport is paused"""
+        self.transport = transport
+        self.maxPending = maxPending
+        self.gameIDs = set()  # Watched games (unused if watching all)
+        self.allGamesP = False  # Whether all games are watched
+        self.droppedP = False
+
+        # Serialized events held back while paused, oldest first
+        self._pending = []
+        self._pausedP = False
+
+        transport.registerProducer(self, True)
+
+    def sendEvent(self, line):
+        """Send (or hold back, if paused) a serialized event"""
+        if self.droppedP:
+            return
+        elif not self._pausedP:
+            self.transport.write(line)
+        elif len(self._pending) < self.maxPending:
+            self._pending.append(line)
+        else:
+            WatchSubscription._logger.warning("Dropping slow spectator")
+            self.droppedP = True
+            self._pending = []
+            self.transport.loseConnection()
+
+    def pauseProducing(self):
+        self._pausedP = True
+
+    def resumeProducing(self):
+        self._pausedP = False
+        if self._pending:
+            # Catch up with a single write
+            pending = self._pending
+            self._pending = []
+            self.transport.writeSequence(pending)
+
+    def stopProducing(self):
+        self.droppedP = True
+        self._pending = []
+
+
+class GameBroadcaster(object):
+    """Fans out events of games to the spectators watching them"""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.broadcast.GameBroadcaster")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self):
+        """Initialize a broadcaster with no spectators"""
+
+        # Dict from gameID to set of WatchSubscriptions watching it
+        self._subscribers = {}
+
+        # Set of WatchSubscriptions watching all games
+        self._allGamesSubscribers = set()
+
+    def subscribe(self, subscription, gameIDs=None):
+        """Send the events of the given games to a subscription
+
+        @param gameIDs: a list of gameIDs, or None to watch all games"""
+        if gameIDs is None:
+            subscription.allGamesP = True
+            self._allGamesSubscribers.add(subscription)
+        else:
+            for gameID in gameIDs:
+                subscription.gameIDs.add(gameID)
+                self._subscribers.setdefault(gameID, set()).add(subscription)
+
+    def unsubscribe(self, subscription):
+        """Stop sending any events to a subscription"""
+        self._allGamesSubscribers.discard(subscription)
+        for gameID in subscription.gameIDs:
+            subscribers = self._subscribers.get(gameID)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[gameID]
+        subscription.gameIDs = set()
+
+    def getNumSubscribers(self, gameID):
+        """Return the number of subscriptions watching the given game"""
+        return len(self._subscribers.get(gameID, set()) |
+                   self._allGamesSubscribers)
+
+    def publishPly(self, gameID, match):
+        """Send the latest ply of the given match to its spectators"""
+        if not self._allGamesSubscribers and gameID not in self._subscribers:
+            return  # Nobody to serialize the event for
+        (fromPosn, toPosn) = match.history[-1]
+        self.__publish(gameID, {"gameID": gameID,
+                                "status": match.status,
+                                "stateVersion": match.stateVersion,
+                                "plyNumber": len(match.history) - 1,
+                                "ply": {"fromRank": fromPosn.rankN,
+                                        "fromFile": fromPosn.fileN,
+                                        "toRank": toPosn.rankN,
+                                        "toFile": toPosn.fileN}})
+
+    def publishStatus(self, gameID, match):
+        """Send the status of the given match to its spectators"""
+        if not self._allGamesSubscribers and gameID not in self._subscribers:
+            return
+        self.__publish(gameID, {"gameID": gameID,
+                                "status": match.status,
+                                "stateVersion": match.stateVersion})
+
+    def __publish(self, gameID, event):
+        """Serialize an event once and send it to each of its spectators"""
+        line = "EVENT {0}\r\n".format(json.dumps(event, ensure_ascii=True))
+        # A set, since a spectator may watch both the game and all games, and
+        # copied, since dropping a spectator may unsubscribe it
+        recipients = (self._subscribers.get(gameID, set()) |
+                      self._allGamesSubscribers)
+        for subscription in recipients:
+            subscription.sendEvent(line)
+        GameBroadcaster._logger.debug("Published event of game %d", gameID)
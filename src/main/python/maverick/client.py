@@ -12,14 +12,25 @@ __version__ = "1.0"
 
 import json
 import logging
+import socket
+import time
 from telnetlib import Telnet
 
 from maverick.data.structs import ChessBoard
 from maverick.data.structs import ChessPiece
 from maverick.data.structs import ChessPosn
+from maverick.wire import FRAME_HEADER
+from maverick.wire import MaverickWireException
+from maverick.wire import VERB_CODES
+from maverick.wire import WIRE_FORMAT_BINARY
+from maverick.wire import WIRE_FORMAT_JSON
+from maverick.wire import decodeResponse
+from maverick.wire import encodeFrame
+from maverick.wire import encodeRequest
 
 __all__ = ["MaverickClient",
-           "MaverickClientException"]
+           "MaverickClientException",
+           "QueuedRequest"]
 
 
 class MaverickClientException(Exception):
@@ -44,11 +55,26 @@ class MaverickClient(object):
     DEFAULT_PORT = 7782
     """Default port to connect to"""
 
-    def __init__(self, host=None, port=None):
+    DEFAULT_BATCH_WINDOW = 0.01
+    """Default number of seconds that queued requests wait for others"""
+
+    MAX_BATCH_SIZE = 256
+    """Largest number of requests sent in one batch (the server's limit)"""
+
+    def __init__(self, host=None, port=None, wireFormat=None,
+                 batchWindow=DEFAULT_BATCH_WINDOW):
         """Initializes a MaverickClient, for use in Maverick Chess
 
         If host or port specified and not None, use them instead of defaults
-        NOTE: Port 7782 is not registered with the IANA as of 2012-12-17"""
+        NOTE: Port 7782 is not registered with the IANA as of 2012-12-17
+
+        @param wireFormat: maverick.wire.WIRE_FORMAT_JSON (the default) to
+                           make one connection per request, or
+                           maverick.wire.WIRE_FORMAT_BINARY to exchange
+                           binary frames over a single persistent connection
+        @param batchWindow: the number of seconds for which requests queued
+                            with queueRequest are held, waiting for others
+                            to be sent with them in one batch"""
 
         if host is None:
             self.host = MaverickClient.DEFAULT_HOST
@@ -60,17 +86,35 @@ class MaverickClient(object):
         else:
             self.port = port
 
-    def _makeRequest(self, verb, **dikt):
-        """Send a request to the server
+        # Local mirrors of game states, kept up to date with GET_STATE deltas
+        # Dict from gameID to dictionaries of form:
+        #  {"stateVersion": the server's state version of the mirror,
+        #   "board": a ChessBoard mirroring the server's board,
+        #   "history": list of (fromPosn, toPosn) plies}
+        self._stateMirrors = {}
+
+        if wireFormat is None:
+            self.wireFormat = WIRE_FORMAT_JSON
+        elif wireFormat in [WIRE_FORMAT_JSON, WIRE_FORMAT_BINARY]:
+            self.wireFormat = wireFormat
+        else:
+            raise MaverickClientException("Unsupported wire format")
 
-        NOTE: does not validate the content of responses"""
+        # Persistent connection (socket, read file) when using binary frames
+        self._binaryConnection = None
 
-        # Connect via telnet to the server
-        connection = Telnet(self.host, self.port)
+        # Requests queued by queueRequest but not yet sent, and the time at
+        # which the first of them was queued
+        self.batchWindow = batchWindow
+        self._queuedRequests = []
+        self._queuedSince = None
 
-        # Receive the welcome message
-        # Example: MaverickChessServer/1.0a1 WAITING_FOR_REQUEST
-        welcome = connection.read_until("\r\n", MaverickClient.TIMEOUT)
+    @staticmethod
+    def _validateWelcome(welcome):
+        """Raise a MaverickClientException if the server welcome is invalid
+
+        @param welcome: the welcome line, including the trailing CRLF
+                Example: MaverickChessServer/1.0a1 WAITING_FOR_REQUEST"""
 
         # Validate the welcome message
         err = None
@@ -92,6 +136,22 @@ class MaverickClient(object):
                                          err, welcome)
             raise MaverickClientException("Invalid server welcome")
 
+    def _makeRequest(self, verb, **dikt):
+        """Send a request to the server
+
+        NOTE: does not validate the content of responses"""
+
+        if self.wireFormat == WIRE_FORMAT_BINARY:
+            return self._makeBinaryRequest(verb, dikt)
+
+        # Connect via telnet to the server
+        connection = Telnet(self.host, self.port)
+
+        # Receive the welcome message
+        # Example: MaverickChessServer/1.0a1 WAITING_FOR_REQUEST
+        welcome = connection.read_until("\r\n", MaverickClient.TIMEOUT)
+        MaverickClient._validateWelcome(welcome)
+
         # Send the request
         requestStr = "{0} {1}\r\n".format(verb,
                                           json.dumps(dikt,
@@ -118,6 +178,78 @@ class MaverickClient(object):
             MaverickClient._logger.error(msg)
             raise MaverickClientException(msg)
 
+    def _openBinaryConnection(self):
+        """Connect to the server and switch to the binary wire format
+
+        @return: a tuple of form (socket, file for reading from the socket)"""
+
+        sock = socket.create_connection((self.host, self.port),
+                                        MaverickClient.TIMEOUT)
+        reader = sock.makefile("rb")
+        try:
+            MaverickClient._validateWelcome(reader.readline())
+
+            # Ask the server to switch to binary frames
+            fStr = "SET_WIRE_FORMAT {0}\r\n"
+            sock.sendall(fStr.format(json.dumps({"format":
+                                                 WIRE_FORMAT_BINARY})))
+            response = reader.readline()
+            if not response.startswith("SUCCESS"):
+                MaverickClient._logger.error("Binary format refused: %s",
+                                             response)
+                raise MaverickClientException("Binary format refused")
+        except:
+            reader.close()
+            sock.close()
+            raise
+
+        return (sock, reader)
+
+    def close(self):
+        """Close the persistent connection to the server, if there is one"""
+        if self._binaryConnection is not None:
+            (sock, reader) = self._binaryConnection
+            self._binaryConnection = None
+            reader.close()
+            sock.close()
+
+    def _makeBinaryRequest(self, verb, dikt):
+        """Send a request to the server as a binary frame
+
+        NOTE: does not validate the content of responses"""
+
+        if self._binaryConnection is None:
+            self._binaryConnection = self._openBinaryConnection()
+        (sock, reader) = self._binaryConnection
+
+        try:
+            sock.sendall(encodeFrame(encodeRequest(verb, dikt)))
+
+            # Receive the length-prefixed response
+            header = reader.read(FRAME_HEADER.size)
+            if len(header) != FRAME_HEADER.size:
+                raise MaverickWireException("Connection closed by server")
+            (length,) = FRAME_HEADER.unpack(header)
+            payload = reader.read(length)
+            if len(payload) != length:
+                raise MaverickWireException("Connection closed by server")
+
+            (errMsg, result) = decodeResponse(verb, payload)
+        except (socket.error, MaverickWireException), e:
+            # Start over with a fresh connection next time
+            self.close()
+            MaverickClient._logger.error("Binary request failed: %s", e)
+            raise MaverickClientException("Binary request failed")
+
+        if errMsg is not None:
+            MaverickClient._logger.debug("Received error response: %s", errMsg)
+            raise MaverickClientException(errMsg.encode("ascii", "replace"))
+
+        # Only JSON-encoded results may contain unicode strings
+        if verb not in VERB_CODES:
+            result = _asciify_json_dict(result)
+        return result
+
     def _request_register(self, name):
         """Registers a player with the system, returning their playerID.
 
@@ -128,6 +260,87 @@ class MaverickClient(object):
         response = self._makeRequest("REGISTER", name=name)
         return response["playerID"]
 
+    def _request_registerBatch(self, names):
+        """Registers many players at once, returning their playerIDs.
+
+        @param names: A list of Strings containing the players' names
+
+        @return: A list of playerIDs, in the order of the given names"""
+
+        response = self._makeRequest("REGISTER_BATCH", names=list(names))
+        return response["playerIDs"]
+
+    def _request_batch(self, requests):
+        """Sends many requests to the server in a single round trip
+
+        @param requests: A list of tuples of form (verb, argsDict)
+
+        @return: A list of tuples of form (errMsg, result), one per request
+                 in the same order; errMsg is None if the request succeeded
+                 and result is the response dictionary if so"""
+
+        subRequests = [{"verb": verb, "args": args}
+                       for (verb, args) in requests]
+        response = self._makeRequest("BATCH", requests=subRequests)
+        return [(subResponse.get("error"), subResponse.get("result"))
+                for subResponse in response["results"]]
+
+    def queueRequest(self, verb, resultKey=None, **dikt):
+        """Queue a request to be sent in a batch with other queued requests
+
+        Queued requests are sent together when the result of one is needed,
+        when flushRequests is called, or when a request is queued after the
+        first one has waited batchWindow seconds.
+
+        @param resultKey: if not None, getResult on the returned request
+                          gives only this item of the response dictionary
+        @return: a QueuedRequest, whose getResult gives the response"""
+
+        now = time.time()
+        if (self._queuedRequests and
+            now - self._queuedSince >= self.batchWindow):
+            self.flushRequests()
+
+        request = QueuedRequest(self, verb, dikt, resultKey)
+        if not self._queuedRequests:
+            self._queuedSince = now
+        self._queuedRequests.append(request)
+
+        if len(self._queuedRequests) >= MaverickClient.MAX_BATCH_SIZE:
+            self.flushRequests()
+        return request
+
+    def _queue_getStatus(self, gameID):
+        """Queue a GET_STATUS request (see queueRequest)"""
+        return self.queueRequest("GET_STATUS", resultKey="status",
+                                 gameID=gameID)
+
+    def _queue_isMyTurn(self, gameID, playerID):
+        """Queue an IS_MY_TURN request (see queueRequest)"""
+        return self.queueRequest("IS_MY_TURN", resultKey="isMyTurn",
+                                 gameID=gameID, playerID=playerID)
+
+    def flushRequests(self):
+        """Send all queued requests to the server in one batch"""
+
+        requests = self._queuedRequests
+        self._queuedRequests = []
+        self._queuedSince = None
+        if not requests:
+            return
+
+        try:
+            responses = self._request_batch([(r.verb, r.args)
+                                             for r in requests])
+        except MaverickClientException, e:
+            # The whole batch failed
+            for request in requests:
+                request._setResponse(str(e), None)
+            raise
+
+        for (request, (errMsg, result)) in zip(requests, responses):
+            request._setResponse(errMsg, result)
+
     def _request_joinGame(self, playerID, startFreshP):
         """Adds the player to a new or pending game.
 
@@ -208,6 +421,42 @@ class MaverickClient(object):
                                      playerID=playerID)
         return response["isMyTurn"]
 
+    @staticmethod
+    def __request_getState_applyDelta(mirror, response):
+        """Apply a delta GET_STATE response to a local mirror of the game
+
+        @param mirror: the game's mirror, as stored in self._stateMirrors
+        @param response: the (delta) response from the server
+
+        @return: True if the delta could be applied, False if the mirror is
+                inconsistent with the server and must be rebuilt"""
+
+        # Deltas must start exactly where the mirror's history leaves off
+        if response["historyStart"] != len(mirror["history"]):
+            return False
+
+        rawHst = response["history"]
+        newPlies = MaverickClient.__request_getState_deserializeHistory(rawHst)
+
+        board = mirror["board"]
+        for (fromPosn, toPosn) in newPlies:
+            # White makes the even-numbered plies, black the odd-numbered ones
+            if len(mirror["history"]) % 2 == 0:
+                color = ChessBoard.WHITE
+            else:
+                color = ChessBoard.BLACK
+
+            # The server has already checked legality, so just make the ply
+            board._executePly(color, fromPosn, toPosn)
+            mirror["history"].append((fromPosn, toPosn))
+
+        # The server's flags are authoritative
+        board.flag_enpassant = response["board"]["enPassantFlags"]
+        board.flag_canCastle = response["board"]["canCastleFlags"]
+        mirror["stateVersion"] = response["stateVersion"]
+
+        return True
+
     def _request_getState(self, playerID, gameID):
         """Return the current state of the game
 
@@ -215,40 +464,76 @@ class MaverickClient(object):
         the playerIDs of the black and white players, whose turn it is,
         the current board state, and the game history.
 
+        A local mirror of each game's board is kept, so that after the first
+        request only the plies made since the previous request are fetched.
+
         @param playerID: the integer of the playerID of the player on which
                          _request_getState is being called
         @param gameID: the integer gameID of an in-progress game"""
 
-        response = self._makeRequest("GET_STATE",
-                                     playerID=playerID,
-                                     gameID=gameID)
-        ## TODO (James): check constants to validate received data
+        mirror = self._stateMirrors.get(gameID)
 
-        # Construct board object from serialized data
-
-        # The serialized board layout
-        rawLayout = response["board"]["layout"]
-        # The deserialized board layout
-        layout = MaverickClient.__request_getState_deserializeLayout(rawLayout)
-
-        # The serialized history
-        rawHst = response["history"]
-        # Deserialize the history
-        histList = MaverickClient.__request_getState_deserializeHistory(rawHst)
+        if mirror is None:
+            response = self._makeRequest("GET_STATE",
+                                         playerID=playerID,
+                                         gameID=gameID)
+        else:
+            response = self._makeRequest("GET_STATE",
+                                         playerID=playerID,
+                                         gameID=gameID,
+                                         sinceVersion=mirror["stateVersion"])
+        ## TODO (James): check constants to validate received data
 
-        curEnPassantFlags = response["board"]["enPassantFlags"]
-        curCastleFlags = response["board"]["canCastleFlags"]
+        if response["isDelta"]:
+            # Bring the mirror up to date, starting over if that fails
+            if not MaverickClient.__request_getState_applyDelta(mirror,
+                                                                response):
+                del self._stateMirrors[gameID]
+                return self._request_getState(playerID, gameID)
 
-        curBoardObj = ChessBoard(startLayout=layout,
-                                 startEnpassantFlags=curEnPassantFlags,
-                                 startCanCastleFlags=curCastleFlags)
+        else:
+            # Construct board object from serialized data
+
+            # The serialized board layout
+            rawLayout = response["board"]["layout"]
+            # The deserialized board layout
+            layout = \
+                MaverickClient.__request_getState_deserializeLayout(rawLayout)
+
+            # The serialized history
+            rawHst = response["history"]
+            # Deserialize the history
+            histList = \
+                MaverickClient.__request_getState_deserializeHistory(rawHst)
+
+            curEPFlags = response["board"]["enPassantFlags"]
+            curCastleFlags = response["board"]["canCastleFlags"]
+
+            mirror = {"stateVersion": response["stateVersion"],
+                      "board": ChessBoard(startLayout=layout,
+                                          startEnpassantFlags=curEPFlags,
+                                          startCanCastleFlags=curCastleFlags),
+                      "history": histList}
+
+            # Only mirror games whose boards exist (deltas need a board)
+            if layout is None:
+                self._stateMirrors.pop(gameID, None)
+            else:
+                self._stateMirrors[gameID] = mirror
+
+        # Hand out a copy so that callers cannot corrupt the mirror
+        mirrorBoard = mirror["board"]
+        curBoardObj = ChessBoard(
+                            startLayout=mirrorBoard.layout,
+                            startEnpassantFlags=mirrorBoard.flag_enpassant,
+                            startCanCastleFlags=mirrorBoard.flag_canCastle)
 
         # Build up return dictionary
         stateDict = {}
         stateDict["youAreColor"] = response["youAreColor"]
         stateDict["isWhitesTurn"] = response["isWhitesTurn"]
         stateDict["board"] = curBoardObj
-        stateDict["history"] = histList
+        stateDict["history"] = list(mirror["history"])
 
         return stateDict
 
@@ -270,6 +555,38 @@ class MaverickClient(object):
                           toFile=toPosn.fileN)
 
 
+class QueuedRequest(object):
+    """A request queued by MaverickClient.queueRequest"""
+
+    def __init__(self, client, verb, args, resultKey):
+        self._client = client
+        self.verb = verb
+        self.args = args
+        self._resultKey = resultKey
+        self._doneP = False
+        self._errMsg = None
+        self._result = None
+
+    def _setResponse(self, errMsg, result):
+        """Record the server's response to this request"""
+        self._doneP = True
+        self._errMsg = errMsg
+        self._result = result
+
+    def getResult(self):
+        """Return the response, sending queued requests first if needed
+
+        @raise MaverickClientException: if the request failed"""
+        if not self._doneP:
+            self._client.flushRequests()
+        if self._errMsg is not None:
+            raise MaverickClientException(self._errMsg)
+        elif self._resultKey is None:
+            return self._result
+        else:
+            return self._result[self._resultKey]
+
+
 def _asciify_json_list(data):
     """Turn strings within a JSON list to ASCII"""
     # Adapted from: bit.ly/TtJpzH
@@ -6,4 +6,4 @@
 """maverick.data: A collection of data structures and modifiers"""
 
 # Submodules to be imported on "from ais import *"
-__all__ = ["structs", "utils"]
+__all__ = ["structs", "utils", "pgn"]
@@ -0,0 +1,449 @@
+#!/usr/bin/python
+
+"""maverick.data.pgn: Reading and writing games in Portable Game Notation"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import calendar
+import logging
+import re
+import textwrap
+import time
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessMatch
+from maverick.data.structs import ChessPosn
+from maverick.data.structs import MaverickDataException
+from maverick.data.utils import enumMoves
+from maverick.data.utils import enumPossPieceMoves
+
+__all__ = ["MaverickPGNException",
+           "getSquareName",
+           "getSquarePosn",
+           "getSAN",
+           "parseSAN",
+           "formatGame",
+           "writeMatch",
+           "readGames"]
+
+# Overview of PGN support
+#
+# Games are written in the PGN export format: the Seven Tag Roster (Event,
+# Site, Date, Round, White, Black, Result) followed by any other tags, then
+# the movetext in Standard Algebraic Notation (SAN), wrapped at 79 columns.
+# Games that did not start from the standard board have SetUp and FEN tags.
+# Start and finish times are written as UTCDate, UTCTime and Duration tags
+# and, if known, the time taken for each move as an "[%emt H:MM:SS.sss]"
+# comment after it.
+#
+# Games are read one at a time from any iterable of lines, so files of any
+# size can be streamed. Comments, variations and numeric annotation glyphs
+# are skipped and the main line is replayed on a ChessBoard. Plies are
+# checked against the moves enumPossPieceMoves finds (castling included)
+# and made with getPlyResult.
+# Maverick has no pawn promotion, so games with promotions cannot be read.
+
+_logger = logging.getLogger("maverick.data.pgn")
+# Initialize if not already initialized
+logging.basicConfig(level=logging.INFO)
+
+ROSTER_TAGS = ["Event", "Site", "Date", "Round", "White", "Black", "Result"]
+"""Names of the tags that every exported game has, in export order"""
+
+_ROSTER_DEFAULTS = {"Event": "?", "Site": "?", "Date": "????.??.??",
+                    "Round": "-", "White": "?", "Black": "?", "Result": "*"}
+
+_STATUS_RESULTS = {ChessMatch.STATUS_WHITE_WON: "1-0",
+                   ChessMatch.STATUS_BLACK_WON: "0-1",
+                   ChessMatch.STATUS_DRAWN: "1/2-1/2"}
+"""Mapping of finished match statuses to game termination markers"""
+
+_RESULT_STATUSES = {"1-0": ChessMatch.STATUS_WHITE_WON,
+                    "0-1": ChessMatch.STATUS_BLACK_WON,
+                    "1/2-1/2": ChessMatch.STATUS_DRAWN,
+                    "*": ChessMatch.STATUS_ONGOING}
+
+_SAN_PIECE_LETTERS = {ChessBoard.KNGT: "N",
+                      ChessBoard.BISH: "B",
+                      ChessBoard.ROOK: "R",
+                      ChessBoard.QUEN: "Q",
+                      ChessBoard.KING: "K"}
+_SAN_PIECE_TYPES = dict((letter, pieceType) for (pieceType, letter)
+                        in _SAN_PIECE_LETTERS.iteritems())
+
+_FILE_LETTERS = "abcdefgh"
+_RANK_NUMBERS = "12345678"
+
+_LINE_WIDTH = 79
+
+# Piece, from file, from rank, capture, destination, promotion
+_SAN_RE = re.compile(r"^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])"
+                     r"(=?[NBRQ])?$")
+
+_CASTLE_FILES = {"O-O": 6, "0-0": 6, "O-O-O": 2, "0-0-0": 2}
+"""Mapping of castling SAN to the file the king moves to"""
+
+_TAG_RE = re.compile(r'^\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]\s*$')
+
+# Comment start, rest-of-line comment, NAG, variation start or end, move
+# number or other token (a move or game termination marker)
+_TOKEN_RE = re.compile(r"(\{)|(;)|(\$\d+)|([()])|(\d+\.+)|([^\s{};()$]+)")
+
+
+class MaverickPGNException(Exception):
+    """Raised when a game cannot be read or written as PGN"""
+    pass
+
+
+def getSquareName(posn):
+    """Return the algebraic name of the given square (e.g., "e4")"""
+    return _FILE_LETTERS[posn.fileN] + _RANK_NUMBERS[posn.rankN]
+
+
+def getSquarePosn(name):
+    """Return the ChessPosn of the square with the given algebraic name
+
+    @raise MaverickPGNException: if name is not a square name"""
+    if (len(name) != 2 or name[0] not in _FILE_LETTERS or
+        name[1] not in _RANK_NUMBERS):
+        raise MaverickPGNException("Invalid square name: " + name)
+    return ChessPosn(_RANK_NUMBERS.index(name[1]),
+                     _FILE_LETTERS.index(name[0]))
+
+
+def __getSAN_checkSuffix(board, color):
+    """Return "#", "+" or "" as the given color is mated, checked or not"""
+    if board.pieceCheckingKing(color) is None:
+        return ""
+    elif enumMoves(board, color):
+        return "+"
+    else:
+        return "#"
+
+
+def getSAN(board, color, fromPosn, toPosn):
+    """Return the Standard Algebraic Notation of the given (legal) ply
+
+    The board is left unchanged.
+
+    @param color: the color making the ply"""
+
+    piece = board[fromPosn]
+    captureP = (board[toPosn] is not None or
+                (piece.pieceType == ChessBoard.PAWN and
+                 fromPosn.fileN != toPosn.fileN))
+
+    if (piece.pieceType == ChessBoard.KING and
+        abs(toPosn.fileN - fromPosn.fileN) == 2):
+        san = "O-O" if toPosn.fileN > fromPosn.fileN else "O-O-O"
+    elif piece.pieceType == ChessBoard.PAWN:
+        san = getSquareName(toPosn)
+        if captureP:
+            san = _FILE_LETTERS[fromPosn.fileN] + "x" + san
+    else:
+        # Find other pieces of the same type that could make the same ply
+        rivals = [posn for posn in board.getPiecesOfColor(color)
+                  if board[posn] == piece and not posn == fromPosn and
+                  toPosn in enumPossPieceMoves(board, posn)]
+
+        disambiguation = ""
+        if rivals:
+            if all(posn.fileN != fromPosn.fileN for posn in rivals):
+                disambiguation = _FILE_LETTERS[fromPosn.fileN]
+            elif all(posn.rankN != fromPosn.rankN for posn in rivals):
+                disambiguation = _RANK_NUMBERS[fromPosn.rankN]
+            else:
+                disambiguation = getSquareName(fromPosn)
+
+        san = (_SAN_PIECE_LETTERS[piece.pieceType] + disambiguation +
+               ("x" if captureP else "") + getSquareName(toPosn))
+
+    ################# MUTATE THE BOARD STATE - MUST BE UNDONE: ############
+    undoDict = board.getPlyResult(fromPosn, toPosn)
+    suffix = __getSAN_checkSuffix(board, ChessBoard.getOtherColor(color))
+    ################# RESTORE THE OLD BOARD STATE - VERY IMPORTANT: #######
+    board.undoPlyResult(undoDict)
+
+    return san + suffix
+
+
+def parseSAN(board, color, san):
+    """Return the ply described by the given Standard Algebraic Notation
+
+    Check, mate and annotation suffixes (e.g., "+", "#", "!?") are ignored.
+    The ply is not checked for legality beyond being one of the moves that
+    enumPossPieceMoves finds.
+
+    @param color: the color making the ply
+    @return: a tuple of form (fromPosn, toPosn)
+
+    @raise MaverickPGNException: if the SAN is malformed, ambiguous or
+                                 matches no ply"""
+
+    move = san.rstrip("+#!?")
+
+    if move in _CASTLE_FILES:
+        homeRank = 0 if color == ChessBoard.WHITE else 7
+        return (ChessPosn(homeRank, 4), ChessPosn(homeRank,
+                                                  _CASTLE_FILES[move]))
+
+    match = _SAN_RE.match(move)
+    if match is None:
+        raise MaverickPGNException("Invalid SAN: " + san)
+    (pieceLetter, fromFile, fromRank, _, toName, promotion) = match.groups()
+    if promotion is not None:
+        raise MaverickPGNException("Pawn promotion is not supported: " + san)
+
+    pieceType = _SAN_PIECE_TYPES.get(pieceLetter, ChessBoard.PAWN)
+    toPosn = getSquarePosn(toName)
+
+    candidates = []
+    for fromPosn in board.getPiecesOfColor(color):
+        piece = board[fromPosn]
+        if (piece.pieceType == pieceType and
+            (fromFile is None or
+             _FILE_LETTERS[fromPosn.fileN] == fromFile) and
+            (fromRank is None or
+             _RANK_NUMBERS[fromPosn.rankN] == fromRank) and
+            toPosn in enumPossPieceMoves(board, fromPosn)):
+            candidates.append(fromPosn)
+
+    if not candidates:
+        raise MaverickPGNException("No legal move matches SAN: " + san)
+    elif len(candidates) > 1:
+        raise MaverickPGNException("Ambiguous SAN: " + san)
+    return (candidates[0], toPosn)
+
+
+def __formatGame_duration(seconds):
+    """Format a number of seconds as H:MM:SS.sss"""
+    (minutes, seconds) = divmod(seconds, 60)
+    (hours, minutes) = divmod(int(minutes), 60)
+    return "{0}:{1:02}:{2:06.3f}".format(hours, minutes, seconds)
+
+
+def __formatGame_tag(name, value):
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"')
+    return '[{0} "{1}"]'.format(name, escaped)
+
+
+def formatGame(tags, plies, startFEN=None, moveTimes=None):
+    """Return the PGN text of a game
+
+    @param tags: a dict from tag name to value. Missing Seven Tag Roster tags
+                 are given their "unknown" values.
+    @param plies: a list of (fromPosn, toPosn) tuples
+    @param startFEN: the FEN of the board the game started with (default:
+                     the standard initial board)
+    @param moveTimes: if given, the seconds taken to choose each ply
+
+    @return: the game as a string, ending in a blank line
+
+    @raise MaverickPGNException: if a ply is not legal"""
+
+    tags = dict(tags)
+    for (name, value) in _ROSTER_DEFAULTS.iteritems():
+        tags.setdefault(name, value)
+    if startFEN is None or startFEN == ChessBoard.FEN_INITIAL:
+        board = ChessBoard()
+        color = ChessBoard.WHITE
+        moveNumber = 1
+    else:
+        try:
+            board = ChessBoard.fromFEN(startFEN)
+        except MaverickDataException, e:
+            raise MaverickPGNException(str(e))
+        color = ChessBoard.getFENColorToMove(startFEN)
+        moveNumber = int(startFEN.split()[5]) if \
+            len(startFEN.split()) > 5 else 1
+        tags["SetUp"] = "1"
+        tags["FEN"] = startFEN
+
+    tokens = []
+    for (plyN, (fromPosn, toPosn)) in enumerate(plies):
+        if color == ChessBoard.WHITE:
+            tokens.append("{0}.".format(moveNumber))
+        elif plyN == 0:
+            tokens.append("{0}...".format(moveNumber))
+
+        if (board[fromPosn] is None or board[fromPosn].color != color or
+            toPosn not in enumPossPieceMoves(board, fromPosn)):
+            raise MaverickPGNException("Illegal ply {0}: {1} -> {2}".format(
+                                                plyN, fromPosn, toPosn))
+        tokens.append(getSAN(board, color, fromPosn, toPosn))
+        board.getPlyResult(fromPosn, toPosn)
+        if moveTimes is not None:
+            tokens.append("{[%emt " +
+                          __formatGame_duration(moveTimes[plyN]) + "]}")
+
+        if color == ChessBoard.BLACK:
+            moveNumber += 1
+        color = ChessBoard.getOtherColor(color)
+    tokens.append(tags["Result"])
+
+    lines = [__formatGame_tag(name, tags[name]) for name in ROSTER_TAGS]
+    lines.extend([__formatGame_tag(name, tags[name])
+                  for name in sorted(tags) if name not in ROSTER_TAGS])
+    lines.append("")
+    lines.append(textwrap.fill(" ".join(tokens), _LINE_WIDTH,
+                               break_long_words=False,
+                               break_on_hyphens=False))
+    lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def writeMatch(fd, match, tags=None, moveTimes=None):
+    """Write the given match to the given file as PGN
+
+    Players are named by their playerIDs. The start and finish times of the
+    match are written as UTCDate, UTCTime and Duration tags.
+
+    @param fd: a file-like object to write to
+    @param tags: a dict of tags to add to (or override) those from the match
+    @param moveTimes: if given, the seconds taken to choose each ply"""
+
+    matchTags = {"Result": _STATUS_RESULTS.get(match.status, "*"),
+                 "PlyCount": str(len(match.history))}
+    for color in [ChessBoard.WHITE, ChessBoard.BLACK]:
+        if match.players[color] is not None:
+            matchTags["White" if color == ChessBoard.WHITE else "Black"] = \
+                "Player {0}".format(match.players[color])
+    if match.startedAt is not None:
+        startTime = time.gmtime(match.startedAt)
+        matchTags["Date"] = time.strftime("%Y.%m.%d", startTime)
+        matchTags["UTCDate"] = matchTags["Date"]
+        matchTags["UTCTime"] = time.strftime("%H:%M:%S", startTime)
+        if match.finishedAt is not None:
+            matchTags["Duration"] = __formatGame_duration(
+                                        match.finishedAt - match.startedAt)
+    matchTags.update(tags or {})
+
+    fd.write(formatGame(matchTags, match.history, startFEN=match.startFEN,
+                        moveTimes=moveTimes))
+
+
+def __readGames_toMatch(tags, sans, result):
+    """Replay a game read by readGames
+
+    @return: a tuple of form (tags, ChessMatch)"""
+
+    match = ChessMatch()
+    match.status = _RESULT_STATUSES[result]
+
+    if tags.get("SetUp") == "1" and "FEN" in tags:
+        match.startFEN = tags["FEN"]
+        try:
+            board = ChessBoard.fromFEN(match.startFEN)
+        except MaverickDataException, e:
+            raise MaverickPGNException(str(e))
+        color = ChessBoard.getFENColorToMove(match.startFEN)
+    else:
+        match.startFEN = ChessBoard.FEN_INITIAL
+        board = ChessBoard()
+        color = ChessBoard.WHITE
+
+    for san in sans:
+        (fromPosn, toPosn) = parseSAN(board, color, san)
+        board.getPlyResult(fromPosn, toPosn)
+        match.history.append((fromPosn, toPosn))
+        color = ChessBoard.getOtherColor(color)
+    match.board = board
+
+    try:
+        match.startedAt = calendar.timegm(time.strptime(
+                tags["UTCDate"] + " " + tags["UTCTime"], "%Y.%m.%d %H:%M:%S"))
+        (hours, minutes, seconds) = tags["Duration"].split(":")
+        match.finishedAt = (match.startedAt + int(hours) * 3600 +
+                            int(minutes) * 60 + float(seconds))
+    except (KeyError, ValueError):
+        pass  # Times are optional
+
+    return (tags, match)
+
+
+def readGames(lines, skipInvalid=False):
+    """Generate the games in the given PGN text, one at a time
+
+    Only the game being read is kept in memory, so files of any size may be
+    read (e.g., readGames(open(path))).
+
+    @param lines: an iterable of lines of PGN text, such as a file
+    @param skipInvalid: if True, games that cannot be replayed are logged and
+                        skipped rather than raising an exception
+
+    @return: a generator of tuples of form (tags, match), where tags is a
+             dict of the game's tags and match is a ChessMatch with the
+             game's history, final board and result as its status (players
+             are not set)
+
+    @raise MaverickPGNException: if a game cannot be replayed"""
+
+    tags = {}
+    sans = []
+    inCommentP = False
+    variationDepth = 0
+    for (lineN, line) in enumerate(lines, 1):
+        pos = 0
+        if not inCommentP and variationDepth == 0:
+            if line.startswith("%"):
+                continue  # Escaped line
+
+            tagMatch = _TAG_RE.match(line.strip())
+            if tagMatch is not None:
+                if sans:
+                    # Movetext ended without a termination marker
+                    _logger.warning("Game ending at line %d has no result",
+                                    lineN)
+                    tags = {}
+                    sans = []
+                tags[tagMatch.group(1)] = re.sub(r"\\(.)", r"\1",
+                                                 tagMatch.group(2))
+                continue
+
+        while True:
+            if inCommentP:
+                end = line.find("}", pos)
+                if end < 0:
+                    break
+                inCommentP = False
+                pos = end + 1
+
+            token = _TOKEN_RE.search(line, pos)
+            if token is None:
+                break
+            pos = token.end()
+            (commentP, restCommentP, _, paren, _, word) = token.groups()
+
+            if commentP:
+                inCommentP = True
+            elif restCommentP:
+                break
+            elif paren == "(":
+                variationDepth += 1
+            elif paren == ")":
+                variationDepth = max(0, variationDepth - 1)
+            elif word is None or variationDepth > 0:
+                pass  # NAG, move number or move in a variation
+            elif word in _RESULT_STATUSES:
+                try:
+                    yield __readGames_toMatch(tags, sans, word)
+                except MaverickPGNException, e:
+                    if not skipInvalid:
+                        raise MaverickPGNException(
+                                "Game ending at line {0}: {1}".format(lineN,
+                                                                      e))
+                    _logger.warning("Skipping game ending at line %d: %s",
+                                    lineN, e)
+                tags = {}
+                sans = []
+            else:
+                sans.append(word)
+
+    if sans:
+        _logger.warning("Last game has no result")
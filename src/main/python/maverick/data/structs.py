@@ -11,9 +11,10 @@ __version__ = "1.0"
 
 # # TODO (James): For ALL MAVERICK CODE - license as BeerWare
 
-import copy
+import bisect
 import logging
 import random
+import time
 
 __all__ = ["ChessBoard",
            "ChessMatch",
@@ -60,7 +61,10 @@ class ChessPosn(object):
 
 
 class ChessPiece(object):
-    """Represents chess piece in Maverick"""
+    """Represents chess piece in Maverick
+
+    ChessPieces are never modified once created, so one may be shared by
+    many squares and boards."""
 
     def __init__(self, color, pieceType):
         """ChessPosn wraps a color and a piece type"""
@@ -86,8 +90,6 @@ class ChessPiece(object):
 class ChessBoard(object):
     """Represents a chess game in Maverick"""
 
-    # TODO (mattsh): Represent threefold repetition draw rule
-
     # TODO (mattsh): getPlyResult, unGetPlyResult should use with syntax
     #                http://www.python.org/dev/peps/pep-0343/
 
@@ -168,6 +170,17 @@ class ChessBoard(object):
 
     Pawns have the special property that they only move up/down"""
 
+    # Constants for the state of the game, as returned by gameState
+    GAME_ONGOING = "ONGOING"  # The color to move has a legal move
+    GAME_CHECKMATE = "CHECKMATE"  # The color to move is checkmated
+    GAME_STALEMATE = "STALEMATE"  # The color to move is stalemated
+
+    GAME_STATE_CACHE_SIZE = 1 << 16
+    """Number of positions whose game state is remembered (see gameState)"""
+
+    FIFTY_MOVE_PLIES = 100
+    """Number of plies without a capture or pawn move that draws the game"""
+
     HUMAN_FILE_LETTERS = ["A", "B", "C", "D", "E", "F", "G", "H"]
     """Ordered listing of valid files"""
 
@@ -182,27 +195,48 @@ class ChessBoard(object):
                         KING: "K"}
     """Mapping of piece constants to their visual represenataion"""
 
+    FEN_PIECE_LETTERS = {PAWN: "P",
+                         ROOK: "R",
+                         KNGT: "N",
+                         BISH: "B",
+                         QUEN: "Q",
+                         KING: "K"}
+    """Mapping of piece constants to their letters in FEN (white pieces)"""
+
+    FEN_COLOR_LETTERS = {WHITE: "w", BLACK: "b"}
+    """Mapping of colors to their letters in FEN"""
+
+    FEN_INITIAL = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+    """FEN of the standard initial board state"""
+
     def __init__(self,
                  startLayout=None,
                  startEnpassantFlags=None,
                  startCanCastleFlags=None,
-                 drawCounter=0):
+                 drawCounter=0,
+                 positionHistory=None):
         """Initialize a new Chess game according to normal Chess rules
 
         There are special states that must be kept track of:
             - En passant
-            - Castling"""
+            - Castling
+            - Plies since the last capture or pawn move (drawCounter)
+            - Positions since then, for repetitions (positionHistory)
+
+        Squares must be changed through __setitem__ (board[posn] = piece)
+        rather than through the layout, so that the position hash is kept
+        up to date."""
 
         # Log initialization
         ChessBoard._logger.debug("Initialized")
 
         # For all instance variables, assign values if supplied in constructor
 
+        # Copy the rows of the start layout. ChessPieces are never modified,
+        # so they are shared rather than copied.
         if startLayout is None:
-            # Perform deep copy of board start state into self.layout
-            self.layout = copy.deepcopy(ChessBoard.DEFAULT_INITIAL_LAYOUT)
-        else:
-            self.layout = copy.deepcopy(startLayout)
+            startLayout = ChessBoard.DEFAULT_INITIAL_LAYOUT
+        self.layout = [list(row) for row in startLayout]
 
         if startEnpassantFlags is None:
             # Initialize en passant flags (True means en passant capture is
@@ -211,7 +245,9 @@ class ChessBoard(object):
                 ChessBoard.WHITE: [False] * ChessBoard.BOARD_LAYOUT_SIZE,
                 ChessBoard.BLACK: [False] * ChessBoard.BOARD_LAYOUT_SIZE}
         else:
-            self.flag_enpassant = copy.deepcopy(startEnpassantFlags)
+            self.flag_enpassant = dict(
+                    (color, list(flags))
+                    for (color, flags) in startEnpassantFlags.iteritems())
 
         if startCanCastleFlags is None:
             # Initialize castle flags (queen-side ability, king-side ability)
@@ -220,11 +256,48 @@ class ChessBoard(object):
                 ChessBoard.WHITE: (True, True),
                 ChessBoard.BLACK: (True, True)}
         else:
-            self.flag_canCastle = copy.deepcopy(startCanCastleFlags)
+            self.flag_canCastle = dict(
+                    (color, tuple(flags))
+                    for (color, flags) in startCanCastleFlags.iteritems())
 
         # Assign draw counter
         self.drawCounter = drawCounter
 
+        # Hashes (see getPositionHash) of the positions of the game, one per
+        # ply, ending with the current one. Plies made on this board push
+        # onto it, and undoPlyResult pops.
+        if positionHistory is None:
+            self.positionHistory = []
+        else:
+            self.positionHistory = list(positionHistory)
+
+        # Last known square of each color's king, kept up to date by
+        # __setitem__ and checked before use (see __isLegalMove_findKings)
+        self._kingPosns = {}
+
+        # Zobrist hash of the pieces alone, kept up to date by __setitem__
+        self._pieceHash = self.__getPieceHash()
+
+    def __setstate__(self, state):
+        """Restore a pickled board, which may predate the king square cache
+        and the position history"""
+        self.__dict__.update(state)
+        self.__dict__.setdefault("_kingPosns", {})
+        self.__dict__.setdefault("positionHistory", [])
+        self._pieceHash = self.__getPieceHash()
+
+    def __getPieceHash(self):
+        """Return the Zobrist hash of the pieces on the layout"""
+        pieceHash = 0
+        squareN = 0
+        for row in self.layout:
+            for piece in row:
+                if piece is not None:
+                    pieceHash ^= _ZOBRIST_PIECE_KEYS[
+                        (piece.color, piece.pieceType)][squareN]
+                squareN += 1
+        return pieceHash
+
     def __getitem__(self, posn):
         """x.__getitem__(y) <==> x[y]
 
@@ -240,7 +313,18 @@ class ChessBoard(object):
         """x.__setitem__(i, y) <==> x[i]=y
 
         Sets the piece object at the given position"""
+        squareN = posn.rankN * ChessBoard.BOARD_LAYOUT_SIZE + posn.fileN
+        oldPiece = self.layout[posn.rankN][posn.fileN]
+        if oldPiece is not None:
+            self._pieceHash ^= _ZOBRIST_PIECE_KEYS[
+                (oldPiece.color, oldPiece.pieceType)][squareN]
+
         self.layout[posn.rankN][posn.fileN] = piece
+        if piece is not None:
+            self._pieceHash ^= _ZOBRIST_PIECE_KEYS[
+                (piece.color, piece.pieceType)][squareN]
+            if piece.pieceType == ChessBoard.KING:
+                self._kingPosns[piece.color] = posn
 
     def _executePly(self, color, fromPosn, toPosn):
         """Make a ply on this board, assuming that it is legal
@@ -273,9 +357,11 @@ class ChessBoard(object):
                 self.flag_canCastle[color] = (prevCastleFlag[0], False)
 
         # Update 50-move counter
-        if movedPiece == ChessBoard.PAWN or self[toPosn] is not None:
+        if (movedPiece.pieceType == ChessBoard.PAWN or
+            self[toPosn] is not None):
             self.drawCounter = 0
-        self.drawCounter += 1
+        else:
+            self.drawCounter += 1
 
         # Change in rank from origin to destination
         rankDeltaAbs = abs(toPosn.rankN - fromPosn.rankN)
@@ -354,6 +440,9 @@ class ChessBoard(object):
                     # Reset the en passant flag, pre-emptively
                     self.flag_enpassant[otherColor][toPosn.fileN] = False
 
+        # Note the new position
+        self.positionHistory.append(self.getPositionHash(otherColor))
+
         # Log the successful move
         logStrF = "Moved piece from %s, to %s"
         ChessBoard._logger.debug(logStrF, fromPosn, toPosn)
@@ -449,6 +538,166 @@ class ChessBoard(object):
         boardStr = "\n".join(boardStrA)
         return boardStr
 
+    @staticmethod
+    def fromFEN(fen):
+        """Return the board described by the given FEN string
+
+        The castling availability, en passant target square and halfmove
+        clock fields set flag_canCastle, flag_enpassant and drawCounter. The
+        side to move and fullmove number are not part of a ChessBoard (see
+        getFENColorToMove). The last two fields may be omitted, as in EPD.
+
+        @param fen: a string in Forsyth-Edwards Notation
+
+        @return: a ChessBoard
+
+        @raise MaverickDataException: if fen is not valid FEN"""
+
+        fields = fen.split()
+        if not 4 <= len(fields) <= 6:
+            raise MaverickDataException("FEN must have 4 to 6 fields")
+        (placement, colorLetter, castling, enpassant) = fields[:4]
+        if colorLetter not in ("w", "b"):
+            raise MaverickDataException("Invalid FEN side to move")
+
+        # Build the layout from rank 1 up, sharing piece objects
+        rankStrs = placement.split("/")
+        if len(rankStrs) != ChessBoard.BOARD_LAYOUT_SIZE:
+            raise MaverickDataException("FEN must have 8 ranks")
+        layout = []
+        for rankStr in reversed(rankStrs):
+            row = []
+            try:
+                for char in rankStr:
+                    row.extend(_FEN_SQUARES[char])
+            except KeyError:
+                raise MaverickDataException("Invalid FEN piece placement")
+            if len(row) != ChessBoard.BOARD_LAYOUT_SIZE:
+                raise MaverickDataException("FEN rank must have 8 squares")
+            layout.append(row)
+
+        if castling != "-" and not set(castling) <= set("KQkq"):
+            raise MaverickDataException("Invalid FEN castling availability")
+        canCastleFlags = {ChessBoard.WHITE: ("Q" in castling,
+                                             "K" in castling),
+                          ChessBoard.BLACK: ("q" in castling,
+                                             "k" in castling)}
+
+        # The target square is behind the pawn that just moved two squares
+        enpassantFlags = {
+            ChessBoard.WHITE: [False] * ChessBoard.BOARD_LAYOUT_SIZE,
+            ChessBoard.BLACK: [False] * ChessBoard.BOARD_LAYOUT_SIZE}
+        if enpassant != "-":
+            if (len(enpassant) != 2 or enpassant[0] not in "abcdefgh" or
+                enpassant[1] not in "36"):
+                raise MaverickDataException("Invalid FEN en passant square")
+            color = ChessBoard.WHITE if enpassant[1] == "3" \
+                else ChessBoard.BLACK
+            enpassantFlags[color]["abcdefgh".index(enpassant[0])] = True
+
+        drawCounter = 0
+        if len(fields) > 4:
+            if not fields[4].isdigit():
+                raise MaverickDataException("Invalid FEN halfmove clock")
+            drawCounter = int(fields[4])
+
+        return ChessBoard(startLayout=layout,
+                          startEnpassantFlags=enpassantFlags,
+                          startCanCastleFlags=canCastleFlags,
+                          drawCounter=drawCounter)
+
+    @staticmethod
+    def getFENColorToMove(fen):
+        """Return the color to move in the given FEN string
+
+        @return: one of ChessBoard.WHITE or ChessBoard.BLACK
+
+        @raise MaverickDataException: if fen has no valid side to move"""
+        fields = fen.split()
+        if len(fields) < 2 or fields[1] not in ("w", "b"):
+            raise MaverickDataException("Invalid FEN side to move")
+        return ChessBoard.WHITE if fields[1] == "w" else ChessBoard.BLACK
+
+    def toFEN(self, colorToMove=WHITE, fullmoveNumber=1):
+        """Return this board in Forsyth-Edwards Notation
+
+        @param colorToMove: the color whose turn it is
+        @param fullmoveNumber: the number of the current full move
+
+        @return: a FEN string, from which fromFEN recreates this board. The
+        en passant target square is given if the other color's en passant
+        flag is set for a file; drawCounter is given as the halfmove
+        clock."""
+
+        rankStrs = []
+        for rankN in xrange(ChessBoard.BOARD_LAYOUT_SIZE - 1, -1, -1):
+            rankStr = ""
+            emptyCount = 0
+            for piece in self.layout[rankN]:
+                if piece is None:
+                    emptyCount += 1
+                else:
+                    if emptyCount:
+                        rankStr += str(emptyCount)
+                        emptyCount = 0
+                    letter = ChessBoard.FEN_PIECE_LETTERS[piece.pieceType]
+                    if piece.color == ChessBoard.BLACK:
+                        letter = letter.lower()
+                    rankStr += letter
+            if emptyCount:
+                rankStr += str(emptyCount)
+            rankStrs.append(rankStr)
+
+        (whiteQueenSide, whiteKingSide) = self.flag_canCastle[ChessBoard.WHITE]
+        (blackQueenSide, blackKingSide) = self.flag_canCastle[ChessBoard.BLACK]
+        castling = "".join([letter for (flag, letter) in
+                            [(whiteKingSide, "K"), (whiteQueenSide, "Q"),
+                             (blackKingSide, "k"), (blackQueenSide, "q")]
+                            if flag]) or "-"
+
+        lastMover = ChessBoard.getOtherColor(colorToMove)
+        enpassant = "-"
+        for (fileN, flag) in enumerate(self.flag_enpassant[lastMover]):
+            if flag:
+                enpassant = "abcdefgh"[fileN] + \
+                    ("3" if lastMover == ChessBoard.WHITE else "6")
+                break
+
+        return " ".join(["/".join(rankStrs),
+                         ChessBoard.FEN_COLOR_LETTERS[colorToMove],
+                         castling,
+                         enpassant,
+                         str(self.drawCounter),
+                         str(fullmoveNumber)])
+
+    def getPositionHash(self, colorToMove):
+        """Return a 64-bit Zobrist hash of this position
+
+        The hash covers the layout, the castle flags, the en passant flags of
+        the color that just moved and the color to move (but not
+        drawCounter). The keys are fixed, so hashes may be stored on disk.
+
+        @param colorToMove: the color whose turn it is
+
+        @return: a non-negative integer less than 2 ** 64"""
+
+        positionHash = self._pieceHash
+        for color in [ChessBoard.WHITE, ChessBoard.BLACK]:
+            for (flag, key) in zip(self.flag_canCastle[color],
+                                   _ZOBRIST_CASTLE_KEYS[color]):
+                if flag:
+                    positionHash ^= key
+
+        lastMover = ChessBoard.getOtherColor(colorToMove)
+        for (flag, key) in zip(self.flag_enpassant[lastMover],
+                               _ZOBRIST_ENPASSANT_KEYS):
+            if flag:
+                positionHash ^= key
+
+        if colorToMove == ChessBoard.BLACK:
+            positionHash ^= _ZOBRIST_BLACK_TO_MOVE_KEY
+        return positionHash
+
     @staticmethod
     def getOtherColor(color):
         """Return the opposing color
@@ -499,36 +748,23 @@ class ChessBoard(object):
                 return False  # There was a piece in one of the path squares
         return True  # None of the path squares contained a piece
 
-    @staticmethod
-    def __isLegal_getInterruptSquares(fromPosn, toPosn):
-        """Return a list of squares that block the given path if moved to
-
-        NOTE: This list will always include fromPosn
-
-        @param fromPosn: a ChessPosn representing the origin position
-        @param toPosn: a ChessPosn representing the destination position
-
-        @return: A list of ChessPosn objects representing squares that, if
-        moved to, would inhibit the piece at fromPosn from being able
-        to move to toPosn"""
-
-        # Squares that could interrupt path from origin to destination. An
-        # Accumulator to built up and returned
-        interruptSquares = []
-        interruptSquares.append(fromPosn)
-
-        # Build up list of squares in path from origin to destination
-        pathSquares = ChessBoard.__isLegal_getSquaresInPath(fromPosn, toPosn)
-
-        interruptSquares += (pathSquares)
-
-        return interruptSquares
-
     def __isLegalMove_findKings(self, color):
         """Return the locations of the given color king, as a ChessPosn
 
         @param color: The color of the king to find
-        @return: the location of the king of the given color, as a ChessPosn"""
+        @return: the location of the king of the given color, as a ChessPosn
+
+        Uses the cached king square if the king is still there (the layout
+        may have been modified directly), and otherwise scans the board."""
+
+        # Check the cached location first
+        kingPosn = self._kingPosns.get(color)
+        if kingPosn is not None:
+            piece = self.layout[kingPosn.rankN][kingPosn.fileN]
+            if (piece is not None and
+                piece.pieceType == ChessBoard.KING and
+                piece.color == color):
+                return kingPosn
 
         # Locate given player's king
         for r in xrange(ChessBoard.BOARD_LAYOUT_SIZE):
@@ -538,6 +774,7 @@ class ChessBoard(object):
                 if (piece is not None and
                     piece.pieceType == ChessBoard.KING and
                     piece.color == color):
+                        self._kingPosns[color] = piecePosn
                         return piecePosn
 
         # Raise exception - we have a deficit of kings
@@ -708,18 +945,27 @@ class ChessBoard(object):
             castleFileKingside = 6
             kingStartRank = 0 if color == ChessBoard.WHITE else 7
 
-            # Check that king only moves more than one square when castling
+            # Check that king only moves more than one square when castling,
+            # from its starting square and with no pieces between it and the
+            # rook
+            kingStartPosn = ChessPosn(kingStartRank, 4)
             if file_delta_abs not in [0, 1] or rank_delta_abs not in [0, 1]:
 
                 # Check for illegal kingside castle
-                if (toPosn == ChessPosn(castleFileKingside, kingStartRank)):
-                    if not castleFlagKingside:
+                if (fromPosn == kingStartPosn and
+                    toPosn == ChessPosn(kingStartRank, castleFileKingside)):
+                    if not castleFlagKingside or \
+                            not ChessBoard.__isLegal_isClearLinearPath(
+                                self, fromPosn, ChessPosn(kingStartRank, 7)):
                         ChessBoard._logger.debug("Illegal kingside castle")
                         return False
 
                 # Check for illegal queenside castle
-                elif (toPosn == ChessPosn(castleFileQueenside, kingStartRank)):
-                    if not castleFlagQueenside:
+                elif (fromPosn == kingStartPosn and
+                      toPosn == ChessPosn(kingStartRank, castleFileQueenside)):
+                    if not castleFlagQueenside or \
+                            not ChessBoard.__isLegal_isClearLinearPath(
+                                self, fromPosn, ChessPosn(kingStartRank, 0)):
                         ChessBoard._logger.debug("Illegal queenside castle")
                         return False
 
@@ -808,12 +1054,13 @@ class ChessBoard(object):
 
             # Check that the king would not be in check after the move
             ChessBoard._logger.debug("Checking for move to in-check state")
+            inCheckP = self.pieceCheckingKing(color) is not None
 
             # Restore the old board state (prior to hypothesization)
             self.undoPlyResult(boardMoveUndoDict)
 
             # Perform the check
-            if self.pieceCheckingKing(color) is not None:
+            if inCheckP:
                 ChessBoard._logger.debug("Illegal move to in-check state")
                 return False
             else:
@@ -833,6 +1080,7 @@ class ChessBoard(object):
         @return: a dictionary of the following form:
                 {"oldCastleFlags": the original castle flags of this board,
                 "oldEnPassantFlags": the original enpassant flags,
+                "oldDrawCounter": the original draw counter,
                 "movedPieces" A list of (ChessPiece, ChessPosn) tuples mapping
                 pieces moved by this function to their original locations}
 
@@ -846,7 +1094,11 @@ class ChessBoard(object):
         returnDict = {}
 
         returnDict['oldCastleFlags'] = self.flag_canCastle.copy()
-        returnDict['oldEnPassantFlags'] = self.flag_enpassant.copy()
+        # The flag lists are copied too, since _executePly modifies them
+        returnDict['oldEnPassantFlags'] = dict(
+                    (flagColor, list(flags))
+                    for (flagColor, flags) in self.flag_enpassant.iteritems())
+        returnDict['oldDrawCounter'] = self.drawCounter
 
         # Make the proposed ply on the hypothetical board
         returnDict['movedPieces'] = self._executePly(color, fromPosn, toPosn)
@@ -863,12 +1115,15 @@ class ChessBoard(object):
         @param undoDict: a dictionary of the following form:
                 {"oldCastleFlags": the original castle flags of this board,
                 "oldEnPassantFlags": the original enpassant flags,
+                "oldDrawCounter": the original draw counter,
                 "movedPieces" A list of (ChessPiece, ChessPosn) tuples mapping
                 pieces moved by this function to their original locations}
                 As produced by a call to getPlyResult"""
 
         self.flag_canCastle = undoDict['oldCastleFlags']
         self.flag_enpassant = undoDict['oldEnPassantFlags']
+        self.drawCounter = undoDict['oldDrawCounter']
+        self.positionHistory.pop()
 
         for pieceRestoration in undoDict['movedPieces']:
             self[pieceRestoration[1]] = pieceRestoration[0]
@@ -883,25 +1138,74 @@ class ChessBoard(object):
                  Otherwise, return None.
                  NOTE: multiple pieces may cause check but only one is returned
 
-        Finds the location of the king of the given color, and checks whether
-        any of the other player's non-king pieces could legally move to that
-        location."""
+        Finds the location of the king of the given color (cached), and
+        checks whether any of the other player's pieces attacks it."""
 
         # Locate given player's king
         kingPosn = self.__isLegalMove_findKings(color)
 
-        # Check if any enemy piece can legally move to the king's location
+        # Look outward from the king for an enemy piece attacking it
         other = ChessBoard.getOtherColor(color)  # Determine enemy's color
-        for loc in self.getPiecesOfColor(other):
-            # If a move to the king's location is legal, the king is in check
-            if self.__isLegal_IsPieceMovementInPattern(other, loc, kingPosn):
-                ChessBoard._logger.debug("Found that %s is in check", color)
-                return loc
+        loc = self.pieceAttackingSquare(other, kingPosn)
+        if loc is not None:
+            ChessBoard._logger.debug("Found that %s is in check", color)
+            return loc
 
-        # If 0 of enemy's pieces can move to king's location, king not in check
+        # If 0 of enemy's pieces attack the king's location, not in check
         ChessBoard._logger.debug("Found that %s is not in check", color)
         return None
 
+    def pieceAttackingSquare(self, color, posn):
+        """Return the position of a piece of the given color attacking posn
+
+        @param color: The color of the attacking pieces, ChessMatch.WHITE or
+        ChessMatch.BLACK
+        @param posn: The square to check, as a ChessPosn
+
+        @return: A posn of a piece of the given color that could capture on
+                 the square, or None if there is none.
+                 NOTE: multiple pieces may attack but only one is returned
+
+        Looks outward from the square rather than at every piece: along each
+        rank, file and diagonal to the nearest piece, then at the few squares
+        a knight, king or pawn could attack it from. Castling and en passant
+        never capture on the square, so they are not considered."""
+
+        layout = self.layout
+        size = ChessBoard.BOARD_LAYOUT_SIZE
+        (rankN, fileN) = (posn.rankN, posn.fileN)
+
+        # Rooks, bishops and queens: the nearest piece along each ray
+        for ((deltaRank, deltaFile), sliders) in _ATTACK_RAYS:
+            r = rankN + deltaRank
+            f = fileN + deltaFile
+            while 0 <= r < size and 0 <= f < size:
+                piece = layout[r][f]
+                if piece is not None:
+                    if piece.color == color and piece.pieceType in sliders:
+                        return ChessPosn(r, f)
+                    break
+                r += deltaRank
+                f += deltaFile
+
+        # Knights, kings and pawns: fixed offsets from the square (pawns
+        # attack diagonally forward, so are found diagonally behind it)
+        pawnDeltaRank = -1 if color == ChessBoard.WHITE else 1
+        for (offsets, pieceType) in [(_KNIGHT_JUMPS, ChessBoard.KNGT),
+                                     (_KING_STEPS, ChessBoard.KING),
+                                     ([(pawnDeltaRank, -1),
+                                       (pawnDeltaRank, 1)], ChessBoard.PAWN)]:
+            for (deltaRank, deltaFile) in offsets:
+                r = rankN + deltaRank
+                f = fileN + deltaFile
+                if 0 <= r < size and 0 <= f < size:
+                    piece = layout[r][f]
+                    if (piece is not None and piece.color == color and
+                        piece.pieceType == pieceType):
+                        return ChessPosn(r, f)
+
+        return None
+
     def getPiecesOfColor(self, color):
         """Return a list of positions where the given color has pieces
 
@@ -909,106 +1213,154 @@ class ChessBoard(object):
 
         @return: a list of ChessPosns enumerating pieces of the given color"""
 
+        # Read the layout directly, building ChessPosns only for the pieces
         pieceLocations = []
-        for rankN in xrange(ChessBoard.BOARD_LAYOUT_SIZE):
-            for fileN in xrange(ChessBoard.BOARD_LAYOUT_SIZE):
-                posn = ChessPosn(rankN, fileN)
-                piece = self[posn]
+        for (rankN, row) in enumerate(self.layout):
+            for (fileN, piece) in enumerate(row):
                 if piece is not None and piece.color == color:
-                    pieceLocations.append(posn)
+                    pieceLocations.append(ChessPosn(rankN, fileN))
         return pieceLocations
 
-    def isKingCheckmated(self, color):
-        """Returns True if the given color is in checkmate on this board
+    def resetPositionHistory(self, colorToMove):
+        """Start the position history at the current position
 
-        @param color: The color of the player to check, ChessMatch.WHITE or
-        ChessMatch.BLACK
-
-        @return True if the given color is in checkmate, False otherwise
+        @param colorToMove: the color whose turn it is"""
+        self.positionHistory = [self.getPositionHash(colorToMove)]
 
-        -Check if any of the given color's pieces can take the enemy piece
-        checking the king
+    def getRepetitionCount(self):
+        """Return how many times the current position occurred before
 
-        -Check if any of the given color's pieces can move in between their
-        king and the piece checking him
+        Only the positions since the last capture or pawn move can repeat
+        the current one, so the position history is searched back only
+        drawCounter plies, and only every other ply (with the same color to
+        move). The current position is the last of positionHistory.
 
-        -Check if the king can legally move
+        @return: the number of earlier occurrences (0 if none)"""
 
-        If any of the above checks passes, see if that move would produce a
-        board where the given color king was not in check. If one does, then
-        there is no checkmate."""
-
-        # Pull out the rank and file of piece checking king if any
-        checkPiecePosn = self.pieceCheckingKing(color)
-
-        # Check that the king is in check
-        if checkPiecePosn is None:
-            return False
+        history = self.positionHistory
+        if not history:
+            return 0
+        current = history[-1]
+        oldestN = max(0, len(history) - 1 - self.drawCounter)
+        count = 0
+        for positionN in xrange(len(history) - 3, oldestN - 1, -2):
+            if history[positionN] == current:
+                count += 1
+        return count
 
-        # TODO (James): Verify this function's functionality
+    def isDrawnByRule(self, repetitions=2):
+        """Return True if the game is drawn by the 50-move rule or repetition
 
-        # Find the king whose checkmate status is in question
-        chkdKingLoc = self.__isLegalMove_findKings(color)
+        @param repetitions: the number of earlier occurrences of the current
+                            position that draw the game (2 for threefold
+                            repetition)"""
+        return (self.drawCounter >= ChessBoard.FIFTY_MOVE_PLIES or
+                self.getRepetitionCount() >= repetitions)
 
-        # Get a list of locations that, if moved to, might alleviate check
-        interruptLocations = ChessBoard.__isLegal_getInterruptSquares(
-                                                             checkPiecePosn,
-                                                             chkdKingLoc)
-        # Get locations of all this player's non-king pieces
-        myPieceLocs = self.getPiecesOfColor(color)
-
-        # Iterate through pieces, and see if any can move to potential check-
-        # alleviating squares
-        for pieceLoc in myPieceLocs:
-            if pieceLoc != chkdKingLoc:
-                for intrpt in interruptLocations:
+    def isKingCheckmated(self, color):
+        """Returns True if the given color is in checkmate on this board
 
-                    # Check if the piece can move to this interrupt square
-                    if self.isLegalMove(color, pieceLoc, intrpt):
+        @param color: The color of the player to check, ChessMatch.WHITE or
+        ChessMatch.BLACK
 
-                        # Generate the board that such a move would produce
-                        boardMoveUndoDict = self.getPlyResult(pieceLoc, intrpt)
-                        # Check if the given color is still in check
-                        # If not, that color is not in checkmate
+        @return True if the given color is in checkmate, False otherwise
 
-                        isNotInCheck = self.pieceCheckingKing(color) is None
+        See gameState."""
+        return self.gameState(color) == ChessBoard.GAME_CHECKMATE
 
-                        # Undo the hypothetical move
-                        self.undoPlyResult(boardMoveUndoDict)
+    def gameState(self, colorToMove):
+        """Return whether the game is over, with the given color to move
 
-                        # Perform the check
-                        if isNotInCheck:
-                            return False
+        @param colorToMove: The color of the player to move, ChessMatch.WHITE
+        or ChessMatch.BLACK
 
-        possibleKingMoves = []  # List of tuples of possible king moves
+        @return: GAME_CHECKMATE or GAME_STALEMATE if the color has no legal
+                 move (and is or is not in check, respectively), and
+                 GAME_ONGOING otherwise
 
-        # If no alleviating moves found, enumerate king's possible moves
-        for r in range(chkdKingLoc.rankN - 1, chkdKingLoc.rankN + 2):
-            for f in range(chkdKingLoc.fileN - 1, chkdKingLoc.fileN + 2):
-                kingMove = ChessPosn(r, f)
-                # Build ChessPosn object to append to list
-                if kingMove != chkdKingLoc:
-                    possibleKingMoves.append(kingMove)
+        Looks for a legal move, stopping at the first one found. Results are
+        remembered by position hash (see getPositionHash), for every board,
+        so the search, the likability heuristics and ChessMatch share them.
+        Draws by the 50-move rule are not considered here."""
 
-        # For each possible king move, test if it is legal.
-        for kingMove in possibleKingMoves:
+        positionHash = self.getPositionHash(colorToMove)
+        state = _GAME_STATES.get(positionHash)
+        if state is not None:
+            _GAME_STATE_PROBES["hits"] += 1
+            return state
+        _GAME_STATE_PROBES["misses"] += 1
 
-            if self.isLegalMove(color, chkdKingLoc, kingMove):
-                # Generate the board that such a move would produce
-                boardMoveUndoDict = self.getPlyResult(chkdKingLoc, kingMove)
+        if self.__gameState_hasLegalMove(colorToMove):
+            state = ChessBoard.GAME_ONGOING
+        elif self.pieceCheckingKing(colorToMove) is not None:
+            state = ChessBoard.GAME_CHECKMATE
+        else:
+            state = ChessBoard.GAME_STALEMATE
 
-                # Restore the previous state of the board
-                self.undoPlyResult(boardMoveUndoDict)
+        # Forget everything once the cache is full, rather than track use
+        if len(_GAME_STATES) >= ChessBoard.GAME_STATE_CACHE_SIZE:
+            _GAME_STATES.clear()
+        _GAME_STATES[positionHash] = state
 
-                # Check if the given color is still in check after the move
-                if self.pieceCheckingKing(color) is None:
-                    logStrF = "Found that %s is not in checkmate"
-                    ChessBoard._logger.debug(logStrF, color)
-                    return False
+        ChessBoard._logger.debug("Found game state %s for %s", state,
+                                 colorToMove)
+        return state
 
-        # No possible moves out of check - given color is in checkmate
-        ChessBoard._logger.debug("Found that %s is in checkmate", color)
-        return True
+    @staticmethod
+    def getGameStateCacheCounts():
+        """Return how often gameState has found its answer remembered
+
+        @return: a dict of form {"hits": n, "misses": n}, counting calls to
+                 gameState since the process started"""
+        return dict(_GAME_STATE_PROBES)
+
+    def __gameState_hasLegalMove(self, color):
+        """Return True if the given color has any legal move on this board"""
+        for fromPosn in self.getPiecesOfColor(color):
+            for toPosn in self.__gameState_getCandidateSquares(fromPosn):
+                if self.isLegalMove(color, fromPosn, toPosn):
+                    return True
+        return False
+
+    def __gameState_getCandidateSquares(self, fromPosn):
+        """Return the squares the piece at fromPosn might move to
+
+        Only the shape of the piece's moves is considered, and sliding pieces
+        stop at the first piece in each direction; isLegalMove decides the
+        rest."""
+
+        size = ChessBoard.BOARD_LAYOUT_SIZE
+        piece = self[fromPosn]
+        (rankN, fileN) = (fromPosn.rankN, fromPosn.fileN)
+
+        if piece.pieceType in [ChessBoard.ROOK, ChessBoard.BISH,
+                               ChessBoard.QUEN]:
+            squares = []
+            for ((deltaRank, deltaFile), sliders) in _ATTACK_RAYS:
+                if piece.pieceType not in sliders:
+                    continue
+                r = rankN + deltaRank
+                f = fileN + deltaFile
+                while 0 <= r < size and 0 <= f < size:
+                    squares.append(ChessPosn(r, f))
+                    if self.layout[r][f] is not None:
+                        break
+                    r += deltaRank
+                    f += deltaFile
+            return squares
+
+        if piece.pieceType == ChessBoard.KNGT:
+            offsets = _KNIGHT_JUMPS
+        elif piece.pieceType == ChessBoard.KING:
+            offsets = _KING_STEPS + [(0, -2), (0, 2)]  # With castling
+        else:
+            pawnDir = 1 if piece.color == ChessBoard.WHITE else -1
+            offsets = [(pawnDir, 0), (2 * pawnDir, 0),
+                       (pawnDir, -1), (pawnDir, 1)]
+        return [ChessPosn(rankN + deltaRank, fileN + deltaFile)
+                for (deltaRank, deltaFile) in offsets
+                if 0 <= rankN + deltaRank < size and
+                0 <= fileN + deltaFile < size]
 
     @staticmethod
     def __isLegal_getSquaresInPath(fromPosn, toPosn):
@@ -1085,6 +1437,72 @@ class ChessBoard(object):
         return pathPosns
 
 
+def _makeFENSquares():
+    """Return a mapping from each FEN placement character to the squares it
+    stands for, as a list of (shared) ChessPieces or Nones"""
+    squares = dict([(str(count), [None] * count)
+                    for count in xrange(1, ChessBoard.BOARD_LAYOUT_SIZE + 1)])
+    for (pieceType, letter) in ChessBoard.FEN_PIECE_LETTERS.iteritems():
+        squares[letter] = [ChessPiece(ChessBoard.WHITE, pieceType)]
+        squares[letter.lower()] = [ChessPiece(ChessBoard.BLACK, pieceType)]
+    return squares
+
+_FEN_SQUARES = _makeFENSquares()
+
+_KING_STEPS = [(deltaRank, deltaFile) for deltaRank in [-1, 0, 1]
+               for deltaFile in [-1, 0, 1] if deltaRank or deltaFile]
+"""Offsets of the squares a king attacks"""
+
+_KNIGHT_JUMPS = [(deltaRank, deltaFile) for deltaRank in [-2, -1, 1, 2]
+                 for deltaFile in [-2, -1, 1, 2]
+                 if abs(deltaRank) != abs(deltaFile)]
+"""Offsets of the squares a knight attacks"""
+
+_ATTACK_RAYS = [((deltaRank, deltaFile),
+                 (ChessBoard.BISH, ChessBoard.QUEN) if deltaRank and deltaFile
+                 else (ChessBoard.ROOK, ChessBoard.QUEN))
+                for (deltaRank, deltaFile) in _KING_STEPS]
+"""Directions of the rays from a square, with the piece types attacking
+along each"""
+
+# Mapping of position hashes (with the color to move) to game states, shared
+# by all boards (see ChessBoard.gameState)
+_GAME_STATES = {}
+
+# Counts of the calls to ChessBoard.gameState that found their position in
+# _GAME_STATES, and of those that did not
+_GAME_STATE_PROBES = {"hits": 0, "misses": 0}
+
+_ZOBRIST_SEED = 0x4d617665
+"""Seed of the Zobrist keys (changing it invalidates stored hashes)"""
+
+
+def _makeZobristKeys():
+    """Return the keys used by ChessBoard.getPositionHash
+
+    @return: a tuple of form (pieceKeys, castleKeys, enpassantKeys,
+             blackToMoveKey), where pieceKeys maps (color, pieceType) to a
+             list of keys indexed by rankN * 8 + fileN, castleKeys maps colors
+             to (queenSideKey, kingSideKey) and enpassantKeys is indexed by
+             file"""
+    rng = random.Random(_ZOBRIST_SEED)
+    numSquares = ChessBoard.BOARD_LAYOUT_SIZE ** 2
+    pieceKeys = {}
+    for color in [ChessBoard.WHITE, ChessBoard.BLACK]:
+        for pieceType in sorted(ChessBoard.FEN_PIECE_LETTERS):
+            pieceKeys[(color, pieceType)] = [rng.getrandbits(64)
+                                             for _ in xrange(numSquares)]
+    castleKeys = {}
+    for color in [ChessBoard.WHITE, ChessBoard.BLACK]:
+        castleKeys[color] = (rng.getrandbits(64), rng.getrandbits(64))
+    enpassantKeys = [rng.getrandbits(64)
+                     for _ in xrange(ChessBoard.BOARD_LAYOUT_SIZE)]
+    return (pieceKeys, castleKeys, enpassantKeys, rng.getrandbits(64))
+
+(_ZOBRIST_PIECE_KEYS, _ZOBRIST_CASTLE_KEYS, _ZOBRIST_ENPASSANT_KEYS,
+ _ZOBRIST_BLACK_TO_MOVE_KEY) = _makeZobristKeys()
+
+
 class ChessBoardUtils(object):
     """Utilities for use with given ChessBoard objects"""
 
@@ -1126,10 +1544,13 @@ class ChessMatch(object):
     STATUS_DRAWN = "W_DRAWN"  # White won the game
     STATUS_CANCELLED = "CANCELD"  # Game was halted early
 
-    def __init__(self, firstPlayerID=None, p1ReqFreshStart=True):
+    def __init__(self, firstPlayerID=None, p1ReqFreshStart=True,
+                 firstPlayerColor=None):
         """Initialize a new chess match with initial state
 
-        @param firstPlayerID: if set, randomly assigned to black or white"""
+        @param firstPlayerID: if set, randomly assigned to black or white
+        @param firstPlayerColor: if set, the color of firstPlayerID instead
+                                 of a random one"""
         # TODO: ## TODO p1ReqFreshStart
 
         # Initialize blankly (new chess board when both players have joined)
@@ -1139,7 +1560,9 @@ class ChessMatch(object):
         self.players = {ChessBoard.WHITE: None, ChessBoard.BLACK: None}
 
         # Randomly set black or white to firstPlayerID (no-op if not specified)
-        self.players[random.choice(self.players.keys())] = firstPlayerID
+        if firstPlayerColor is None:
+            firstPlayerColor = random.choice(self.players.keys())
+        self.players[firstPlayerColor] = firstPlayerID
 
         # Initialize match status
         self.status = ChessMatch.STATUS_PENDING
@@ -1147,9 +1570,26 @@ class ChessMatch(object):
         # Initialize ply history -- a list of (moveFrom, moveTo) plies
         self.history = []
 
+        # Monotonic counter, incremented whenever the match state changes
+        self.stateVersion = 0
+
+        # State version at which each ply in history was appended (parallel
+        # to self.history, and therefore sorted)
+        self.historyVersions = []
+
+        # State version at which the board was initialized (None until then)
+        self.boardVersion = None
+
+        # Times (from time.time()) at which the match started and finished
+        self.startedAt = None
+        self.finishedAt = None
+
         # True if game should start with a blank board
         self.freshStartP = p1ReqFreshStart
 
+        # FEN of the board the game started with (None until initialized)
+        self.startFEN = None
+
         # Number of moves remaining until 50-move draw kicks in
         self.drawCounter = 50
 
@@ -1163,6 +1603,30 @@ class ChessMatch(object):
         else:
             return ChessBoard.BLACK
 
+    def _bumpStateVersion(self):
+        """Note that the state of this match has changed
+
+        @return: the new state version"""
+        self.stateVersion += 1
+        return self.stateVersion
+
+    def getPliesSince(self, sinceVersion):
+        """Return the plies appended to the history after the given version
+
+        @param sinceVersion: a state version previously reported by this match
+
+        @return: a tuple of form (startIndex, plies) where plies is the list
+                of (fromPosn, toPosn) tuples appended after sinceVersion and
+                startIndex is the index of the first of them in self.history"""
+        startIndex = bisect.bisect_right(self.historyVersions, sinceVersion)
+        return (startIndex, self.history[startIndex:])
+
+    def cancel(self):
+        """Mark this match as cancelled"""
+        self.status = ChessMatch.STATUS_CANCELLED
+        self.finishedAt = time.time()
+        self._bumpStateVersion()
+
     def getColorOfPlayer(self, playerID):
         """Returns the color of the player (None if player is not in game)"""
         if playerID == self.players[ChessBoard.WHITE]:
@@ -1176,55 +1640,106 @@ class ChessMatch(object):
         """Makes a move if legal
 
         @return: "SUCCESS" if move was successful, error message otherwise"""
-        if self.status == ChessMatch.STATUS_ONGOING:
-            if (self.players[ChessBoard.WHITE] == player):
-                color = ChessBoard.WHITE
-            elif (self.players[ChessBoard.BLACK] == player):
-                color = ChessBoard.BLACK
-            else:
-                return "You are not a player in this game"
-
-            if color != self.whoseTurn():
-                return "It is not your turn"
-
-            moveLegal = self.board.makePly(color, fromPosn, toPosn)
-
-            # Check if move was made
-            if moveLegal:
-                # Log this ply
-                self.history.append((fromPosn, toPosn))
-                logStrF = "Added %s -> %s to match history"
-                ChessMatch._logger.debug(logStrF, fromPosn, toPosn)
-
-                # Check for check-mates, draws, etc
-                ChessMatch._logger.debug("Checking for end of game")
-                if self.board.isKingCheckmated(ChessBoard.WHITE):
-                    self.status = ChessMatch.STATUS_BLACK_WON
-                elif self.board.isKingCheckmated(ChessBoard.BLACK):
-                    self.status = ChessMatch.STATUS_WHITE_WON
-                elif self.__makePly_forcedDrawP():
-                    self.status = ChessMatch.STATUS_DRAWN
-
-                return "SUCCESS"
-            else:
-                return "Illegal move"
+        (color, errMsg) = self.checkPly(player)
+        if errMsg is not None:
+            return errMsg
+
+        (board, status) = self.computePly(color, fromPosn, toPosn,
+                                          board=self.board)
+        if board is None:
+            return "Illegal move"
+
+        return self.commitPly(fromPosn, toPosn, board, status)
+
+    def checkPly(self, player):
+        """Check whether the given player may make a ply now
+
+        @return: a tuple of form (color, errMsg), where errMsg is None if the
+                 player may move and color is the player's color"""
+        if self.status != ChessMatch.STATUS_ONGOING:
+            return (None, "Game not in progress")
+
+        if (self.players[ChessBoard.WHITE] == player):
+            color = ChessBoard.WHITE
+        elif (self.players[ChessBoard.BLACK] == player):
+            color = ChessBoard.BLACK
         else:
+            return (None, "You are not a player in this game")
+
+        if color != self.whoseTurn():
+            return (color, "It is not your turn")
+
+        return (color, None)
+
+    def computePly(self, color, fromPosn, toPosn, board=None):
+        """Validate a ply and find the resulting status of the game
+
+        Does not change this match, so (when given no board) may be run
+        outside of the thread that owns the match.
+
+        @param color: the color of the player making the ply
+        @param board: the board to make the ply on (default: a copy of the
+                      match's board)
+        @return: a tuple of form (board, status), where board is the board
+                 after the ply (None if the ply is illegal) and status is
+                 the status of the game after the ply"""
+
+        if board is None:
+            current = self.board
+            board = ChessBoard(startLayout=current.layout,
+                               startEnpassantFlags=current.flag_enpassant,
+                               startCanCastleFlags=current.flag_canCastle,
+                               drawCounter=current.drawCounter,
+                               positionHistory=current.positionHistory)
+
+        if not board.makePly(color, fromPosn, toPosn):
+            return (None, self.status)
+
+        # Check for check-mates, draws, etc
+        ChessMatch._logger.debug("Checking for end of game")
+        gameState = board.gameState(ChessBoard.getOtherColor(color))
+        if gameState == ChessBoard.GAME_CHECKMATE:
+            status = (ChessMatch.STATUS_WHITE_WON
+                      if color == ChessBoard.WHITE
+                      else ChessMatch.STATUS_BLACK_WON)
+        elif gameState == ChessBoard.GAME_STALEMATE:
+            status = ChessMatch.STATUS_DRAWN
+        elif board.isDrawnByRule():
+            status = ChessMatch.STATUS_DRAWN
+        else:
+            status = ChessMatch.STATUS_ONGOING
+
+        return (board, status)
+
+    def commitPly(self, fromPosn, toPosn, board, status):
+        """Record a ply computed by computePly
+
+        @param board: the board after the ply
+        @param status: the status of the game after the ply
+        @return: "SUCCESS" if the ply was recorded, error message otherwise"""
+        if self.status != ChessMatch.STATUS_ONGOING:
             return "Game not in progress"
 
-    def __makePly_forcedDrawP(self):
-        # 51 rather than 50 to allow for the player to check-mate on 50th move
-        # After that, a smart player would have asked for a draw if beneficial
-        fiftyMovesDraw = self.board.drawCounter >= 51
+        self.board = board
+
+        # Log this ply
+        self.history.append((fromPosn, toPosn))
+        self.historyVersions.append(self._bumpStateVersion())
+        logStrF = "Added %s -> %s to match history"
+        ChessMatch._logger.debug(logStrF, fromPosn, toPosn)
 
-        # TODO (mattsh): also check for three-fold repetition
-        threeFoldRepetition = False
+        self.status = status
+        if self.status != ChessMatch.STATUS_ONGOING:
+            self.finishedAt = time.time()
 
-        return fiftyMovesDraw or threeFoldRepetition
+        return "SUCCESS"
 
-    def join(self, playerID, p2ReqFreshStart=True):
+    def join(self, playerID, p2ReqFreshStart=True, board=None):
         """Joins the match in an empty slot. If ready, game starts.
 
         @param playerID: ID of the player being added
+        @param board: if set, the board to start the game with (instead of
+                      one chosen according to the fresh start preferences)
         @return: color constant if successful, None otherwise"""
 
         if self.status != ChessMatch.STATUS_PENDING:
@@ -1237,11 +1752,14 @@ class ChessMatch(object):
             for color in [ChessBoard.WHITE, ChessBoard.BLACK]:
                 if self.players[color] is None:
                     self.players[color] = playerID
+                    self._bumpStateVersion()
                     if None not in self.players.itervalues():
                         self.status = ChessMatch.STATUS_ONGOING
 
                         self.freshStartP = self.freshStartP or p2ReqFreshStart
-                        if self.freshStartP:
+                        if board is not None:
+                            self.board = board
+                        elif self.freshStartP:
                             self.board = ChessBoard()
                         else:
                             ###################################################
@@ -1253,6 +1771,10 @@ class ChessMatch(object):
                             from maverick.data.utils import getMidGameBoard
                             self.board = getMidGameBoard()
                             del getMidGameBoard
+                        self.board.resetPositionHistory(ChessBoard.WHITE)
+                        self.startFEN = self.board.toFEN()
+                        self.boardVersion = self.stateVersion
+                        self.startedAt = time.time()
                     retVal = color
             ChessMatch._logger.debug("Joined player %d to this game", playerID)
             return retVal
@@ -0,0 +1,433 @@
+#!/usr/bin/python
+
+"""journal.py: Write-ahead log and snapshots of a Maverick tournament"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import logging
+import os
+import pickle
+import re
+import struct
+import time
+import zlib
+
+from maverick.data.structs import ChessBoard
+from maverick.wire import decodeBoard
+from maverick.wire import decodeMove
+from maverick.wire import encodeBoard
+from maverick.wire import encodeMove
+
+from twisted.internet import task
+from twisted.internet import threads
+
+__all__ = ["Journal",
+           "JournalSnapshotter",
+           "MaverickJournalException",
+           "readRecords",
+           "replayRecords",
+           "buildSnapshot",
+           "recover"]
+
+# Overview of the journal
+#
+# A journal directory holds numbered log segments (journal.000001.log, ...)
+# and at most one snapshot (snapshot.pickle). The snapshot is a pickled dict
+# holding a TournamentSystem and the number of the last segment whose
+# records it includes. Recovering replays the remaining segments, in order,
+# on top of the snapshot.
+#
+# Each segment is a sequence of records, each made up of a 4-byte length and
+# a 4-byte CRC32 of the payload, followed by the payload. A payload is a
+# 1-byte record type, an 8-byte timestamp, and the record's fields. A
+# truncated or corrupt record ends the segment (it was being written when
+# the server stopped).
+
+RECORD_REGISTER = "R"
+"""Record of a new player: (playerID, name)"""
+
+RECORD_RATING = "S"
+"""Record of a rating change: (playerID, rating or None)"""
+
+RECORD_JOIN = "J"
+"""Record of a join: (playerID, gameID, startFreshP, color, board or None)
+
+The board is set iff the join started the game"""
+
+RECORD_PLY = "P"
+"""Record of a legal ply: (playerID, gameID, fromRank, fromFile, toRank,
+toFile)"""
+
+RECORD_CANCEL = "C"
+"""Record of a cancelled game: (gameID,)"""
+
+RECORD_ARCHIVE = "A"
+"""Record of a game moved to the archive: (gameID,)"""
+
+
+class MaverickJournalException(Exception):
+    """Raised when the journal cannot be recovered"""
+    pass
+
+
+_FRAME_HEADER = struct.Struct("!II")
+_PAYLOAD_HEADER = struct.Struct("!cd")
+_REGISTER = struct.Struct("!I")
+_RATING = struct.Struct("!Id")
+_JOIN = struct.Struct("!IIBBB")
+_PLY = struct.Struct("!IIH")
+_GAME = struct.Struct("!I")
+
+_COLOR_CODES = {ChessBoard.WHITE: 0, ChessBoard.BLACK: 1}
+_COLOR_NAMES = dict((v, k) for (k, v) in _COLOR_CODES.iteritems())
+
+SNAPSHOT_NAME = "snapshot.pickle"
+"""Name of the snapshot file within a journal directory"""
+
+_SEGMENT_NAME_F = "journal.{0:06d}.log"
+_SEGMENT_NAME_RE = re.compile(r"^journal\.(\d+)\.log$")
+
+
+def _getSegmentPath(directory, segmentN):
+    """Return the path of the given log segment"""
+    return os.path.join(directory, _SEGMENT_NAME_F.format(segmentN))
+
+
+def _listSegments(directory):
+    """Return the sorted numbers of the log segments in the directory"""
+    segments = []
+    for name in os.listdir(directory):
+        match = _SEGMENT_NAME_RE.match(name)
+        if match:
+            segments.append(int(match.group(1)))
+    return sorted(segments)
+
+
+def _fsyncDirectory(directory):
+    """Make renames and new files in the directory durable"""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Journal(object):
+    """Appends records of tournament changes to a log segment
+
+    Records are buffered and only reach the disk when sync is called (at
+    most one sync interval of changes can be lost in a crash)."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.journal.Journal")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, directory, segmentN):
+        """Open the given log segment for appending
+
+        @param directory: the journal directory
+        @param segmentN: the number of the segment to append to"""
+        self.directory = directory
+        self.segmentN = segmentN
+        self._fd = open(_getSegmentPath(directory, segmentN), "ab")
+        self._dirtyP = False
+        self.numRecords = 0  # Number of records appended to this segment
+
+    def _append(self, recordType, body):
+        """Append a record of the given type with the given packed fields"""
+        payload = _PAYLOAD_HEADER.pack(recordType, time.time()) + body
+        crc = zlib.crc32(payload) & 0xFFFFFFFF
+        self._fd.write(_FRAME_HEADER.pack(len(payload), crc) + payload)
+        self._dirtyP = True
+        self.numRecords += 1
+
+    def logRegister(self, playerID, name):
+        """Record the registration of a new player"""
+        self._append(RECORD_REGISTER,
+                     _REGISTER.pack(playerID) + name.encode("utf-8"))
+
+    def logRating(self, playerID, rating):
+        """Record a change to (or clearing of) a player's rating"""
+        rating = float("nan") if rating is None else float(rating)
+        self._append(RECORD_RATING, _RATING.pack(playerID, rating))
+
+    def logJoin(self, playerID, gameID, startFreshP, color, board):
+        """Record a player joining a game
+
+        @param board: the game's initial board if the join started the game,
+                      None otherwise"""
+        body = _JOIN.pack(playerID, gameID, bool(startFreshP),
+                          _COLOR_CODES[color], board is not None)
+        if board is not None:
+            body += encodeBoard(board)
+        self._append(RECORD_JOIN, body)
+
+    def logPly(self, playerID, gameID, fromRank, fromFile, toRank, toFile):
+        """Record a legal ply"""
+        self._append(RECORD_PLY,
+                     _PLY.pack(playerID, gameID,
+                               encodeMove(fromRank, fromFile, toRank, toFile)))
+
+    def logCancel(self, gameID):
+        """Record the cancellation of a game"""
+        self._append(RECORD_CANCEL, _GAME.pack(gameID))
+
+    def logArchive(self, gameID):
+        """Record that a game was moved to the archive"""
+        self._append(RECORD_ARCHIVE, _GAME.pack(gameID))
+
+    def sync(self):
+        """Write all buffered records to disk"""
+        if self._dirtyP:
+            self._fd.flush()
+            os.fsync(self._fd.fileno())
+            self._dirtyP = False
+
+    def rotate(self):
+        """Sync and close the current segment and start appending to a new one
+
+        @return: the number of the closed segment"""
+        self.sync()
+        self._fd.close()
+        closedN = self.segmentN
+        self.segmentN += 1
+        self._fd = open(_getSegmentPath(self.directory, self.segmentN), "ab")
+        self.numRecords = 0
+        _fsyncDirectory(self.directory)
+        Journal._logger.debug("Rotated journal to segment %d", self.segmentN)
+        return closedN
+
+    def close(self):
+        """Sync and close the current segment"""
+        self.sync()
+        self._fd.close()
+
+
+def readRecords(path):
+    """Generate the records in a log segment as (type, timestamp, fields)
+
+    Stops at the first truncated or corrupt record."""
+
+    with open(path, "rb") as fd:
+        data = fd.read()
+
+    offset = 0
+    while offset + _FRAME_HEADER.size <= len(data):
+        (length, crc) = _FRAME_HEADER.unpack_from(data, offset)
+        start = offset + _FRAME_HEADER.size
+        payload = data[start:start + length]
+        if (len(payload) != length or
+                zlib.crc32(payload) & 0xFFFFFFFF != crc):
+            break
+
+        (recordType, timestamp) = _PAYLOAD_HEADER.unpack_from(payload)
+        body = payload[_PAYLOAD_HEADER.size:]
+        if recordType == RECORD_REGISTER:
+            (playerID,) = _REGISTER.unpack_from(body)
+            fields = (playerID, body[_REGISTER.size:].decode("utf-8"))
+        elif recordType == RECORD_RATING:
+            (playerID, rating) = _RATING.unpack(body)
+            fields = (playerID, None if rating != rating else rating)
+        elif recordType == RECORD_JOIN:
+            (playerID, gameID, startFreshP, colorCode, hasBoardP) = \
+                _JOIN.unpack_from(body)
+            board = None
+            if hasBoardP:
+                board = decodeBoard(body, _JOIN.size)
+            fields = (playerID, gameID, bool(startFreshP),
+                      _COLOR_NAMES[colorCode], board)
+        elif recordType == RECORD_PLY:
+            (playerID, gameID, move) = _PLY.unpack(body)
+            fields = (playerID, gameID) + decodeMove(move)
+        elif recordType in [RECORD_CANCEL, RECORD_ARCHIVE]:
+            fields = _GAME.unpack(body)
+        else:
+            raise MaverickJournalException("Unknown record type in " + path)
+
+        yield (recordType, timestamp, fields)
+        offset = start + length
+
+    if offset != len(data):
+        Journal._logger.warning("Ignoring %d bytes at the end of %s",
+                                len(data) - offset, path)
+
+
+def replayRecords(tournament, records):
+    """Apply journal records to a tournament that has no journal attached"""
+
+    for (recordType, timestamp, fields) in records:
+        if recordType == RECORD_REGISTER:
+            (playerID, name) = fields
+            if tournament.register(name)[1]["playerID"] != playerID:
+                raise MaverickJournalException("Journal does not match "
+                                               "snapshot (player IDs differ)")
+        elif recordType == RECORD_RATING:
+            tournament.setRating(*fields)
+        elif recordType == RECORD_JOIN:
+            tournament._replayJoin(*fields, timestamp=timestamp)
+        elif recordType == RECORD_PLY:
+            gameID = fields[1]
+            (successP, result) = tournament.makePly(*fields)
+            if not successP:
+                raise MaverickJournalException("Journaled ply failed in game "
+                                               "{0}: {1}".format(gameID,
+                                                                 result))
+            tournament._replayFinishTime(gameID, timestamp)
+        elif recordType == RECORD_CANCEL:
+            (gameID,) = fields
+            tournament.cancelGame(gameID)
+            tournament._replayFinishTime(gameID, timestamp)
+        elif recordType == RECORD_ARCHIVE:
+            (gameID,) = fields
+            tournament._replayArchive(gameID)
+
+
+def _loadSnapshot(directory):
+    """Return (lastSegment, tournament) from the snapshot, or (0, None)"""
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    if not os.path.exists(path):
+        return (0, None)
+    with open(path, "rb") as fd:
+        snapshot = pickle.load(fd)
+    return (snapshot["lastSegment"], snapshot["tournament"])
+
+
+def _writeSnapshot(directory, lastSegment, tournament):
+    """Atomically replace the snapshot with the given tournament"""
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as fd:
+        pickle.dump({"lastSegment": lastSegment, "tournament": tournament},
+                    fd, pickle.HIGHEST_PROTOCOL)
+        fd.flush()
+        os.fsync(fd.fileno())
+    os.rename(tmpPath, path)
+    _fsyncDirectory(directory)
+
+
+def buildSnapshot(directory, lastSegment):
+    """Fold closed log segments into the snapshot
+
+    Works on its own copy of the tournament (rebuilt from the old snapshot
+    and the segments), so it is safe to run in a thread while the server
+    keeps appending to a later segment. Segments folded into the snapshot
+    are deleted.
+
+    @param lastSegment: the number of the last closed segment to include"""
+
+    (snapshotSegment, tournament) = _loadSnapshot(directory)
+    if tournament is None:
+        raise MaverickJournalException("No snapshot in " + directory)
+
+    for segmentN in _listSegments(directory):
+        if snapshotSegment < segmentN <= lastSegment:
+            replayRecords(tournament,
+                          readRecords(_getSegmentPath(directory, segmentN)))
+
+    _writeSnapshot(directory, lastSegment, tournament)
+
+    for segmentN in _listSegments(directory):
+        if segmentN <= lastSegment:
+            os.remove(_getSegmentPath(directory, segmentN))
+
+    Journal._logger.info("Wrote snapshot including segments up to %d",
+                         lastSegment)
+
+
+def recover(directory, tournamentFactory):
+    """Rebuild a tournament from a journal directory and attach a journal
+
+    Creates the directory if needed.
+
+    @param tournamentFactory: callable returning a new, empty tournament
+                              (used if there is no snapshot yet)
+
+    @return: the recovered tournament, journaling to a new segment"""
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    (snapshotSegment, tournament) = _loadSnapshot(directory)
+    if tournament is None:
+        # Later snapshots are built on top of this one
+        tournament = tournamentFactory()
+        _writeSnapshot(directory, snapshotSegment, tournament)
+
+    segments = [n for n in _listSegments(directory) if n > snapshotSegment]
+    for segmentN in segments:
+        replayRecords(tournament,
+                      readRecords(_getSegmentPath(directory, segmentN)))
+
+    Journal._logger.info("Recovered from snapshot (up to segment %d) and %d "
+                         "more segments", snapshotSegment, len(segments))
+
+    # Never append to a segment that may end in a torn record
+    nextSegment = max([snapshotSegment] + segments) + 1
+    tournament.attachJournal(Journal(directory, nextSegment))
+    return tournament
+
+
+class JournalSnapshotter(object):
+    """Periodically syncs a journal and folds it into a snapshot
+
+    Snapshots are built in a thread from the files on disk, so the reactor
+    only pays for rotating the journal."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.journal.JournalSnapshotter")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, journal, syncInterval, snapshotInterval):
+        """Initialize for the given journal
+
+        @param syncInterval: seconds between syncs of the journal to disk
+        @param snapshotInterval: seconds between snapshots"""
+        self.journal = journal
+        self.syncInterval = syncInterval
+        self.snapshotInterval = snapshotInterval
+        self._snapshotRunningP = False
+
+    def start(self):
+        """Start syncing and snapshotting (requires a running reactor)"""
+        task.LoopingCall(self.journal.sync).start(self.syncInterval,
+                                                  now=False)
+        task.LoopingCall(self.snapshot).start(self.snapshotInterval,
+                                              now=False)
+
+    def snapshot(self):
+        """Rotate the journal and build a snapshot in a thread
+
+        Does nothing if the previous snapshot is still being built or if
+        nothing has been journaled since the last snapshot.
+
+        @return: a Deferred firing when the snapshot is written, or None"""
+
+        if self._snapshotRunningP:
+            JournalSnapshotter._logger.warning("Skipping snapshot (previous "
+                                               "one still running)")
+            return None
+        elif self.journal.numRecords == 0:
+            return None
+
+        self._snapshotRunningP = True
+        lastSegment = self.journal.rotate()
+        d = threads.deferToThread(buildSnapshot, self.journal.directory,
+                                  lastSegment)
+        d.addErrback(self._snapshotFailed)
+        d.addBoth(self._snapshotDone)
+        return d
+
+    def _snapshotFailed(self, failure):
+        JournalSnapshotter._logger.error("Snapshot failed: %s",
+                                         failure.getTraceback())
+
+    def _snapshotDone(self, _):
+        self._snapshotRunningP = False
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+
+"""matchmaking.py: Indexes of pending and active games for the server"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import collections
+import logging
+
+__all__ = ["MatchmakingQueue"]
+
+
+class MatchmakingQueue(object):
+    """Finds pending games for joining players in constant time
+
+    Pending games are kept in FIFO queues keyed by the fresh-start preference
+    of their first player and (optionally) by the rating band of that player.
+    Games that stop being pending are dropped lazily, as they reach the front
+    of their queue. Also keeps an index of the games each player is in."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.matchmaking.MatchmakingQueue")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, ratingBandWidth=None):
+        """Initialize empty queues
+
+        @param ratingBandWidth: if not None, players are only matched with
+                                games whose first player's rating falls in
+                                the same band of this width"""
+
+        self.ratingBandWidth = ratingBandWidth
+
+        # Dict from (startFreshP, ratingBand) to deque of pending gameIDs
+        self._pendingQueues = {}
+
+        # Dict from pending gameID to (queue key, ID of the waiting player)
+        self._pendingGames = {}
+
+        # Dict from playerID to set of gameIDs of their active games
+        self._activeGames = {}
+
+    def _getRatingBand(self, rating):
+        """Return the rating band of the given rating (None if not banded)"""
+        if self.ratingBandWidth is None or rating is None:
+            return None
+        else:
+            return int(rating // self.ratingBandWidth)
+
+    def addPendingGame(self, gameID, playerID, startFreshP, rating=None):
+        """Note a new game waiting for an opponent for the given player
+
+        @param gameID: the ID of the new game
+        @param playerID: the ID of the player waiting in the game
+        @param startFreshP: the player's fresh start preference
+        @param rating: the player's rating, if any"""
+
+        key = (bool(startFreshP), self._getRatingBand(rating))
+        self._pendingQueues.setdefault(key, collections.deque()).append(gameID)
+        self._pendingGames[gameID] = (key, playerID)
+
+    def removePendingGame(self, gameID):
+        """Stop offering the given game to joining players (if pending)"""
+        self._pendingGames.pop(gameID, None)
+
+    def popPendingGame(self, playerID, startFreshP, rating=None):
+        """Remove and return a pending game that the given player can join
+
+        Games with the same fresh start preference are preferred, but games
+        with the other preference are used if there are none.
+
+        @return: a gameID, or None if there is no suitable pending game"""
+
+        band = self._getRatingBand(rating)
+        for freshP in [bool(startFreshP), not startFreshP]:
+            queue = self._pendingQueues.get((freshP, band))
+            if queue is None:
+                continue
+
+            # Games the player is already waiting in are set aside
+            ownGames = []
+            gameID = None
+            while queue:
+                candidateID = queue.popleft()
+                if candidateID not in self._pendingGames:
+                    continue  # No longer pending - drop it
+                elif self._pendingGames[candidateID][1] == playerID:
+                    ownGames.append(candidateID)
+                else:
+                    gameID = candidateID
+                    break
+
+            # Put back the player's own games, in their original order
+            queue.extendleft(reversed(ownGames))
+
+            if gameID is not None:
+                del self._pendingGames[gameID]
+                return gameID
+
+        return None
+
+    def addActiveGame(self, playerID, gameID):
+        """Note that the given player is in the given game"""
+        self._activeGames.setdefault(playerID, set()).add(gameID)
+
+    def finishGame(self, gameID, playerIDs):
+        """Remove a finished (or cancelled) game from all indexes
+
+        @param playerIDs: the IDs of the players in the game"""
+
+        self.removePendingGame(gameID)
+        for playerID in playerIDs:
+            games = self._activeGames.get(playerID)
+            if games is not None:
+                games.discard(gameID)
+                if not games:
+                    del self._activeGames[playerID]
+
+    def getActiveGames(self, playerID):
+        """Return the set of IDs of pending or ongoing games of a player"""
+        return set(self._activeGames.get(playerID, ()))
+
+    def getNumPendingGames(self):
+        """Return the number of games waiting for an opponent"""
+        return len(self._pendingGames)
@@ -0,0 +1,227 @@
+#!/usr/bin/python
+
+"""metrics.py: Request counters and latency histograms for the server"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import json
+import logging
+import time
+
+from twisted.internet import endpoints
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.web import resource
+from twisted.web import server as webServer
+
+__all__ = ["LatencyHistogram",
+           "ServerMetrics",
+           "StatsResource",
+           "listenHTTP"]
+
+
+class LatencyHistogram(object):
+    """Histogram of durations in power-of-two buckets of microseconds
+
+    Bucket i counts durations of less than 2**i microseconds (and at least
+    2**(i-1)), so recording a duration is a few integer operations and the
+    histogram takes constant space."""
+
+    NUM_BUCKETS = 32
+    """Number of buckets (the last one also holds anything longer)"""
+
+    def __init__(self):
+        """Initialize an empty histogram"""
+        self.count = 0
+        self.total = 0.0  # Sum of recorded durations, in seconds
+        self.maximum = 0.0  # Longest recorded duration, in seconds
+        self.buckets = [0] * LatencyHistogram.NUM_BUCKETS
+
+    def record(self, seconds):
+        """Add a duration, given in seconds, to the histogram"""
+        self.count += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        bucket = int(seconds * 1e6).bit_length()
+        self.buckets[min(bucket, LatencyHistogram.NUM_BUCKETS - 1)] += 1
+
+    def getPercentile(self, fraction):
+        """Return an upper bound on the given percentile, in seconds
+
+        @param fraction: the percentile as a fraction, e.g., 0.99
+        @return: the upper edge of the bucket holding the percentile, or
+                 None if the histogram is empty"""
+
+        if self.count == 0:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for (bucket, n) in enumerate(self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(2 ** bucket / 1e6, self.maximum)
+        return self.maximum
+
+    def toDict(self):
+        """Return a summary of the histogram, with durations in milliseconds
+
+        Buckets are given as a dict from their upper edge (in microseconds)
+        to their count, leaving out empty ones."""
+
+        def toMs(seconds):
+            return None if seconds is None else round(seconds * 1e3, 3)
+
+        return {"count": self.count,
+                "meanMs": toMs(self.total / self.count if self.count
+                               else None),
+                "p50Ms": toMs(self.getPercentile(0.5)),
+                "p99Ms": toMs(self.getPercentile(0.99)),
+                "maxMs": toMs(self.maximum),
+                "buckets": dict((str(2 ** bucket), n)
+                                for (bucket, n) in enumerate(self.buckets)
+                                if n)}
+
+
+class ServerMetrics(object):
+    """Counters and latency histograms for a running server
+
+    Shared by all connections of a server. Recording is cheap enough to be
+    left on: a clock read at each end of a request and a few additions."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.metrics.ServerMetrics")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    DEFAULT_LAG_INTERVAL = 1.0
+    """Default number of seconds between reactor lag measurements"""
+
+    def __init__(self, gameCounter=None):
+        """Initialize metrics with nothing recorded
+
+        @param gameCounter: if not None, a function returning a dict from
+                            game status to number of games, reported by
+                            getStats (e.g., TournamentSystem.getGameCounts)"""
+
+        self._gameCounter = gameCounter
+        self.startedAt = time.time()
+
+        # Dict from verb to latency histogram of its requests
+        self._latencies = {}
+
+        # Dict from verb to number of its requests that gave an error
+        self._errors = {}
+
+        self.activeConnections = 0
+        self.totalConnections = 0
+
+        # How late the reactor ran a timed call, measured periodically
+        self.reactorLag = LatencyHistogram()
+        self.lastReactorLag = None
+        self._lagMonitor = None
+        self._lagExpectedAt = None
+        self._lagInterval = None
+
+    def recordRequest(self, verb, errMsg, seconds):
+        """Note that a request was answered
+
+        @param verb: the request's verb
+        @param errMsg: None if the request succeeded, an error otherwise
+        @param seconds: the time taken to answer the request"""
+
+        histogram = self._latencies.get(verb)
+        if histogram is None:
+            histogram = self._latencies[verb] = LatencyHistogram()
+        histogram.record(seconds)
+        if errMsg is not None:
+            self._errors[verb] = self._errors.get(verb, 0) + 1
+
+    def connectionOpened(self):
+        """Note that a client connected"""
+        self.activeConnections += 1
+        self.totalConnections += 1
+
+    def connectionClosed(self):
+        """Note that a client disconnected"""
+        self.activeConnections -= 1
+
+    def startLagMonitor(self, interval=DEFAULT_LAG_INTERVAL):
+        """Periodically measure how late the reactor runs timed calls
+
+        @param interval: the number of seconds between measurements"""
+        self._lagInterval = interval
+        self._lagExpectedAt = time.time() + interval
+        self._lagMonitor = task.LoopingCall(self.__measureLag)
+        self._lagMonitor.start(interval, now=False)
+
+    def stopLagMonitor(self):
+        """Stop measuring reactor lag"""
+        if self._lagMonitor is not None and self._lagMonitor.running:
+            self._lagMonitor.stop()
+        self._lagMonitor = None
+
+    def __measureLag(self):
+        """Record how long after it was due this call was run"""
+        now = time.time()
+        self.lastReactorLag = max(0.0, now - self._lagExpectedAt)
+        self.reactorLag.record(self.lastReactorLag)
+        self._lagExpectedAt = now + self._lagInterval
+
+    def getStats(self):
+        """Return a JSON-serializable summary of all metrics
+
+        @return: a dict of form
+            {"uptime": seconds since the metrics were created,
+             "connections": {"active": number, "total": number},
+             "verbs": {verb: histogram summary (see LatencyHistogram.toDict)
+                             with an added "errors" count},
+             "reactorLag": {"lastMs": latest lag in ms, or None,
+                            ...histogram summary},
+             "games": dict from status to count (if there is a counter)}"""
+
+        verbs = {}
+        for (verb, histogram) in self._latencies.iteritems():
+            verbs[verb] = histogram.toDict()
+            verbs[verb]["errors"] = self._errors.get(verb, 0)
+
+        reactorLag = self.reactorLag.toDict()
+        reactorLag["lastMs"] = (None if self.lastReactorLag is None
+                                else round(self.lastReactorLag * 1e3, 3))
+
+        stats = {"uptime": round(time.time() - self.startedAt, 3),
+                 "connections": {"active": self.activeConnections,
+                                 "total": self.totalConnections},
+                 "verbs": verbs,
+                 "reactorLag": reactorLag}
+        if self._gameCounter is not None:
+            stats["games"] = self._gameCounter()
+        return stats
+
+
+class StatsResource(resource.Resource):
+    """Web resource serving ServerMetrics.getStats as JSON"""
+
+    isLeaf = True
+
+    def __init__(self, metrics):
+        resource.Resource.__init__(self)
+        self._metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader("Content-Type", "application/json")
+        return json.dumps(self._metrics.getStats(), sort_keys=True)
+
+
+def listenHTTP(port, metrics):
+    """Serve the given metrics as JSON over HTTP on the given port"""
+    endpoint = endpoints.TCP4ServerEndpoint(reactor, port)
+    d = endpoint.listen(webServer.Site(StatsResource(metrics)))
+    ServerMetrics._logger.info("Serving metrics over HTTP on port %d", port)
+    return d
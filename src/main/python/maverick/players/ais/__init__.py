@@ -6,4 +6,5 @@
 """maverick-chess.ais: A collection of AIs that play chess"""
 
 # Submodules to be imported on "from ais import *"
-__all__ = ["common", "quiescenceSearchAI", "randomAI"]
+__all__ = ["common", "openingBook", "profiling", "quiescenceSearchAI",
+           "randomAI", "searchStats", "tablebase"]
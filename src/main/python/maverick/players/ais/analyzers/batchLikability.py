@@ -0,0 +1,481 @@
+#!/usr/bin/python
+
+"""batchLikability.py: Likability evaluation of many boards at once"""
+
+from __future__ import division
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import numpy as np
+
+from maverick.data.structs import ChessBoard
+from maverick.players.ais.analyzers.likability import HEURISTIC_WEIGHT_KEYS
+from maverick.players.ais.analyzers.likability import MAX_TOTAL_PIECE_VALUE
+from maverick.players.ais.analyzers.likability import PIECE_VALUES
+
+__all__ = ["BoardBatch",
+           "evaluateHeuristicsBatch",
+           "evaluateGameOverBatch",
+           "evaluateLikabilityBatch"]
+
+# Overview of batch evaluation
+#
+# A BoardBatch holds N boards as arrays: an N x 64 array of piece codes
+# (square index rankN * 8 + fileN; positive for white, negative for black)
+# and the castle and en passant flags of each board.
+#
+# The functions here compute the same values as evaluateHeuristics and
+# evaluateBoardLikability in maverick.players.ais.analyzers.likability, for
+# every board at once. Moves are generated with the same rules as
+# maverick.data.utils.enumMoves: candidate moves of all boards are found
+# with whole-array operations, each is applied to a copy of its board, and
+# those that leave the mover's king attacked (as found by
+# ChessBoard.pieceCheckingKing) are dropped.
+#
+# Boards are processed CHUNK_SIZE at a time, to bound memory use.
+
+PIECE_CODES = {ChessBoard.PAWN: 1,
+               ChessBoard.KNGT: 2,
+               ChessBoard.BISH: 3,
+               ChessBoard.ROOK: 4,
+               ChessBoard.QUEN: 5,
+               ChessBoard.KING: 6}
+"""Codes of the piece types in a BoardBatch layout (negated for black)"""
+
+COLOR_INDICES = {ChessBoard.WHITE: 0, ChessBoard.BLACK: 1}
+"""Index of each color in the flag arrays of a BoardBatch"""
+
+CHUNK_SIZE = 1024
+"""Number of boards evaluated at once"""
+
+_OFF_BOARD = 127
+"""Code of the sentinel square that off-board destinations map to"""
+
+_SIZE = ChessBoard.BOARD_LAYOUT_SIZE
+_NUM_SQUARES = _SIZE * _SIZE
+
+_RANKS = np.arange(_NUM_SQUARES) // _SIZE
+_FILES = np.arange(_NUM_SQUARES) % _SIZE
+
+_PAWN = PIECE_CODES[ChessBoard.PAWN]
+_KNGT = PIECE_CODES[ChessBoard.KNGT]
+_BISH = PIECE_CODES[ChessBoard.BISH]
+_ROOK = PIECE_CODES[ChessBoard.ROOK]
+_QUEN = PIECE_CODES[ChessBoard.QUEN]
+_KING = PIECE_CODES[ChessBoard.KING]
+
+# Point value of each piece code, indexed by the code's absolute value
+_CODE_VALUES = np.zeros(_KING + 1)
+for (_pieceType, _code) in PIECE_CODES.iteritems():
+    _CODE_VALUES[_code] = PIECE_VALUES[_pieceType]
+
+# Weights of empty squares, as in heuristicEmptySpaceCvrg
+_SQUARE_WEIGHTS = np.where((_RANKS >= 3) & (_RANKS <= 4) &
+                           (_FILES >= 3) & (_FILES <= 4), 2.0, 1.0)
+
+
+def _makeOffsetTable(rankDelta, fileDelta):
+    """Return the square reached from each square by the given offset
+
+    @return: an array of 65 square indices, where off-board destinations
+             (and the sentinel square 64 itself) map to 64"""
+    table = np.empty(_NUM_SQUARES + 1, dtype=np.intp)
+    table.fill(_NUM_SQUARES)
+    for square in xrange(_NUM_SQUARES):
+        (rankN, fileN) = divmod(square, _SIZE)
+        if (0 <= rankN + rankDelta < _SIZE and
+            0 <= fileN + fileDelta < _SIZE):
+            table[square] = (rankN + rankDelta) * _SIZE + fileN + fileDelta
+    return table
+
+_ORTHOGONAL = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+_DIAGONAL = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+_KNIGHT_JUMPS = [(2, -1), (2, 1), (1, -2), (1, 2),
+                 (-1, -2), (-1, 2), (-2, -1), (-2, 1)]
+
+# Offset tables for each step along each ray, and for single steps
+_RAYS = dict([(direction,
+               [_makeOffsetTable(direction[0] * step, direction[1] * step)
+                for step in xrange(1, _SIZE)])
+              for direction in _ORTHOGONAL + _DIAGONAL])
+_OFFSETS = dict([((rankDelta, fileDelta),
+                  _makeOffsetTable(rankDelta, fileDelta))
+                 for rankDelta in xrange(-2, 3)
+                 for fileDelta in xrange(-2, 3)])
+
+
+class BoardBatch(object):
+    """A batch of boards, encoded as arrays"""
+
+    def __init__(self, layouts, canCastle, enpassant):
+        """Initialize a batch of N boards
+
+        @param layouts: an N x 64 array of piece codes (see PIECE_CODES,
+                        negated for black pieces, 0 for empty squares)
+        @param canCastle: an N x 2 x 2 boolean array of castle flags, indexed
+                          by COLOR_INDICES and then (queen-side, king-side)
+        @param enpassant: an N x 2 x 8 boolean array of en passant flags,
+                          indexed by COLOR_INDICES and then file"""
+
+        # Layouts with a sentinel square, so that off-board destinations can
+        # be looked up like any other square
+        self._padded = np.empty((len(layouts), _NUM_SQUARES + 1),
+                                dtype=np.int8)
+        self._padded[:, :_NUM_SQUARES] = layouts
+        self._padded[:, _NUM_SQUARES] = _OFF_BOARD
+
+        self.layouts = self._padded[:, :_NUM_SQUARES]
+        self.canCastle = np.asarray(canCastle, dtype=bool)
+        self.enpassant = np.asarray(enpassant, dtype=bool)
+
+    def __len__(self):
+        return len(self._padded)
+
+    @staticmethod
+    def fromBoards(boards):
+        """Encode the given ChessBoards as a BoardBatch"""
+
+        layouts = np.zeros((len(boards), _NUM_SQUARES), dtype=np.int8)
+        canCastle = np.zeros((len(boards), 2, 2), dtype=bool)
+        enpassant = np.zeros((len(boards), 2, _SIZE), dtype=bool)
+        for (boardN, board) in enumerate(boards):
+            for (rankN, row) in enumerate(board.layout):
+                for (fileN, piece) in enumerate(row):
+                    if piece is not None:
+                        code = PIECE_CODES[piece.pieceType]
+                        if piece.color == ChessBoard.BLACK:
+                            code = -code
+                        layouts[boardN, rankN * _SIZE + fileN] = code
+            for (color, colorN) in COLOR_INDICES.iteritems():
+                canCastle[boardN, colorN] = board.flag_canCastle[color]
+                enpassant[boardN, colorN] = board.flag_enpassant[color]
+        return BoardBatch(layouts, canCastle, enpassant)
+
+    def _getChunk(self, start, stop):
+        """Return a BoardBatch of boards start..stop-1 of this one"""
+        return BoardBatch(self.layouts[start:stop],
+                          self.canCastle[start:stop],
+                          self.enpassant[start:stop])
+
+
+def _getSign(colorN):
+    """Return the sign of the piece codes of the color with the given index"""
+    return 1 if colorN == COLOR_INDICES[ChessBoard.WHITE] else -1
+
+
+def _isOwnedBy(values, colorN):
+    """Return which of the given square contents are pieces of the color"""
+    if _getSign(colorN) > 0:
+        return (values > 0) & (values != _OFF_BOARD)
+    else:
+        return values < 0
+
+
+def _findKings(padded, colorN):
+    """Return the square of the king of the color on each layout
+
+    Like ChessBoard.__isLegalMove_findKings, returns the first in rank order
+    if there are several."""
+    kingCode = _KING * _getSign(colorN)
+    return np.argmax(padded[:, :_NUM_SQUARES] == kingCode, axis=1)
+
+
+def _isAttacked(padded, squares, attackerN):
+    """Return whether the given squares are attacked by the given color
+
+    Follows ChessBoard.pieceAttackingSquare: a square is attacked if one of
+    the attacker's pieces could capture on it.
+
+    @param padded: an M x 65 array of padded layouts
+    @param squares: an array of M squares, one per layout
+    @return: an array of M booleans"""
+
+    sign = _getSign(attackerN)
+    rows = np.arange(len(padded))
+    attacked = np.zeros(len(padded), dtype=bool)
+
+    # Rooks, bishops and queens along clear paths
+    for (directions, sliders) in [(_ORTHOGONAL, (_ROOK, _QUEN)),
+                                  (_DIAGONAL, (_BISH, _QUEN))]:
+        for direction in directions:
+            clear = np.ones(len(padded), dtype=bool)
+            for table in _RAYS[direction]:
+                values = padded[rows, table[squares]]
+                attacked |= clear & ((values == sliders[0] * sign) |
+                                     (values == sliders[1] * sign))
+                clear &= (values == 0)
+                if not clear.any():
+                    break
+
+    # Knights and kings
+    for (offsets, code) in [(_KNIGHT_JUMPS, _KNGT),
+                            (_ORTHOGONAL + _DIAGONAL, _KING)]:
+        for offset in offsets:
+            values = padded[rows, _OFFSETS[offset][squares]]
+            attacked |= (values == code * sign)
+
+    # Pawns attack diagonally forward, so are found diagonally behind
+    for fileDelta in [-1, 1]:
+        values = padded[rows, _OFFSETS[(-sign, fileDelta)][squares]]
+        attacked |= (values == _PAWN * sign)
+
+    return attacked
+
+
+def _findCandidateMoves(batch, colorN):
+    """Return the moves enumMoves considers before the check filter
+
+    @return: a tuple of arrays (board indices, origins, destinations)"""
+
+    padded = batch._padded
+    layouts = batch.layouts
+    sign = _getSign(colorN)
+    otherN = 1 - colorN
+    ownTypes = np.where(_isOwnedBy(layouts, colorN),
+                        np.abs(layouts), 0)
+    moves = []
+
+    def addMoves(movableP, table):
+        """Note the moves of pieces where movableP, to squares in table"""
+        (boardNs, origins) = np.nonzero(movableP)
+        moves.append((boardNs, origins, table[origins]))
+
+    def getTargets(table):
+        """Return the contents and on-board-ness of squares in table"""
+        return (padded[:, table[:_NUM_SQUARES]],
+                (table[:_NUM_SQUARES] != _NUM_SQUARES)[np.newaxis, :])
+
+    # Knights and kings move to any square not held by their own pieces
+    for (offsets, code) in [(_KNIGHT_JUMPS, _KNGT),
+                            (_ORTHOGONAL + _DIAGONAL, _KING)]:
+        movers = (ownTypes == code)
+        for offset in offsets:
+            (values, onBoard) = getTargets(_OFFSETS[offset])
+            addMoves(movers & onBoard & ~_isOwnedBy(values, colorN),
+                     _OFFSETS[offset])
+
+    # Rooks, bishops and queens move until blocked
+    for (directions, sliders) in [(_ORTHOGONAL, (_ROOK, _QUEN)),
+                                  (_DIAGONAL, (_BISH, _QUEN))]:
+        movers = (ownTypes == sliders[0]) | (ownTypes == sliders[1])
+        for direction in directions:
+            clear = movers.copy()
+            for table in _RAYS[direction]:
+                (values, onBoard) = getTargets(table)
+                clear &= onBoard
+                addMoves(clear & ~_isOwnedBy(values, colorN), table)
+                clear &= (values == 0)
+
+    # Pawns
+    pawns = (ownTypes == _PAWN)
+    startRank = ChessBoard.PAWN_STARTING_RANKS[
+                                    ChessBoard.WHITE if sign > 0 else
+                                    ChessBoard.BLACK]
+    otherStartRank = ChessBoard.PAWN_STARTING_RANKS[
+                                    ChessBoard.BLACK if sign > 0 else
+                                    ChessBoard.WHITE]
+    (oneAhead, onBoard) = getTargets(_OFFSETS[(sign, 0)])
+    addMoves(pawns & onBoard & (oneAhead == 0), _OFFSETS[(sign, 0)])
+    (twoAhead, _) = getTargets(_OFFSETS[(2 * sign, 0)])
+    addMoves(pawns & (_RANKS == startRank) & (oneAhead == 0) &
+             (twoAhead == 0), _OFFSETS[(2 * sign, 0)])
+    for fileDelta in [-1, 1]:
+        table = _OFFSETS[(sign, fileDelta)]
+        (values, onBoard) = getTargets(table)
+        toFiles = np.minimum(table[:_NUM_SQUARES], _NUM_SQUARES - 1) % _SIZE
+        enpassantP = ((values == 0) &
+                      batch.enpassant[:, otherN][:, toFiles] &
+                      (_RANKS + 2 * sign == otherStartRank))
+        addMoves(pawns & onBoard &
+                 (_isOwnedBy(values, otherN) | enpassantP), table)
+
+    # Castling, if the squares between king and rook are empty
+    kings = (ownTypes == _KING)
+    homeRank = 0 if sign > 0 else _SIZE - 1
+    homeRow = layouts[:, homeRank * _SIZE:(homeRank + 1) * _SIZE]
+    for (sideN, fileDelta, betweenFiles) in [(0, -2, slice(1, 4)),
+                                             (1, 2, slice(5, 7))]:
+        allowed = (batch.canCastle[:, colorN, sideN] &
+                   (homeRow[:, betweenFiles] == 0).all(axis=1))
+        (values, onBoard) = getTargets(_OFFSETS[(0, fileDelta)])
+        addMoves(kings & allowed[:, np.newaxis] & onBoard &
+                 ~_isOwnedBy(values, colorN), _OFFSETS[(0, fileDelta)])
+
+    return tuple(np.concatenate(parts) for parts in zip(*moves))
+
+
+def _applyMoves(batch, colorN, boardNs, origins, destinations):
+    """Return copies of the padded layouts with the given moves made
+
+    Follows ChessBoard._executePly, including castling and en passant."""
+
+    padded = batch._padded[boardNs]
+    rows = np.arange(len(padded))
+    pieces = padded[rows, origins]
+    captured = padded[rows, destinations]
+    padded[rows, origins] = 0
+    padded[rows, destinations] = pieces
+
+    # Move the rook when a king moves two files
+    fileDeltas = _FILES[destinations] - _FILES[origins]
+    castles = (np.abs(pieces) == _KING) & (np.abs(fileDeltas) == 2)
+    if castles.any():
+        castleRows = rows[castles]
+        rankStarts = _RANKS[destinations[castles]] * _SIZE
+        kingSideP = fileDeltas[castles] > 0
+        rookOrigins = rankStarts + np.where(kingSideP, _SIZE - 1, 0)
+        rookDestinations = rankStarts + np.where(kingSideP, 5, 3)
+        rooks = padded[castleRows, rookOrigins]
+        padded[castleRows, rookOrigins] = 0
+        padded[castleRows, rookDestinations] = rooks
+
+    # Remove pawns captured en passant. The flag of a file is cleared first
+    # if a pawn is captured on it.
+    sign = _getSign(colorN)
+    otherN = 1 - colorN
+    captureRank = ChessBoard.PAWN_STARTING_RANKS[
+                        ChessBoard.BLACK if sign > 0 else
+                        ChessBoard.WHITE] - sign
+    toFiles = _FILES[destinations]
+    enpassants = ((np.abs(pieces) == _PAWN) &
+                  batch.enpassant[boardNs, otherN, toFiles] &
+                  (np.abs(captured) != _PAWN) &
+                  (_RANKS[destinations] == captureRank))
+    padded[rows[enpassants],
+           (captureRank - sign) * _SIZE + toFiles[enpassants]] = 0
+
+    return padded
+
+
+def _findLegalMoves(batch, colorN):
+    """Return the color's moves, as given by enumMoves
+
+    @return: a tuple of arrays (board indices, destinations)"""
+
+    (boardNs, origins, destinations) = _findCandidateMoves(batch, colorN)
+    padded = _applyMoves(batch, colorN, boardNs, origins, destinations)
+    legal = ~_isAttacked(padded, _findKings(padded, colorN), 1 - colorN)
+    return (boardNs[legal], destinations[legal])
+
+
+def _findCoveredSquares(batch, colorN):
+    """Return the destinations of the color's moves, as given by enumMoves
+
+    @return: an N x 64 boolean array"""
+
+    (boardNs, destinations) = _findLegalMoves(batch, colorN)
+    covered = np.zeros((len(batch), _NUM_SQUARES), dtype=bool)
+    covered[boardNs, destinations] = True
+    return covered
+
+
+def _findChecks(batch, colorN):
+    """Return whether the color's king is in check on each board"""
+    return _isAttacked(batch._padded, _findKings(batch._padded, colorN),
+                       1 - colorN)
+
+
+def __evaluateHeuristicsBatch_chunk(batch, colorN):
+    """Return the heuristic values of each board, as seen by the color
+
+    @return: an N x len(HEURISTIC_WEIGHT_KEYS) array"""
+
+    layouts = batch.layouts
+    values = _CODE_VALUES[np.abs(layouts)]
+    empty = (layouts == 0)
+
+    # Values of each heuristic for each color, indexed by color index
+    pieceValue = []
+    inCheck = []
+    pcsUnderAttack = []
+    emptySpaceCvrg = []
+    covered = [_findCoveredSquares(batch, n) for n in xrange(2)]
+    for n in xrange(2):
+        ownValues = np.where(_isOwnedBy(layouts, n), values, 0)
+
+        # See heuristicPieceValue
+        halfMaxVal = MAX_TOTAL_PIECE_VALUE / 2
+        pieceValue.append((ownValues.sum(axis=1) - halfMaxVal) / halfMaxVal)
+
+        # See heuristicInCheck
+        inCheck.append(np.where(_findChecks(batch, n), -1.0, 1.0))
+
+        # See heuristicPcsUnderAttack
+        attackedValue = np.where(covered[1 - n], ownValues, 0).sum(axis=1)
+        pcsUnderAttack.append(1 - 2 * (attackedValue /
+                                       MAX_TOTAL_PIECE_VALUE))
+
+        # See heuristicEmptySpaceCvrg
+        coveredWeight = (np.where(covered[n] & empty, _SQUARE_WEIGHTS, 0)
+                         .sum(axis=1))
+        emptyWeight = np.where(empty, _SQUARE_WEIGHTS, 0).sum(axis=1)
+        emptySpaceCvrg.append(-1 + coveredWeight / emptyWeight * 2)
+
+    # Combined as in evaluateHeuristics (see combineHeuristicValues)
+    otherN = 1 - colorN
+    return np.column_stack(
+            [(pieceValue[otherN] - pieceValue[colorN]) / 2,
+             (inCheck[colorN] - inCheck[otherN]) / 2,
+             (pcsUnderAttack[colorN] - pcsUnderAttack[otherN]) / 2,
+             (emptySpaceCvrg[colorN] - emptySpaceCvrg[otherN]) / 2])
+
+
+def evaluateHeuristicsBatch(color, batch):
+    """Return the values of evaluateHeuristics for each board of a batch
+
+    @param color: One of maverick.data.ChessBoard.WHITE or
+                   maverick.data.ChessBoard.BLACK
+    @param batch: a BoardBatch of N boards
+
+    @return: an N x len(HEURISTIC_WEIGHT_KEYS) array, with the values of
+    evaluateHeuristics(color, board) in each row"""
+
+    colorN = COLOR_INDICES[color]
+    result = np.empty((len(batch), len(HEURISTIC_WEIGHT_KEYS)))
+    for start in xrange(0, len(batch), CHUNK_SIZE):
+        chunk = batch._getChunk(start, start + CHUNK_SIZE)
+        result[start:start + len(chunk)] = \
+            __evaluateHeuristicsBatch_chunk(chunk, colorN)
+    return result
+
+
+def evaluateGameOverBatch(color, batch):
+    """Return the likability of the boards of a batch whose game is over
+
+    Like evaluateBoardLikability, by ChessBoard.gameState with the given
+    color to move.
+
+    @return: an array of N numbers: -1 if the color is checkmated, 0 if it
+    is stalemated, and NaN if it has a legal move"""
+
+    colorN = COLOR_INDICES[color]
+    (boardNs, _) = _findLegalMoves(batch, colorN)
+    hasMove = np.bincount(boardNs, minlength=len(batch)) > 0
+    return np.where(hasMove, np.nan,
+                    np.where(_findChecks(batch, colorN), -1.0, 0.0))
+
+
+def evaluateLikabilityBatch(color, batch, weightDict):
+    """Return the values of evaluateBoardLikability for each board of a batch
+
+    @param weightDict: A dictionary describing the weights to use for the
+                        various heuristics (see evaluateBoardLikability)
+
+    @return: an array of N numbers in [-1,1]"""
+
+    weights = [weightDict[key] for key in HEURISTIC_WEIGHT_KEYS]
+    values = evaluateHeuristicsBatch(color, batch)
+
+    # Summed in the same order as evaluateBoardLikability
+    weightedSum = np.zeros(len(batch))
+    for (valueN, weight) in enumerate(weights):
+        weightedSum = weightedSum + weight * values[:, valueN]
+    gameOvers = evaluateGameOverBatch(color, batch)
+    return np.where(np.isnan(gameOvers), weightedSum / sum(weights),
+                    gameOvers)
@@ -264,11 +264,74 @@ def combineHeuristicValues(res1, res2):
     return ((res1 - res2) / 2)
 
 
+HEURISTIC_WEIGHT_KEYS = ['pieceValWeight',
+                         'inCheckWeight',
+                         'pcsUnderAttackWeight',
+                         'emptySpaceCvgWeight']
+"""Keys of the weights of the heuristics in use, in the order of the values
+returned by evaluateHeuristics"""
+
+
+def evaluateHeuristics(color, board):
+    """Return the combined values of each heuristic for the given board
+
+    @param color: One of maverick.data.ChessBoard.WHITE or
+                   maverick.data.ChessBoard.BLACK
+    @param board: A ChessBoard Object
+
+    @return: a list of numbers in [-1,1], one per heuristic, in the order of
+    HEURISTIC_WEIGHT_KEYS. Each is the combination of the heuristic run on
+    both colors, as seen by the given color.
+
+    Checkmate is not considered here; see evaluateBoardLikability."""
+
+    # Determine opposing player color
+    otherColor = ChessBoard.getOtherColor(color)
+
+    ## TODO (James): Clean up the code below a bit - there has to be
+    #                a cleaner way to do this
+
+    # Piece value opinion
+    pieceValueFriend = heuristicPieceValue(otherColor, board)
+    pieceValueFoe = heuristicPieceValue(color, board)
+    pieceValueRes = combineHeuristicValues(pieceValueFriend, pieceValueFoe)
+
+    # In check opinion
+    inCheckFriend = heuristicInCheck(color, board)
+    inCheckFoe = heuristicInCheck(otherColor, board)
+    inCheckRes = combineHeuristicValues(inCheckFriend,
+                                                inCheckFoe)
+
+    # Pieces under attack opinion
+    pcsUnderAtkFriend = heuristicPcsUnderAttack(color, board)
+    pcsUnderAtkFoe = heuristicPcsUnderAttack(otherColor,
+                                                      board)
+    pcsUnderAtkRes = combineHeuristicValues(pcsUnderAtkFriend,
+                                                 pcsUnderAtkFoe)
+
+    # Empty space coverage opinion
+    emptySpcsCvdFriend = heuristicEmptySpaceCvrg(color, board)
+    emptySpcsCvdFoe = heuristicEmptySpaceCvrg(otherColor, board)
+    emptySpcsCvdRes = combineHeuristicValues(emptySpcsCvdFriend,
+                                                  emptySpcsCvdFoe)
+
+    ## TODO (James): Re-enable this when it is more efficient (and add
+    #                'piecesCoveredWeight' to HEURISTIC_WEIGHT_KEYS)
+
+    # Pieces covered opinion
+#    pcsCoveredFriend = heuristicPiecesCovered(color, board)
+#    pcsCoveredFoe = heuristicPiecesCovered(otherColor, board)
+#    pcsCoveredRes = combineHeuristicValues(pcsCoveredFriend,
+#                                                pcsCoveredFoe)
+
+    return [pieceValueRes, inCheckRes, pcsUnderAtkRes, emptySpcsCvdRes]
+
+
 def evaluateBoardLikability(color, board, weightDict):
     """Return a number in [-1,1] based on board's likability to color
 
     @param color: One of maverick.data.ChessBoard.WHITE or
-                   maverick.data.ChessBoard.BLACK
+                   maverick.data.ChessBoard.BLACK, the color to move
     @param board: A ChessBoard Object
     @param weightDict: A dictionary describing the weights to use for the
                         various heuristics, of form
@@ -289,71 +352,19 @@ def evaluateBoardLikability(color, board, weightDict):
      - 0 means neither player is favored; can mean a state of draw
      - +1 means guaranteed win"""
 
-    # Pairing of heuristics with their weights
-    pieceValueWeight = weightDict['pieceValWeight']
-    inCheckWeight = weightDict['inCheckWeight']
-    piecesUnderAttackWeight = weightDict['pcsUnderAttackWeight']
-    emptySpaceCoverageWeight = weightDict['emptySpaceCvgWeight']
-    piecesCoveredWeight = weightDict['piecesCoveredWeight']  # TODO (mattsh)
-
-    # Determine opposing player color
-    otherColor = ChessBoard.getOtherColor(color)
-
-    # Check to see if either player is checkmated and return appropriately
-    if board.isKingCheckmated(otherColor):
-        return 1
-    elif board.isKingCheckmated(color):
+    # Check to see if the game is over and return appropriately
+    gameState = board.gameState(color)
+    if gameState == ChessBoard.GAME_CHECKMATE:
         return -1
+    elif gameState == ChessBoard.GAME_STALEMATE:
+        return 0
     else:
 
-        # Data structure of 'opinions' from heuristics
-        # Format: ListOf[("Name", weight, value)]
-        opinions = []
-
-        ## TODO (James): Clean up the code below a bit - there has to be
-        #                a cleaner way to do this
-
-        # Add piece value opinion
-        pieceValueFriend = heuristicPieceValue(otherColor, board)
-        pieceValueFoe = heuristicPieceValue(color, board)
-        pieceValueRes = combineHeuristicValues(pieceValueFriend, pieceValueFoe)
-        opinions.append(("PieceValue", pieceValueWeight, pieceValueRes))
-
-        # Add in check opinion
-        inCheckFriend = heuristicInCheck(color, board)
-        inCheckFoe = heuristicInCheck(otherColor, board)
-        inCheckRes = combineHeuristicValues(inCheckFriend,
-                                                    inCheckFoe)
-        opinions.append(("InCheck", inCheckWeight, inCheckRes))
-
-        # Add pieces under attack opinion
-        pcsUnderAtkFriend = heuristicPcsUnderAttack(color, board)
-        pcsUnderAtkFoe = heuristicPcsUnderAttack(otherColor,
-                                                          board)
-        pcsUnderAtkRes = combineHeuristicValues(pcsUnderAtkFriend,
-                                                     pcsUnderAtkFoe)
-        opinions.append(("PiecesUnderAttack", piecesUnderAttackWeight,
-                        pcsUnderAtkRes))
-
-        # Add empty space coverage opinion
-        emptySpcsCvdFriend = heuristicEmptySpaceCvrg(color, board)
-        emptySpcsCvdFoe = heuristicEmptySpaceCvrg(otherColor, board)
-        emptySpcsCvdRes = combineHeuristicValues(emptySpcsCvdFriend,
-                                                      emptySpcsCvdFoe)
-        opinions.append(("EmptySpaceCoverage", emptySpaceCoverageWeight,
-                        emptySpcsCvdRes))
-
-        ## TODO (James): Re-enable this when it is more efficient
-
-        # Add pieces covered opinion
-#        pcsCoveredFriend = heuristicPiecesCovered(color, board)
-#        pcsCoveredFoe = heuristicPiecesCovered(otherColor, board)
-#        pcsCoveredRes = combineHeuristicValues(pcsCoveredFriend,
-#                                                    pcsCoveredFoe)
-#        opinions.append(("PiecesCovered", piecesCoveredWeight,
-#                        pcsCoveredRes))
+        # Pairing of heuristics with their weights
+        weights = [weightDict[key] for key in HEURISTIC_WEIGHT_KEYS]
+        values = evaluateHeuristics(color, board)
 
         # Return the weighted average
-        return sum([weight * value for (_, weight, value) in opinions]) / \
-            sum([weight for (_, weight, _) in opinions])
-
+        return sum([weight * value
+                    for (weight, value) in zip(weights, values)]) / \
+            sum(weights)
@@ -0,0 +1,171 @@
+#!/usr/bin/python
+
+"""openingBook.py: Memory-mapped opening books for Maverick AIs"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import logging
+import mmap
+import os
+import random
+import struct
+
+from maverick.data.structs import ChessPosn
+from maverick.wire import decodeMove
+from maverick.wire import encodeMove
+
+__all__ = ["OpeningBook",
+           "MaverickBookException",
+           "writeBook"]
+
+# Overview of the opening book file format
+#
+# A book file is BOOK_MAGIC followed by fixed-size records (see _RECORD), each
+# a position hash (from ChessBoard.getPositionHash), a move (as encoded by
+# maverick.wire.encodeMove) and a weight. Records are sorted by hash and then
+# move, so the moves for a position are found by binary search directly on
+# the memory-mapped file, without reading or parsing it first.
+#
+# Books are compiled from games by maverick.tools.book.
+
+BOOK_MAGIC = "MVBOOK1\n"
+"""Bytes at the start of every opening book file"""
+
+# Struct for position hash, move and weight
+_RECORD = struct.Struct("!QHH")
+
+_HASH = struct.Struct("!Q")
+
+MAX_WEIGHT = 0xFFFF
+"""Largest weight that a book record can hold"""
+
+
+class MaverickBookException(Exception):
+    """Raised when an opening book file is invalid"""
+    pass
+
+
+def writeBook(path, weights):
+    """Write an opening book file
+
+    @param path: the path of the file to (over)write
+    @param weights: a dict from (positionHash, fromPosn, toPosn) tuples, with
+                    the ChessPosns given as (rankN, fileN) tuples, to
+                    positive weights. Weights are scaled down proportionally
+                    if any exceeds MAX_WEIGHT.
+
+    @return: the number of records written"""
+
+    records = []
+    for ((positionHash, fromPosn, toPosn), weight) in weights.iteritems():
+        records.append((positionHash, encodeMove(*(fromPosn + toPosn)),
+                        weight))
+    records.sort()
+
+    maxWeight = max([weight for (_, _, weight) in records] or [0])
+    scale = min(1.0, MAX_WEIGHT / float(maxWeight or 1))
+
+    with open(path, "wb") as fd:
+        fd.write(BOOK_MAGIC)
+        for (positionHash, move, weight) in records:
+            fd.write(_RECORD.pack(positionHash, move,
+                                  max(1, int(weight * scale))))
+    return len(records)
+
+
+class OpeningBook(object):
+    """A read-only opening book, memory-mapped from a book file"""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.players.ais.openingBook.OpeningBook")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, path):
+        """Map the book file at the given path into memory
+
+        @raise MaverickBookException: if the file is not an opening book"""
+
+        self.path = path
+        with open(path, "rb") as fd:
+            size = os.fstat(fd.fileno()).st_size
+            if (size < len(BOOK_MAGIC) or
+                (size - len(BOOK_MAGIC)) % _RECORD.size != 0 or
+                fd.read(len(BOOK_MAGIC)) != BOOK_MAGIC):
+                raise MaverickBookException("Not an opening book: " + path)
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        self._numRecords = (size - len(BOOK_MAGIC)) // _RECORD.size
+        OpeningBook._logger.debug("Mapped %d book records from %s",
+                                  self._numRecords, path)
+
+    def __len__(self):
+        return self._numRecords
+
+    def __getstate__(self):
+        """Pickle only the path (the file is mapped again on unpickling)"""
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __findFirst(self, positionHash):
+        """Return the index of the first record with at least the given hash"""
+        (lo, hi) = (0, self._numRecords)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            (midHash,) = _HASH.unpack_from(self._map, len(BOOK_MAGIC) +
+                                           mid * _RECORD.size)
+            if midHash < positionHash:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def getMoves(self, positionHash):
+        """Return the book moves for the position with the given hash
+
+        @return: a list of tuples of form (fromPosn, toPosn, weight)"""
+        moves = []
+        for recordN in xrange(self.__findFirst(positionHash),
+                              self._numRecords):
+            (recordHash, move, weight) = _RECORD.unpack_from(
+                        self._map, len(BOOK_MAGIC) + recordN * _RECORD.size)
+            if recordHash != positionHash:
+                break
+            (fromRank, fromFile, toRank, toFile) = decodeMove(move)
+            moves.append((ChessPosn(fromRank, fromFile),
+                          ChessPosn(toRank, toFile), weight))
+        return moves
+
+    def chooseMove(self, board, color, rng=random):
+        """Choose a book move for the given color, at random by weight
+
+        Book moves that are not legal on the board (e.g., after a hash
+        collision) are ignored.
+
+        @param rng: the source of randomness (an object like random)
+        @return: a tuple of form (fromPosn, toPosn), or None if the book has
+                 no legal move for this position"""
+
+        moves = [(fromPosn, toPosn, weight) for (fromPosn, toPosn, weight)
+                 in self.getMoves(board.getPositionHash(color))
+                 if board.isLegalMove(color, fromPosn, toPosn)]
+        if not moves:
+            return None
+
+        choice = rng.uniform(0, sum([weight for (_, _, weight) in moves]))
+        for (fromPosn, toPosn, weight) in moves:
+            choice -= weight
+            if choice <= 0:
+                break
+        return (fromPosn, toPosn)
+
+    def close(self):
+        """Unmap the book file"""
+        self._map.close()
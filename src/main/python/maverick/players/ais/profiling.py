@@ -0,0 +1,182 @@
+#!/usr/bin/python
+
+"""profiling.py: Call counts and timings of the functions searches rely on"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import json
+import logging
+import os
+import sys
+from time import time
+
+from maverick.data import utils
+from maverick.data.structs import ChessBoard
+from maverick.players.ais.analyzers import likability
+from maverick.players.ais.common import MaverickAIException
+
+__all__ = ["SearchProfiler"]
+
+# Overview of search profiling
+#
+# Profiling must cost nothing when it is off, so the profiled functions hold
+# no hooks of their own. Instead, SearchProfiler.start replaces each of them
+# (wherever a Maverick module has imported it by name) with a wrapper that
+# counts its calls and times them, and SearchProfiler.stop puts the
+# originals back. Times are inclusive: the time of enumMoves includes that of
+# the isLegalMove calls it makes.
+#
+# The game state cache (see ChessBoard.gameState) stands in for a
+# transposition table, so its hits and misses are reported as well.
+
+_PROFILED = [("moveGen", utils, "enumMoves"),
+             ("pieceMoveGen", utils, "enumPossPieceMoves"),
+             ("isLegalMove", ChessBoard, "isLegalMove"),
+             ("attackCheck", ChessBoard, "pieceAttackingSquare"),
+             ("makePly", ChessBoard, "getPlyResult"),
+             ("undoPly", ChessBoard, "undoPlyResult"),
+             ("positionHash", ChessBoard, "getPositionHash"),
+             ("gameState", ChessBoard, "gameState"),
+             ("evaluate", likability, "evaluateBoardLikability"),
+             ("evalPieceValue", likability, "heuristicPieceValue"),
+             ("evalInCheck", likability, "heuristicInCheck"),
+             ("evalPcsUnderAttack", likability, "heuristicPcsUnderAttack"),
+             ("evalEmptySpaceCvrg", likability, "heuristicEmptySpaceCvrg")]
+"""Profiled functions, as (counter name, owning module or class, name)"""
+
+
+class SearchProfiler(object):
+    """Counts calls to, and times, the functions searches rely on
+
+    Profiles one move at a time, between calls to start and stop, and keeps
+    a breakdown of each move for the report."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.players.ais.profiling."
+                                "SearchProfiler")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    # The profiler whose hooks are installed, if any
+    _active = None
+
+    def __init__(self):
+        """Initialize a profiler with no moves profiled"""
+        self.moves = []
+        self._counters = {}
+        self._startCacheCounts = None
+        self._replaced = []  # (namespace, name, original function) tuples
+        self._startTime = None
+
+    def start(self):
+        """Install the hooks and start profiling a move
+
+        @raise MaverickAIException: if a profiler is already running"""
+        if SearchProfiler._active is not None:
+            raise MaverickAIException("A search profiler is already running")
+        SearchProfiler._active = self
+
+        self._counters = dict((name, [0, 0.0]) for (name, _, _) in _PROFILED)
+        for (name, owner, attrName) in _PROFILED:
+            self.__start_replace(owner, attrName,
+                                 self.__start_makeHook(
+                                            name, owner.__dict__[attrName]))
+        self._startCacheCounts = ChessBoard.getGameStateCacheCounts()
+        self._startTime = time()
+
+    def __start_replace(self, owner, attrName, hook):
+        """Replace a function by a hook in its owner and in every Maverick
+        module that has imported it by name"""
+        original = owner.__dict__[attrName]
+        namespaces = [owner]
+        if not isinstance(owner, type):
+            namespaces.extend(module for (moduleName, module)
+                              in sys.modules.items()
+                              if module is not None and
+                              module is not owner and
+                              moduleName.startswith("maverick.") and
+                              module.__dict__.get(attrName) is original)
+        for namespace in namespaces:
+            self._replaced.append((namespace, attrName, original))
+            setattr(namespace, attrName, hook)
+
+    def __start_makeHook(self, name, function):
+        """Return a wrapper of function that counts into the named counter"""
+        counter = self._counters[name]
+
+        def hook(*args, **kwargs):
+            startTime = time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                counter[0] += 1
+                counter[1] += time() - startTime
+        return hook
+
+    def stop(self, **moveInfo):
+        """Remove the hooks and record the profile of the move
+
+        @param moveInfo: extra fields for the record of the move (e.g., the
+                         move chosen)
+
+        @return: the record of the move, a dict of form
+                 {"seconds": time taken,
+                  "functions": {counter name: {"calls": n, "seconds": s}},
+                  "gameStateCache": {"hits": n, "misses": n},
+                  ...moveInfo}"""
+
+        seconds = time() - self._startTime
+        cacheCounts = ChessBoard.getGameStateCacheCounts()
+        for (namespace, attrName, original) in reversed(self._replaced):
+            setattr(namespace, attrName, original)
+        self._replaced = []
+        SearchProfiler._active = None
+
+        record = {"seconds": round(seconds, 6),
+                  "functions": dict((name, {"calls": calls,
+                                            "seconds": round(total, 6)})
+                                    for (name, (calls, total))
+                                    in self._counters.iteritems()),
+                  "gameStateCache": dict(
+                                (key, n - self._startCacheCounts[key])
+                                for (key, n) in cacheCounts.iteritems())}
+        record.update(moveInfo)
+        self.moves.append(record)
+        return record
+
+    def toDict(self):
+        """Return the report: the moves profiled and their totals
+
+        @return: a dict of form
+                 {"moves": list of records as returned by stop,
+                  "totals": {"seconds": s, "functions": ...,
+                             "gameStateCache": ...} summed over moves}"""
+
+        totals = {"seconds": 0.0, "functions": {},
+                  "gameStateCache": {"hits": 0, "misses": 0}}
+        for record in self.moves:
+            totals["seconds"] += record["seconds"]
+            for (name, counts) in record["functions"].iteritems():
+                total = totals["functions"].setdefault(
+                                            name, {"calls": 0, "seconds": 0.0})
+                total["calls"] += counts["calls"]
+                total["seconds"] += counts["seconds"]
+            for (key, n) in record["gameStateCache"].iteritems():
+                totals["gameStateCache"][key] += n
+        return {"moves": self.moves, "totals": totals}
+
+    def writeReport(self, path):
+        """Write the report (see toDict) to the given file as JSON
+
+        The file is replaced whole, so it may be read at any time."""
+        with open(path + ".tmp", "w") as fd:
+            json.dump(self.toDict(), fd, indent=2, sort_keys=True)
+        os.rename(path + ".tmp", path)
+        SearchProfiler._logger.debug("Wrote profile of %d moves to %s",
+                                     len(self.moves), path)
@@ -9,6 +9,7 @@
 
 from __future__ import division
 
+import json
 import logging
 import random
 
@@ -18,8 +19,14 @@ from time import time
 
 from maverick.players.ais.analyzers.likability import evaluateBoardLikability
 from maverick.players.ais.common import MaverickAI
+from maverick.players.ais.openingBook import OpeningBook
+from maverick.players.ais.profiling import SearchProfiler
+from maverick.players.ais.searchStats import SearchStats
+from maverick.players.ais.tablebase import Tablebases
 from maverick.data.structs import ChessBoard
 from maverick.data.utils import enumMoves
+from maverick.wire import WIRE_FORMAT_BINARY
+from maverick.wire import WIRE_FORMAT_JSON
 
 ## TODO (mattsh): Not sure, but is there a way we can cache some board enums?
 ## TODO (James): @mattsh, yes there is - it's called a transposition table.
@@ -39,6 +46,14 @@ class QLAI(MaverickAI):
     # Initialize if not already initialized
     logging.basicConfig(level=logging.DEBUG)
 
+    SEARCH_DEPTH = 2
+    """Depth of the deepest search iteration, in plies"""
+
+    SEARCH_TIME_BUFFER = 0.5
+    """Seconds left unused of the time allowed for a move, since searches
+    take some time to stop. Experience shows that 0.5 seconds is more than
+    enough buffer time"""
+
     # Default heuristic weights for likability evaluation
     defaultWeights = {'pieceValWeight': 0.8,
                          'inCheckWeight': 1,
@@ -48,12 +63,26 @@ class QLAI(MaverickAI):
 
     def __init__(self, host=None, port=None, pieceValWgt=None,
                  inCheckWgt=None, piecesUnderAttackWgt=None,
-                 emptySpaceCoverageWgt=None, piecesCoveredWgt=None):
+                 emptySpaceCoverageWgt=None, piecesCoveredWgt=None,
+                 wireFormat=None, bookPath=None, tablebasePath=None,
+                 profilePath=None, searchLogPath=None):
         """Initialize a QLAI
 
-        Notes the given heuristic weights, and calls superclass constructor"""
+        Notes the given heuristic weights, and calls superclass constructor
+
+        @param bookPath: if set, the path of an opening book file to play
+                         from (instead of searching) while it has moves
+        @param tablebasePath: if set, the directory of endgame tablebase
+                              files to play from (instead of searching) in
+                              the positions they cover
+        @param profilePath: if set, the path of a JSON file to write a
+                            profile of each move's search to (see
+                            SearchProfiler)
+        @param searchLogPath: if set, the path of a file to append the
+                              statistics of each search iteration to, as
+                              JSON lines (see SearchStats.toDict)"""
 
-        MaverickAI.__init__(self, host=host, port=port)
+        MaverickAI.__init__(self, host=host, port=port, wireFormat=wireFormat)
 
         # Construct a dictionary of heuristic weight values
         self.heuristicWgts = {}
@@ -87,16 +116,54 @@ class QLAI(MaverickAI):
         else:
             self.heuristicWgts['piecesCoveredWeight'] = piecesCoveredWgt
 
+        # Open the opening book, if any
+        if bookPath is None:
+            self.book = None
+        else:
+            self.book = OpeningBook(bookPath)
+
+        # Find the endgame tablebases, if any
+        if tablebasePath is None:
+            self.tablebases = None
+        else:
+            self.tablebases = Tablebases(tablebasePath)
+
+        # Positions of the current game seen by this player, as tuples of
+        # form (position hash, irreversibility signature), for rebuilding the
+        # position history of boards that arrive without one
+        self._gamePositions = []
+        self._gamePositionsGameID = None
+
+        # Profile searches only if asked to, since profiling slows them down
+        self.profilePath = profilePath
+        if profilePath is None:
+            self.profiler = None
+        else:
+            self.profiler = SearchProfiler()
+
+        # Where to write search statistics, besides the log
+        self.searchLogPath = searchLogPath
+
+        # Statistics of the search in progress (None between searches)
+        self._searchStats = None
+
+        # Statistics of the last search (None until one is made)
+        self.lastSearchStats = None
+
+        # Set to True (e.g., from another thread) to make the search in
+        # progress stop soon. Cleared by getNextMove, and otherwise left to
+        # whoever sets it.
+        self.stopRequested = False
+
     def getNextMove(self, board):
-        """TODO PyDoc"""
-        print board
+        """Choose a move, noting the positions before and after it so that
+        the search can avoid (or aim for) repeating them
 
-        SEARCH_DEPTH = 2  # Search to a depth of 3
+        @param board: the current board, with this player to move
 
-        # How long we want to allow the search to run before it starts
-        # terminating - most tournaments allow 3 minutes per turn.
-        # Experience shows that 0.5 seconds is more than enough buffer time
-        SEARCH_TIME_SECONDS = (MaverickAI.CALCULATION_TIMEOUT * 60) - 0.5
+        @return: a move of the form (fromChessPosn, toChessPosn)"""
+
+        print board
 
         # Figure out our color
         if self.isWhite:
@@ -104,11 +171,116 @@ class QLAI(MaverickAI):
         else:
             color = ChessBoard.BLACK
 
+        # How long we want to allow the search to run before it starts
+        # terminating - most tournaments allow 3 minutes per turn.
+        stopSrchTime = (time() + MaverickAI.CALCULATION_TIMEOUT * 60 -
+                        QLAI.SEARCH_TIME_BUFFER)
+        self.stopRequested = False
+
+        move = None
+        if self.profiler is not None:
+            self.profiler.start()
+        try:
+            self._seedPositionHistory(board, color)
+            move = self.chooseMove(board, color, QLAI.SEARCH_DEPTH,
+                                   stopSrchTime)
+        finally:
+            if self.profiler is not None:
+                self.profiler.stop(color=color, move=None if move is None
+                                   else [move[0].rankN, move[0].fileN,
+                                         move[1].rankN, move[1].fileN])
+                self.profiler.writeReport(self.profilePath)
+        (fromPosn, toPosn) = move
+
+        ########## MUTATE THE BOARD STATE - MUST BE UNDONE: ##########
+        undoDict = board.getPlyResult(fromPosn, toPosn)
+        self._recordPosition(board, ChessBoard.getOtherColor(color))
+        ########## RESTORE THE OLD BOARD STATE - VERY IMPORTANT: #####
+        board.undoPlyResult(undoDict)
+
+        return (fromPosn, toPosn)
+
+    @staticmethod
+    def __getIrreversibleSignature(board):
+        """Return what a reversible ply leaves unchanged: the number of
+        pieces and the squares of the pawns"""
+        pieceCount = 0
+        pawnSquares = []
+        for (rankN, row) in enumerate(board.layout):
+            for (fileN, piece) in enumerate(row):
+                if piece is not None:
+                    pieceCount += 1
+                    if piece.pieceType == ChessBoard.PAWN:
+                        pawnSquares.append((piece.color, rankN, fileN))
+        return (pieceCount, tuple(pawnSquares))
+
+    def _recordPosition(self, board, colorToMove):
+        """Note a position of the current game (see _seedPositionHistory)"""
+        if self._gamePositionsGameID != self.gameID:
+            self._gamePositions = []
+            self._gamePositionsGameID = self.gameID
+        self._gamePositions.append(
+                (board.getPositionHash(colorToMove),
+                 QLAI.__getIrreversibleSignature(board)))
+
+    def _seedPositionHistory(self, board, color):
+        """Give the board the position history of the current game
+
+        Boards received from the server carry neither a position history nor
+        a draw counter, so both are rebuilt from the positions this player
+        has seen since the last capture or pawn move. Positions the opponent
+        passed through without this player seeing them are not counted.
+
+        @param board: the current board, with color to move
+        @param color: the color of this player"""
+
+        self._recordPosition(board, color)
+        if board.positionHistory:
+            return
+
+        signature = self._gamePositions[-1][1]
+        reversibleN = len(self._gamePositions) - 1
+        while (reversibleN > 0 and
+               self._gamePositions[reversibleN - 1][1] == signature):
+            reversibleN -= 1
+        board.positionHistory = [positionHash for (positionHash, _) in
+                                 self._gamePositions[reversibleN:]]
+        board.drawCounter = max(board.drawCounter,
+                                len(board.positionHistory) - 1)
+
+    def chooseMove(self, board, color, maxDepth, stopSrchTime):
+        """Choose a move by book, tablebase or search
+
+        @param board: the current board, with color to move (and its
+                      position history, for avoiding repetitions)
+        @param color: the color of this player
+        @param maxDepth: the depth of the deepest search iteration
+        @param stopSrchTime: time at which the search should begin to
+                             terminate (see _boardSearch)
+
+        @return: a move of the form (fromChessPosn, toChessPosn)
+
+        @raise IndexError: if color has no legal move"""
+
+        # Play from the opening book while it knows the position
+        if self.book is not None:
+            bookMove = self.book.chooseMove(board, color)
+            if bookMove is not None:
+                QLAI._logger.info("Found book move %s -> %s", *bookMove)
+                return bookMove
+
+        # Play perfectly once few enough pieces are left for the tablebases
+        if self.tablebases is not None:
+            tablebaseMove = self.tablebases.getBestMove(board, color)
+            if tablebaseMove is not None:
+                (fromPosn, toPosn, result, plies) = tablebaseMove
+                QLAI._logger.info("Found tablebase move %s -> %s "
+                                  "(result %d in %s plies)", fromPosn, toPosn,
+                                  result, plies)
+                return (fromPosn, toPosn)
+
         QLAI._logger.info("Calculating next move")
-        (nextMv, _, nodesVisited) = self._boardSearch(board, color,
-                                                      SEARCH_DEPTH, -1, 1,
-                                                      True, time() +
-                                                      SEARCH_TIME_SECONDS)
+        nextMv = self._search(board, color, maxDepth, stopSrchTime)
 
         # Make sure we found a move
         if nextMv is None:
@@ -121,6 +293,55 @@ class QLAI(MaverickAI):
 
         return (fromPosn, toPosn)
 
+    def _search(self, board, color, maxDepth, stopSrchTime):
+        """Search one ply deeper at a time, up to the given depth
+
+        Reports the statistics of each iteration (see _reportSearchStats).
+
+        @param board: The board to find a move on
+        @param color: The color of the player to find a move for
+        @param maxDepth: The depth of the last iteration
+        @param stopSrchTime: Time after which no new iteration starts
+
+        @return: the best move found by the deepest iteration that found
+                 one, or None
+
+        The statistics of the search are left in lastSearchStats."""
+
+        self._searchStats = SearchStats()
+        try:
+            bestMove = None
+            for depth in xrange(1, maxDepth + 1):
+                self._searchStats.startIteration(depth)
+                (move, _, nodesVisited) = self._boardSearch(board, color,
+                                                            depth, -1, 1,
+                                                            True,
+                                                            stopSrchTime)
+                self._searchStats.endIteration(nodesVisited)
+                self._reportSearchStats(self._searchStats)
+                if move is not None:
+                    bestMove = move
+                if self.stopRequested or time() > stopSrchTime:
+                    break
+            return bestMove
+        finally:
+            self.lastSearchStats = self._searchStats
+            self._searchStats = None
+
+    def _reportSearchStats(self, stats):
+        """Log the statistics of a search iteration as a UCI info line, and
+        append them to the search log, if any
+
+        @param stats: a SearchStats"""
+        QLAI._logger.info(stats.toUCI())
+        if self.searchLogPath is not None:
+            record = stats.toDict()
+            record["engine"] = self.__class__.__name__
+            record["version"] = __version__
+            record["gameID"] = self.gameID
+            with open(self.searchLogPath, "a") as fd:
+                fd.write(json.dumps(record, sort_keys=True) + "\n")
+
     def _quiescentSearch(self, board, color, alpha, beta, isMaxNode):
         """Perform a quiescent search on the given board, examining captures
 
@@ -158,6 +379,9 @@ class QLAI(MaverickAI):
         moveFilterFunct = lambda m: ((board[m[1]] is not None) and
                                     (board[m[1]].color == otherColor))
         captureMoves = filter(moveFilterFunct, moveChoices)
+        if captureMoves:
+            stats = self._searchStats
+            stats.seldepth = max(stats.seldepth, stats.depth + 1)
 
         # Determine whether captures are a good or a bad thing
         if isMaxNode:
@@ -214,8 +438,9 @@ class QLAI(MaverickAI):
                      isMaxNode, stopSrchTime):
         """Performs a board via alpha-beta pruning/quiescence search
 
-        NOTE: Not guaranteed to stop promptly at stopSrchTime - may take some
-        time to terminate. Leave a time buffer.
+        NOTE: Not guaranteed to stop promptly at stopSrchTime (or once
+        stopRequested is set) - may take some time to terminate. Leave a time
+        buffer.
 
         Selectively explores past the final depth if many pieces have
         been captured recently, by calling quiescent search
@@ -266,9 +491,8 @@ class QLAI(MaverickAI):
             return (a, b, 1)
 
         # Check if we should otherwise terminate
-        elif (time() > stopSrchTime or
-              board.isKingCheckmated(color) or
-              board.isKingCheckmated(otherColor)):
+        elif (self.stopRequested or time() > stopSrchTime or
+              board.gameState(color) != ChessBoard.GAME_ONGOING):
             return (None, evaluateBoardLikability(color, board,
                                                   self.heuristicWgts),
                     nodesVisited)
@@ -278,28 +502,24 @@ class QLAI(MaverickAI):
             #logStrF = "Considering {0} poss. moves".format(len(moveChoices))
             #QLAI._logger.debug(logStrF)
 
+            # Ply of this node, counting from the root of the iteration
+            stats = self._searchStats
+            ply = stats.depth - depth
+
             # Check whether seeking to find minimum or maximum value
             if isMaxNode:
                 newMin = alpha
                 newMoveChoice = None
-                for move in moveChoices:
+                for (moveN, move) in enumerate(moveChoices):
 
-                    # Rather than calling getPlyResult, use THIS board. Much
-                    # faster. REMEMBER TO UNDO THIS HYPOTHETICAL MOVE
-
-                    # Save the old flag sets so they can be restored
-                    boardMoveUndoDict = board.getPlyResult(move[0], move[1])
-
-                    # Find the next move for this node, and how likable the
-                    # enemy will consider this child node
-                    (_, nodeEnemyLikability, nVisit) = self._boardSearch(board,
-                                                                 otherColor,
-                                                                 depth - 1,
-                                                                 newMin, beta,
-                                                                 not isMaxNode,
-                                                                 stopSrchTime)
-                    # RESTORE THE OLD BOARD STATE - VERY IMPORTANT
-                    board.undoPlyResult(boardMoveUndoDict)
+                    # Find how likable the enemy will consider this child node
+                    (nodeEnemyLikability, nVisit) = self._searchChild(
+                                                            board, move, ply,
+                                                            otherColor,
+                                                            depth - 1,
+                                                            newMin, beta,
+                                                            not isMaxNode,
+                                                            stopSrchTime)
 
                     # Note how many more nodes we've visited
                     nodesVisited += nVisit
@@ -309,10 +529,12 @@ class QLAI(MaverickAI):
                     if nodeEnemyLikability > newMin:
                         newMin = nodeEnemyLikability
                         newMoveChoice = move
+                        stats.noteBestMove(ply, move)
 
                     # Don't search outside of the target range
                     elif nodeEnemyLikability > beta:
                         #QLAI._logger.debug("Pruning because new value > beta")
+                        stats.noteCutoff(moveN)
                         return (move, beta, nodesVisited)
 
                     # Check to see if we've evaluated the max number of nodes
@@ -324,24 +546,16 @@ class QLAI(MaverickAI):
             else:
                 newMax = beta
                 newMoveChoice = None
-                for move in moveChoices:
-
-                    # Rather than calling getPlyResult, use THIS board. Much
-                    # faster. REMEMBER TO UNDO THIS HYPOTHETICAL MOVE
-
-                    # Save the old flag sets so they can be restored
-                    boardMoveUndoDict = board.getPlyResult(move[0], move[1])
+                for (moveN, move) in enumerate(moveChoices):
 
                     # Find how likable the enemy will consider this child node
-                    (_, nodeEnemyLikability, nVisit) = self._boardSearch(board,
-                                                                 otherColor,
-                                                                 depth - 1,
-                                                                 alpha, newMax,
-                                                                 not isMaxNode,
-                                                                 stopSrchTime)
-
-                    # RESTORE THE OLD BOARD STATE - VERY IMPORTANT:
-                    board.undoPlyResult(boardMoveUndoDict)
+                    (nodeEnemyLikability, nVisit) = self._searchChild(
+                                                            board, move, ply,
+                                                            otherColor,
+                                                            depth - 1,
+                                                            alpha, newMax,
+                                                            not isMaxNode,
+                                                            stopSrchTime)
 
                     # Note how many more nodes we've visited
                     nodesVisited += nVisit
@@ -351,30 +565,67 @@ class QLAI(MaverickAI):
                     if nodeEnemyLikability < newMax:
                         newMax = nodeEnemyLikability
                         newMoveChoice = move
+                        stats.noteBestMove(ply, move)
 
                     # Don't bother searching outside of our target range
                     elif nodeEnemyLikability < alpha:
                         #QLAI._logger.debug("pruning because new val < alpha")
+                        stats.noteCutoff(moveN)
                         return (move, alpha, nodesVisited)
 
                     # Check to see if we've evaluated the max number of nodes
                     if ((not USE_WALL_CLOCK) and
                         (nodesVisited > NUM_NODES_TO_VISIT)):
-                        return (newMoveChoice, newMin, nodesVisited)
+                        return (newMoveChoice, newMax, nodesVisited)
                 return (newMoveChoice, newMax, nodesVisited)
 
+    def _searchChild(self, board, move, ply, color, depth, alpha, beta,
+                     isMaxNode, stopSrchTime):
+        """Make a move, search the resulting board, and undo the move
+
+        @param move: the move to make, of form (fromChessPosn, toChessPosn)
+        @param ply: the ply of the board before the move
+        Other parameters are passed on to _boardSearch for the child node.
+
+        @return: a tuple of form (likability, nodesVisited) for the child
+                 node, as found by _boardSearch"""
+
+        # Rather than copying the board, use THIS board. Much faster.
+        ########## MUTATE THE BOARD STATE - MUST BE UNDONE: ##########
+        boardMoveUndoDict = board.getPlyResult(move[0], move[1])
+        self._searchStats.pvTable[ply + 1] = []
+
+        # A repeated position is a draw, so cut the cycle short
+        if board.isDrawnByRule(repetitions=1):
+            result = (0, 1)
+        else:
+            (_, likability, nodesVisited) = self._boardSearch(board, color,
+                                                              depth, alpha,
+                                                              beta,
+                                                              isMaxNode,
+                                                              stopSrchTime)
+            result = (likability, nodesVisited)
+
+        ########## RESTORE THE OLD BOARD STATE - VERY IMPORTANT: #####
+        board.undoPlyResult(boardMoveUndoDict)
+        return result
+
     def _showPlayerMove(self, board, fromPosn, toPosn):
         pass  # No printouts needed for AI
 
 
 def runAI(host=None, port=None, pieceValWeight=None, inCheckWeight=None,
           piecesUnderAttackWeight=None, emptySpaceCoverageWeight=None,
-          piecesCoveredWeight=None):
+          piecesCoveredWeight=None, wireFormat=None, bookPath=None,
+          tablebasePath=None, profilePath=None, searchLogPath=None):
     ai = QLAI(host=host, port=port, pieceValWgt=pieceValWeight,
               inCheckWgt=inCheckWeight,
               piecesUnderAttackWgt=piecesUnderAttackWeight,
               emptySpaceCoverageWgt=emptySpaceCoverageWeight,
-              piecesCoveredWgt=piecesCoveredWeight)
+              piecesCoveredWgt=piecesCoveredWeight,
+              wireFormat=wireFormat, bookPath=bookPath,
+              tablebasePath=tablebasePath, profilePath=profilePath,
+              searchLogPath=searchLogPath)
     ai.run(startFreshP=False)
 
 
@@ -384,22 +635,38 @@ def main():
                         help="specify hostname of Maverick server")
     parser.add_argument("--port", default=None, type=int,
                         help="specify port of Maverick server")
-    parser.add_argument("--piecevalweight", default=None, type=int,
+    parser.add_argument("--piecevalweight", default=None, type=float,
                         help="specify weight of pieceValue heuristic")
-    parser.add_argument("--incheckweight", default=None, type=int,
+    parser.add_argument("--incheckweight", default=None, type=float,
                         help="specify weight of inCheck heuristic")
-    parser.add_argument("--piecesunderattackweight", default=None, type=int,
+    parser.add_argument("--piecesunderattackweight", default=None, type=float,
                         help="specify weight of piecesUnderAttack heuristic")
-    parser.add_argument("--emptyspacecoverageweight", default=None, type=int,
+    parser.add_argument("--emptyspacecoverageweight", default=None, type=float,
                         help="specify weight of emptySpaceCoverage heuristic")
-    parser.add_argument("--piecescoveredweight", default=None, type=int,
+    parser.add_argument("--piecescoveredweight", default=None, type=float,
                         help="specify weight of piecesCovered heuristic")
+    parser.add_argument("--wireformat", default=WIRE_FORMAT_JSON,
+                        choices=[WIRE_FORMAT_JSON, WIRE_FORMAT_BINARY],
+                        help="specify wire format for server communication")
+    parser.add_argument("--book", default=None, type=str,
+                        help="specify opening book file to play from")
+    parser.add_argument("--tablebases", default=None, type=str,
+                        help="specify directory of endgame tablebases")
+    parser.add_argument("--profile", default=None, type=str, metavar="PATH",
+                        help="write a JSON profile of each move's search to "
+                             "PATH")
+    parser.add_argument("--searchlog", default=None, type=str, metavar="PATH",
+                        help="append the statistics of each search iteration "
+                             "to PATH as JSON lines")
     args = parser.parse_args()
     runAI(host=args.host, port=args.port, pieceValWeight=args.piecevalweight,
           inCheckWeight=args.incheckweight,
           piecesUnderAttackWeight=args.piecesunderattackweight,
           emptySpaceCoverageWeight=args.emptyspacecoverageweight,
-          piecesCoveredWeight=args.piecescoveredweight)
+          piecesCoveredWeight=args.piecescoveredweight,
+          wireFormat=args.wireformat, bookPath=args.book,
+          tablebasePath=args.tablebases, profilePath=args.profile,
+          searchLogPath=args.searchlog)
 
 if __name__ == '__main__':
     main()
@@ -17,6 +17,8 @@ import random
 from maverick.data.structs import ChessBoard
 from maverick.players.ais.common import MaverickAI, MaverickAIException
 from maverick.data.utils import enumMoves
+from maverick.wire import WIRE_FORMAT_BINARY
+from maverick.wire import WIRE_FORMAT_JSON
 
 
 __author__ = "Matthew Strax-Haber and James Magnarelli"
@@ -47,8 +49,8 @@ class RandomAI(MaverickAI):
             raise MaverickAIException("No possible moves... SEE CODE COMMENT")
 
 
-def runAI(host=None, port=None):
-    ai = RandomAI(host=host, port=port)
+def runAI(host=None, port=None, wireFormat=None):
+    ai = RandomAI(host=host, port=port, wireFormat=wireFormat)
     ai.run(startFreshP=False)
 
 
@@ -58,8 +60,11 @@ def main():
                         help="specify hostname of Maverick server")
     parser.add_argument("--port", default=None, type=int,
                         help="specify port of Maverick server")
+    parser.add_argument("--wireformat", default=WIRE_FORMAT_JSON,
+                        choices=[WIRE_FORMAT_JSON, WIRE_FORMAT_BINARY],
+                        help="specify wire format for server communication")
     args = parser.parse_args()
-    runAI(host=args.host, port=args.port)
+    runAI(host=args.host, port=args.port, wireFormat=args.wireformat)
 
 if __name__ == '__main__':
-    runAI()
+    main()
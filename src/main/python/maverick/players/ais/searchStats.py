@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+"""searchStats.py: Statistics of a search, reported after each iteration"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+from time import time
+
+from maverick.data.pgn import getSquareName
+from maverick.data.structs import ChessBoard
+
+__all__ = ["SearchStats",
+           "getMoveName"]
+
+# Overview of search statistics
+#
+# A search deepens one ply at a time, and after each iteration reports its
+# statistics in two forms: as a UCI "info" line (see toUCI), which chess GUIs
+# and tournament managers display, and as a dict (see toDict), which may be
+# written as JSON lines for plotting across engine versions.
+#
+# Nodes, time and cutoffs accumulate over all iterations of the search, as
+# UCI expects. The game state cache (see ChessBoard.gameState) stands in for
+# the transposition table in the hit rate.
+
+
+def getMoveName(move):
+    """Return the UCI name of a move (e.g., "e2e4")
+
+    @param move: a tuple of form (fromChessPosn, toChessPosn)"""
+    return getSquareName(move[0]) + getSquareName(move[1])
+
+
+class SearchStats(object):
+    """Statistics of one search, from the start of its first iteration"""
+
+    def __init__(self):
+        """Start counting, with no iteration done"""
+        self.startTime = time()
+        self.depth = 0
+        self.seldepth = 0
+        self.nodes = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0  # Cutoffs by the first move searched
+        self.pv = []
+        self._startCacheCounts = ChessBoard.getGameStateCacheCounts()
+
+        # The best line found from each ply of the current iteration, as
+        # lists of moves (only the line at ply 0 is complete)
+        self.pvTable = []
+
+    def startIteration(self, depth):
+        """Note that an iteration to the given depth is starting"""
+        self.depth = depth
+        self.seldepth = max(self.seldepth, depth)
+        self.pvTable = [[] for _ in xrange(depth + 2)]
+
+    def noteCutoff(self, moveN):
+        """Note a beta cutoff by the moveN-th move (from 0) of a node"""
+        self.betaCutoffs += 1
+        if moveN == 0:
+            self.firstMoveCutoffs += 1
+
+    def noteBestMove(self, ply, move):
+        """Note a new best move at the given ply, followed by the best line
+        from the ply after it"""
+        self.pvTable[ply] = [move] + self.pvTable[ply + 1]
+
+    def endIteration(self, nodes):
+        """Note that the current iteration is over
+
+        @param nodes: the number of nodes it visited"""
+        self.nodes += nodes
+        if self.pvTable[0]:
+            self.pv = self.pvTable[0]
+
+    def getElapsedMs(self):
+        """Return the milliseconds since the search started"""
+        return int((time() - self.startTime) * 1000)
+
+    def toDict(self):
+        """Return the statistics as a dict, ready for JSON
+
+        @return: a dict of form
+                 {"depth": n, "seldepth": n, "nodes": n, "timeMs": n,
+                  "nps": nodes per second, "ttHits": n, "ttProbes": n,
+                  "ttHitRate": fraction (None if no probes),
+                  "betaCutoffs": n, "firstMoveCutoffs": n,
+                  "firstMoveCutoffRate": fraction (None if no cutoffs),
+                  "pv": list of UCI move names}"""
+
+        timeMs = self.getElapsedMs()
+        cacheCounts = ChessBoard.getGameStateCacheCounts()
+        hits = cacheCounts["hits"] - self._startCacheCounts["hits"]
+        probes = (hits + cacheCounts["misses"] -
+                  self._startCacheCounts["misses"])
+        return {"depth": self.depth,
+                "seldepth": self.seldepth,
+                "nodes": self.nodes,
+                "timeMs": timeMs,
+                "nps": self.nodes * 1000 // max(timeMs, 1),
+                "ttHits": hits,
+                "ttProbes": probes,
+                "ttHitRate": (round(float(hits) / probes, 4) if probes
+                              else None),
+                "betaCutoffs": self.betaCutoffs,
+                "firstMoveCutoffs": self.firstMoveCutoffs,
+                "firstMoveCutoffRate": (
+                        round(float(self.firstMoveCutoffs) /
+                              self.betaCutoffs, 4) if self.betaCutoffs
+                        else None),
+                "pv": [getMoveName(move) for move in self.pv]}
+
+    def toUCI(self):
+        """Return the statistics as a UCI info line (without a newline)
+
+        Fields UCI has no name for (the hit rate and cutoffs) follow the PV
+        as an info string."""
+        stats = self.toDict()
+        fields = ["info",
+                  "depth", str(stats["depth"]),
+                  "seldepth", str(stats["seldepth"]),
+                  "time", str(stats["timeMs"]),
+                  "nodes", str(stats["nodes"]),
+                  "nps", str(stats["nps"])]
+        if stats["pv"]:
+            fields.append("pv")
+            fields.extend(stats["pv"])
+        fields.extend(["string",
+                       "tthitrate", str(stats["ttHitRate"]),
+                       "cutoffs", str(stats["betaCutoffs"]),
+                       "firstmovecutoffs", str(stats["firstMoveCutoffs"])])
+        return " ".join(fields)
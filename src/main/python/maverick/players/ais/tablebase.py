@@ -0,0 +1,374 @@
+#!/usr/bin/python
+
+"""tablebase.py: Probing of endgame tablebases for Maverick AIs"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import glob
+import logging
+import mmap
+import os
+
+from maverick.data.structs import ChessBoard
+from maverick.data.utils import enumMoves
+
+__all__ = ["Tablebases",
+           "TableLayout",
+           "MaverickTablebaseException",
+           "RESULT_WIN",
+           "RESULT_DRAW",
+           "RESULT_LOSS"]
+
+# Overview of the tablebase file format
+#
+# There is one file per material balance, named after it (e.g., "KQvK.mtb"
+# for white king and queen against black king), holding TABLE_MAGIC and then
+# one byte for each position (see TableLayout for how positions are
+# numbered). The byte is CODE_INVALID for impossible positions, CODE_DRAW for
+# drawn ones, and CODE_DECIDED plus the number of plies to mate otherwise.
+# Since the winner makes the mating ply, the side to move wins if the number
+# of plies is odd and loses if it is even.
+#
+# Tables are generated by retrograde analysis (see maverick.tools.tablebase)
+# under Maverick's rules, so pawns are never promoted. Positions where
+# castling or en passant capture is possible are not covered.
+
+TABLE_MAGIC = "MVTB1\n"
+"""Bytes at the start of every tablebase file"""
+
+TABLE_SUFFIX = ".mtb"
+"""Suffix of the names of tablebase files"""
+
+CODE_INVALID = 0
+CODE_DRAW = 1
+CODE_DECIDED = 2
+
+RESULT_WIN = 1
+RESULT_DRAW = 0
+RESULT_LOSS = -1
+
+_PIECE_ORDER = [ChessBoard.KING, ChessBoard.QUEN, ChessBoard.ROOK,
+                ChessBoard.BISH, ChessBoard.KNGT, ChessBoard.PAWN]
+"""Order of the pieces of each color in material names and positions"""
+
+_SIZE = ChessBoard.BOARD_LAYOUT_SIZE
+_NUM_SQUARES = _SIZE * _SIZE
+
+
+class MaverickTablebaseException(Exception):
+    """Raised when a tablebase is missing or invalid"""
+    pass
+
+
+def __makeTransforms():
+    """Return the 8 symmetries of the board, as lists mapping square numbers
+
+    The identity comes first, and the left-right mirror second."""
+    transforms = []
+    for (swapP, flipRankP, flipFileP) in [(False, False, False),
+                                          (False, False, True),
+                                          (False, True, False),
+                                          (False, True, True),
+                                          (True, False, False),
+                                          (True, False, True),
+                                          (True, True, False),
+                                          (True, True, True)]:
+        transform = []
+        for squareN in xrange(_NUM_SQUARES):
+            (rankN, fileN) = divmod(squareN, _SIZE)
+            if swapP:
+                (rankN, fileN) = (fileN, rankN)
+            if flipRankP:
+                rankN = _SIZE - 1 - rankN
+            if flipFileP:
+                fileN = _SIZE - 1 - fileN
+            transform.append(rankN * _SIZE + fileN)
+        transforms.append(transform)
+    return transforms
+
+_TRANSFORMS = __makeTransforms()
+
+# Squares the white king is moved into by symmetry: the a1-d1-d4 triangle
+# when there are no pawns, and otherwise the a-d files (as pawns only allow
+# the left-right mirror)
+_KING_REGIONS = {
+    False: [rankN * _SIZE + fileN for fileN in xrange(_SIZE // 2)
+            for rankN in xrange(fileN + 1)],
+    True: [squareN for squareN in xrange(_NUM_SQUARES)
+           if squareN % _SIZE < _SIZE // 2]}
+
+
+def __makeCanonicalTransforms():
+    """Return, for each white king square, the symmetry to apply
+
+    @return: a dict from True (if there are pawns) or False to a list of
+             transform indices indexed by white king square"""
+    canonical = {}
+    for (pawnsP, region) in _KING_REGIONS.iteritems():
+        numTransforms = 2 if pawnsP else len(_TRANSFORMS)
+        canonical[pawnsP] = [
+            [t for t in xrange(numTransforms)
+             if _TRANSFORMS[t][squareN] in region][0]
+            for squareN in xrange(_NUM_SQUARES)]
+    return canonical
+
+_CANONICAL_TRANSFORMS = __makeCanonicalTransforms()
+
+
+def getMaterialName(pieceTypes):
+    """Return the name of the given material balance (e.g., "KRvKN")
+
+    @param pieceTypes: a dict from color to a list of the piece types of
+                       that color"""
+    return "v".join(["".join([ChessBoard.FEN_PIECE_LETTERS[pieceType]
+                              for pieceType in sorted(pieceTypes[color],
+                                                      key=_PIECE_ORDER.index)])
+                     for color in [ChessBoard.WHITE, ChessBoard.BLACK]])
+
+
+class TableLayout(object):
+    """The numbering of the positions of one material balance
+
+    A position is given by the squares (rankN * 8 + fileN) of its pieces, in
+    the order of self.pieces (white king first, then the other white pieces,
+    black king, and the other black pieces, each ordered as _PIECE_ORDER),
+    and the color to move. It is first moved by symmetry so that the white
+    king is in the region of _KING_REGIONS, then numbered with the color to
+    move as the most significant digit, then the white king's index in the
+    region, then the squares of the other pieces in base 64."""
+
+    def __init__(self, name):
+        """@param name: a material name, as returned by getMaterialName
+
+        @raise MaverickTablebaseException: if the name is invalid"""
+        self.name = name
+        self.pieces = []
+        sides = name.split("v")
+        if len(sides) != 2:
+            raise MaverickTablebaseException("Invalid material: " + name)
+        letterTypes = dict((letter, pieceType) for (pieceType, letter)
+                           in ChessBoard.FEN_PIECE_LETTERS.iteritems())
+        for (color, side) in zip([ChessBoard.WHITE, ChessBoard.BLACK], sides):
+            pieceTypes = [letterTypes.get(letter) for letter in side]
+            if (None in pieceTypes or pieceTypes[:1] != [ChessBoard.KING] or
+                pieceTypes.count(ChessBoard.KING) != 1):
+                raise MaverickTablebaseException("Invalid material: " + name)
+            self.pieces.extend([(color, pieceType) for pieceType in
+                                sorted(pieceTypes, key=_PIECE_ORDER.index)])
+        if getMaterialName(self.getPieceTypes()) != name:
+            raise MaverickTablebaseException("Material not in order: " + name)
+
+        self.pawnsP = (ChessBoard.PAWN in
+                       [pieceType for (_, pieceType) in self.pieces])
+        self._region = _KING_REGIONS[self.pawnsP]
+        self._regionIndex = dict((squareN, i) for (i, squareN)
+                                 in enumerate(self._region))
+        self._canonical = _CANONICAL_TRANSFORMS[self.pawnsP]
+        self.size = (2 * len(self._region) *
+                     _NUM_SQUARES ** (len(self.pieces) - 1))
+
+    def getPieceTypes(self):
+        """Return a dict from color to the list of piece types of that color"""
+        pieceTypes = {ChessBoard.WHITE: [], ChessBoard.BLACK: []}
+        for (color, pieceType) in self.pieces:
+            pieceTypes[color].append(pieceType)
+        return pieceTypes
+
+    def getIndex(self, squares, colorToMove):
+        """Return the number of the given position
+
+        @param squares: the squares of the pieces, in the order of
+                        self.pieces"""
+        transform = _TRANSFORMS[self._canonical[squares[0]]]
+        index = (1 if colorToMove == ChessBoard.BLACK else 0)
+        index = (index * len(self._region) +
+                 self._regionIndex[transform[squares[0]]])
+        for squareN in squares[1:]:
+            index = index * _NUM_SQUARES + transform[squareN]
+        return index
+
+    def getPosition(self, index):
+        """Return the position with the given number
+
+        @return: a tuple of form (squares, colorToMove)"""
+        squares = []
+        for _ in xrange(len(self.pieces) - 1):
+            (index, squareN) = divmod(index, _NUM_SQUARES)
+            squares.append(squareN)
+        (index, regionN) = divmod(index, len(self._region))
+        squares.append(self._region[regionN])
+        squares.reverse()
+        return (squares, ChessBoard.BLACK if index else ChessBoard.WHITE)
+
+
+def decodeResult(code):
+    """Return the result a position's code stands for
+
+    @return: a tuple of form (result, plies), where result is one of
+             RESULT_WIN, RESULT_DRAW or RESULT_LOSS for the color to move and
+             plies is the number of plies to mate (None if drawn), or None
+             if the code is CODE_INVALID"""
+    if code == CODE_INVALID:
+        return None
+    elif code == CODE_DRAW:
+        return (RESULT_DRAW, None)
+    plies = code - CODE_DECIDED
+    return (RESULT_WIN if plies % 2 else RESULT_LOSS, plies)
+
+
+class Tablebases(object):
+    """The tablebase files in a directory, memory-mapped as they are needed"""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.players.ais.tablebase.Tablebases")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, directory):
+        """Find the tablebase files in the given directory"""
+        self.directory = directory
+
+        # Dict from material name to the path of its table
+        self._paths = {}
+        for path in glob.glob(os.path.join(directory, "*" + TABLE_SUFFIX)):
+            name = os.path.basename(path)[:-len(TABLE_SUFFIX)]
+            self._paths[name] = path
+
+        # Dict from material name to a tuple of form (TableLayout, mmap)
+        self._tables = {}
+
+        # The most pieces in any table (bare kings are always known)
+        self.maxPieces = max([2] + [len(name) - 1 for name in self._paths])
+
+        Tablebases._logger.debug("Found %d tables in %s", len(self._paths),
+                                 directory)
+
+    def __contains__(self, name):
+        return name in self._paths
+
+    def __getTable(self, name):
+        """Return the (TableLayout, mmap) of the named table"""
+        if name not in self._tables:
+            layout = TableLayout(name)
+            with open(self._paths[name], "rb") as fd:
+                size = os.fstat(fd.fileno()).st_size
+                if (size != len(TABLE_MAGIC) + layout.size or
+                    fd.read(len(TABLE_MAGIC)) != TABLE_MAGIC):
+                    raise MaverickTablebaseException(
+                            "Invalid tablebase file: " + self._paths[name])
+                tableMap = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            self._tables[name] = (layout, tableMap)
+        return self._tables[name]
+
+    def probe(self, board, color):
+        """Look up the given position in the tablebases
+
+        @param color: the color to move
+        @return: a tuple of form (result, plies), where result is one of
+                 RESULT_WIN, RESULT_DRAW or RESULT_LOSS for the color to move
+                 and plies is the number of plies to mate with best play
+                 (None if drawn), or None if the position is not covered"""
+
+        pieces = []
+        pieceTypes = {ChessBoard.WHITE: [], ChessBoard.BLACK: []}
+        for (rankN, row) in enumerate(board.layout):
+            for (fileN, piece) in enumerate(row):
+                if piece is not None:
+                    pieces.append((piece.color, piece.pieceType,
+                                   rankN * _SIZE + fileN))
+                    pieceTypes[piece.color].append(piece.pieceType)
+        if len(pieces) > self.maxPieces:
+            return None
+
+        # Castling and en passant captures are not in the tables
+        for (pieceColor, pieceType, squareN) in pieces:
+            if pieceType == ChessBoard.KING:
+                homeRank = 0 if pieceColor == ChessBoard.WHITE else _SIZE - 1
+                rook = [(pieceColor, ChessBoard.ROOK, homeRank * _SIZE),
+                        (pieceColor, ChessBoard.ROOK,
+                         homeRank * _SIZE + _SIZE - 1)]
+                for (flag, rookPiece) in zip(board.flag_canCastle[pieceColor],
+                                             rook):
+                    if (flag and squareN == homeRank * _SIZE + 4 and
+                        rookPiece in pieces):
+                        return None
+        if (ChessBoard.PAWN in pieceTypes[color] and
+            any(board.flag_enpassant[ChessBoard.getOtherColor(color)])):
+            return None
+
+        name = getMaterialName(pieceTypes)
+        if name not in self._paths:
+            flippedName = "v".join(reversed(name.split("v")))
+            if flippedName not in self._paths:
+                if len(pieces) == 2:
+                    return (RESULT_DRAW, None)  # Bare kings
+                return None
+
+            # Swap the colors and mirror the board top to bottom
+            name = flippedName
+            pieces = [(ChessBoard.getOtherColor(pieceColor), pieceType,
+                       (_SIZE - 1 - squareN // _SIZE) * _SIZE +
+                       squareN % _SIZE)
+                      for (pieceColor, pieceType, squareN) in pieces]
+            color = ChessBoard.getOtherColor(color)
+
+        (layout, tableMap) = self.__getTable(name)
+        squares = []
+        for (pieceColor, pieceType) in layout.pieces:
+            for (i, piece) in enumerate(pieces):
+                if piece[:2] == (pieceColor, pieceType):
+                    squares.append(pieces.pop(i)[2])
+                    break
+        index = len(TABLE_MAGIC) + layout.getIndex(squares, color)
+        return decodeResult(ord(tableMap[index]))
+
+    def getBestMove(self, board, color):
+        """Return the best move for the given color, by the tablebases
+
+        Wins are played to mate as fast as possible and losses are drawn out
+        as long as possible.
+
+        @return: a tuple of form (fromPosn, toPosn, result, plies), with
+                 result and plies as returned by probe for the position
+                 before the move, or None if the position or any of the
+                 positions after its moves is not covered"""
+
+        if self.probe(board, color) is None:
+            return None
+
+        otherColor = ChessBoard.getOtherColor(color)
+        best = None
+        for (fromPosn, toPosn) in enumMoves(board, color):
+            ################# MUTATE THE BOARD STATE - MUST BE UNDONE: ########
+            undoDict = board.getPlyResult(fromPosn, toPosn)
+            probed = self.probe(board, otherColor)
+            ################# RESTORE THE OLD BOARD STATE - VERY IMPORTANT: ###
+            board.undoPlyResult(undoDict)
+            if probed is None:
+                return None
+
+            # Rank the move by its result for us, then by speed of mate
+            (otherResult, plies) = probed
+            result = -otherResult
+            if result == RESULT_WIN:
+                rank = (result, -plies)
+            elif result == RESULT_LOSS:
+                rank = (result, plies)
+            else:
+                rank = (result, 0)
+            if best is None or rank > best[0]:
+                best = (rank, (fromPosn, toPosn, result,
+                               None if plies is None else plies + 1))
+        return None if best is None else best[1]
+
+    def close(self):
+        """Unmap the tables"""
+        for (_, tableMap) in self._tables.itervalues():
+            tableMap.close()
+        self._tables = {}
@@ -36,15 +36,17 @@ class MaverickPlayer(MaverickClient):
     SLEEP_TIME = 0.1
     """Amount of time to wait between requests when polling"""
 
-    def __init__(self, host=None, port=None):
+    def __init__(self, host=None, port=None, wireFormat=None):
         """Initialize a MaverickPlayer
 
         If host or port specified and not None, use them instead of defaults
+        (wireFormat is as for MaverickClient)
 
         NOTE: MaverickPlayer.startPlaying must be run to set playerID, gameID,
         and isWhite before the player can make moves"""
 
-        MaverickClient.__init__(self, host=host, port=port)
+        MaverickClient.__init__(self, host=host, port=port,
+                                wireFormat=wireFormat)
 
         # These variables must be overridden
         self.playerID = None    # ID for player's system registration
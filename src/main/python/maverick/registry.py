@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+"""registry.py: Player registration and ID allocation for the server"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import logging
+
+__all__ = ["IDAllocator",
+           "PlayerRegistry"]
+
+
+class IDAllocator(object):
+    """Hands out distinct integer IDs in [1,2**32-1] from a counter"""
+
+    MAX_ID = 2 ** 32 - 1
+    """Largest ID that can be allocated (IDs must fit in 32 bits)"""
+
+    def __init__(self, firstID=1):
+        """Initialize an allocator whose first ID is firstID"""
+        self._nextID = firstID
+
+    def allocate(self):
+        """Return a new ID, distinct from all others given by this allocator"""
+        if self._nextID > IDAllocator.MAX_ID:
+            raise RuntimeError("Cannot allocate more than 2**32-1 IDs")
+        newID = self._nextID
+        self._nextID += 1
+        return newID
+
+    def reserve(self, usedID):
+        """Ensure that the given ID (allocated elsewhere) is never handed out
+
+        Used when restoring IDs that were allocated by a previous allocator"""
+        self._nextID = max(self._nextID, usedID + 1)
+
+
+class PlayerRegistry(object):
+    """Two-way index between player names and player IDs"""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.registry.PlayerRegistry")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self):
+        """Initialize an empty registry"""
+        self.namesByID = {}  # Dict from playerID to player name
+        self._idsByName = {}  # Dict from player name to playerID
+        self._allocator = IDAllocator()
+
+    def register(self, name):
+        """Return the ID of the player with the given name, adding if new
+
+        @return: a tuple of form (playerID, newP), where newP is True iff the
+                 player was not previously registered"""
+
+        playerID = self._idsByName.get(name)
+        if playerID is not None:
+            return (playerID, False)
+
+        playerID = self._allocator.allocate()
+        self._idsByName[name] = playerID
+        self.namesByID[playerID] = name
+        PlayerRegistry._logger.debug("Registered %s with playerID %d",
+                                     name, playerID)
+        return (playerID, True)
+
+    def registerBatch(self, names):
+        """Register each of the given names
+
+        @return: a list of the players' IDs, in the order of the names"""
+        return [self.register(name)[0] for name in names]
+
+    def getID(self, name):
+        """Return the ID of the player with the given name, or None"""
+        return self._idsByName.get(name)
+
+    def __contains__(self, playerID):
+        return playerID in self.namesByID
+
+    def __len__(self):
+        return len(self.namesByID)
@@ -17,19 +17,41 @@ __version__ = "1.0"
 from argparse import ArgumentDefaultsHelpFormatter
 from argparse import ArgumentParser
 
+import collections
 import json
 import logging
 import pickle
-import random
+import time
 
+from maverick.archive import GameArchive
+from maverick.broadcast import GameBroadcaster
+from maverick.broadcast import WatchSubscription
 from maverick.data.structs import ChessBoard
 from maverick.data.structs import ChessMatch
 from maverick.data.structs import ChessPosn
-
+from maverick.journal import JournalSnapshotter
+from maverick.journal import recover
+from maverick.matchmaking import MatchmakingQueue
+from maverick.metrics import ServerMetrics
+from maverick.metrics import listenHTTP
+from maverick.registry import IDAllocator
+from maverick.registry import PlayerRegistry
+from maverick.wire import MaverickWireException
+from maverick.wire import WIRE_FORMAT_BINARY
+from maverick.wire import WIRE_FORMAT_JSON
+from maverick.wire import decodeRequest
+from maverick.wire import encodeFrame
+from maverick.wire import encodeResponse
+from maverick.wire import splitFrames
+
+from twisted.internet import defer
 from twisted.internet import endpoints
 from twisted.internet import protocol
 from twisted.internet import reactor
+from twisted.internet import task
+from twisted.internet import threads
 from twisted.protocols import basic as basicProtocols
+from twisted.python import failure
 
 
 __all__ = ["TournamentSystem",
@@ -46,12 +68,52 @@ class TournamentSystem(object):
     # Initialize if not already initialized
     logging.basicConfig(level=logging.INFO)
 
-    def __init__(self):
-        """Initializes a new tournament system with no games"""
+    DEFAULT_ARCHIVE_GRACE_PERIOD = 60
+    """Default number of seconds that finished games stay in memory"""
+
+    def __init__(self, ratingBandWidth=None, archivePath=None,
+                 archiveGracePeriod=DEFAULT_ARCHIVE_GRACE_PERIOD):
+        """Initializes a new tournament system with no games
+
+        @param ratingBandWidth: if not None, only players whose ratings fall
+                                in the same band of this width are matched
+        @param archivePath: if not None, the path of a file to which finished
+                            games are moved by archiveFinishedGames
+        @param archiveGracePeriod: the number of seconds that a finished game
+                                   stays in memory before being archived"""
         self.games = {}  # Dict from gameIDs to game objects. Initially empty.
-        self.players = {}  # Dict from playerID to player name
+        self._registry = PlayerRegistry()
+        self.players = self._registry.namesByID  # Dict from ID to name
+        self._gameIDs = IDAllocator()  # Allocator of IDs for new games
+        self.ratings = {}  # Dict from playerID to rating, for those rated
+
+        # Index of pending games and of each player's active games
+        self._matchmaking = MatchmakingQueue(ratingBandWidth=ratingBandWidth)
+
+        # Finished games still in memory, as (finishedAt, gameID) tuples in
+        # order of finishing
+        self._finishedGames = collections.deque()
+        self.archiveGracePeriod = archiveGracePeriod
+        if archivePath is None:
+            self._archive = None
+        else:
+            self._archive = GameArchive(archivePath)
+            # Never reuse the IDs of games archived by earlier servers
+            for gameID in self._archive.getGameIDs():
+                self._gameIDs.reserve(gameID)
         self._version = __version__  # Used in version check during un-pickling
 
+        # Write-ahead log of changes (None if not journaled)
+        self._journal = None
+
+        # Sender of game events to spectators (None if not broadcasting)
+        self._broadcaster = None
+
+        # Whether plies are validated in the reactor's thread pool, and the
+        # plies waiting for the ply in flight in each game (see makePly)
+        self._offloadPliesP = False
+        self._plyQueues = {}
+
         # Log initialization
         TournamentSystem._logger.debug("Initialized")
 
@@ -60,8 +122,8 @@ class TournamentSystem(object):
         """Pickles the current games' states to a file
 
         @param fileName: The file to save state to"""
-        fd = open(fileName)
-        pickle.dump(tournament, fd)
+        with open(fileName, "wb") as fd:
+            pickle.dump(tournament, fd, pickle.HIGHEST_PROTOCOL)
         TournamentSystem._logger.debug("Dumped game state to %s", fileName)
 
     @staticmethod
@@ -70,17 +132,55 @@ class TournamentSystem(object):
 
         @param fileName: file created using TournamentSystem.saveGames"""
 
-        fd = open(fileName)
-        tournament = pickle.load(fd)
+        with open(fileName, "rb") as fd:
+            tournament = pickle.load(fd)
 
         if (tournament._version != __version__):
             raise TypeError("Attempted loading of an incompatible version")
 
-        logStrF = "Loaded game state from pickle file at "
+        logStrF = "Loaded game state from pickle file at %s"
         TournamentSystem._logger.debug(logStrF, fileName)
 
         return tournament
 
+    def __getstate__(self):
+        """Pickle everything but the journal, spectators and plies in flight"""
+        state = self.__dict__.copy()
+        state["_journal"] = None
+        state["_broadcaster"] = None
+        state["_offloadPliesP"] = False
+        state["_plyQueues"] = {}
+        return state
+
+    def __setstate__(self, state):
+        state.setdefault("_broadcaster", None)
+        state.setdefault("_offloadPliesP", False)
+        state.setdefault("_plyQueues", {})
+        self.__dict__.update(state)
+
+    def attachJournal(self, journal):
+        """Record all further changes in the given maverick.journal.Journal
+
+        @param journal: a Journal, or None to stop journaling"""
+        self._journal = journal
+
+    def attachBroadcaster(self, broadcaster):
+        """Send events of all games to the given maverick.broadcast broadcaster
+
+        @param broadcaster: a GameBroadcaster, or None to stop broadcasting"""
+        self._broadcaster = broadcaster
+
+    def setPlyOffloading(self, enabledP):
+        """Set whether plies are validated in the reactor's thread pool
+
+        While enabled, makePly returns a Deferred firing with its result, so
+        that checking a ply (the most expensive request) does not hold up
+        the reactor. Plies within a game are still applied one at a time, in
+        the order in which they were received.
+
+        @param enabledP: True to validate plies in the thread pool"""
+        self._offloadPliesP = enabledP
+
     def register(self, name):
         """Registers a player with the system, returning their playerID.
 
@@ -92,16 +192,39 @@ class TournamentSystem(object):
         error message"}).  On success, returns a tuple of form (True,
         {"PlayerID": someInteger})"""
 
-        if name in self.players.itervalues():
-            userPID = dict((self.players[k], k) for k in self.players)[name]
+        (playerID, newP) = self._registry.register(name)
+        if not newP:
             self._logger.debug("Player already exists, giving ID")
-            return (True, {"playerID": userPID})
-        else:
-            newID = _getUniqueInt(self.players.keys())
-            self.players[newID] = name
-            TournamentSystem._logger.debug("Registered %s with playerID %d",
-                                          name, newID)
-            return (True, {"playerID": newID})
+        elif self._journal is not None:
+            self._journal.logRegister(playerID, name)
+        return (True, {"playerID": playerID})
+
+    def registerBatch(self, names):
+        """Registers many players at once, returning their playerIDs.
+
+        Players who are already registered keep their existing IDs.
+
+        @param names: A list of Strings containing the players' names
+
+        @return: On failure, returns a tuple of form (False, {"error": "some
+        error message"}).  On success, returns a tuple of form (True,
+        {"playerIDs": [someInteger, ...]}), in the order of the names"""
+
+        if (not isinstance(names, list) or
+                not all(isinstance(name, basestring) for name in names)):
+            return (False, {"error": "Names must be a list of strings"})
+
+        newNames = set(name for name in names
+                       if self._registry.getID(name) is None)
+        playerIDs = self._registry.registerBatch(names)
+        if self._journal is not None:
+            for (name, playerID) in zip(names, playerIDs):
+                if name in newNames:
+                    newNames.discard(name)  # Once, even if named twice
+                    self._journal.logRegister(playerID, name)
+        TournamentSystem._logger.debug("Registered batch of %d players",
+                                      len(names))
+        return (True, {"playerIDs": playerIDs})
 
     def joinGame(self, playerID, startFreshP):
         """Adds the player to a new or pending game.
@@ -117,26 +240,214 @@ class TournamentSystem(object):
         TournamentSystem._logger.debug(logStrF, playerID, str(startFreshP))
 
         # Add the player to a pending game if one exists
-        for gameID, game in self.games.iteritems():
-            if game.status == ChessMatch.STATUS_PENDING:
-                color = game.join(playerID, p2ReqFreshStart=startFreshP)
-                if color:
-                    logStrF = "Added player %d to existing game %d (sfP=%s)"
-                    TournamentSystem._logger.debug(logStrF,
-                                                   playerID,
-                                                   gameID,
-                                                   str(startFreshP))
-                    return (True, {"gameID": gameID,
-                                   "startFreshP": startFreshP})
+        rating = self.ratings.get(playerID)
+        gameID = self._matchmaking.popPendingGame(playerID, startFreshP,
+                                                  rating=rating)
+        while gameID is not None:
+            if self.__joinPendingGame(playerID, gameID, startFreshP):
+                return (True, {"gameID": gameID,
+                               "startFreshP": startFreshP})
+            gameID = self._matchmaking.popPendingGame(playerID, startFreshP,
+                                                      rating=rating)
 
         # Add a player to a new game otherwise
+        newID = self._gameIDs.allocate()
+        self.__createGame(playerID, newID, startFreshP)
+        return (True, {"gameID": newID})
+
+    def joinGameWithID(self, playerID, gameID, startFreshP):
+        """Adds the player to the game with the given ID, creating it if new
+
+        Used by shard workers, whose game IDs are allocated by a router (see
+        maverick.sharding), instead of joinGame.
+
+        @return: On failure, returns a tuple of form (False, {"error": "some
+        error message"}).  On success, returns a tuple of form (True,
+        {"gameID": someInteger})"""
+
+        if gameID not in self.games:
+            self._gameIDs.reserve(gameID)
+            self.__createGame(playerID, gameID, startFreshP)
+            return (True, {"gameID": gameID})
+
+        self._matchmaking.removePendingGame(gameID)
+        if self.__joinPendingGame(playerID, gameID, startFreshP):
+            return (True, {"gameID": gameID, "startFreshP": startFreshP})
+        else:
+            return (False, {"error": "Game not pending"})
+
+    def __joinPendingGame(self, playerID, gameID, startFreshP):
+        """Add the player to the given pending game, if possible
+
+        @return: True if the player joined the game, False otherwise"""
+
+        match = self.games[gameID]
+        color = match.join(playerID, p2ReqFreshStart=startFreshP)
+        if not color:
+            return False
+
+        self._matchmaking.addActiveGame(playerID, gameID)
+        if self._journal is not None:
+            self._journal.logJoin(playerID, gameID, startFreshP, color,
+                                  match.board)
+        if self._broadcaster is not None:
+            self._broadcaster.publishStatus(gameID, match)
+        logStrF = "Added player %d to existing game %d (sfP=%s)"
+        TournamentSystem._logger.debug(logStrF, playerID, gameID,
+                                       str(startFreshP))
+        return True
+
+    def __createGame(self, playerID, gameID, startFreshP):
+        """Create a pending game with the given ID for the given player"""
+
         newMatch = ChessMatch(firstPlayerID=playerID,
                               p1ReqFreshStart=startFreshP)
-        newID = _getUniqueInt(self.games.keys())
-        self.games[newID] = newMatch
+        self.games[gameID] = newMatch
+        self._matchmaking.addPendingGame(gameID, playerID, startFreshP,
+                                         rating=self.ratings.get(playerID))
+        self._matchmaking.addActiveGame(playerID, gameID)
+        if self._journal is not None:
+            self._journal.logJoin(playerID, gameID, startFreshP,
+                                  newMatch.getColorOfPlayer(playerID), None)
         TournamentSystem._logger.debug("Added player %d to new game %d",
-                                      playerID, newID)
-        return (True, {"gameID": newID})
+                                      playerID, gameID)
+
+    def _replayJoin(self, playerID, gameID, startFreshP, color, board,
+                    timestamp=None):
+        """Repeat a journaled join, with the same outcome as the original
+
+        @param color: the color the player was given
+        @param board: the initial board, if the join started the game
+        @param timestamp: the time of the join"""
+
+        match = self.games.get(gameID)
+        if match is None:
+            match = ChessMatch(firstPlayerID=playerID,
+                               p1ReqFreshStart=startFreshP,
+                               firstPlayerColor=color)
+            self._gameIDs.reserve(gameID)
+            self.games[gameID] = match
+            self._matchmaking.addPendingGame(gameID, playerID, startFreshP,
+                                             rating=self.ratings.get(playerID))
+            self._matchmaking.addActiveGame(playerID, gameID)
+        else:
+            self._matchmaking.removePendingGame(gameID)
+            match.join(playerID, p2ReqFreshStart=startFreshP, board=board)
+            self._matchmaking.addActiveGame(playerID, gameID)
+            if timestamp is not None:
+                match.startedAt = timestamp
+
+    def setRating(self, playerID, rating):
+        """Set the rating used to match the given player with opponents
+
+        Only affects games joined after the call.
+
+        @param playerID: The integer playerID of a registered player
+        @param rating: A number, or None to clear the player's rating
+
+        @return: On failure, returns a tuple of form (False, {"error": "some
+        error message"}).  On success, returns a tuple of form (True, {})"""
+
+        if playerID not in self.players:
+            return (False, {"error": "Invalid player ID"})
+
+        if rating is None:
+            self.ratings.pop(playerID, None)
+        else:
+            self.ratings[playerID] = rating
+        if self._journal is not None:
+            self._journal.logRating(playerID, rating)
+        return (True, {})
+
+    def getActiveGames(self, playerID):
+        """Returns the IDs of the pending and ongoing games of a player
+
+        @param playerID: The integer playerID of a registered player
+
+        @return: On failure, returns a tuple of form (False, {"error": "some
+        error message"}).  On success, returns a tuple of form (True,
+        {"gameIDs": [someInteger, ...]})"""
+
+        if playerID not in self.players:
+            return (False, {"error": "Invalid player ID"})
+        else:
+            return self.getGamesOfPlayer(playerID)
+
+    def getGamesOfPlayer(self, playerID):
+        """Returns the IDs of the pending and ongoing games of any playerID
+
+        Unlike getActiveGames, this does not require the player to have been
+        registered here (shard workers do not register players).
+
+        @return: A tuple of form (True, {"gameIDs": [someInteger, ...]})"""
+
+        gameIDs = sorted(self._matchmaking.getActiveGames(playerID))
+        return (True, {"gameIDs": gameIDs})
+
+    def __removeFinishedGame(self, gameID):
+        """Remove the given game from the matchmaking indexes
+
+        If the tournament system has an archive, the game is queued to be
+        archived once its grace period is over"""
+        match = self.games[gameID]
+        playerIDs = [pID for pID in match.players.itervalues()
+                     if pID is not None]
+        self._matchmaking.finishGame(gameID, playerIDs)
+        if self._archive is not None:
+            self._finishedGames.append((match.finishedAt, gameID))
+
+    def archiveFinishedGames(self, now=None):
+        """Move games that finished over a grace period ago to the archive
+
+        Archived games can still be queried with getStatus and getState.
+        Does nothing if the tournament system has no archive.
+
+        @param now: the current time (defaults to time.time())
+
+        @return: the number of games archived"""
+
+        if self._archive is None:
+            return 0
+        if now is None:
+            now = time.time()
+
+        cutoff = now - self.archiveGracePeriod
+        archivedIDs = []
+        while self._finishedGames and self._finishedGames[0][0] <= cutoff:
+            (_, gameID) = self._finishedGames.popleft()
+            if gameID in self.games:  # Not already archived in a replay
+                self._archive.append(gameID, self.games.pop(gameID))
+                archivedIDs.append(gameID)
+        numArchived = len(archivedIDs)
+
+        if numArchived:
+            self._archive.sync()
+            if self._journal is not None:
+                for gameID in archivedIDs:
+                    self._journal.logArchive(gameID)
+            TournamentSystem._logger.debug("Archived %d finished games",
+                                          numArchived)
+        return numArchived
+
+    def _replayArchive(self, gameID):
+        """Repeat a journaled move of a game to the archive"""
+        self.games.pop(gameID, None)
+
+    def _replayFinishTime(self, gameID, timestamp):
+        """Restore the journaled finish time of a replayed game, if over"""
+        match = self.games.get(gameID)
+        if match is not None and match.finishedAt is not None:
+            match.finishedAt = timestamp
+
+    def __getMatch(self, gameID):
+        """Return the game with the given ID, in memory or archived, or None
+
+        Archived games are shared with the archive's cache, so must not be
+        changed"""
+        match = self.games.get(gameID)
+        if match is None and self._archive is not None:
+            match = self._archive.get(gameID)
+        return match
 
     def cancelGame(self, gameID):
         """Marks the given match as cancelled
@@ -148,10 +459,19 @@ class TournamentSystem(object):
         if gameID in self.games:
             if (self.games[gameID].status in [ChessMatch.STATUS_ONGOING,
                                               ChessMatch.STATUS_PENDING]):
-                TournamentSystem._logger("Canceled game %d", gameID)
-                self.games[gameID].status = ChessMatch.STATUS_CANCELLED
+                TournamentSystem._logger.debug("Canceled game %d", gameID)
+                self.games[gameID].cancel()
+                self.__removeFinishedGame(gameID)
+                if self._journal is not None:
+                    self._journal.logCancel(gameID)
+                if self._broadcaster is not None:
+                    self._broadcaster.publishStatus(gameID,
+                                                    self.games[gameID])
+                return (True, {})
             else:
                 return (False, {"error": "Game not active"})
+        elif self._archive is not None and gameID in self._archive:
+            return (False, {"error": "Game not active"})
         else:
             return (False, {"error": "Invalid game ID"})
 
@@ -164,14 +484,34 @@ class TournamentSystem(object):
         error message"}).  On success, returns a tuple of form (True,
         {"status": someStatus})"""
 
-        if gameID in self.games:
-            status = self.games[gameID].status
+        match = self.__getMatch(gameID)
+        if match is not None:
+            status = match.status
             TournamentSystem._logger.debug("Found status of game %d to be %s",
                                           gameID, status)
             return (True, {"status": status})
         else:
             return (False, {"error": "Invalid game ID"})
 
+    def getGameCounts(self):
+        """Return the number of games with each status
+
+        Archived games are counted under "ARCHIVED" rather than their status
+        (only games still in memory are looked at).
+
+        @return: a dict from status to number of games"""
+        counts = dict((status, 0) for status in [ChessMatch.STATUS_PENDING,
+                                                 ChessMatch.STATUS_ONGOING,
+                                                 ChessMatch.STATUS_BLACK_WON,
+                                                 ChessMatch.STATUS_WHITE_WON,
+                                                 ChessMatch.STATUS_DRAWN,
+                                                 ChessMatch.STATUS_CANCELLED])
+        for match in self.games.itervalues():
+            counts[match.status] += 1
+        if self._archive is not None:
+            counts["ARCHIVED"] = len(self._archive)
+        return counts
+
     @staticmethod
     def __getState_serializeLayout(board):
         """Serialize the layout of the given ChessBoard object
@@ -182,7 +522,7 @@ class TournamentSystem(object):
                     each either None or a tuple of form (pieceColor, pieceType)
                  Otherwise, the string \"GAME NOT STARTED\""""
 
-        if not board.layout:
+        if board is None or not board.layout:
             return "BOARD NOT INITIALIZED"
 
         # Accumulator for return value
@@ -231,8 +571,8 @@ class TournamentSystem(object):
 
         @return:    On failure: tuple of form (False, {"error": "some err"}),
             On success: tuble of form (True, {"isMyTurn": True/False/None})"""
-        if gameID in self.games:
-            match = self.games[gameID]
+        match = self.__getMatch(gameID)
+        if match is not None:
             myColor = match.getColorOfPlayer(playerID)
             if myColor is None:
                 return (False, {"error": "Not a player in the game"})
@@ -241,21 +581,30 @@ class TournamentSystem(object):
         else:
             return (False, {"error": "Invalid game ID"})
 
-    def getState(self, playerID, gameID):
+    def getState(self, playerID, gameID, sinceVersion=None):
         """Returns the current state of the game
 
         The state contains information about
         the playerIDs of the black and white players, whose turn it is,
         the current board state, and the game history.
 
+        If sinceVersion is provided (and is a state version of this game
+        reported by a previous call, taken after the board was initialized),
+        only the plies made since that version are returned along with the
+        current flags. Otherwise, the full layout and history are returned.
+
         @param gameID:  the integer gameID of an in-progress game
+        @param sinceVersion: the "stateVersion" from a previous response
 
         @return: On failure, returns a tuple of form (False, {"error": "some
         error message"}).  On success, returns a tuple of form (True,
         {"youAreColor": ChessBoard.WHITE or ChessBoard.BLACK,
          "isWhitesTurn": someBoolean,
+         "stateVersion": the current state version of the game,
+         "isDelta": True if only plies since sinceVersion are included,
+         "historyStart": index in the full history of the first ply given,
          "board": {"layout": 2d board array as returned by
-                        __getState_serializeLayout,
+                        __getState_serializeLayout (omitted in deltas),
                    "enPassantFlags": flags of form
                         ChessBoard.flag_enpassant,
                     "canCastleFlags": flags of form
@@ -266,24 +615,45 @@ class TournamentSystem(object):
                       'toRank': toRank,
                       'toFile': toFile}"""
 
-        if gameID in self.games:
-            g = self.games[gameID]
-
+        g = self.__getMatch(gameID)
+        if g is not None:
             # Determine which player the client is
             youAreColor = g.getColorOfPlayer(playerID)
             if youAreColor is None:
                 return (False, {"error": "You are not a player in this game"})
 
-            # Serialize layout and history
-            serialLayout = TournamentSystem.__getState_serializeLayout(g.board)
-            serialHst = TournamentSystem.__getState_serializeHistory(g.history)
+            # Only send a delta if the client's version is one we can use
+            isDelta = (sinceVersion is not None and
+                       g.boardVersion is not None and
+                       g.boardVersion <= sinceVersion <= g.stateVersion)
 
-            board = {"layout": serialLayout,
-                     "enPassantFlags": g.board.flag_enpassant,
-                     "canCastleFlags": g.board.flag_canCastle}
+            if isDelta:
+                (historyStart, plies) = g.getPliesSince(sinceVersion)
+                serialHst = TournamentSystem.__getState_serializeHistory(plies)
+                board = {"enPassantFlags": g.board.flag_enpassant,
+                         "canCastleFlags": g.board.flag_canCastle}
+            else:
+                # Serialize layout and history
+                historyStart = 0
+                serialLayout = \
+                    TournamentSystem.__getState_serializeLayout(g.board)
+                serialHst = \
+                    TournamentSystem.__getState_serializeHistory(g.history)
+
+                if g.board is None:
+                    board = {"layout": serialLayout,
+                             "enPassantFlags": None,
+                             "canCastleFlags": None}
+                else:
+                    board = {"layout": serialLayout,
+                             "enPassantFlags": g.board.flag_enpassant,
+                             "canCastleFlags": g.board.flag_canCastle}
 
             return (True, {"youAreColor": youAreColor,
                            "isWhitesTurn": (g.whoseTurn() == ChessBoard.WHITE),
+                           "stateVersion": g.stateVersion,
+                           "isDelta": isDelta,
+                           "historyStart": historyStart,
                            "board": board,
                            "history": serialHst})
         else:
@@ -301,44 +671,106 @@ class TournamentSystem(object):
         @param toFile: The rank to which the piece should be moved
 
         @return: On failure, returns a tuple of form (False, {"error": "some
-        error message"}).  On success, returns a tuple of form (True, {})"""
+        error message"}).  On success, returns a tuple of form (True, {}).
+        If ply offloading is enabled (see setPlyOffloading), returns a
+        Deferred that fires with that tuple instead."""
 
         # Build ChessPosn objects from received client data
 
         fromPosn = ChessPosn(fromRank, fromFile)
         toPosn = ChessPosn(toRank, toFile)
 
-        if gameID in self.games:
-            result = self.games[gameID].makePly(playerID, fromPosn, toPosn)
-            if result == "SUCCESS":
-                return (True, {})
-            else:
-                return (False, {"error": result})
-        else:
+        if gameID not in self.games:
             return (False, {"error": "Invalid game ID"})
 
+        if not self._offloadPliesP:
+            match = self.games[gameID]
+            result = match.makePly(playerID, fromPosn, toPosn)
+            return self.__makePly_recorded(result, match, playerID, gameID,
+                                           fromPosn, toPosn)
+
+        # Queue the ply behind any ply of this game that is in flight
+        d = defer.Deferred()
+        ply = (playerID, fromPosn, toPosn, d)
+        if gameID in self._plyQueues:
+            self._plyQueues[gameID].append(ply)
+        else:
+            self._plyQueues[gameID] = collections.deque([ply])
+            self.__makePly_runQueue(gameID)
+        return d
+
+    def __makePly_runQueue(self, gameID):
+        """Send the next queued ply of the given game to the thread pool
+
+        Plies that can be rejected without checking the board are answered
+        right away. The game's queue is removed once it is empty."""
+
+        queue = self._plyQueues[gameID]
+        while queue:
+            (playerID, fromPosn, toPosn, d) = queue.popleft()
+            match = self.games.get(gameID)
+            if match is None:
+                d.callback((False, {"error": "Invalid game ID"}))
+                continue
+
+            (color, errMsg) = match.checkPly(playerID)
+            if errMsg is not None:
+                d.callback((False, {"error": errMsg}))
+                continue
+
+            computeD = threads.deferToThread(match.computePly, color,
+                                             fromPosn, toPosn)
+            computeD.addCallback(self.__makePly_commit, match, playerID,
+                                 gameID, fromPosn, toPosn)
+            computeD.addBoth(self.__makePly_done, gameID, d)
+            return
+
+        del self._plyQueues[gameID]
+
+    def __makePly_commit(self, (board, status), match, playerID, gameID,
+                         fromPosn, toPosn):
+        """Apply a ply checked in the thread pool (in the reactor thread)"""
+        if board is None:
+            result = "Illegal move"
+        else:
+            result = match.commitPly(fromPosn, toPosn, board, status)
+        return self.__makePly_recorded(result, match, playerID, gameID,
+                                       fromPosn, toPosn)
+
+    def __makePly_done(self, result, gameID, d):
+        """Answer an offloaded ply and start on the next one in its game"""
+        if isinstance(result, failure.Failure):
+            d.errback(result)
+        else:
+            d.callback(result)
+        self.__makePly_runQueue(gameID)
+
+    def __makePly_recorded(self, result, match, playerID, gameID, fromPosn,
+                           toPosn):
+        """Journal a ply made in the given match and update the indexes
+
+        @param result: the result of making the ply in the match
+        @return: the response to the makePly request"""
+        if result == "SUCCESS":
+            if self._journal is not None:
+                self._journal.logPly(playerID, gameID,
+                                     fromPosn.rankN, fromPosn.fileN,
+                                     toPosn.rankN, toPosn.fileN)
+            if match.status != ChessMatch.STATUS_ONGOING:
+                self.__removeFinishedGame(gameID)
+            if self._broadcaster is not None:
+                self._broadcaster.publishPly(gameID, match)
+            return (True, {})
+        else:
+            return (False, {"error": result})
 
-def _getUniqueInt(intList):
-    """Return a random integer in [1,2**32-1] that is not in intList"""
-    maxVals = 2 ** 32 - 1   # Maximum value of an int
-    maxSize = 2 ** 31     # Maximum number of allocated ints
-
-    # Fail fast if the list is more than half filled in
-    if (len(intList) >= maxSize):
-        raise RuntimeError("Cannot play more than 2**31-1 games concurrently")
-
-    # Get a unique value
-    n = random.randint(1, maxVals)
-    while n in intList:
-        n = random.randint(1, maxVals)
-    return n
 
 """Default port for server"""
 DEFAULT_MAVERICK_PORT = 7782
 # Port 7782 isn't registered for use with the IANA as of December 17th, 2002
 
 
-class MaverickServerProtocol(basicProtocols.LineOnlyReceiver):
+class MaverickServerProtocol(basicProtocols.LineReceiver):
     """Protocol for asynchronous server that administers chess games to clients
 
     Initiates all connections with a message:
@@ -351,7 +783,22 @@ class MaverickServerProtocol(basicProtocols.LineOnlyReceiver):
      if Successful:    SUCCESS {JSON of response}
      if Error:         ERROR {error message} [{query}]
 
-    After the query is responded to, the server disconnects the client"""
+    After the query is responded to, the server disconnects the client
+
+    A client may instead send SET_WIRE_FORMAT {"format": "binary"}, after
+    which the connection is kept open and requests and responses are
+    exchanged as length-prefixed binary frames (see maverick.wire)
+
+    BATCH {"requests": [{"verb": VERB, "args": {JSON of arguments}}, ...]}
+    answers many requests at once with SUCCESS {"results": [...]}, holding
+    {"result": {JSON of response}} or {"error": error message} for each.
+
+    If the server keeps metrics, STATS {} returns them (see
+    maverick.metrics.ServerMetrics.getStats)
+
+    If the server broadcasts games, WATCH {"gameIDs": [gameIDs] or null}
+    keeps the connection open and streams events of the given games (or of
+    all games, if null) to it (see maverick.broadcast)"""
 
     # Initialize class logger
     _logger = logging.getLogger("maverick.server.MaverickServerProtocol")
@@ -367,6 +814,9 @@ class MaverickServerProtocol(basicProtocols.LineOnlyReceiver):
     VALID_REQUESTS = {"REGISTER": (TournamentSystem.register,
                                    set(["name"]),
                                    set(["playerID"])),
+                      "REGISTER_BATCH": (TournamentSystem.registerBatch,
+                                         set(["names"]),
+                                         set(["playerIDs"])),
                       "JOIN_GAME": (TournamentSystem.joinGame,
                                     set(["playerID", "startFreshP"]),
                                     set(["gameID"])),
@@ -379,23 +829,94 @@ class MaverickServerProtocol(basicProtocols.LineOnlyReceiver):
                       "GET_STATE": (TournamentSystem.getState,
                                     set(["playerID", "gameID"]),
                                     set(["youAreColor", "isWhitesTurn",
-                                         "board", "history"])),
+                                         "stateVersion", "isDelta",
+                                         "historyStart", "board",
+                                         "history"])),
                       "MAKE_PLY": (TournamentSystem.makePly,
                                    set(["playerID", "gameID",
                                         "fromRank", "fromFile",
                                         "toRank", "toFile"]),
-                                   {})}
+                                   {}),
+                      "GET_ACTIVE_GAMES": (TournamentSystem.getActiveGames,
+                                           set(["playerID"]),
+                                           set(["gameIDs"]))}
     """Map of valid request names to:
         - corresponding TournamentSystem function
         - expected arguments
-        - expected return values (currently unused)"""
+        - expected return values (currently unused)
+
+    Requests are dispatched to the method of the same name on the backing
+    object, so any object implementing these methods (such as the router in
+    maverick.sharding) can stand in for a TournamentSystem. Methods may
+    return a Deferred firing with their result."""
+
+    SHARD_REQUESTS = {"SHARD_JOIN_GAME": (TournamentSystem.joinGameWithID,
+                                          set(["playerID", "gameID",
+                                               "startFreshP"]),
+                                          set(["gameID"])),
+                      "SHARD_GET_ACTIVE_GAMES": (
+                                        TournamentSystem.getGamesOfPlayer,
+                                        set(["playerID"]),
+                                        set(["gameIDs"]))}
+    """Additional requests served by shard workers (see maverick.sharding)"""
+
+    OPTIONAL_REQUEST_ARGS = {"GET_STATE": set(["sinceVersion"])}
+    """Map of request names to arguments that may be omitted by clients"""
 
-    def __init__(self, tournamentSystem):
-        """Initialize with a reference to a TournamentSystem backing"""
+    WIRE_FORMAT_VERB = "SET_WIRE_FORMAT"
+    """Verb used by clients to switch their connection's wire format"""
+
+    STATS_VERB = "STATS"
+    """Verb used by clients to fetch the server's metrics"""
+
+    BATCH_VERB = "BATCH"
+    """Verb used by clients to send many requests in one round trip"""
+
+    MAX_BATCH_SIZE = 256
+    """Maximum number of sub-requests in a BATCH request"""
+
+    WATCH_VERB = "WATCH"
+    """Verb used by spectators to follow games"""
+
+    UNBATCHABLE = set([BATCH_VERB, WATCH_VERB, WIRE_FORMAT_VERB])
+    """Verbs that may not be sent inside a BATCH request"""
+
+    UNRECOGNIZED_VERB = "UNRECOGNIZED"
+    """Verb under which requests with unknown verbs are counted in metrics"""
+
+    def __init__(self, tournamentSystem, validRequests=None, metrics=None,
+                 broadcaster=None):
+        """Initialize with a reference to a TournamentSystem backing
+
+        @param validRequests: the requests to serve, in the format of
+                              VALID_REQUESTS (defaults to VALID_REQUESTS)
+        @param metrics: if not None, the maverick.metrics.ServerMetrics in
+                        which to record requests and connections
+        @param broadcaster: if not None, the maverick.broadcast.
+                            GameBroadcaster used to serve WATCH requests"""
 
         # put a TournamentSystem instance here
         self._ts = tournamentSystem
 
+        if validRequests is None:
+            validRequests = MaverickServerProtocol.VALID_REQUESTS
+        self._validRequests = validRequests
+        self._metrics = metrics
+        self._broadcaster = broadcaster
+
+        # Games watched by this connection (None until it sends WATCH)
+        self._subscription = None
+
+        # Binary responses not yet sent, in request order, as one-item lists
+        # holding the response frame (None until the response is ready)
+        self._pendingFrames = collections.deque()
+
+        # Wire format of this connection (changed by SET_WIRE_FORMAT)
+        self._wireFormat = WIRE_FORMAT_JSON
+
+        # Received binary data not yet making up a complete frame
+        self._frameBuffer = ""
+
         # Log initialization fact
         MaverickServerProtocol._logger.debug("Initialized")
 
@@ -404,6 +925,8 @@ class MaverickServerProtocol(basicProtocols.LineOnlyReceiver):
 
         # Log the connection
         MaverickServerProtocol._logger.debug("Connection made with client.")
+        if self._metrics is not None:
+            self._metrics.connectionOpened()
 
         # Print out the server name, version, and prompt
         #  (e.g., "MaverickChessServer/1.0a1 WAITING_FOR_REQUEST")
@@ -419,6 +942,157 @@ class MaverickServerProtocol(basicProtocols.LineOnlyReceiver):
 
         # Log the disconnection
         MaverickServerProtocol._logger.debug("Client disconnected.")
+        if self._metrics is not None:
+            self._metrics.connectionClosed()
+        if self._subscription is not None:
+            self._broadcaster.unsubscribe(self._subscription)
+            self.transport.unregisterProducer()
+
+    def _dispatchRequest(self, requestName, requestArgs):
+        """Validate a parsed request and dispatch it to the TournamentSystem
+
+        @param requestName: the verb of the request (e.g., "REGISTER")
+        @param requestArgs: the dictionary of arguments provided
+
+        @return: a Deferred firing with a tuple of form (errMsg, result);
+                errMsg is None if the request succeeded, and result is the
+                dictionary of results"""
+
+        if self._metrics is None:
+            return self.__dispatchRequest_unmeasured(requestName, requestArgs)
+
+        startedAt = time.time()
+        d = self.__dispatchRequest_unmeasured(requestName, requestArgs)
+        if (requestName not in self._validRequests and
+            requestName not in MaverickServerProtocol.UNBATCHABLE and
+            requestName != MaverickServerProtocol.STATS_VERB):
+            # Do not keep a histogram per bad verb
+            requestName = MaverickServerProtocol.UNRECOGNIZED_VERB
+        d.addCallback(self.__dispatchRequest_measured, requestName, startedAt)
+        return d
+
+    def __dispatchRequest_measured(self, (errMsg, result), requestName,
+                                   startedAt):
+        """Record the time taken by a request in the server's metrics"""
+        self._metrics.recordRequest(requestName, errMsg,
+                                    time.time() - startedAt)
+        return (errMsg, result)
+
+    def __dispatchRequest_unmeasured(self, requestName, requestArgs):
+        """Dispatch a request without recording it (see _dispatchRequest)"""
+
+        if (requestName == MaverickServerProtocol.STATS_VERB and
+            self._metrics is not None):
+            if requestArgs != {}:
+                return defer.succeed(("Invalid arguments, expected: none",
+                                      None))
+            return defer.succeed((None, self._metrics.getStats()))
+
+        if requestName == MaverickServerProtocol.BATCH_VERB:
+            return self._dispatchBatch(requestArgs)
+
+        if (requestName == MaverickServerProtocol.WATCH_VERB and
+            self._broadcaster is not None):
+            return defer.succeed(self._startWatching(requestArgs))
+
+        if requestName not in self._validRequests:
+            # Give an error if provided an invalid command
+            fStr = "Unrecognized verb \"{0}\" in request"
+            return defer.succeed((fStr.format(requestName), None))
+
+        if not isinstance(requestArgs, dict):
+            return defer.succeed(("Invalid JSON for arguments", None))
+
+        # Pull out the requirements for this request
+        (tsCommand, expArgs, _) = self._validRequests[requestName]
+
+        # Arguments which may be left out of this request
+        optArgs = MaverickServerProtocol.OPTIONAL_REQUEST_ARGS.get(requestName,
+                                                                   set())
+
+        if not (expArgs <= set(requestArgs.keys()) <= (expArgs | optArgs)):
+            # Give an error if not provided the correct arguments
+            fStr = "Invalid arguments, expected: {0}"
+            return defer.succeed((fStr.format(",".join(list(expArgs))), None))
+
+        # Dispatch command to TournamentSystem instance
+        method = getattr(self._ts, tsCommand.__name__)
+        d = defer.maybeDeferred(method, **requestArgs)
+        d.addCallbacks(self.__dispatchRequest_succeeded,
+                       self.__dispatchRequest_failed)
+        return d
+
+    def _dispatchBatch(self, requestArgs):
+        """Dispatch each of the sub-requests of a BATCH request
+
+        Sub-requests are dispatched in order (so plies in the same game are
+        made in order), but may finish in any order.
+
+        @param requestArgs: a dictionary of form {"requests": list of
+                            sub-requests of form {"verb": verb,
+                                                  "args": arguments}}
+        @return: a Deferred firing with a tuple of form (errMsg, result),
+                 where result is of form {"results": list with, for each
+                 sub-request, either {"result": result} or {"error": msg}}"""
+
+        if (not isinstance(requestArgs, dict) or
+            set(requestArgs.keys()) != set(["requests"]) or
+            not isinstance(requestArgs["requests"], list)):
+            return defer.succeed(("Invalid arguments, expected: requests",
+                                  None))
+
+        subRequests = requestArgs["requests"]
+        if len(subRequests) > MaverickServerProtocol.MAX_BATCH_SIZE:
+            fStr = "Batches are limited to {0} requests"
+            return defer.succeed((fStr.format(
+                                    MaverickServerProtocol.MAX_BATCH_SIZE),
+                                  None))
+
+        ds = []
+        for subRequest in subRequests:
+            if (not isinstance(subRequest, dict) or
+                set(subRequest.keys()) != set(["verb", "args"])):
+                d = defer.succeed(("Invalid sub-request, expected: verb,args",
+                                   None))
+            elif subRequest["verb"] in MaverickServerProtocol.UNBATCHABLE:
+                fStr = "Verb \"{0}\" not allowed in a batch"
+                d = defer.succeed((fStr.format(subRequest["verb"]), None))
+            else:
+                d = self._dispatchRequest(subRequest["verb"],
+                                          subRequest["args"])
+            ds.append(d)
+
+        d = defer.gatherResults(ds)
+        d.addCallback(MaverickServerProtocol.__dispatchBatch_collect)
+        return d
+
+    @staticmethod
+    def __dispatchBatch_collect(subResults):
+        """Combine the (errMsg, result) tuples of sub-requests"""
+        results = []
+        for (errMsg, result) in subResults:
+            if errMsg is None:
+                results.append({"result": result})
+            else:
+                results.append({"error": errMsg})
+        return (None, {"results": results})
+
+    @staticmethod
+    def __dispatchRequest_succeeded((successP, result)):
+        """Convert a TournamentSystem result into (errMsg, result)"""
+        if successP:
+            # TODO (mattsh): check keys of response
+            return (None, result)
+        else:
+            # Pull out structured error messages from func call
+            return (result["error"], None)
+
+    @staticmethod
+    def __dispatchRequest_failed(failure):
+        """Give an error if the TournamentSystem raised an exception"""
+        MaverickServerProtocol._logger.error("Uncaught exception: %s",
+                                             failure.getTraceback())
+        return ("Uncaught exception", None)
 
     def lineReceived(self, line):
         """Take input line-by-line and redirect it to the core"""
@@ -429,79 +1103,148 @@ class MaverickServerProtocol(basicProtocols.LineOnlyReceiver):
         # Pull out request name (e.g., "REGISTER") and arguments (unparsed)
         (requestName, _, requestArgsString) = line.partition(" ")
 
-        errMsg = None  # If this gets set, there was an error
-        if requestName in MaverickServerProtocol.VALID_REQUESTS:
-            try:
-                requestArgs = json.loads(requestArgsString,
-                                         encoding="utf-8")
-            except ValueError:
+        try:
+            requestArgs = json.loads(requestArgsString, encoding="utf-8")
+        except ValueError:
+            if requestName in self._validRequests:
                 errMsg = "Invalid JSON for arguments"
             else:
-                # Pull out the requirements for this request
-                (tsCommand, expArgs, _) = \
-                    MaverickServerProtocol.VALID_REQUESTS[requestName]
-
-                if expArgs != set(requestArgs.keys()):
-                    # Give an error if not provided the correct arguments
-                    fStr = "Invalid arguments, expected: {0}"
-                    errMsg = fStr.format(",".join(list(expArgs)))
-                else:
-                    try:
-                        import traceback
-                        # Dispatch command to TournamentSystem instance
-                        (successP, result) = tsCommand(self._ts, **requestArgs)
-
-                    except:
-                        tb = traceback.format_exc()
-                        print tb
-                        # Give an error if caught an exception
-                        errMsg = "Uncaught exception"
-
-                    else:
-                        if successP:
-                            # TODO (mattsh): check keys of response
-
-                            # Provide successful results to the user
-                            jsonStr = json.dumps(result,
-                                                 ensure_ascii=True,
-                                                 encoding="utf-8")
-                            response = "SUCCESS {0}".format(jsonStr)
-                        if not successP:
-                            # Pull out structured error messages from func call
-                            errMsg = result["error"]
+                errMsg = "Unrecognized verb \"{0}\" in request".format(
+                                                                requestName)
+            self.__lineReceived_respond((errMsg, None), line)
         else:
-            # Give an error if provided an invalid command
-            errMsg = "Unrecognized verb \"{0}\" in request".format(requestName)
+            if requestName == MaverickServerProtocol.WIRE_FORMAT_VERB:
+                # Switch formats before any more data is read
+                self.__lineReceived_respond(
+                                    self._negotiateWireFormat(requestArgs),
+                                    line)
+            else:
+                d = self._dispatchRequest(requestName, requestArgs)
+                d.addCallback(self.__lineReceived_respond, line)
+
+    def __lineReceived_respond(self, (errMsg, result), line):
+        """Send the response to a line-based request"""
 
         # Respond to the client
         if errMsg is None:
             # Provide client with the response
+            jsonStr = json.dumps(result, ensure_ascii=True, encoding="utf-8")
+            response = "SUCCESS {0}".format(jsonStr)
+        else:
+            # Provide client with the error
+            response = "ERROR {0}".format(errMsg, line)
 
-            # Log successful response
-            logStrF = "RESPONSE [query=\"%s\"]: %s"
-            MaverickServerProtocol._logger.info(logStrF, line, response)
+        # Log response
+        logStrF = "RESPONSE [query=\"%s\"]: %s"
+        MaverickServerProtocol._logger.debug(logStrF, line, response)
 
-            # Send successful response
-            self.sendLine(response)
+        # Send response
+        self.sendLine(response)
+
+        if self._wireFormat == WIRE_FORMAT_BINARY:
+            # Keep the connection open, reading binary frames from now on
+            self.setRawMode()
+        elif self._subscription is not None:
+            # Keep the connection open for events of watched games
+            MaverickServerProtocol._logger.debug("Streaming to spectator")
         else:
-            # Provide client with the error
+            # Log the fact that the connection is being closed
+            logStrF = "Dropping connection to user after completion"
+            MaverickServerProtocol._logger.debug(logStrF)
+
+            # Close connection after each request
+            self.transport.loseConnection()
+
+    def _startWatching(self, requestArgs):
+        """Subscribe this connection to the events of the requested games
+
+        @return: a tuple of form (errMsg, result), as with _dispatchRequest,
+                 where result is of form {"statuses": list of the current
+                 statuses of the games (None if watching all games)}"""
+
+        if (not isinstance(requestArgs, dict) or
+            set(requestArgs.keys()) != set(["gameIDs"])):
+            return ("Invalid arguments, expected: gameIDs", None)
+
+        if self._wireFormat != WIRE_FORMAT_JSON:
+            return ("WATCH requires the JSON wire format", None)
+
+        gameIDs = requestArgs["gameIDs"]
+        if gameIDs is None:
+            statuses = None
+        elif isinstance(gameIDs, list):
+            statuses = []
+            for gameID in gameIDs:
+                (successP, result) = self._ts.getStatus(gameID)
+                if not successP:
+                    return (result["error"], None)
+                statuses.append(result["status"])
+        else:
+            return ("Invalid list of game IDs", None)
 
-            # Compute error response
-            response = "ERROR {0}".format(errMsg, line)
+        if self._subscription is None:
+            self._subscription = WatchSubscription(self.transport)
+        self._broadcaster.subscribe(self._subscription, gameIDs)
+        return (None, {"statuses": statuses})
+
+    def _negotiateWireFormat(self, requestArgs):
+        """Switch this connection to the requested wire format
+
+        @return: a tuple of form (errMsg, result), as with _dispatchRequest"""
+
+        if (not isinstance(requestArgs, dict) or
+            set(requestArgs.keys()) != set(["format"])):
+            return ("Invalid arguments, expected: format", None)
 
-            # Log error response
-            logStrF = "RESPONSE [query=\"%s\"]: %s"
-            MaverickServerProtocol._logger.info(logStrF, line, response)
+        wireFormat = requestArgs["format"]
+        if wireFormat not in [WIRE_FORMAT_JSON, WIRE_FORMAT_BINARY]:
+            return ("Unsupported wire format", None)
 
-            # Send error response
-            self.sendLine(response)
+        self._wireFormat = wireFormat
+        MaverickServerProtocol._logger.debug("Using wire format %s",
+                                             wireFormat)
+        return (None, {"format": wireFormat})
 
-        # Log the fact that the connection is being closed
-        logStrF = "Dropping connection to user after completion"
-        MaverickServerProtocol._logger.debug(logStrF)
+    def rawDataReceived(self, data):
+        """Take input in binary frames and redirect each request to the core
 
-        # Close connection after each request
-        self.transport.loseConnection()
+        Only used once the client has switched to the binary wire format. The
+        connection is kept open until the client closes it."""
+
+        try:
+            (payloads, self._frameBuffer) = splitFrames(self._frameBuffer +
+                                                        data)
+        except MaverickWireException:
+            MaverickServerProtocol._logger.error("Dropping bad frame stream")
+            self.transport.loseConnection()
+            return
+
+        for payload in payloads:
+            try:
+                (requestName, requestArgs) = decodeRequest(payload)
+            except MaverickWireException, e:
+                (requestName, requestArgs) = (None, None)
+                d = defer.succeed((e.message, None))
+            else:
+                d = self._dispatchRequest(requestName, requestArgs)
+
+            # Responses are sent in request order, even if they finish early
+            pendingFrame = [None]
+            self._pendingFrames.append(pendingFrame)
+            d.addCallback(self.__rawDataReceived_respond, requestName,
+                          pendingFrame)
+
+    def __rawDataReceived_respond(self, (errMsg, result), requestName,
+                                  pendingFrame):
+        """Send all ready binary responses that are not waiting on others"""
+
+        MaverickServerProtocol._logger.debug("Binary %s request (err=%s)",
+                                             requestName, errMsg)
+        pendingFrame[0] = encodeFrame(encodeResponse(requestName, errMsg,
+                                                     result))
+
+        while self._pendingFrames and self._pendingFrames[0][0] is not None:
+            self.transport.write(self._pendingFrames.popleft()[0])
 
 
 class MaverickServerProtFactory(protocol.ServerFactory):
@@ -514,33 +1257,96 @@ class MaverickServerProtFactory(protocol.ServerFactory):
     _logger = logging.getLogger("maverick.server.MaverickServerProtFactory")
     _logger.setLevel("INFO")
 
-    def __init__(self, tournamentSystem):
+    def __init__(self, tournamentSystem, validRequests=None, metrics=None,
+                 broadcaster=None):
         """Initialize server state
 
-        Makes a link to the TournamentSystem instance provided"""
+        Makes a link to the TournamentSystem instance provided
+
+        @param validRequests: the requests to serve, in the format of
+                              MaverickServerProtocol.VALID_REQUESTS
+        @param metrics: if not None, the maverick.metrics.ServerMetrics in
+                        which to record requests and connections
+        @param broadcaster: if not None, the maverick.broadcast.
+                            GameBroadcaster used to serve WATCH requests"""
 
         # Store a reference to the TournamentSystem backing up this server
         self._tournamentSystem = tournamentSystem
+        self._validRequests = validRequests
+        self._metrics = metrics
+        self._broadcaster = broadcaster
 
         # Log initialization
         MaverickServerProtFactory._logger.info("Server initialized")
 
     def buildProtocol(self, addr):
         """Create an instance of MaverickServerProtocol"""
-        return MaverickServerProtocol(self._tournamentSystem)
+        return MaverickServerProtocol(self._tournamentSystem,
+                                      validRequests=self._validRequests,
+                                      metrics=self._metrics,
+                                      broadcaster=self._broadcaster)
 
 
-def startServer(port=DEFAULT_MAVERICK_PORT):
-    """Start a server on the specified (or default) port
+ARCHIVE_INTERVAL = 10
+"""Number of seconds between sweeps of finished games into the archive"""
 
-    @param port: The port to use for communication with a Maverick server"""
 
-    # Initialize a new instance of MaverickCore
-    core = TournamentSystem()
+def startServer(port=DEFAULT_MAVERICK_PORT, archivePath=None,
+                archiveGracePeriod=60, journalDir=None, syncInterval=0.1,
+                snapshotInterval=300, shardWorkerP=False, metricsPort=None):
+    """Start a server on the specified (or default) port
+
+    @param port: The port to use for communication with a Maverick server
+    @param archivePath: if not None, finished games are moved to this file
+    @param archiveGracePeriod: seconds that finished games stay in memory
+    @param journalDir: if not None, the tournament is recovered from and
+                       journaled to this directory
+    @param syncInterval: seconds between syncs of the journal to disk
+    @param snapshotInterval: seconds between snapshots of the journal
+    @param shardWorkerP: if True, also serve the requests used by a shard
+                         router (see maverick.sharding)
+    @param metricsPort: if not None, the server's metrics are also served
+                        as JSON over HTTP on this port"""
+
+    def newTournament():
+        return TournamentSystem(archivePath=archivePath,
+                                archiveGracePeriod=archiveGracePeriod)
+
+    if journalDir is None:
+        # Initialize a new instance of MaverickCore
+        core = newTournament()
+    else:
+        # Pick up where the last server left off
+        core = recover(journalDir, newTournament)
+        JournalSnapshotter(core._journal, syncInterval,
+                           snapshotInterval).start()
+
+    # Check plies in the thread pool so that other requests are not held up
+    core.setPlyOffloading(True)
+
+    # Periodically move finished games out of memory
+    if archivePath is not None:
+        archiver = task.LoopingCall(core.archiveFinishedGames)
+        archiver.start(ARCHIVE_INTERVAL, now=False)
+
+    validRequests = dict(MaverickServerProtocol.VALID_REQUESTS)
+    if shardWorkerP:
+        validRequests.update(MaverickServerProtocol.SHARD_REQUESTS)
+
+    # Keep metrics, served by the STATS verb (and over HTTP, if asked)
+    metrics = ServerMetrics(gameCounter=core.getGameCounts)
+    metrics.startLagMonitor()
+    if metricsPort is not None:
+        listenHTTP(metricsPort, metrics)
+
+    # Stream plies to spectators
+    broadcaster = GameBroadcaster()
+    core.attachBroadcaster(broadcaster)
 
     # Run a server on the specified port
     endpoint = endpoints.TCP4ServerEndpoint(reactor, port)
-    endpoint.listen(MaverickServerProtFactory(core))
+    endpoint.listen(MaverickServerProtFactory(core, validRequests, metrics,
+                                              broadcaster))
     reactor.run()  # @UndefinedVariable
 
 
@@ -548,8 +1354,36 @@ def main():
     parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
     parser.add_argument("--port", default=7782, type=int,
                         help="specify port for Maverick server")
+    parser.add_argument("--archive", default=None, metavar="PATH",
+                        help="archive finished games to this file")
+    parser.add_argument("--archive-grace", default=60, type=float,
+                        metavar="SECONDS",
+                        help="time finished games stay in memory")
+    parser.add_argument("--journal", default=None, metavar="DIR",
+                        help="recover from and journal changes to this dir")
+    parser.add_argument("--sync-interval", default=0.1, type=float,
+                        metavar="SECONDS",
+                        help="time between syncs of the journal to disk")
+    parser.add_argument("--snapshot-interval", default=300, type=float,
+                        metavar="SECONDS",
+                        help="time between snapshots of the journal")
+    parser.add_argument("--shard-worker", action="store_true",
+                        help="also serve requests from a shard router")
+    parser.add_argument("--metrics-port", default=None, type=int,
+                        metavar="PORT",
+                        help="also serve metrics as JSON over HTTP")
+    parser.add_argument("--quiet", action="store_true",
+                        help="only log warnings and errors")
     args = parser.parse_args()
-    startServer(args.port)
+    if args.quiet:
+        logging.disable(logging.INFO)
+    startServer(args.port, archivePath=args.archive,
+                archiveGracePeriod=args.archive_grace,
+                journalDir=args.journal,
+                syncInterval=args.sync_interval,
+                snapshotInterval=args.snapshot_interval,
+                shardWorkerP=args.shard_worker,
+                metricsPort=args.metrics_port)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,504 @@
+#!/usr/bin/python
+
+"""sharding.py: A Maverick server split across several worker processes"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+from argparse import ArgumentDefaultsHelpFormatter
+from argparse import ArgumentParser
+import bisect
+import collections
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+
+from maverick.client import MaverickClient
+from maverick.client import MaverickClientException
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.matchmaking import MatchmakingQueue
+from maverick.metrics import ServerMetrics
+from maverick.registry import IDAllocator
+from maverick.registry import PlayerRegistry
+from maverick.server import DEFAULT_MAVERICK_PORT
+from maverick.server import MaverickServerProtFactory
+from maverick.server import MaverickServerProtocol
+from maverick.wire import MaverickWireException
+from maverick.wire import WIRE_FORMAT_BINARY
+from maverick.wire import decodeResponse
+from maverick.wire import encodeFrame
+from maverick.wire import encodeRequest
+from maverick.wire import splitFrames
+
+from twisted.internet import defer
+from twisted.internet import endpoints
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.protocols import basic as basicProtocols
+
+__all__ = ["HashRing",
+           "ShardRouter",
+           "startShardedServer",
+           "runBenchmark"]
+
+# Overview of sharded mode
+#
+# Each worker process runs an ordinary Maverick server (started with
+# --shard-worker) that owns the games whose IDs hash to it. The router
+# process accepts client connections and serves the usual verbs: it
+# registers players and allocates game IDs itself, and forwards every
+# per-game request to the owning worker over a persistent connection using
+# the binary wire format (see maverick.wire).
+
+
+class HashRing(object):
+    """Consistent hash ring mapping integer keys to shards"""
+
+    DEFAULT_VIRTUAL_NODES = 64
+    """Default number of points on the ring for each shard"""
+
+    def __init__(self, shardIDs, virtualNodes=DEFAULT_VIRTUAL_NODES):
+        """Place the given shards on the ring
+
+        @param shardIDs: a list of distinct shard identifiers
+        @param virtualNodes: the number of points on the ring for each shard"""
+
+        points = []
+        for shardID in shardIDs:
+            for i in xrange(virtualNodes):
+                points.append((HashRing._hash("{0}-{1}".format(shardID, i)),
+                               shardID))
+        points.sort()
+        self._points = [point for (point, _) in points]
+        self._shardIDs = [shardID for (_, shardID) in points]
+
+    @staticmethod
+    def _hash(key):
+        """Return a 32-bit hash of the given string"""
+        return struct.unpack_from("!I", hashlib.md5(key).digest())[0]
+
+    def getShard(self, key):
+        """Return the shard owning the given key"""
+        i = bisect.bisect(self._points, HashRing._hash(str(key)))
+        return self._shardIDs[i % len(self._shardIDs)]
+
+
+class _ShardConnection(basicProtocols.LineReceiver):
+    """Persistent binary connection from the router to a shard worker
+
+    Requests are pipelined; the worker answers them in order."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.sharding._ShardConnection")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._welcomedP = False
+        self._frameBuffer = ""
+        self._waiting = collections.deque()  # (verb, Deferred) per request
+
+    def lineReceived(self, line):
+        if not self._welcomedP:
+            # Switch to the binary format after the welcome message
+            self._welcomedP = True
+            args = json.dumps({"format": WIRE_FORMAT_BINARY})
+            self.sendLine("{0} {1}".format(
+                                    MaverickServerProtocol.WIRE_FORMAT_VERB,
+                                    args))
+        elif line.startswith("SUCCESS"):
+            self.setRawMode()
+            self._factory._connectionReady(self)
+        else:
+            _ShardConnection._logger.error("Shard refused binary format: %s",
+                                           line)
+            self.transport.loseConnection()
+
+    def request(self, verb, args):
+        """Send a request, returning a Deferred firing with (errMsg, result)"""
+        d = defer.Deferred()
+        self._waiting.append((verb, d))
+        self.transport.write(encodeFrame(encodeRequest(verb, args)))
+        return d
+
+    def rawDataReceived(self, data):
+        try:
+            (payloads, self._frameBuffer) = splitFrames(self._frameBuffer +
+                                                        data)
+        except MaverickWireException:
+            _ShardConnection._logger.error("Bad frame stream from shard")
+            self.transport.loseConnection()
+            return
+
+        for payload in payloads:
+            (verb, d) = self._waiting.popleft()
+            try:
+                response = decodeResponse(verb, payload)
+            except MaverickWireException, e:
+                response = (e.message, None)
+            d.callback(response)
+
+    def connectionLost(self, reason=None):
+        self._factory._connectionLost(self)
+        while self._waiting:
+            (_, d) = self._waiting.popleft()
+            d.callback(("Shard unavailable", None))
+
+
+class _ShardClientFactory(protocol.ReconnectingClientFactory):
+    """Keeps a connection open to one shard worker
+
+    Requests made while disconnected are sent once connected."""
+
+    initialDelay = 0.1
+    maxDelay = 2
+
+    def __init__(self):
+        self._connection = None
+        self._queued = []  # (verb, args, Deferred) awaiting a connection
+
+    def buildProtocol(self, addr):
+        self.resetDelay()
+        return _ShardConnection(self)
+
+    def request(self, verb, args):
+        """Send a request, returning a Deferred firing with (errMsg, result)"""
+        if self._connection is not None:
+            return self._connection.request(verb, args)
+        d = defer.Deferred()
+        self._queued.append((verb, args, d))
+        return d
+
+    def _connectionReady(self, connection):
+        self._connection = connection
+        (queued, self._queued) = (self._queued, [])
+        for (verb, args, d) in queued:
+            connection.request(verb, args).chainDeferred(d)
+
+    def _connectionLost(self, connection):
+        if self._connection is connection:
+            self._connection = None
+
+
+class ShardRouter(object):
+    """Serves the TournamentSystem verbs by routing games to shard workers
+
+    Players and game IDs are managed here; games live on the workers."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.sharding.ShardRouter")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, shardAddresses):
+        """Connect to the given shard workers
+
+        @param shardAddresses: a list of (host, port) tuples, one per shard.
+                               The order determines which games each owns."""
+
+        self._registry = PlayerRegistry()
+        self.players = self._registry.namesByID  # Dict from ID to name
+        self._gameIDs = IDAllocator()  # Allocator of IDs for new games
+        self._matchmaking = MatchmakingQueue()
+
+        self._ring = HashRing(range(len(shardAddresses)))
+        self._shards = [self._connectShard(host, port)
+                        for (host, port) in shardAddresses]
+
+    def _connectShard(self, host, port):
+        """Start connecting to the shard worker at the given address
+
+        @return: an object whose request(verb, args) method returns a
+                 Deferred firing with (errMsg, result), as _ShardClientFactory
+                 does"""
+        factory = _ShardClientFactory()
+        reactor.connectTCP(host, port, factory)  # @UndefinedVariable
+        return factory
+
+    def _forward(self, gameID, verb, args):
+        """Send a request to the shard owning the given game
+
+        @return: a Deferred firing with the TournamentSystem-style result"""
+        shard = self._shards[self._ring.getShard(gameID)]
+        return shard.request(verb, args).addCallback(ShardRouter._toResult)
+
+    @staticmethod
+    def _toResult((errMsg, result)):
+        """Convert (errMsg, result) to a TournamentSystem-style result"""
+        if errMsg is None:
+            return (True, result)
+        else:
+            return (False, {"error": errMsg})
+
+    def register(self, name):
+        """See TournamentSystem.register"""
+        return (True, {"playerID": self._registry.register(name)[0]})
+
+    def registerBatch(self, names):
+        """See TournamentSystem.registerBatch"""
+        if (not isinstance(names, list) or
+                not all(isinstance(name, basestring) for name in names)):
+            return (False, {"error": "Names must be a list of strings"})
+        return (True, {"playerIDs": self._registry.registerBatch(names)})
+
+    def joinGame(self, playerID, startFreshP):
+        """See TournamentSystem.joinGame"""
+        gameID = self._matchmaking.popPendingGame(playerID, startFreshP)
+        if gameID is None:
+            gameID = self._gameIDs.allocate()
+            self._matchmaking.addPendingGame(gameID, playerID, startFreshP)
+        return self._forward(gameID, "SHARD_JOIN_GAME",
+                             {"playerID": playerID, "gameID": gameID,
+                              "startFreshP": startFreshP})
+
+    def getStatus(self, gameID):
+        """See TournamentSystem.getStatus"""
+        return self._forward(gameID, "GET_STATUS", {"gameID": gameID})
+
+    def isMyTurn(self, gameID, playerID):
+        """See TournamentSystem.isMyTurn"""
+        return self._forward(gameID, "IS_MY_TURN",
+                             {"gameID": gameID, "playerID": playerID})
+
+    def getState(self, playerID, gameID, sinceVersion=None):
+        """See TournamentSystem.getState"""
+        args = {"playerID": playerID, "gameID": gameID}
+        if sinceVersion is not None:
+            args["sinceVersion"] = sinceVersion
+        return self._forward(gameID, "GET_STATE", args)
+
+    def makePly(self, playerID, gameID, fromRank, fromFile, toRank, toFile):
+        """See TournamentSystem.makePly"""
+        return self._forward(gameID, "MAKE_PLY",
+                             {"playerID": playerID, "gameID": gameID,
+                              "fromRank": fromRank, "fromFile": fromFile,
+                              "toRank": toRank, "toFile": toFile})
+
+    def getActiveGames(self, playerID):
+        """See TournamentSystem.getActiveGames (asks every shard)"""
+        if playerID not in self.players:
+            return (False, {"error": "Invalid player ID"})
+
+        ds = [shard.request("SHARD_GET_ACTIVE_GAMES", {"playerID": playerID})
+              for shard in self._shards]
+        d = defer.gatherResults(ds)
+        d.addCallback(ShardRouter.__getActiveGames_merge)
+        return d
+
+    @staticmethod
+    def __getActiveGames_merge(responses):
+        gameIDs = []
+        for (errMsg, result) in responses:
+            if errMsg is not None:
+                return (False, {"error": errMsg})
+            gameIDs.extend(result["gameIDs"])
+        return (True, {"gameIDs": sorted(gameIDs)})
+
+
+def _spawnWorker(port, quietP=False):
+    """Start a shard worker server in a new process listening on the port"""
+    args = [sys.executable, "-m", "maverick.server", "--port", str(port),
+            "--shard-worker"]
+    if quietP:
+        args.append("--quiet")
+    return subprocess.Popen(args, env=_getChildEnv())
+
+
+def _getChildEnv():
+    """Return an environment in which child processes can import maverick"""
+    env = dict(os.environ)
+    srcDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if env.get("PYTHONPATH"):
+        env["PYTHONPATH"] = srcDir + os.pathsep + env["PYTHONPATH"]
+    else:
+        env["PYTHONPATH"] = srcDir
+    return env
+
+
+def startShardedServer(port=DEFAULT_MAVERICK_PORT, numShards=None,
+                       workerBasePort=None, quietP=False):
+    """Start a router on the given port in front of new worker processes
+
+    The workers are stopped when the router stops.
+
+    @param numShards: the number of worker processes (default: one per CPU)
+    @param workerBasePort: workers listen on consecutive ports from this one
+                           (default: the port after the router's)
+    @param quietP: if True, only log warnings and errors"""
+
+    if numShards is None:
+        numShards = multiprocessing.cpu_count()
+    if workerBasePort is None:
+        workerBasePort = port + 1
+
+    ports = range(workerBasePort, workerBasePort + numShards)
+    workers = [_spawnWorker(workerPort, quietP=quietP) for workerPort in ports]
+
+    def stopWorkers():
+        for worker in workers:
+            worker.terminate()
+        for worker in workers:
+            worker.wait()
+    reactor.addSystemEventTrigger("before", "shutdown", stopWorkers)
+
+    # The router's metrics cover requests as seen by clients (each worker
+    # reports its own games through its STATS verb)
+    metrics = ServerMetrics()
+    metrics.startLagMonitor()
+
+    router = ShardRouter([("127.0.0.1", workerPort) for workerPort in ports])
+    endpoint = endpoints.TCP4ServerEndpoint(reactor, port)
+    endpoint.listen(MaverickServerProtFactory(router, metrics=metrics))
+    reactor.run()  # @UndefinedVariable
+
+
+# Knight moves that can be repeated forever from the initial board
+_BENCHMARK_PLIES = [(0, 6, 2, 5), (7, 6, 5, 5), (2, 5, 0, 6), (5, 5, 7, 6)]
+
+
+def _benchmarkClient(port, clientN, deadline, counts):
+    """Play games over a binary connection until the deadline
+
+    Each ply costs a MAKE_PLY and a GET_STATE request. The number of
+    successful requests is stored in counts[clientN]."""
+
+    client = MaverickClient("127.0.0.1", port, wireFormat=WIRE_FORMAT_BINARY)
+    (p1, p2) = client._request_registerBatch(["bench{0}a".format(clientN),
+                                              "bench{0}b".format(clientN)])
+    numRequests = 1
+    while time.time() < deadline:
+        gameID = client._request_joinGame(p1, True)
+        client._request_joinGame(p2, True)
+        if client._request_getState(p1, gameID)["youAreColor"] == \
+                ChessBoard.WHITE:
+            players = [p1, p2]
+        else:
+            players = [p2, p1]
+        numRequests += 3
+
+        plyN = 0
+        while time.time() < deadline:
+            (fromRank, fromFile, toRank, toFile) = \
+                _BENCHMARK_PLIES[plyN % len(_BENCHMARK_PLIES)]
+            try:
+                client._request_makePly(players[plyN % 2], gameID,
+                                        ChessPosn(fromRank, fromFile),
+                                        ChessPosn(toRank, toFile))
+            except MaverickClientException:
+                break  # The game was drawn
+            client._request_getState(players[plyN % 2], gameID)
+            numRequests += 2
+            plyN += 1
+
+    client.close()
+    counts[clientN] = numRequests
+
+
+def _waitForServer(port, timeout=30):
+    """Wait until a server accepts connections on the given port"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def runBenchmark(shardCounts, numClients, duration, port):
+    """Measure requests per second for each number of shards
+
+    A shard count of 0 means a single, unsharded server.
+
+    @return: a list of (shardCount, requestsPerSecond) tuples"""
+
+    results = []
+    for numShards in shardCounts:
+        if numShards == 0:
+            args = [sys.executable, "-m", "maverick.server"]
+        else:
+            args = [sys.executable, "-m", "maverick.sharding",
+                    "--shards", str(numShards)]
+        server = subprocess.Popen(args + ["--port", str(port), "--quiet"],
+                                  env=_getChildEnv())
+        try:
+            _waitForServer(port)
+            for shardPort in xrange(port + 1, port + 1 + numShards):
+                _waitForServer(shardPort)
+
+            counts = multiprocessing.Array("l", numClients)
+            deadline = time.time() + duration
+            clients = [multiprocessing.Process(target=_benchmarkClient,
+                                               args=(port, clientN, deadline,
+                                                     counts))
+                       for clientN in xrange(numClients)]
+            start = time.time()
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+            elapsed = time.time() - start
+        finally:
+            server.terminate()
+            server.wait()
+
+        rate = sum(counts) / elapsed
+        results.append((numShards, rate))
+        print "{0:>7} shards: {1:10.1f} requests/s".format(numShards, rate)
+
+        port += numShards + 1  # Avoid ports that may be in TIME_WAIT
+    return results
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--port", default=DEFAULT_MAVERICK_PORT, type=int,
+                        help="specify port for the router")
+    parser.add_argument("--shards", default=multiprocessing.cpu_count(),
+                        type=int, help="number of worker processes")
+    parser.add_argument("--worker-port", default=None, type=int,
+                        help="first worker port (default: port + 1)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="only log warnings and errors")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="report requests/s for 0 (unsharded), 1, 2, "
+                             "4, ... shards up to --shards, then exit")
+    parser.add_argument("--clients", default=16, type=int,
+                        help="number of benchmark client processes")
+    parser.add_argument("--duration", default=10, type=float,
+                        help="seconds to run each benchmark")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        shardCounts = [0]
+        numShards = 1
+        while numShards < args.shards:
+            shardCounts.append(numShards)
+            numShards *= 2
+        shardCounts.append(args.shards)
+        runBenchmark(shardCounts, args.clients, args.duration, args.port)
+    else:
+        if args.quiet:
+            logging.disable(logging.INFO)
+        startShardedServer(args.port, args.shards,
+                           workerBasePort=args.worker_port, quietP=args.quiet)
+
+
+if __name__ == '__main__':
+    main()
@@ -45,7 +45,14 @@ class TestTournamentSystem(unittest.TestCase):
         self.assertEqual(failedMove1[1], {"error": "Illegal move"})
 
         self.assertFalse(ts.makePly(wp, gid, 0, 5, 3, 2)[0])
+        self.assertTrue(ts.makePly(bp, gid, 7, 1, 5, 2)[0])
+        self.assertTrue(ts.makePly(wp, gid, 0, 5, 3, 2)[0])
         self.assertTrue(ts.makePly(bp, gid, 7, 6, 5, 5)[0])
+
+        # The game goes on until the queen, defended by the bishop on C4,
+        # takes on F7
+        self.assertEqual(ts.getStatus(gid)[1],
+                         {"status": ChessMatch.STATUS_ONGOING})
         self.assertTrue(ts.makePly(wp, gid, 4, 7, 6, 5)[0])
 
         finalStatus = ts.getStatus(gid)
@@ -0,0 +1,169 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import os
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+from maverick.archive import GameArchive
+from maverick.data import pgn
+from maverick.data.structs import ChessBoard
+from maverick.data.utils import enumMoves
+from maverick.server import TournamentSystem
+
+
+class Test_maverick_archive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpDir, "games.archive")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def _playShortGame(self, ts):
+        """Start a game, make two plies, and cancel it
+
+        @return: a tuple of form (gameID, whitePlayerID, blackPlayerID)"""
+        p1 = ts.register("a")[1]["playerID"]
+        p2 = ts.register("b")[1]["playerID"]
+        gid = ts.joinGame(p1, True)[1]["gameID"]
+        ts.joinGame(p2, True)
+        if ts.isMyTurn(gid, p1)[1]["isMyTurn"]:
+            (wp, bp) = (p1, p2)
+        else:
+            (wp, bp) = (p2, p1)
+        ts.makePly(wp, gid, 1, 4, 3, 4)
+        ts.makePly(bp, gid, 6, 4, 4, 4)
+        ts.cancelGame(gid)
+        return (gid, wp, bp)
+
+    def test_archiveAfterGracePeriod(self):
+        ts = TournamentSystem(archivePath=self.path, archiveGracePeriod=60)
+        (gid, wp, _) = self._playShortGame(ts)
+        before = ts.getState(wp, gid)[1]
+        finishedAt = ts.games[gid].finishedAt
+
+        self.assertEqual(ts.archiveFinishedGames(now=finishedAt + 30), 0)
+        self.assertIn(gid, ts.games)
+        self.assertEqual(ts.archiveFinishedGames(now=finishedAt + 60), 1)
+        self.assertNotIn(gid, ts.games)
+
+        self.assertEqual(ts.getStatus(gid), (True, {"status": "CANCELD"}))
+        after = ts.getState(wp, gid)[1]
+        for key in ["youAreColor", "isWhitesTurn", "history", "board",
+                    "stateVersion"]:
+            self.assertEqual(after[key], before[key])
+        self.assertFalse(ts.cancelGame(gid)[0])
+
+    def test_noArchiveQueuesNothing(self):
+        ts = TournamentSystem()
+        (gid, _, _) = self._playShortGame(ts)
+        self.assertEqual(len(ts._finishedGames), 0)
+        self.assertEqual(ts.archiveFinishedGames(), 0)
+        self.assertIn(gid, ts.games)
+
+    def test_archiveSyncedBeforeJournaled(self):
+        ts = TournamentSystem(archivePath=self.path, archiveGracePeriod=0)
+        (gid, _, _) = self._playShortGame(ts)
+        events = []
+
+        class StubJournal(object):
+            def logArchive(self, gameID):
+                events.append(("logArchive", gameID))
+
+        sync = ts._archive.sync
+
+        def recordSync():
+            sync()
+            events.append(("sync", os.path.getsize(self.path)))
+        ts._archive.sync = recordSync
+        ts.attachJournal(StubJournal())
+
+        ts.archiveFinishedGames()
+        self.assertEqual([event[0] for event in events],
+                         ["sync", "logArchive"])
+        self.assertGreater(events[0][1], 0)
+        self.assertEqual(events[1][1], gid)
+
+    def test_archiveSurvivesRestart(self):
+        ts = TournamentSystem(archivePath=self.path, archiveGracePeriod=0)
+        (gid, _, bp) = self._playShortGame(ts)
+        ts.archiveFinishedGames()
+        history = ts.getState(bp, gid)[1]["history"]
+
+        archive = GameArchive(self.path)
+        self.assertEqual(archive.getGameIDs(), [gid])
+        match = archive.get(gid)
+        self.assertEqual(match.status, "CANCELD")
+        self.assertEqual(len(match.history), len(history))
+
+        # New games do not reuse archived IDs
+        ts2 = TournamentSystem(archivePath=self.path)
+        p = ts2.register("c")[1]["playerID"]
+        self.assertNotEqual(ts2.joinGame(p, True)[1]["gameID"], gid)
+
+    def test_exportPGN(self):
+        ts = TournamentSystem(archivePath=self.path, archiveGracePeriod=0)
+        (gid, _, _) = self._playShortGame(ts)
+        ts.archiveFinishedGames()
+
+        fd = StringIO.StringIO()
+        self.assertEqual(GameArchive(self.path).exportPGN(fd), 1)
+        fd.seek(0)
+        ((tags, match),) = list(pgn.readGames(fd))
+        self.assertEqual(tags["GameId"], str(gid))
+        self.assertEqual(tags["Result"], "*")
+        self.assertEqual(len(match.history), 2)
+
+    def test_exportPGN_midGameStart(self):
+        ts = TournamentSystem(archivePath=self.path, archiveGracePeriod=0)
+        p1 = ts.register("a")[1]["playerID"]
+        p2 = ts.register("b")[1]["playerID"]
+        gid = ts.joinGame(p1, False)[1]["gameID"]
+        ts.joinGame(p2, False)
+        startFEN = ts.games[gid].startFEN
+        self.assertNotEqual(startFEN, ChessBoard.FEN_INITIAL)
+
+        # Make any legal ply for the side to move
+        colorToMove = ChessBoard.getFENColorToMove(startFEN)
+        board = ChessBoard.fromFEN(startFEN)
+        (fromPosn, toPosn) = list(enumMoves(board, colorToMove))[0]
+        mover = p1 if ts.isMyTurn(gid, p1)[1]["isMyTurn"] else p2
+        self.assertTrue(ts.makePly(mover, gid, fromPosn.rankN,
+                                   fromPosn.fileN, toPosn.rankN,
+                                   toPosn.fileN)[0])
+        ts.cancelGame(gid)
+        ts.archiveFinishedGames()
+
+        archive = GameArchive(self.path)
+        self.assertEqual(archive.get(gid).startFEN, startFEN)
+        fd = StringIO.StringIO()
+        self.assertEqual(archive.exportPGN(fd), 1)
+        fd.seek(0)
+        ((tags, match),) = list(pgn.readGames(fd))
+        self.assertEqual(tags["SetUp"], "1")
+        self.assertEqual(tags["FEN"], startFEN)
+        self.assertEqual(match.startFEN, startFEN)
+        self.assertEqual(len(match.history), 1)
+
+    def test_truncatedRecordIsDiscarded(self):
+        ts = TournamentSystem(archivePath=self.path, archiveGracePeriod=0)
+        (gid, _, _) = self._playShortGame(ts)
+        ts.archiveFinishedGames()
+        size = os.path.getsize(self.path)
+        with open(self.path, "ab") as fd:
+            fd.write("\x00\x00\x01")
+
+        archive = GameArchive(self.path)
+        self.assertIn(gid, archive)
+        self.assertEqual(os.path.getsize(self.path), size)
+
+
+if __name__ == "__main__":
+    unittest.main()
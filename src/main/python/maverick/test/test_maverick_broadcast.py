@@ -0,0 +1,110 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import json
+import unittest
+
+from maverick.broadcast import GameBroadcaster
+from maverick.broadcast import WatchSubscription
+from maverick.data.structs import ChessBoard
+from maverick.server import MaverickServerProtocol
+from maverick.server import TournamentSystem
+
+from twisted.test import proto_helpers
+
+
+class Test_maverick_broadcast(unittest.TestCase):
+
+    def _startGame(self, ts):
+        """Start a fresh game, returning (gameID, whiteID, blackID)"""
+        p1 = ts.register("a")[1]["playerID"]
+        p2 = ts.register("b")[1]["playerID"]
+        gid = ts.joinGame(p1, True)[1]["gameID"]
+        ts.joinGame(p2, True)
+        if ts.getState(p1, gid)[1]["youAreColor"] == ChessBoard.WHITE:
+            return (gid, p1, p2)
+        else:
+            return (gid, p2, p1)
+
+    def _watch(self, ts, broadcaster, gameIDs):
+        """Open a spectator connection, returning (protocol, transport)"""
+        prot = MaverickServerProtocol(ts, broadcaster=broadcaster)
+        transport = proto_helpers.StringTransport()
+        prot.makeConnection(transport)
+        prot.lineReceived("WATCH " + json.dumps({"gameIDs": gameIDs}))
+        return (prot, transport)
+
+    def test_watch_streamsPlies(self):
+        ts = TournamentSystem()
+        broadcaster = GameBroadcaster()
+        ts.attachBroadcaster(broadcaster)
+        (gid, wp, bp) = self._startGame(ts)
+
+        (prot, transport) = self._watch(ts, broadcaster, [gid])
+        (_, allTransport) = self._watch(ts, broadcaster, None)
+        self.assertEqual(broadcaster.getNumSubscribers(gid), 2)
+
+        ts.makePly(wp, gid, 1, 4, 3, 4)
+        ts.cancelGame(gid)
+
+        lines = transport.value().splitlines()
+        self.assertEqual(lines[1], 'SUCCESS {"statuses": ["ONGOING"]}')
+        self.assertFalse(transport.disconnecting)
+        plyEvent = json.loads(lines[2].partition(" ")[2])
+        self.assertEqual(plyEvent["plyNumber"], 0)
+        self.assertEqual(plyEvent["ply"], {"fromRank": 1, "fromFile": 4,
+                                           "toRank": 3, "toFile": 4})
+        cancelEvent = json.loads(lines[3].partition(" ")[2])
+        self.assertEqual(cancelEvent["status"], "CANCELD")
+        self.assertEqual(allTransport.value().splitlines()[2:], lines[2:])
+
+        prot.connectionLost()
+        self.assertEqual(broadcaster.getNumSubscribers(gid), 1)
+
+    def test_watch_gameThenAllGames(self):
+        ts = TournamentSystem()
+        broadcaster = GameBroadcaster()
+        ts.attachBroadcaster(broadcaster)
+        (gid, wp, _) = self._startGame(ts)
+
+        (prot, transport) = self._watch(ts, broadcaster, [gid])
+        prot.lineReceived("WATCH " + json.dumps({"gameIDs": None}))
+        self.assertEqual(broadcaster.getNumSubscribers(gid), 1)
+
+        ts.makePly(wp, gid, 1, 4, 3, 4)
+        events = [line for line in transport.value().splitlines()
+                  if line.startswith("EVENT")]
+        self.assertEqual(len(events), 1)
+        self.assertEqual(json.loads(events[0].partition(" ")[2])
+                         ["plyNumber"], 0)
+
+    def test_watch_invalidGame(self):
+        ts = TournamentSystem()
+        broadcaster = GameBroadcaster()
+        (_, transport) = self._watch(ts, broadcaster, [5])
+        self.assertTrue(transport.value().splitlines()[1].startswith("ERROR"))
+        self.assertTrue(transport.disconnecting)
+
+    def test_slowSpectatorDropped(self):
+        transport = proto_helpers.StringTransport()
+        subscription = WatchSubscription(transport, maxPending=2)
+        subscription.pauseProducing()
+        subscription.sendEvent("a\r\n")
+        subscription.sendEvent("b\r\n")
+        self.assertEqual(transport.value(), "")
+
+        subscription.resumeProducing()
+        self.assertEqual(transport.value(), "a\r\nb\r\n")
+
+        subscription.pauseProducing()
+        for line in ["c\r\n", "d\r\n", "e\r\n"]:
+            subscription.sendEvent(line)
+        self.assertTrue(transport.disconnecting)
+        self.assertTrue(subscription.droppedP)
+
+
+if __name__ == "__main__":
+    unittest.main()
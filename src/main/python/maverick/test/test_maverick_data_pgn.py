@@ -0,0 +1,128 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import StringIO
+import unittest
+
+from maverick.data import pgn
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessMatch
+from maverick.data.structs import ChessPosn
+
+_GAMES = """[Event "Ruy Lopez"]
+[Site "?"]
+[Date "2026.10.18"]
+[Round "1"]
+[White "Alice \\"A\\" Smith"]
+[Black "Bob"]
+[Result "1/2-1/2"]
+
+1. e4 e5 2. Nf3 {a comment
+spanning lines} Nc6 3. Bb5 a6 (3... Nf6 4. O-O Nxe4) 4. Ba4 Nf6 5. O-O Be7 $1
+6. Re1 b5 7. Bb3 d6 8. c3 O-O 9. h3 Nb8 10. d4 Nbd7 ; rest of line
+1/2-1/2
+
+% An escaped line
+[Event "Scholar's mate"]
+[Result "1-0"]
+
+1.e4 e5 2.Bc4 Nc6 3.Qh5 Nf6?? 4.Qxf7# 1-0
+"""
+
+
+class Test_maverick_data_pgn(unittest.TestCase):
+
+    def test_squareNames(self):
+        self.assertEqual(pgn.getSquareName(ChessPosn(3, 4)), "e4")
+        self.assertEqual(pgn.getSquarePosn("h8"), ChessPosn(7, 7))
+        self.assertRaises(pgn.MaverickPGNException, pgn.getSquarePosn, "i1")
+
+    def test_SAN(self):
+        board = ChessBoard.fromFEN("4k3/8/8/8/8/8/4K3/R6R w - - 0 1")
+        self.assertEqual(pgn.getSAN(board, ChessBoard.WHITE,
+                                    ChessPosn(0, 0), ChessPosn(0, 3)),
+                         "Rad1")
+        self.assertRaises(pgn.MaverickPGNException, pgn.parseSAN,
+                          board, ChessBoard.WHITE, "Rd1")
+
+        board = ChessBoard.fromFEN("4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1")
+        self.assertEqual(pgn.getSAN(board, ChessBoard.WHITE,
+                                    ChessPosn(0, 4), ChessPosn(0, 6)),
+                         "O-O")
+        self.assertEqual(pgn.getSAN(board, ChessBoard.WHITE,
+                                    ChessPosn(0, 7), ChessPosn(7, 7)),
+                         "Rh8+")
+        self.assertEqual(pgn.parseSAN(board, ChessBoard.WHITE, "Rhf1"),
+                         (ChessPosn(0, 7), ChessPosn(0, 5)))
+        self.assertEqual(pgn.parseSAN(board, ChessBoard.WHITE, "O-O-O"),
+                         (ChessPosn(0, 4), ChessPosn(0, 2)))
+        for san in ["Rb2", "Qd1", "e8=Q", "Zz9"]:
+            self.assertRaises(pgn.MaverickPGNException, pgn.parseSAN,
+                              board, ChessBoard.WHITE, san)
+
+    def test_readGames(self):
+        games = list(pgn.readGames(StringIO.StringIO(_GAMES)))
+        self.assertEqual(len(games), 2)
+
+        (tags, match) = games[0]
+        self.assertEqual(tags["White"], 'Alice "A" Smith')
+        self.assertEqual(match.status, ChessMatch.STATUS_DRAWN)
+        self.assertEqual(len(match.history), 20)
+        self.assertEqual(match.board[ChessPosn(0, 6)],
+                         ChessBoard()[ChessPosn(0, 4)])
+
+        (tags, match) = games[1]
+        self.assertEqual(tags["Event"], "Scholar's mate")
+        self.assertEqual(match.status, ChessMatch.STATUS_WHITE_WON)
+        self.assertEqual(match.history[-1],
+                         (ChessPosn(4, 7), ChessPosn(6, 5)))
+
+    def test_readGames_invalid(self):
+        text = '[Event "Bad"]\n\n1. e4 e4 *\n\n[Event "Good"]\n\n1. d4 *\n'
+        self.assertRaises(pgn.MaverickPGNException, list,
+                          pgn.readGames(StringIO.StringIO(text)))
+        games = list(pgn.readGames(StringIO.StringIO(text),
+                                   skipInvalid=True))
+        self.assertEqual([tags["Event"] for (tags, _) in games], ["Good"])
+
+    def test_writeMatch_roundTrip(self):
+        (_, match) = list(pgn.readGames(StringIO.StringIO(_GAMES)))[0]
+        match.players = {ChessBoard.WHITE: 1, ChessBoard.BLACK: 2}
+        match.startedAt = 1792324800.0
+        match.finishedAt = match.startedAt + 3725.5
+
+        fd = StringIO.StringIO()
+        pgn.writeMatch(fd, match, moveTimes=[0.25] * len(match.history))
+        text = fd.getvalue()
+        self.assertIn('[White "Player 1"]', text)
+        self.assertIn('[Duration "1:02:05.500"]', text)
+        self.assertIn("{[%emt 0:00:00.250]}", text)
+        self.assertTrue(all(len(line) <= 79 for line in text.splitlines()))
+
+        ((tags, again),) = list(pgn.readGames(StringIO.StringIO(text)))
+        self.assertEqual(again.history, match.history)
+        self.assertEqual(again.status, match.status)
+        self.assertEqual(again.startedAt, match.startedAt)
+        self.assertEqual(again.finishedAt, match.finishedAt)
+        self.assertEqual(tags["PlyCount"], "20")
+
+    def test_formatGame_fromPosition(self):
+        fen = "4k3/8/8/8/8/8/4P3/4K3 b - - 0 12"
+        text = pgn.formatGame({"Result": "*"},
+                              [(ChessPosn(7, 4), ChessPosn(7, 3)),
+                               (ChessPosn(1, 4), ChessPosn(3, 4))],
+                              startFEN=fen)
+        self.assertIn('[FEN "{0}"]'.format(fen), text)
+        self.assertIn("12... Kd8 13. e4 *", text)
+
+        ((_, match),) = list(pgn.readGames(StringIO.StringIO(text)))
+        self.assertEqual(match.startFEN, fen)
+        self.assertTrue(match.board.toFEN(ChessBoard.BLACK).startswith(
+                "3k4/8/8/8/4P3/8/8/4K3 b - e3 "))
+
+
+if __name__ == "__main__":
+    unittest.main()
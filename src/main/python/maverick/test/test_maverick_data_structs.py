@@ -0,0 +1,262 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.data.structs import MaverickDataException
+from maverick.data.utils import enumMoves
+from maverick.test import common
+
+
+class Test_maverick_data_structs(unittest.TestCase):
+
+    def _assertBoardsEqual(self, board1, board2):
+        self.assertEqual(board1.layout, board2.layout)
+        self.assertEqual(board1.flag_canCastle, board2.flag_canCastle)
+        self.assertEqual(board1.flag_enpassant, board2.flag_enpassant)
+        self.assertEqual(board1.drawCounter, board2.drawCounter)
+
+    def test_FEN_initial(self):
+        self.assertEqual(ChessBoard().toFEN(), ChessBoard.FEN_INITIAL)
+        self._assertBoardsEqual(ChessBoard.fromFEN(ChessBoard.FEN_INITIAL),
+                                ChessBoard())
+
+    def test_FEN_roundTrip(self):
+        for board in [common.getBoardNew(), common.getBoardComplex(),
+                      common.getBoard1(), common.getBoard5(),
+                      common.getBoard8()]:
+            self._assertBoardsEqual(ChessBoard.fromFEN(board.toFEN()), board)
+
+        # White just moved a pawn two squares, so it is black's turn
+        board = common.getBoardWD4()
+        self._assertBoardsEqual(
+                ChessBoard.fromFEN(board.toFEN(ChessBoard.BLACK)), board)
+
+    def test_FEN_flags(self):
+        board = ChessBoard.fromFEN(
+                "r3k2r/8/8/3pP3/8/8/8/R3K2R w Kq d6 12 30")
+        self.assertEqual(board.flag_canCastle,
+                         {ChessBoard.WHITE: (False, True),
+                          ChessBoard.BLACK: (True, False)})
+        self.assertEqual(board.flag_enpassant[ChessBoard.BLACK],
+                         [False, False, False, True,
+                          False, False, False, False])
+        self.assertFalse(any(board.flag_enpassant[ChessBoard.WHITE]))
+        self.assertEqual(board.drawCounter, 12)
+        self.assertEqual(board[ChessPosn(4, 3)],
+                         ChessBoard()[ChessPosn(6, 3)])
+        self.assertEqual(board.toFEN(ChessBoard.WHITE, 30),
+                         "r3k2r/8/8/3pP3/8/8/8/R3K2R w Kq d6 12 30")
+
+    def test_FEN_afterPly(self):
+        board = ChessBoard()
+        board.getPlyResult(ChessPosn(1, 4), ChessPosn(3, 4))
+        fen = board.toFEN(ChessBoard.BLACK)
+        self.assertTrue(fen.startswith(
+                "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 "))
+        self.assertEqual(ChessBoard.getFENColorToMove(fen), ChessBoard.BLACK)
+        self._assertBoardsEqual(ChessBoard.fromFEN(fen), board)
+
+    def test_FEN_epd(self):
+        board = ChessBoard.fromFEN(
+                "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq -")
+        self._assertBoardsEqual(board, ChessBoard())
+
+    def test_FEN_invalid(self):
+        for fen in ["",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1",
+                    "rnbqkbnr/ppppxppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1",
+                    "rnbqkbnr/pppppppp/7/8/8/8/PPPPPPPP/RNBQKBNR w - - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x - - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KX - 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - e4 0 1",
+                    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w - - x 1"]:
+            self.assertRaises(MaverickDataException, ChessBoard.fromFEN, fen)
+
+    def test_getPositionHash(self):
+        board = ChessBoard()
+        startHash = board.getPositionHash(ChessBoard.WHITE)
+        self.assertNotEqual(startHash, board.getPositionHash(ChessBoard.BLACK))
+        self.assertEqual(startHash, ChessBoard.fromFEN(
+                ChessBoard.FEN_INITIAL).getPositionHash(ChessBoard.WHITE))
+        self.assertTrue(0 <= startHash < 2 ** 64)
+
+        # The same position reached by different move orders
+        board.getPlyResult(ChessPosn(0, 6), ChessPosn(2, 5))
+        board.getPlyResult(ChessPosn(7, 6), ChessPosn(5, 5))
+        board.getPlyResult(ChessPosn(0, 1), ChessPosn(2, 2))
+        other = ChessBoard()
+        other.getPlyResult(ChessPosn(0, 1), ChessPosn(2, 2))
+        other.getPlyResult(ChessPosn(7, 6), ChessPosn(5, 5))
+        other.getPlyResult(ChessPosn(0, 6), ChessPosn(2, 5))
+        self.assertEqual(board.getPositionHash(ChessBoard.BLACK),
+                         other.getPositionHash(ChessBoard.BLACK))
+
+        # Castle and en passant flags are part of the position
+        noCastle = ChessBoard.fromFEN(
+                "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w Kkq - 0 1")
+        self.assertNotEqual(noCastle.getPositionHash(ChessBoard.WHITE),
+                            startHash)
+        withEnpassant = ChessBoard.fromFEN(
+                "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3")
+        withoutEnpassant = ChessBoard.fromFEN(
+                "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq -")
+        self.assertNotEqual(
+                withEnpassant.getPositionHash(ChessBoard.BLACK),
+                withoutEnpassant.getPositionHash(ChessBoard.BLACK))
+
+    def test_pieceAttackingSquare(self):
+        board = ChessBoard.fromFEN("4k3/8/2n5/8/1b2R3/8/2P5/4K3 w - -")
+        self.assertEqual(board.pieceAttackingSquare(ChessBoard.BLACK,
+                                                    ChessPosn(0, 4)),
+                         ChessPosn(3, 1))  # Bishop on b4 checks e1
+        self.assertEqual(board.pieceAttackingSquare(ChessBoard.BLACK,
+                                                    ChessPosn(3, 3)),
+                         ChessPosn(5, 2))  # Knight on c6 attacks d4
+        self.assertEqual(board.pieceAttackingSquare(ChessBoard.WHITE,
+                                                    ChessPosn(2, 3)),
+                         ChessPosn(1, 2))  # Pawn on c2 attacks d3
+        self.assertEqual(board.pieceAttackingSquare(ChessBoard.WHITE,
+                                                    ChessPosn(0, 3)),
+                         ChessPosn(0, 4))  # King on e1 attacks d1
+        # Pawns do not attack straight ahead or backwards
+        self.assertIsNone(board.pieceAttackingSquare(ChessBoard.WHITE,
+                                                     ChessPosn(2, 2)))
+        self.assertIsNone(board.pieceAttackingSquare(ChessBoard.WHITE,
+                                                     ChessPosn(0, 2)))
+        # The rook on e4 checks e8, and the bishop on b4 checks e1
+        self.assertEqual(board.pieceCheckingKing(ChessBoard.BLACK),
+                         ChessPosn(3, 4))
+        self.assertEqual(board.pieceCheckingKing(ChessBoard.WHITE),
+                         ChessPosn(3, 1))
+
+        # A king that may castle attacks only its neighbouring squares
+        board = ChessBoard.fromFEN("8/k7/8/8/8/8/8/4K2R b K -")
+        self.assertIsNone(board.pieceCheckingKing(ChessBoard.BLACK))
+
+    def test_kingPosnCache(self):
+        board = ChessBoard.fromFEN("R3k3/8/8/8/8/8/8/4K3 b - -")
+        self.assertEqual(board.pieceCheckingKing(ChessBoard.BLACK),
+                         ChessPosn(7, 0))
+        undoDict = board.getPlyResult(ChessPosn(7, 4), ChessPosn(6, 4))
+        self.assertIsNone(board.pieceCheckingKing(ChessBoard.BLACK))
+        board.undoPlyResult(undoDict)
+        self.assertEqual(board.pieceCheckingKing(ChessBoard.BLACK),
+                         ChessPosn(7, 0))
+
+        # Changing the layout directly is noticed too
+        board.layout[6][3] = board.layout[7][4]
+        board.layout[7][4] = None
+        self.assertIsNone(board.pieceCheckingKing(ChessBoard.BLACK))
+
+    def test_gameState(self):
+        # Scholar's mate
+        board = ChessBoard.fromFEN("r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/"
+                                   "PPPP1PPP/RNB1K1NR b KQkq -")
+        self.assertEqual(board.gameState(ChessBoard.BLACK),
+                         ChessBoard.GAME_CHECKMATE)
+        self.assertTrue(board.isKingCheckmated(ChessBoard.BLACK))
+        self.assertEqual(board.gameState(ChessBoard.WHITE),
+                         ChessBoard.GAME_ONGOING)
+
+        # Check that the king escapes by taking the (undefended) queen
+        board = ChessBoard.fromFEN("r1bqkb1r/pppp1Qpp/2n2n2/4p3/4P3/8/"
+                                   "PPPP1PPP/RNB1KBNR b KQkq -")
+        self.assertEqual(board.gameState(ChessBoard.BLACK),
+                         ChessBoard.GAME_ONGOING)
+        self.assertTrue(board.isLegalMove(ChessBoard.BLACK, ChessPosn(7, 4),
+                                          ChessPosn(6, 5)))
+        self.assertFalse(board.isLegalMove(ChessBoard.BLACK, ChessPosn(6, 0),
+                                           ChessPosn(5, 0)))
+
+        # Stalemate
+        board = ChessBoard.fromFEN("7k/5Q2/6K1/8/8/8/8/8 b - -")
+        self.assertEqual(board.gameState(ChessBoard.BLACK),
+                         ChessBoard.GAME_STALEMATE)
+        self.assertFalse(board.isKingCheckmated(ChessBoard.BLACK))
+
+    def test_isLegalMove_castle(self):
+        board = ChessBoard.fromFEN("r3k2r/8/8/8/8/8/8/RN2K2R w KQkq -")
+        self.assertTrue(board.isLegalMove(ChessBoard.WHITE, ChessPosn(0, 4),
+                                          ChessPosn(0, 6)))
+        self.assertFalse(board.isLegalMove(ChessBoard.WHITE, ChessPosn(0, 4),
+                                           ChessPosn(0, 2)))
+        self.assertTrue(board.isLegalMove(ChessBoard.BLACK, ChessPosn(7, 4),
+                                          ChessPosn(7, 2)))
+        board = ChessBoard.fromFEN("r3k2r/8/8/8/8/8/8/R3K2R w Qkq -")
+        self.assertFalse(board.isLegalMove(ChessBoard.WHITE, ChessPosn(0, 4),
+                                           ChessPosn(0, 6)))
+        self.assertTrue(board.makePly(ChessBoard.WHITE, ChessPosn(0, 4),
+                                      ChessPosn(0, 2)))
+        self.assertEqual(board.toFEN(ChessBoard.BLACK),
+                         "r3k2r/8/8/8/8/8/8/2KR3R b kq - 1 1")
+
+    def test_positionHash_incremental(self):
+        board = common.getBoardComplex()
+        startHash = board.getPositionHash(ChessBoard.WHITE)
+        undoDicts = []
+        for color in [ChessBoard.WHITE, ChessBoard.BLACK] * 3:
+            (fromPosn, toPosn) = enumMoves(board, color)[0]
+            undoDicts.append(board.getPlyResult(fromPosn, toPosn))
+            fullScan = ChessBoard(startLayout=board.layout,
+                                  startEnpassantFlags=board.flag_enpassant,
+                                  startCanCastleFlags=board.flag_canCastle)
+            self.assertEqual(board.getPositionHash(color),
+                             fullScan.getPositionHash(color))
+        for undoDict in reversed(undoDicts):
+            board.undoPlyResult(undoDict)
+        self.assertEqual(board.getPositionHash(ChessBoard.WHITE), startHash)
+
+    def test_drawCounter(self):
+        board = ChessBoard()
+        undoDict = board.getPlyResult(ChessPosn(0, 6), ChessPosn(2, 5))
+        self.assertEqual(board.drawCounter, 1)
+        board.undoPlyResult(undoDict)
+        self.assertEqual(board.drawCounter, 0)
+        board.getPlyResult(ChessPosn(0, 6), ChessPosn(2, 5))
+        board.getPlyResult(ChessPosn(6, 4), ChessPosn(4, 4))
+        self.assertEqual(board.drawCounter, 0)
+
+    def test_getRepetitionCount(self):
+        board = ChessBoard()
+        board.resetPositionHistory(ChessBoard.WHITE)
+        shuffle = [(ChessPosn(0, 6), ChessPosn(2, 5)),
+                   (ChessPosn(7, 6), ChessPosn(5, 5)),
+                   (ChessPosn(2, 5), ChessPosn(0, 6)),
+                   (ChessPosn(5, 5), ChessPosn(7, 6))]
+        for (fromPosn, toPosn) in shuffle:
+            board.getPlyResult(fromPosn, toPosn)
+        self.assertEqual(board.getRepetitionCount(), 1)
+        self.assertFalse(board.isDrawnByRule())
+        self.assertTrue(board.isDrawnByRule(repetitions=1))
+
+        undoDicts = [board.getPlyResult(fromPosn, toPosn)
+                     for (fromPosn, toPosn) in shuffle]
+        self.assertEqual(board.getRepetitionCount(), 2)
+        self.assertTrue(board.isDrawnByRule())
+        for undoDict in reversed(undoDicts):
+            board.undoPlyResult(undoDict)
+        self.assertEqual(len(board.positionHistory), 5)
+        self.assertEqual(board.getRepetitionCount(), 1)
+
+        # Positions before a pawn move cannot repeat
+        board.getPlyResult(ChessPosn(1, 4), ChessPosn(3, 4))
+        board.getPlyResult(ChessPosn(6, 4), ChessPosn(4, 4))
+        self.assertEqual(board.getRepetitionCount(), 0)
+
+    def test_isDrawnByRule_fiftyMoves(self):
+        board = ChessBoard.fromFEN("4k3/8/8/8/8/8/8/4K2R w - - 99 80")
+        board.resetPositionHistory(ChessBoard.WHITE)
+        self.assertFalse(board.isDrawnByRule())
+        board.getPlyResult(ChessPosn(0, 7), ChessPosn(1, 7))
+        self.assertTrue(board.isDrawnByRule())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from maverick.journal import buildSnapshot
+from maverick.journal import recover
+from maverick.server import TournamentSystem
+
+
+class Test_maverick_journal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def _playPlies(self, ts):
+        """Start a match and make two plies in it
+
+        @return: a tuple of form (gameID, playerID of first player)"""
+        (p1, p2) = ts.registerBatch(["a", "b"])[1]["playerIDs"]
+        gid = ts.joinGame(p1, True)[1]["gameID"]
+        ts.joinGame(p2, True)
+        match = ts.games[gid]
+        for ply in [(1, 4, 3, 4), (6, 4, 4, 4)]:
+            mover = match.players[match.whoseTurn()]
+            self.assertTrue(ts.makePly(mover, gid, *ply)[0])
+        return (gid, p1)
+
+    def test_recoverReplaysJournal(self):
+        ts = recover(self.tmpDir, TournamentSystem)
+        (gid, p1) = self._playPlies(ts)
+        ts.setRating(p1, 1500)
+        expected = ts.getState(p1, gid)[1]
+        ts._journal.close()
+
+        recovered = recover(self.tmpDir, TournamentSystem)
+        self.assertEqual(recovered.getState(p1, gid)[1], expected)
+        self.assertEqual(recovered.register("b"), ts.register("b"))
+        self.assertEqual(recovered.ratings, {p1: 1500})
+
+        # New IDs do not collide with recovered ones
+        p3 = recovered.register("c")[1]["playerID"]
+        self.assertNotIn(p3, ts.players)
+
+    def test_recoverReplaysBatchRegistration(self):
+        ts = recover(self.tmpDir, TournamentSystem)
+        ts.register("b")
+        ts.registerBatch(["a", "b", "c", "a"])
+        ts._journal.close()
+
+        recovered = recover(self.tmpDir, TournamentSystem)
+        self.assertEqual(recovered.players, ts.players)
+        self.assertEqual(len(recovered.players), 3)
+
+    def test_snapshotFoldsSegments(self):
+        ts = recover(self.tmpDir, TournamentSystem)
+        (gid, p1) = self._playPlies(ts)
+        buildSnapshot(self.tmpDir, ts._journal.rotate())
+        ts.cancelGame(gid)
+        ts._journal.close()
+
+        logs = [name for name in os.listdir(self.tmpDir)
+                if name.endswith(".log")]
+        self.assertEqual(len(logs), 1)
+
+        recovered = recover(self.tmpDir, TournamentSystem)
+        self.assertEqual(recovered.getState(p1, gid)[1],
+                         ts.getState(p1, gid)[1])
+        self.assertEqual(recovered.getStatus(gid), ts.getStatus(gid))
+
+    def test_tornRecordIsIgnored(self):
+        ts = recover(self.tmpDir, TournamentSystem)
+        pID = ts.register("a")[1]["playerID"]
+        ts._journal.close()
+        path = os.path.join(self.tmpDir, "journal.000001.log")
+        with open(path, "ab") as fd:
+            fd.write("\x00\x00\x00\x20\x00")
+
+        recovered = recover(self.tmpDir, TournamentSystem)
+        self.assertEqual(recovered.players, {pID: "a"})
+
+
+if __name__ == "__main__":
+    unittest.main()
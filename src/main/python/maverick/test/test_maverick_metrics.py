@@ -0,0 +1,73 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import json
+import unittest
+
+from maverick.metrics import LatencyHistogram
+from maverick.metrics import ServerMetrics
+from maverick.server import MaverickServerProtocol
+from maverick.server import TournamentSystem
+
+from twisted.test import proto_helpers
+
+
+class Test_maverick_metrics(unittest.TestCase):
+
+    def test_histogram_percentiles(self):
+        histogram = LatencyHistogram()
+        self.assertIsNone(histogram.getPercentile(0.5))
+
+        for _ in xrange(98):
+            histogram.record(0.0001)  # 100us, in the bucket below 128us
+        histogram.record(0.01)
+        histogram.record(0.02)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.getPercentile(0.5), 128 / 1e6)
+        self.assertEqual(histogram.getPercentile(0.99), 16384 / 1e6)
+        self.assertEqual(histogram.getPercentile(1.0), 0.02)
+
+        summary = histogram.toDict()
+        self.assertEqual(summary["buckets"], {"128": 98, "16384": 1,
+                                              "32768": 1})
+        self.assertEqual(summary["maxMs"], 20.0)
+
+    def test_statsVerb(self):
+        ts = TournamentSystem()
+        metrics = ServerMetrics(gameCounter=ts.getGameCounts)
+
+        def request(line):
+            prot = MaverickServerProtocol(ts, metrics=metrics)
+            transport = proto_helpers.StringTransport()
+            prot.makeConnection(transport)
+            prot.lineReceived(line)
+            prot.connectionLost()
+            return transport.value().splitlines()[-1]
+
+        request('REGISTER {"name": "a"}')
+        request('REGISTER {"name": "b"}')
+        request('GET_STATUS {"gameID": 12}')
+        request('BOGUS {}')
+
+        response = request('STATS {}')
+        self.assertTrue(response.startswith("SUCCESS "))
+        stats = json.loads(response.partition(" ")[2])
+
+        self.assertEqual(stats["connections"], {"active": 1, "total": 5})
+        self.assertEqual(stats["verbs"]["REGISTER"]["count"], 2)
+        self.assertEqual(stats["verbs"]["REGISTER"]["errors"], 0)
+        self.assertEqual(stats["verbs"]["GET_STATUS"]["errors"], 1)
+        self.assertEqual(stats["verbs"]["UNRECOGNIZED"]["count"], 1)
+        self.assertEqual(stats["games"]["ONGOING"], 0)
+
+        response = request('STATS {"x": 1}')
+        self.assertTrue(response.startswith("ERROR"))
+        self.assertIn("Invalid arguments, expected: none", response)
+
+
+if __name__ == "__main__":
+    unittest.main()
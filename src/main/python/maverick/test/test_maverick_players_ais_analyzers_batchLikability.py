@@ -0,0 +1,88 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.players.ais.analyzers.batchLikability import BoardBatch
+from maverick.players.ais.analyzers.batchLikability import \
+    evaluateHeuristicsBatch
+from maverick.players.ais.analyzers.batchLikability import \
+    evaluateLikabilityBatch
+from maverick.players.ais.analyzers.likability import evaluateBoardLikability
+from maverick.players.ais.analyzers.likability import evaluateHeuristics
+from maverick.players.ais.quiescenceSearchAI import QLAI
+from maverick.test import common
+
+
+def _playOpening(plies):
+    """Return a new board with the given plies made on it"""
+    board = ChessBoard()
+    for (fromRank, fromFile, toRank, toFile) in plies:
+        board.getPlyResult(ChessPosn(fromRank, fromFile),
+                           ChessPosn(toRank, toFile))
+    return board
+
+
+class Test_maverick_players_ais_analyzers_batchLikability(unittest.TestCase):
+
+    def _getTestBoards(self):
+        return [common.getBoardNew(),
+                common.getBoardWD4(),
+                common.getBoardComplex(),
+                common.getBoard1(),
+                common.getBoard2(),
+                common.getBoard3(),
+                common.getBoard4(),
+                common.getBoard5(),
+                common.getBoard6(),
+                common.getBoard7(),
+                common.getBoard8(),
+                # White may capture en passant on D6
+                _playOpening([(1, 4, 3, 4), (6, 0, 5, 0),
+                              (3, 4, 4, 4), (6, 3, 4, 3)]),
+                # White may castle king-side
+                _playOpening([(1, 4, 3, 4), (6, 4, 4, 4),
+                              (0, 6, 2, 5), (7, 1, 5, 2),
+                              (0, 5, 3, 2), (7, 6, 5, 5)]),
+                # Black is in check from the bishop on B5
+                _playOpening([(1, 4, 3, 4), (6, 3, 4, 3),
+                              (0, 5, 4, 1)]),
+                # Black is checkmated (scholar's mate)
+                ChessBoard.fromFEN("r1bqkb1r/pppp1Qpp/2n2n2/4p3/2B1P3/8/"
+                                   "PPPP1PPP/RNB1K1NR b KQkq -"),
+                # Black is stalemated
+                ChessBoard.fromFEN("7k/5Q2/6K1/8/8/8/8/8 b - -")]
+
+    def test_heuristicsMatchScalar(self):
+        boards = self._getTestBoards()
+        batch = BoardBatch.fromBoards(boards)
+        for color in [ChessBoard.WHITE, ChessBoard.BLACK]:
+            values = evaluateHeuristicsBatch(color, batch)
+            for (board, row) in zip(boards, values):
+                self.assertEqual(list(row), evaluateHeuristics(color, board))
+
+    def test_likabilityMatchesScalar(self):
+        boards = self._getTestBoards()
+        batch = BoardBatch.fromBoards(boards)
+        weights = dict(QLAI.defaultWeights, inCheckWeight=0.7)
+        for color in [ChessBoard.WHITE, ChessBoard.BLACK]:
+            scores = evaluateLikabilityBatch(color, batch, weights)
+            for (board, score) in zip(boards, scores):
+                self.assertEqual(score,
+                                 evaluateBoardLikability(color, board,
+                                                         weights))
+
+    def test_emptyBatch(self):
+        batch = BoardBatch.fromBoards([])
+        self.assertEqual(len(batch), 0)
+        self.assertEqual(evaluateHeuristicsBatch(ChessBoard.WHITE,
+                                                 batch).shape, (0, 4))
+
+
+if __name__ == "__main__":
+    unittest.main()
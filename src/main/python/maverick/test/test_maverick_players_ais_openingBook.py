@@ -0,0 +1,84 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import os
+import random
+import tempfile
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.players.ais.openingBook import MaverickBookException
+from maverick.players.ais.openingBook import OpeningBook
+from maverick.players.ais.openingBook import writeBook
+from maverick.players.ais.quiescenceSearchAI import QLAI
+
+
+class Test_maverick_players_ais_openingBook(unittest.TestCase):
+
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp(suffix=".book")
+        os.close(fd)
+
+        board = ChessBoard()
+        self.startHash = board.getPositionHash(ChessBoard.WHITE)
+        board.getPlyResult(ChessPosn(1, 4), ChessPosn(3, 4))
+        self.e4Hash = board.getPositionHash(ChessBoard.BLACK)
+        self.weights = {(self.startHash, (1, 4), (3, 4)): 3,
+                        (self.startHash, (1, 3), (3, 3)): 1,
+                        (self.startHash, (1, 0), (4, 0)): 100,  # Illegal
+                        (self.e4Hash, (6, 2), (4, 2)): 70000}
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_getMoves(self):
+        self.assertEqual(writeBook(self.path, self.weights), 4)
+        book = OpeningBook(self.path)
+        self.assertEqual(len(book), 4)
+
+        moves = book.getMoves(self.startHash)
+        self.assertEqual([(f, t) for (f, t, _) in moves],
+                         [(ChessPosn(1, 0), ChessPosn(4, 0)),
+                          (ChessPosn(1, 3), ChessPosn(3, 3)),
+                          (ChessPosn(1, 4), ChessPosn(3, 4))])
+
+        # Weights are scaled to fit in the book
+        ((_, _, weight),) = book.getMoves(self.e4Hash)
+        self.assertEqual(weight, 0xFFFF)
+        self.assertEqual(book.getMoves(self.e4Hash + 1), [])
+        self.assertEqual(book.getMoves(0), [])
+        book.close()
+
+    def test_chooseMove(self):
+        writeBook(self.path, self.weights)
+        book = OpeningBook(self.path)
+        rng = random.Random(0)
+        choices = [book.chooseMove(ChessBoard(), ChessBoard.WHITE, rng)
+                   for _ in xrange(200)]
+        self.assertNotIn((ChessPosn(1, 0), ChessPosn(4, 0)), choices)
+        self.assertIn((ChessPosn(1, 3), ChessPosn(3, 3)), choices)
+        self.assertGreater(choices.count((ChessPosn(1, 4), ChessPosn(3, 4))),
+                           100)
+        self.assertIsNone(book.chooseMove(ChessBoard(), ChessBoard.BLACK))
+
+    def test_QLAI_playsBookMove(self):
+        writeBook(self.path, self.weights)
+        ai = QLAI(bookPath=self.path)
+        ai.isWhite = False
+        board = ChessBoard()
+        board.getPlyResult(ChessPosn(1, 4), ChessPosn(3, 4))
+        self.assertEqual(ai.getNextMove(board),
+                         (ChessPosn(6, 2), ChessPosn(4, 2)))
+
+    def test_invalidFile(self):
+        with open(self.path, "wb") as fd:
+            fd.write("not a book")
+        self.assertRaises(MaverickBookException, OpeningBook, self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
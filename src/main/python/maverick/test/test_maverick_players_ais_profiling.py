@@ -0,0 +1,85 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from maverick.data import utils
+from maverick.data.structs import ChessBoard
+from maverick.players.ais import quiescenceSearchAI
+from maverick.players.ais.analyzers.likability import evaluateBoardLikability
+from maverick.players.ais.common import MaverickAIException
+from maverick.players.ais.profiling import SearchProfiler
+from maverick.players.ais.quiescenceSearchAI import QLAI
+
+
+class Test_maverick_players_ais_profiling(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_startStop(self):
+        originalEnumMoves = utils.enumMoves
+        originalIsLegalMove = ChessBoard.__dict__["isLegalMove"]
+        board = ChessBoard()
+        profiler = SearchProfiler()
+
+        profiler.start()
+        self.assertIsNot(utils.enumMoves, originalEnumMoves)
+        self.assertIsNot(quiescenceSearchAI.enumMoves, originalEnumMoves)
+        self.assertRaises(MaverickAIException, SearchProfiler().start)
+        utils.enumMoves(board, ChessBoard.WHITE)
+        quiescenceSearchAI.enumMoves(board, ChessBoard.BLACK)
+        record = profiler.stop(note="first")
+
+        # The originals are back in place
+        self.assertIs(utils.enumMoves, originalEnumMoves)
+        self.assertIs(quiescenceSearchAI.enumMoves, originalEnumMoves)
+        self.assertIs(ChessBoard.__dict__["isLegalMove"], originalIsLegalMove)
+
+        self.assertEqual(record["note"], "first")
+        self.assertEqual(record["functions"]["moveGen"]["calls"], 2)
+        self.assertEqual(record["functions"]["pieceMoveGen"]["calls"], 32)
+        self.assertEqual(record["functions"]["evaluate"]["calls"], 0)
+        self.assertGreaterEqual(record["seconds"],
+                                record["functions"]["moveGen"]["seconds"])
+
+        # Calls made while stopped are not counted
+        utils.enumMoves(board, ChessBoard.WHITE)
+        profiler.start()
+        evaluateBoardLikability(ChessBoard.WHITE, board,
+                                QLAI.defaultWeights)
+        record = profiler.stop()
+        self.assertEqual(record["functions"]["evaluate"]["calls"], 1)
+        self.assertEqual(record["functions"]["evalPieceValue"]["calls"], 2)
+        self.assertEqual(sum(record["gameStateCache"].values()), 1)
+
+        report = profiler.toDict()
+        self.assertEqual(len(report["moves"]), 2)
+        self.assertEqual(report["totals"]["functions"]["moveGen"]["calls"],
+                         2 + record["functions"]["moveGen"]["calls"])
+
+    def test_writeReport(self):
+        path = os.path.join(self.directory, "profile.json")
+        profiler = SearchProfiler()
+        profiler.start()
+        profiler.stop(move=[1, 4, 3, 4])
+        profiler.writeReport(path)
+        with open(path) as fd:
+            report = json.load(fd)
+        self.assertEqual(report["moves"][0]["move"], [1, 4, 3, 4])
+        self.assertIn("isLegalMove", report["totals"]["functions"])
+        self.assertEqual(os.listdir(self.directory), ["profile.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
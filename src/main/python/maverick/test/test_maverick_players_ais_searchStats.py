@@ -0,0 +1,88 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.players.ais.quiescenceSearchAI import QLAI
+from maverick.players.ais.searchStats import SearchStats
+from maverick.players.ais.searchStats import getMoveName
+
+
+class Test_maverick_players_ais_searchStats(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_getMoveName(self):
+        self.assertEqual(getMoveName((ChessPosn(1, 4), ChessPosn(3, 4))),
+                         "e2e4")
+        self.assertEqual(getMoveName((ChessPosn(7, 6), ChessPosn(5, 5))),
+                         "g8f6")
+
+    def test_iterations(self):
+        e2e4 = (ChessPosn(1, 4), ChessPosn(3, 4))
+        e7e5 = (ChessPosn(6, 4), ChessPosn(4, 4))
+        d2d4 = (ChessPosn(1, 3), ChessPosn(3, 3))
+        stats = SearchStats()
+
+        stats.startIteration(1)
+        stats.noteBestMove(0, e2e4)
+        stats.endIteration(20)
+        self.assertEqual(stats.toDict()["pv"], ["e2e4"])
+
+        # The line below a new best move replaces the old line
+        stats.startIteration(2)
+        stats.pvTable[1] = []
+        stats.noteBestMove(1, e7e5)
+        stats.noteBestMove(0, e2e4)
+        stats.pvTable[1] = []
+        stats.noteBestMove(0, d2d4)
+        stats.noteCutoff(0)
+        stats.noteCutoff(3)
+        stats.endIteration(400)
+
+        result = stats.toDict()
+        self.assertEqual(result["depth"], 2)
+        self.assertEqual(result["nodes"], 420)
+        self.assertEqual(result["pv"], ["d2d4"])
+        self.assertEqual(result["betaCutoffs"], 2)
+        self.assertEqual(result["firstMoveCutoffRate"], 0.5)
+        self.assertEqual(result["ttProbes"], 0)
+        self.assertIsNone(result["ttHitRate"])
+
+        line = stats.toUCI()
+        self.assertTrue(line.startswith("info depth 2 seldepth 2 time "))
+        self.assertIn(" nodes 420 nps ", line)
+        self.assertIn(" pv d2d4 string ", line)
+
+    def test_search_log(self):
+        path = os.path.join(self.directory, "search.jsonl")
+        ai = QLAI(searchLogPath=path)
+        board = ChessBoard.fromFEN("6k1/5ppp/8/8/8/8/8/R5K1 w - -")
+        board.resetPositionHistory(ChessBoard.WHITE)
+        move = ai._search(board, ChessBoard.WHITE, 1, float("inf"))
+
+        with open(path) as fd:
+            records = [json.loads(line) for line in fd]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["depth"], 1)
+        self.assertEqual(records[0]["pv"], [getMoveName(move)])
+        self.assertEqual(records[0]["engine"], "QLAI")
+        self.assertGreater(records[0]["nodes"], 0)
+        self.assertIsNone(ai._searchStats)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.players.ais import tablebase
+from maverick.players.ais.tablebase import TableLayout
+from maverick.players.ais.tablebase import Tablebases
+
+
+class Test_maverick_players_ais_tablebase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def __writeTable(self, name, codes):
+        """Write a table of draws except for the given {index: code}"""
+        layout = TableLayout(name)
+        table = bytearray([tablebase.CODE_DRAW]) * layout.size
+        for (index, code) in codes.iteritems():
+            table[index] = code
+        with open(os.path.join(self.directory,
+                               name + tablebase.TABLE_SUFFIX), "wb") as fd:
+            fd.write(tablebase.TABLE_MAGIC)
+            fd.write(str(table))
+
+    def test_getMaterialName(self):
+        self.assertEqual(tablebase.getMaterialName(
+                {ChessBoard.WHITE: [ChessBoard.ROOK, ChessBoard.KING],
+                 ChessBoard.BLACK: [ChessBoard.PAWN, ChessBoard.KING,
+                                    ChessBoard.KNGT]}), "KRvKNP")
+        self.assertRaises(tablebase.MaverickTablebaseException,
+                          TableLayout, "QKvK")
+        self.assertRaises(tablebase.MaverickTablebaseException,
+                          TableLayout, "KQ")
+
+    def test_layoutIndex(self):
+        for name in ["KQvK", "KPvK"]:
+            layout = TableLayout(name)
+            for index in xrange(0, layout.size, 997):
+                (squares, color) = layout.getPosition(index)
+                self.assertEqual(layout.getIndex(squares, color), index)
+
+        # Symmetric positions share a number: white king on h8 is moved to
+        # a1 (and the queen from g6 to b3) without pawns, and white king on
+        # h2 to a2 (and the pawn from g4 to b4) with them
+        layout = TableLayout("KQvK")
+        self.assertEqual(layout.getIndex([63, 46, 0], ChessBoard.BLACK),
+                         layout.getIndex([0, 17, 63], ChessBoard.BLACK))
+        layout = TableLayout("KPvK")
+        self.assertEqual(layout.getIndex([15, 30, 0], ChessBoard.WHITE),
+                         layout.getIndex([8, 25, 7], ChessBoard.WHITE))
+
+    def test_probe(self):
+        # White: Kc3, Qb3; black: Ka1; white to move (mate in 1)
+        layout = TableLayout("KQvK")
+        self.__writeTable("KQvK", {layout.getIndex([18, 17, 0],
+                                                   ChessBoard.WHITE): 3})
+        tablebases = Tablebases(self.directory)
+        self.assertEqual(tablebases.maxPieces, 3)
+        self.assertTrue("KQvK" in tablebases)
+
+        board = ChessBoard.fromFEN("8/8/8/8/8/1QK5/8/k7 w - -")
+        self.assertEqual(tablebases.probe(board, ChessBoard.WHITE),
+                         (tablebase.RESULT_WIN, 1))
+        self.assertEqual(tablebases.probe(board, ChessBoard.BLACK),
+                         (tablebase.RESULT_DRAW, None))
+
+        # The same position with the colors swapped
+        board = ChessBoard.fromFEN("K7/8/1qk5/8/8/8/8/8 b - -")
+        self.assertEqual(tablebases.probe(board, ChessBoard.BLACK),
+                         (tablebase.RESULT_WIN, 1))
+
+        # Bare kings are drawn; other material is not covered
+        board = ChessBoard.fromFEN("8/8/8/8/8/2K5/8/k7 w - -")
+        self.assertEqual(tablebases.probe(board, ChessBoard.WHITE),
+                         (tablebase.RESULT_DRAW, None))
+        board = ChessBoard.fromFEN("8/8/8/8/8/1RK5/8/k7 w - -")
+        self.assertEqual(tablebases.probe(board, ChessBoard.WHITE), None)
+        tablebases.close()
+
+    def test_probeCastling(self):
+        self.__writeTable("KRvK", {})
+        tablebases = Tablebases(self.directory)
+        board = ChessBoard.fromFEN("4k3/8/8/8/8/8/8/4K2R w K -")
+        self.assertEqual(tablebases.probe(board, ChessBoard.WHITE), None)
+        board = ChessBoard.fromFEN("4k3/8/8/8/8/8/8/4K2R w - -")
+        self.assertEqual(tablebases.probe(board, ChessBoard.WHITE),
+                         (tablebase.RESULT_DRAW, None))
+        tablebases.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,257 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import json
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessMatch
+from maverick.data.structs import ChessPosn
+from maverick.server import MaverickServerProtocol
+from maverick.server import TournamentSystem
+
+from twisted.test import proto_helpers
+
+
+class Test_maverick_server(unittest.TestCase):
+
+    def _startGame(self, ts):
+        """Register two players and start a fresh game between them
+
+        @return: a tuple of form (gameID, whitePlayerID, blackPlayerID)"""
+        p1 = ts.register("a")[1]["playerID"]
+        p2 = ts.register("b")[1]["playerID"]
+        gid = ts.joinGame(p1, True)[1]["gameID"]
+        ts.joinGame(p2, True)
+
+        if ts.getState(p1, gid)[1]["youAreColor"] == ChessBoard.WHITE:
+            return (gid, p1, p2)
+        else:
+            return (gid, p2, p1)
+
+    def test_getState_fullWithoutVersion(self):
+        ts = TournamentSystem()
+        (gid, wp, bp) = self._startGame(ts)
+        ts.makePly(wp, gid, 1, 4, 3, 4)
+
+        (successP, state) = ts.getState(bp, gid)
+        self.assertTrue(successP)
+        self.assertFalse(state["isDelta"])
+        self.assertEqual(state["historyStart"], 0)
+        self.assertEqual(len(state["history"]), 1)
+        self.assertIn("layout", state["board"])
+
+    def test_getState_deltaSinceVersion(self):
+        ts = TournamentSystem()
+        (gid, wp, bp) = self._startGame(ts)
+        ts.makePly(wp, gid, 1, 4, 3, 4)
+        version = ts.getState(wp, gid)[1]["stateVersion"]
+
+        ts.makePly(bp, gid, 6, 4, 4, 4)
+        ts.makePly(wp, gid, 0, 3, 4, 7)
+
+        (successP, state) = ts.getState(wp, gid, sinceVersion=version)
+        self.assertTrue(successP)
+        self.assertTrue(state["isDelta"])
+        self.assertEqual(state["historyStart"], 1)
+        self.assertEqual(state["history"],
+                         [{'fromRank': 6, 'fromFile': 4,
+                           'toRank': 4, 'toFile': 4},
+                          {'fromRank': 0, 'fromFile': 3,
+                           'toRank': 4, 'toFile': 7}])
+        self.assertNotIn("layout", state["board"])
+        self.assertFalse(state["isWhitesTurn"])
+
+    def test_getState_deltaUpToDate(self):
+        ts = TournamentSystem()
+        (gid, wp, _) = self._startGame(ts)
+        version = ts.getState(wp, gid)[1]["stateVersion"]
+
+        state = ts.getState(wp, gid, sinceVersion=version)[1]
+        self.assertTrue(state["isDelta"])
+        self.assertEqual(state["history"], [])
+        self.assertEqual(state["stateVersion"], version)
+
+    def test_getState_unknownVersionGivesFullState(self):
+        ts = TournamentSystem()
+        (gid, wp, _) = self._startGame(ts)
+        version = ts.getState(wp, gid)[1]["stateVersion"]
+
+        state = ts.getState(wp, gid, sinceVersion=version + 10)[1]
+        self.assertFalse(state["isDelta"])
+        self.assertIn("layout", state["board"])
+
+    def test_getState_pendingGame(self):
+        ts = TournamentSystem()
+        p1 = ts.register("a")[1]["playerID"]
+        gid = ts.joinGame(p1, True)[1]["gameID"]
+
+        (successP, state) = ts.getState(p1, gid, sinceVersion=0)
+        self.assertTrue(successP)
+        self.assertFalse(state["isDelta"])
+        self.assertEqual(state["board"]["layout"], "BOARD NOT INITIALIZED")
+
+    def test_joinGame_skipsFinishedGames(self):
+        ts = TournamentSystem()
+        for _ in xrange(20):
+            (gid, _, _) = self._startGame(ts)
+            ts.cancelGame(gid)
+
+        p1 = ts.register("c")[1]["playerID"]
+        p2 = ts.register("d")[1]["playerID"]
+        gid = ts.joinGame(p1, True)[1]["gameID"]
+        self.assertEqual(ts.joinGame(p2, True)[1]["gameID"], gid)
+        self.assertEqual(ts.getStatus(gid)[1]["status"], "ONGOING")
+
+    def test_joinGame_doesNotJoinOwnGame(self):
+        ts = TournamentSystem()
+        p1 = ts.register("a")[1]["playerID"]
+        p2 = ts.register("b")[1]["playerID"]
+        gid1 = ts.joinGame(p1, True)[1]["gameID"]
+        gid2 = ts.joinGame(p1, True)[1]["gameID"]
+        self.assertNotEqual(gid1, gid2)
+
+        # The oldest pending game is joined first
+        self.assertEqual(ts.joinGame(p2, True)[1]["gameID"], gid1)
+
+    def test_joinGame_prefersSameFreshStartPreference(self):
+        ts = TournamentSystem()
+        p1 = ts.register("a")[1]["playerID"]
+        p2 = ts.register("b")[1]["playerID"]
+        p3 = ts.register("c")[1]["playerID"]
+        gidStale = ts.joinGame(p1, False)[1]["gameID"]
+        gidFresh = ts.joinGame(p1, True)[1]["gameID"]
+
+        self.assertEqual(ts.joinGame(p2, True)[1]["gameID"], gidFresh)
+        # Falls back to the other preference when no other game is pending
+        self.assertEqual(ts.joinGame(p3, True)[1]["gameID"], gidStale)
+
+    def test_joinGame_ratingBands(self):
+        ts = TournamentSystem(ratingBandWidth=100)
+        p1 = ts.register("a")[1]["playerID"]
+        p2 = ts.register("b")[1]["playerID"]
+        p3 = ts.register("c")[1]["playerID"]
+        ts.setRating(p1, 1510)
+        ts.setRating(p2, 1720)
+        ts.setRating(p3, 1590)
+
+        gid = ts.joinGame(p1, True)[1]["gameID"]
+        self.assertNotEqual(ts.joinGame(p2, True)[1]["gameID"], gid)
+        self.assertEqual(ts.joinGame(p3, True)[1]["gameID"], gid)
+
+    def test_getActiveGames(self):
+        ts = TournamentSystem()
+        (gid, wp, bp) = self._startGame(ts)
+        self.assertEqual(ts.getActiveGames(wp), (True, {"gameIDs": [gid]}))
+
+        ts.cancelGame(gid)
+        self.assertEqual(ts.getActiveGames(bp), (True, {"gameIDs": []}))
+        self.assertFalse(ts.getActiveGames(-1)[0])
+
+    def test_register_existingNameKeepsID(self):
+        ts = TournamentSystem()
+        p1 = ts.register("a")[1]["playerID"]
+        p2 = ts.register("b")[1]["playerID"]
+        self.assertNotEqual(p1, p2)
+        self.assertEqual(ts.register("a"), (True, {"playerID": p1}))
+
+    def test_registerBatch(self):
+        ts = TournamentSystem()
+        p1 = ts.register("a")[1]["playerID"]
+
+        (successP, result) = ts.registerBatch(["b", "a", "c", "b"])
+        self.assertTrue(successP)
+        pIDs = result["playerIDs"]
+        self.assertEqual(pIDs[1], p1)
+        self.assertEqual(pIDs[0], pIDs[3])
+        self.assertEqual(len(set(pIDs)), 3)
+        self.assertEqual(ts.players[pIDs[2]], "c")
+
+        self.assertFalse(ts.registerBatch("abc")[0])
+        self.assertFalse(ts.registerBatch([1, 2])[0])
+
+    def test_joinGameWithID(self):
+        ts = TournamentSystem()
+        self.assertEqual(ts.joinGameWithID(10, 42, True),
+                         (True, {"gameID": 42}))
+        self.assertEqual(ts.joinGameWithID(11, 42, True),
+                         (True, {"gameID": 42, "startFreshP": True}))
+        self.assertEqual(ts.getStatus(42), (True, {"status": "ONGOING"}))
+        self.assertFalse(ts.joinGameWithID(12, 42, True)[0])
+        self.assertEqual(ts.getGamesOfPlayer(11), (True, {"gameIDs": [42]}))
+
+        # Locally allocated IDs skip those given by the router
+        p1 = ts.register("a")[1]["playerID"]
+        self.assertGreater(ts.joinGame(p1, True)[1]["gameID"], 42)
+
+    def test_computePly_leavesMatchUnchanged(self):
+        ts = TournamentSystem()
+        (gid, wp, bp) = self._startGame(ts)
+        match = ts.games[gid]
+        version = match.stateVersion
+
+        (color, errMsg) = match.checkPly(bp)
+        self.assertEqual(errMsg, "It is not your turn")
+        (color, errMsg) = match.checkPly(wp)
+        self.assertIsNone(errMsg)
+
+        (board, status) = match.computePly(color, ChessPosn(1, 4),
+                                           ChessPosn(3, 4))
+        self.assertIsNot(board, match.board)
+        self.assertEqual(status, "ONGOING")
+        self.assertEqual(match.stateVersion, version)
+        self.assertEqual(match.history, [])
+        self.assertIsNotNone(match.board[ChessPosn(1, 4)])
+
+        illegal = match.computePly(color, ChessPosn(1, 4), ChessPosn(5, 4))
+        self.assertIsNone(illegal[0])
+
+        # A ply checked before the game was cancelled is not applied
+        ts.cancelGame(gid)
+        self.assertEqual(match.commitPly(ChessPosn(1, 4), ChessPosn(3, 4),
+                                         board, status),
+                         "Game not in progress")
+        self.assertEqual(match.history, [])
+
+    def test_makePly_threefoldRepetition(self):
+        ts = TournamentSystem()
+        (gid, wp, bp) = self._startGame(ts)
+        shuffle = [(wp, 0, 6, 2, 5), (bp, 7, 6, 5, 5),
+                   (wp, 2, 5, 0, 6), (bp, 5, 5, 7, 6)]
+        for ply in shuffle * 2:
+            self.assertEqual(ts.games[gid].status, "ONGOING")
+            ts.makePly(ply[0], gid, *ply[1:])
+        self.assertEqual(ts.games[gid].status, ChessMatch.STATUS_DRAWN)
+
+    def test_batchVerb(self):
+        ts = TournamentSystem()
+        (gid, wp, bp) = self._startGame(ts)
+
+        prot = MaverickServerProtocol(ts)
+        transport = proto_helpers.StringTransport()
+        prot.makeConnection(transport)
+        batch = {"requests": [{"verb": "GET_STATUS",
+                               "args": {"gameID": gid}},
+                              {"verb": "IS_MY_TURN",
+                               "args": {"gameID": gid, "playerID": bp}},
+                              {"verb": "GET_STATUS",
+                               "args": {"gameID": gid + 1}},
+                              {"verb": "BATCH", "args": {}},
+                              {"verb": "MAKE_PLY"}]}
+        prot.lineReceived("BATCH " + json.dumps(batch))
+
+        response = transport.value().splitlines()[-1]
+        self.assertTrue(response.startswith("SUCCESS "))
+        results = json.loads(response.partition(" ")[2])["results"]
+        self.assertEqual(results[0], {"result": {"status": "ONGOING"}})
+        self.assertEqual(results[1], {"result": {"isMyTurn": False}})
+        self.assertEqual(results[2], {"error": "Invalid game ID"})
+        self.assertIn("error", results[3])
+        self.assertIn("error", results[4])
+
+
+if __name__ == "__main__":
+    unittest.main()
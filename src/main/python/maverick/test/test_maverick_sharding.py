@@ -0,0 +1,146 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import unittest
+
+from twisted.test import proto_helpers
+
+from maverick.data.structs import ChessMatch
+from maverick.server import MaverickServerProtocol
+from maverick.server import TournamentSystem
+from maverick.sharding import HashRing
+from maverick.sharding import ShardRouter
+from maverick.sharding import _ShardClientFactory
+
+
+class _InProcessShard(object):
+    """Serves shard requests from a TournamentSystem in this process"""
+
+    def __init__(self):
+        self.ts = TournamentSystem()
+        validRequests = dict(MaverickServerProtocol.VALID_REQUESTS)
+        validRequests.update(MaverickServerProtocol.SHARD_REQUESTS)
+        self._protocol = MaverickServerProtocol(self.ts,
+                                                validRequests=validRequests)
+        self.verbs = []
+
+    def request(self, verb, args):
+        self.verbs.append(verb)
+        return self._protocol._dispatchRequest(verb, args)
+
+
+class _StubShardRouter(ShardRouter):
+    """A router in front of the given shards instead of worker processes"""
+
+    def __init__(self, shards):
+        self._stubShards = list(shards)
+        ShardRouter.__init__(self, [("127.0.0.1", 0)] * len(shards))
+
+    def _connectShard(self, host, port):
+        return self._stubShards.pop(0)
+
+
+class Test_maverick_sharding(unittest.TestCase):
+
+    def setUp(self):
+        self.shards = [_InProcessShard() for _ in xrange(4)]
+        self.router = _StubShardRouter(self.shards)
+
+    def _getResult(self, d):
+        """Return the result of a Deferred that has already fired"""
+        results = []
+        d.addBoth(results.append)
+        self.assertEqual(len(results), 1)
+        return results[0]
+
+    def _getOwner(self, gameID):
+        return self.shards[self.router._ring.getShard(gameID)]
+
+    def test_hashRing_usesEveryShard(self):
+        ring = HashRing(range(4))
+        counts = [0] * 4
+        for gameID in xrange(1, 4001):
+            counts[ring.getShard(gameID)] += 1
+        for count in counts:
+            self.assertGreater(count, 500)
+
+    def test_hashRing_isConsistent(self):
+        ring = HashRing(range(4))
+        grownRing = HashRing(range(5))
+        movedToOldShard = 0
+        for gameID in xrange(1, 1001):
+            shard = grownRing.getShard(gameID)
+            if shard != ring.getShard(gameID) and shard != 4:
+                movedToOldShard += 1
+        # Adding a shard only moves keys to the new shard
+        self.assertEqual(movedToOldShard, 0)
+
+    def test_router_joinGame(self):
+        p1 = self.router.register("a")[1]["playerID"]
+        p2 = self.router.register("b")[1]["playerID"]
+        (successP, result) = self._getResult(self.router.joinGame(p1, True))
+        self.assertTrue(successP)
+        gid = result["gameID"]
+        self.assertEqual(self._getResult(self.router.joinGame(p2, True)),
+                         (True, {"gameID": gid, "startFreshP": True}))
+
+        # Both joins were forwarded to the owning shard, and only to it
+        owner = self._getOwner(gid)
+        self.assertEqual(owner.verbs, ["SHARD_JOIN_GAME"] * 2)
+        for shard in self.shards:
+            if shard is not owner:
+                self.assertEqual(shard.verbs, [])
+        self.assertEqual(sorted(owner.ts.games[gid].players.values()),
+                         sorted([p1, p2]))
+        self.assertEqual(self._getResult(self.router.getStatus(gid)),
+                         (True, {"status": ChessMatch.STATUS_ONGOING}))
+
+    def test_router_getActiveGames(self):
+        p1 = self.router.register("a")[1]["playerID"]
+        gameIDs = [self._getResult(self.router.joinGame(p1, True))[1]
+                   ["gameID"] for _ in xrange(8)]
+        self.assertTrue(len(set(self._getOwner(gid) for gid in gameIDs)) > 1)
+
+        self.assertEqual(self._getResult(self.router.getActiveGames(p1)),
+                         (True, {"gameIDs": sorted(gameIDs)}))
+        for shard in self.shards:
+            self.assertEqual(shard.verbs.count("SHARD_GET_ACTIVE_GAMES"), 1)
+
+    def test_router_errors(self):
+        self.assertEqual(self.router.getActiveGames(12345),
+                         (False, {"error": "Invalid player ID"}))
+        self.assertEqual(self._getResult(self.router.getStatus(12345)),
+                         (False, {"error": "Invalid game ID"}))
+
+        # Errors of the shard's TournamentSystem.joinGameWithID come back too
+        players = [self.router.register(name)[1]["playerID"]
+                   for name in ["a", "b", "c"]]
+        gid = self._getResult(self.router.joinGame(players[0], True))[1][
+                                                                    "gameID"]
+        self.router.joinGame(players[1], True)
+        args = {"playerID": players[2], "gameID": gid, "startFreshP": True}
+        self.assertEqual(self._getResult(self.router._forward(
+                                            gid, "SHARD_JOIN_GAME", args)),
+                         (False, {"error": "Game not pending"}))
+
+    def test_router_shardUnavailable(self):
+        factory = _ShardClientFactory()
+        router = _StubShardRouter([factory])
+        connection = factory.buildProtocol(None)
+        connection.makeConnection(proto_helpers.StringTransport())
+        factory._connectionReady(connection)
+
+        d = router.getStatus(1)
+        connection.connectionLost()
+        self.assertEqual(self._getResult(d),
+                         (False, {"error": "Shard unavailable"}))
+
+        # Requests made while disconnected wait for the shard to return
+        self.assertFalse(router.getStatus(1).called)
+
+
+if __name__ == "__main__":
+    unittest.main()
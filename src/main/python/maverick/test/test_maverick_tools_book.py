@@ -0,0 +1,52 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import os
+import tempfile
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.players.ais.openingBook import OpeningBook
+from maverick.tools import book
+from maverick.tools import selfplay
+
+
+class Test_maverick_tools_book(unittest.TestCase):
+
+    def test_countBookMoves(self):
+        e4 = (ChessPosn(1, 4), ChessPosn(3, 4))
+        d4 = (ChessPosn(1, 3), ChessPosn(3, 3))
+        e5 = (ChessPosn(6, 4), ChessPosn(4, 4))
+        games = [(None, [e4, e5], selfplay.RESULT_WHITE_WON),
+                 (ChessBoard.FEN_INITIAL, [e4], selfplay.RESULT_DRAWN),
+                 (None, [d4, e5], selfplay.RESULT_BLACK_WON)]
+        weights = book.countBookMoves(games, maxPlies=2)
+
+        startHash = ChessBoard().getPositionHash(ChessBoard.WHITE)
+        self.assertEqual(weights[(startHash, (1, 4), (3, 4))], 3)
+        self.assertEqual(weights[(startHash, (1, 3), (3, 3))], 0)
+        self.assertEqual(len(weights), 4)
+
+    def test_buildBook(self):
+        (fd, path) = tempfile.mkstemp(suffix=".book")
+        os.close(fd)
+        try:
+            e4 = (ChessPosn(1, 4), ChessPosn(3, 4))
+            games = [(None, [e4], selfplay.RESULT_DRAWN)] * 2 + \
+                [(None, [(ChessPosn(1, 3), ChessPosn(3, 3))],
+                  selfplay.RESULT_DRAWN)]
+            self.assertEqual(book.buildBook(path, games, minWeight=2), 1)
+            openingBook = OpeningBook(path)
+            self.assertEqual(openingBook.chooseMove(ChessBoard(),
+                                                    ChessBoard.WHITE), e4)
+            openingBook.close()
+        finally:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
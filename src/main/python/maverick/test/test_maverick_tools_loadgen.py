@@ -0,0 +1,41 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import unittest
+
+from maverick.tools.loadgen import LoadStats
+from maverick.tools.loadgen import _parseMix
+
+
+class Test_maverick_tools_loadgen(unittest.TestCase):
+
+    def test_loadStats_summary(self):
+        stats = LoadStats()
+        for ms in xrange(1, 101):
+            stats.record("GET_STATUS", None, ms / 1e3)
+        stats.record("MAKE_PLY", "Illegal move", 0.002)
+        stats.record("MAKE_PLY", None, 0.004)
+
+        summary = stats.toDict(2.0)
+        self.assertEqual(summary["requests"], 102)
+        self.assertEqual(summary["throughput"], 51.0)
+        self.assertEqual(summary["errors"], 1)
+
+        getStatus = summary["verbs"]["GET_STATUS"]
+        self.assertEqual(getStatus["p50Ms"], 51.0)
+        self.assertEqual(getStatus["p99Ms"], 99.0)
+        self.assertEqual(getStatus["maxMs"], 100.0)
+        self.assertEqual(summary["verbs"]["MAKE_PLY"]["errorRate"], 0.5)
+
+    def test_parseMix(self):
+        self.assertEqual(_parseMix("IS_MY_TURN=3,GET_STATE=1"),
+                         {"IS_MY_TURN": 3.0, "GET_STATE": 1.0})
+        self.assertRaises(ValueError, _parseMix, "MAKE_PLY=1")
+        self.assertRaises(ValueError, _parseMix, "GET_STATUS=0")
+
+
+if __name__ == "__main__":
+    unittest.main()
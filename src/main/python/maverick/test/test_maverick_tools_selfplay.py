@@ -0,0 +1,76 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import StringIO
+import unittest
+
+from maverick.data import pgn
+from maverick.data.structs import ChessBoard
+from maverick.players.ais.randomAI import RandomAI
+from maverick.tools.selfplay import RESULT_DRAWN
+from maverick.tools.selfplay import _summarize
+from maverick.tools.selfplay import formatRecordPGN
+from maverick.tools.selfplay import gauntlet
+from maverick.tools.selfplay import loadPlayer
+from maverick.tools.selfplay import playGame
+from maverick.tools.selfplay import roundRobin
+
+RANDOM_SPEC = "maverick.players.ais.randomAI.RandomAI"
+
+
+class Test_maverick_tools_selfplay(unittest.TestCase):
+
+    def test_loadPlayer(self):
+        player = loadPlayer(RANDOM_SPEC + ':port=1234,host="example"')
+        self.assertIsInstance(player, RandomAI)
+        self.assertEqual(player.port, 1234)
+        self.assertEqual(player.host, "example")
+        self.assertRaises(ValueError, loadPlayer,
+                          "maverick.data.structs.ChessBoard")
+
+    def test_playGame_isReproducible(self):
+        record = playGame(RANDOM_SPEC, RANDOM_SPEC, maxPlies=6,
+                          openingSeed=3)
+        again = playGame(RANDOM_SPEC, RANDOM_SPEC, maxPlies=6, openingSeed=3)
+        self.assertEqual(record["plies"], again["plies"])
+        self.assertLessEqual(len(record["plies"]), 6)
+        self.assertEqual(len(record["moveTimes"]), len(record["plies"]))
+        if record["reason"] == "maxPlies":
+            self.assertEqual(record["result"], RESULT_DRAWN)
+
+    def test_formatRecordPGN(self):
+        record = playGame(RANDOM_SPEC, RANDOM_SPEC, maxPlies=6,
+                          openingSeed=5, freshStartP=False)
+        text = formatRecordPGN(record)
+        ((tags, match),) = list(pgn.readGames(StringIO.StringIO(text)))
+        self.assertEqual(tags["White"], RANDOM_SPEC)
+        self.assertEqual(tags["Result"], record["result"])
+        self.assertEqual(match.startFEN, record["startFEN"])
+        self.assertNotEqual(match.startFEN, ChessBoard.FEN_INITIAL)
+        self.assertEqual([[f.rankN, f.fileN, t.rankN, t.fileN]
+                          for (f, t) in match.history], record["plies"])
+
+    def test_schedules(self):
+        tasks = roundRobin(["a", "b", "c"], 2)
+        self.assertEqual(len(tasks), 12)
+        self.assertEqual(len(gauntlet("a", ["b", "c"], 2)), 8)
+        self.assertEqual(tasks[0]["whiteSpec"], tasks[1]["blackSpec"])
+        self.assertEqual(tasks[0]["openingSeed"], tasks[1]["openingSeed"])
+
+    def test_summarize(self):
+        records = [{"white": "a", "black": "b", "result": "1-0",
+                    "moveTimes": [1.0, 2.0, 1.0]},
+                   {"white": "b", "black": "a", "result": RESULT_DRAWN,
+                    "moveTimes": [2.0, 3.0]}]
+        standings = _summarize(records)
+        self.assertEqual(standings["a"]["score"], 1.5)
+        self.assertEqual(standings["b"]["losses"], 1)
+        self.assertEqual(standings["a"]["meanMoveTime"], 5.0 / 3)
+        self.assertEqual(standings["b"]["meanMoveTime"], 2.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import shutil
+import tempfile
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.players.ais import tablebase
+from maverick.players.ais.tablebase import Tablebases
+from maverick.tools.tablebase import generateTable
+from maverick.tools.tablebase import solveTable
+
+
+class Test_maverick_tools_tablebase(unittest.TestCase):
+
+    def test_solveTable(self):
+        # 0: checkmated; 1: can mate (move to 0) or draw (move to 4);
+        # 2: every move reaches a won position; 3: a capture into a smaller
+        # table's loss in 2 plies; 4: stalemate; 5: invalid; 6 and 7: move
+        # back and forth forever
+        states = [tablebase.CODE_DECIDED, None, None, None,
+                  tablebase.CODE_DRAW, tablebase.CODE_INVALID, None, None]
+        moveCounts = [0, 2, 2, 2, 0, 0, 1, 1]
+        moves = [0, 4,
+                 1, -2 - 1,
+                 -2 - 2, 1,
+                 7,
+                 6]
+        codes = list(solveTable(states, moveCounts, moves))
+        self.assertEqual(codes, [tablebase.CODE_DECIDED + 0,
+                                 tablebase.CODE_DECIDED + 1,
+                                 tablebase.CODE_DECIDED + 2,
+                                 tablebase.CODE_DECIDED + 3,
+                                 tablebase.CODE_DRAW,
+                                 tablebase.CODE_INVALID,
+                                 tablebase.CODE_DRAW,
+                                 tablebase.CODE_DRAW])
+
+    def test_generateTable(self):
+        directory = tempfile.mkdtemp()
+        try:
+            stats = generateTable("KvK", directory, processes=1)
+            self.assertEqual(stats["wins"] + stats["losses"], 0)
+            self.assertEqual(stats["draws"] + stats["invalid"], 1280)
+
+            tablebases = Tablebases(directory)
+            self.assertTrue("KvK" in tablebases)
+            board = ChessBoard.fromFEN("8/8/8/4k3/8/8/8/4K3 b - -")
+            self.assertEqual(tablebases.probe(board, ChessBoard.BLACK),
+                             (tablebase.RESULT_DRAW, None))
+            tablebases.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.players.ais.analyzers.likability import evaluateBoardLikability
+from maverick.players.ais.analyzers.likability import evaluateHeuristics
+from maverick.players.ais.analyzers.likability import HEURISTIC_WEIGHT_KEYS
+from maverick.players.ais.quiescenceSearchAI import QLAI
+from maverick.tools import selfplay
+from maverick.tools import tune
+
+
+class Test_maverick_tools_tune(unittest.TestCase):
+
+    def test_heuristicsMatchLikability(self):
+        board = ChessBoard()
+        board.getPlyResult(ChessPosn(1, 4), ChessPosn(3, 4))
+        values = np.array(evaluateHeuristics(ChessBoard.BLACK, board))
+        weights = tune._toVector(QLAI.defaultWeights)
+        self.assertAlmostEqual(values.dot(weights) / weights.sum(),
+                               evaluateBoardLikability(ChessBoard.BLACK,
+                                                       board,
+                                                       QLAI.defaultWeights))
+
+    def test_buildDataset(self):
+        record = {"result": selfplay.RESULT_BLACK_WON,
+                  "plies": [[1, 4, 3, 4], [6, 4, 4, 4],
+                            [0, 6, 2, 5], [7, 1, 5, 2]]}
+        midGameRecord = dict(record, freshStartP=False)
+        (features, results) = tune.buildDataset([record, midGameRecord],
+                                                skipPlies=2, sampleEvery=2,
+                                                processes=1)
+        self.assertEqual(features.shape, (2, len(HEURISTIC_WEIGHT_KEYS)))
+        self.assertEqual(list(results), [0.0, 0.0])
+
+        (fd, path) = tempfile.mkstemp(suffix=".npz")
+        os.close(fd)
+        try:
+            tune.saveDataset(path, features, results)
+            (loadedFeatures, loadedResults) = tune.loadDataset(path)
+        finally:
+            os.remove(path)
+        self.assertTrue(np.array_equal(loadedFeatures, features))
+        self.assertTrue(np.array_equal(loadedResults, results))
+
+    def test_fitTexel_recoversWeights(self):
+        random = np.random.RandomState(0)
+        features = random.uniform(-1, 1, (2000, len(HEURISTIC_WEIGHT_KEYS)))
+        trueWeights = np.array([2.0, 0.5, 1.0, 0.5])
+        scale = 4.0
+
+        # Results are exactly the predictions of the true weights
+        likabilities = features.dot(trueWeights) / trueWeights.sum()
+        results = 1 / (1 + np.exp(-scale * likabilities))
+
+        (weights, fitScale, loss) = tune.fitTexel(features, results,
+                                                  QLAI.defaultWeights)
+        fitted = tune._toVector(weights)
+        self.assertLess(loss, 1e-5)
+        self.assertAlmostEqual(fitScale, scale, places=1)
+        self.assertTrue(np.allclose(fitted / fitted.sum(),
+                                    trueWeights / trueWeights.sum(),
+                                    atol=0.01))
+        self.assertEqual(weights["piecesCoveredWeight"],
+                         QLAI.defaultWeights["piecesCoveredWeight"])
+
+    def test_getQLAISpec(self):
+        player = selfplay.loadPlayer(tune.getQLAISpec(
+                dict(QLAI.defaultWeights, inCheckWeight=0.25)))
+        self.assertEqual(player.heuristicWgts,
+                         dict(QLAI.defaultWeights, inCheckWeight=0.25))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import StringIO
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.uci import UCIEngine
+from maverick.uci import allocateMoveTime
+
+
+class Test_maverick_uci(unittest.TestCase):
+
+    # Black king boxed in on h8, so that only Kh7 is legal
+    ONE_MOVE_FEN = "7k/8/5K2/8/8/8/8/6R1 b - - 0 1"
+
+    # Black king on h8 stalemated by the queen on f7
+    STALEMATE_FEN = "7k/5Q2/6K1/8/8/8/8/8 b - - 0 1"
+
+    def setUp(self):
+        self.cacheSize = ChessBoard.GAME_STATE_CACHE_SIZE
+        self.output = StringIO.StringIO()
+        self.engine = UCIEngine(output=self.output)
+
+    def tearDown(self):
+        self.engine.handleCommand("stop")
+        ChessBoard.GAME_STATE_CACHE_SIZE = self.cacheSize
+
+    def _getLines(self):
+        return self.output.getvalue().splitlines()
+
+    def _search(self, *commands):
+        """Send the commands, wait for the search, and return the lines"""
+        for command in commands:
+            self.engine.handleCommand(command)
+        self.engine._searchThread.join()
+        return self._getLines()
+
+    def test_allocateMoveTime(self):
+        self.assertAlmostEqual(allocateMoveTime(60000), 2)
+        self.assertAlmostEqual(allocateMoveTime(60000, 1000, 10), 6.75)
+        # Never more than the clock has left
+        self.assertAlmostEqual(allocateMoveTime(1000, 10000), 0.9)
+        self.assertEqual(allocateMoveTime(0), 0)
+
+    def test_handshake(self):
+        self.assertTrue(self.engine.handleCommand("uci"))
+        self.engine.handleCommand("isready")
+        self.engine.handleCommand("xyzzy")
+        lines = self._getLines()
+        self.assertTrue(lines[0].startswith("id name "))
+        self.assertIn("option name Hash type spin default 16 min 1 max 1024",
+                      lines)
+        self.assertEqual(lines[-2:], ["uciok", "readyok"])
+        self.assertFalse(self.engine.handleCommand("quit"))
+
+    def test_setoption(self):
+        self.engine.handleCommand("setoption name Hash value 1")
+        self.assertEqual(self.engine.hashMB, 1)
+        self.assertEqual(ChessBoard.GAME_STATE_CACHE_SIZE, 4096)
+        self.engine.handleCommand("setoption name Threads value 4")
+        self.assertEqual(self._getLines(), ["info string Threads must be 1"])
+
+    def test_position(self):
+        self.engine.handleCommand("position startpos moves e2e4 e7e5 g1f3")
+        self.assertEqual(self.engine.colorToMove, ChessBoard.BLACK)
+        self.assertEqual(self.engine.board[ChessPosn(2, 5)].pieceType,
+                         ChessBoard.KNGT)
+        self.assertEqual(len(self.engine.board.positionHistory), 4)
+
+        self.engine.handleCommand("position fen " + self.ONE_MOVE_FEN)
+        self.assertEqual(self.engine.colorToMove, ChessBoard.BLACK)
+        self.assertEqual(self.engine.board.toFEN(ChessBoard.BLACK),
+                         self.ONE_MOVE_FEN)
+
+        # Invalid positions leave the position unchanged
+        self.engine.handleCommand("position startpos moves e2e5")
+        self.engine.handleCommand("position fen 8/8 w - - 0 1")
+        self.assertEqual(self.engine.board.toFEN(ChessBoard.BLACK),
+                         self.ONE_MOVE_FEN)
+        self.assertEqual(len(self._getLines()), 2)
+
+    def test_go(self):
+        lines = self._search("position fen " + self.ONE_MOVE_FEN,
+                             "go depth 1")
+        self.assertTrue(lines[0].startswith("info depth 1 "))
+        self.assertEqual(lines[-1], "bestmove h8h7")
+
+        lines = self._search("position fen " + self.STALEMATE_FEN,
+                             "go wtime 1000 btime 1000")
+        self.assertEqual(lines[-1], "bestmove 0000")
+
+    def test_go_infinite(self):
+        self.engine.handleCommand("position fen " + self.ONE_MOVE_FEN)
+        self.engine.handleCommand("go infinite depth 1")
+        self.engine._searchThread.join(0.5)
+        self.assertTrue(self.engine._searchThread.isAlive())
+        self.assertFalse([line for line in self._getLines()
+                          if line.startswith("bestmove")])
+
+        self.engine.handleCommand("stop")
+        self.assertEqual(self._getLines()[-1], "bestmove h8h7")
+
+
+if __name__ == "__main__":
+    unittest.main()
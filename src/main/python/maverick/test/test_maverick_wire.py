@@ -0,0 +1,105 @@
+'''
+Created on Oct 18, 2026
+
+@author: James Magnarelli and Matthew Strax-Haber
+'''
+
+import unittest
+
+from maverick.data.structs import ChessBoard
+from maverick.wire import decodeBoardLayout
+from maverick.wire import decodeRequest
+from maverick.wire import decodeResponse
+from maverick.wire import encodeBoardLayout
+from maverick.wire import encodeFrame
+from maverick.wire import encodeRequest
+from maverick.wire import encodeResponse
+from maverick.wire import splitFrames
+from maverick.test.common import getBoardComplex
+
+_w = ChessBoard.WHITE
+_b = ChessBoard.BLACK
+
+
+class Test_maverick_wire(unittest.TestCase):
+
+    def _roundTripRequest(self, verb, args):
+        self.assertEqual((verb, args),
+                         decodeRequest(encodeRequest(verb, args)))
+
+    def _roundTripResponse(self, verb, result):
+        payload = encodeResponse(verb, None, result)
+        self.assertEqual((None, result), decodeResponse(verb, payload))
+
+    def test_boardLayout_roundTrip(self):
+        board = getBoardComplex()
+        packed = encodeBoardLayout(board.layout)
+        self.assertEqual(32, len(packed))
+
+        expected = [[None if p is None else (p.color, p.pieceType)
+                     for p in row] for row in board.layout]
+        self.assertEqual(expected, decodeBoardLayout(packed))
+
+    def test_splitFrames_partial(self):
+        data = encodeFrame("abc") + encodeFrame("") + encodeFrame("defg")
+        (payloads, rest) = splitFrames(data[:-2])
+        self.assertEqual(["abc", ""], payloads)
+        (payloads, rest) = splitFrames(rest + data[-2:])
+        self.assertEqual(["defg"], payloads)
+        self.assertEqual("", rest)
+
+    def test_requests_roundTrip(self):
+        self._roundTripRequest("REGISTER", {"name": u"bob"})
+        self._roundTripRequest("JOIN_GAME", {"playerID": 2 ** 32 - 1,
+                                             "startFreshP": True})
+        self._roundTripRequest("GET_STATUS", {"gameID": 7})
+        self._roundTripRequest("IS_MY_TURN", {"gameID": 7, "playerID": 9})
+        self._roundTripRequest("GET_STATE", {"gameID": 7, "playerID": 9})
+        self._roundTripRequest("GET_STATE", {"gameID": 7, "playerID": 9,
+                                             "sinceVersion": 0})
+        self._roundTripRequest("MAKE_PLY", {"playerID": 1, "gameID": 2,
+                                            "fromRank": 1, "fromFile": 4,
+                                            "toRank": 3, "toFile": 4})
+        self._roundTripRequest("SOME_VERB", {u"a": [1, 2]})
+
+    def test_responses_roundTrip(self):
+        self._roundTripResponse("REGISTER", {"playerID": 12})
+        self._roundTripResponse("JOIN_GAME", {"gameID": 13})
+        self._roundTripResponse("GET_STATUS", {"status": "W_BLACK"})
+        self._roundTripResponse("IS_MY_TURN", {"isMyTurn": False})
+        self._roundTripResponse("MAKE_PLY", {})
+
+    def test_stateResponse_roundTrip(self):
+        board = getBoardComplex()
+        layout = [[None if p is None else (p.color, p.pieceType)
+                   for p in row] for row in board.layout]
+        history = [{'fromRank': 1, 'fromFile': 4, 'toRank': 3, 'toFile': 4}]
+        full = {"youAreColor": _b,
+                "isWhitesTurn": False,
+                "stateVersion": 5,
+                "isDelta": False,
+                "historyStart": 0,
+                "board": {"layout": layout,
+                          "enPassantFlags": {_w: [False] * 4 + [True] +
+                                             [False] * 3,
+                                             _b: [False] * 8},
+                          "canCastleFlags": {_w: (True, False),
+                                             _b: (False, True)}},
+                "history": history}
+        self._roundTripResponse("GET_STATE", full)
+
+        delta = dict(full)
+        delta["isDelta"] = True
+        delta["historyStart"] = 3
+        delta["board"] = dict(full["board"])
+        del delta["board"]["layout"]
+        self._roundTripResponse("GET_STATE", delta)
+
+    def test_errorResponse(self):
+        payload = encodeResponse("MAKE_PLY", "Illegal move", None)
+        self.assertEqual((u"Illegal move", None),
+                         decodeResponse("MAKE_PLY", payload))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,9 @@
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+"""tools: utilities for measuring and tuning the maverick chess system"""
+
+# Submodules to be imported on "from tools import *"
+__all__ = ["book", "loadgen", "selfplay", "tablebase", "tune"]
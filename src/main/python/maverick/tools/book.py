@@ -0,0 +1,141 @@
+#!/usr/bin/python
+
+"""book.py: Compiling opening books from recorded games"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+from argparse import ArgumentDefaultsHelpFormatter
+from argparse import ArgumentParser
+import collections
+
+from maverick.data import pgn
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.players.ais.openingBook import writeBook
+from maverick.tools import selfplay
+from maverick.tools.tune import readRecords
+
+__all__ = ["gamesFromPGN",
+           "gamesFromRecords",
+           "countBookMoves",
+           "buildBook"]
+
+# Overview of book building
+#
+# Games are read from PGN files and from self-play output files as tuples of
+# form (startFEN, plies, result). The first plies of each game are replayed,
+# and every (position, move) pair seen is given a weight that sums, over the
+# games it was played in, 2 for a win by the color that moved, 1 for a draw
+# (or unknown result) and 0 for a loss. Moves with too little weight are left
+# out, and the rest are written as an opening book (see openingBook).
+
+DEFAULT_BOOK_PLIES = 30
+"""Default number of plies of each game to put in the book"""
+
+_RESULT_WEIGHTS = {selfplay.RESULT_WHITE_WON: {ChessBoard.WHITE: 2,
+                                               ChessBoard.BLACK: 0},
+                   selfplay.RESULT_BLACK_WON: {ChessBoard.WHITE: 0,
+                                               ChessBoard.BLACK: 2}}
+"""Weights of moves by each color in won games (others weigh 1)"""
+
+
+def gamesFromPGN(paths):
+    """Yield the games in the given PGN files (skipping invalid ones)
+
+    @return: a generator of tuples of form (startFEN, plies, result)"""
+    for path in paths:
+        with open(path) as fd:
+            for (tags, match) in pgn.readGames(fd, skipInvalid=True):
+                yield (match.startFEN, match.history, tags.get("Result"))
+
+
+def gamesFromRecords(paths):
+    """Yield the games in the given self-play output files
+
+    @return: a generator of tuples of form (startFEN, plies, result)"""
+    for record in readRecords(paths):
+        plies = [(ChessPosn(fromRank, fromFile), ChessPosn(toRank, toFile))
+                 for (fromRank, fromFile, toRank, toFile) in record["plies"]]
+        yield (record.get("startFEN"), plies, record["result"])
+
+
+def countBookMoves(games, maxPlies=DEFAULT_BOOK_PLIES):
+    """Total the weights of the moves made in the opening of each game
+
+    @param games: an iterable of tuples of form (startFEN, plies, result),
+                  where startFEN is None for the standard initial board
+    @param maxPlies: the number of plies of each game to count
+
+    @return: a dict from (positionHash, fromPosn, toPosn) tuples, with the
+             ChessPosns given as (rankN, fileN) tuples, to weights"""
+
+    weights = collections.defaultdict(int)
+    for (startFEN, plies, result) in games:
+        if startFEN is None:
+            board = ChessBoard()
+            color = ChessBoard.WHITE
+        else:
+            board = ChessBoard.fromFEN(startFEN)
+            color = ChessBoard.getFENColorToMove(startFEN)
+        colorWeights = _RESULT_WEIGHTS.get(result)
+
+        for (fromPosn, toPosn) in plies[:maxPlies]:
+            key = (board.getPositionHash(color),
+                   (fromPosn.rankN, fromPosn.fileN),
+                   (toPosn.rankN, toPosn.fileN))
+            weights[key] += 1 if colorWeights is None else colorWeights[color]
+            board.getPlyResult(fromPosn, toPosn)
+            color = ChessBoard.getOtherColor(color)
+    return weights
+
+
+def buildBook(path, games, maxPlies=DEFAULT_BOOK_PLIES, minWeight=1):
+    """Compile the given games into an opening book file
+
+    @param games: an iterable of tuples of form (startFEN, plies, result)
+    @param minWeight: the smallest total weight of a move kept in the book
+
+    @return: the number of moves written"""
+    weights = countBookMoves(games, maxPlies=maxPlies)
+    return writeBook(path, dict((key, weight)
+                                for (key, weight) in weights.iteritems()
+                                if weight >= max(1, minWeight)))
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--pgn", nargs="+", default=[], metavar="PATH",
+                        help="PGN files to read games from")
+    parser.add_argument("--records", nargs="+", default=[], metavar="PATH",
+                        help="self-play output files to read games from")
+    parser.add_argument("--max-plies", default=DEFAULT_BOOK_PLIES, type=int,
+                        help="plies of each game to put in the book")
+    parser.add_argument("--min-weight", default=2, type=int,
+                        help="smallest total weight of a book move (2 per "
+                             "win, 1 per draw)")
+    parser.add_argument("--output", default="maverick.book", metavar="PATH",
+                        help="book file to write")
+    args = parser.parse_args()
+
+    if not args.pgn and not args.records:
+        parser.error("Give at least one of --pgn and --records")
+
+    def games():
+        for game in gamesFromPGN(args.pgn):
+            yield game
+        for game in gamesFromRecords(args.records):
+            yield game
+
+    numMoves = buildBook(args.output, games(), maxPlies=args.max_plies,
+                         minWeight=args.min_weight)
+    print "Wrote {0} book moves to {1}".format(numMoves, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,568 @@
+#!/usr/bin/python
+
+"""loadgen.py: Simulated clients for measuring Maverick server capacity"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+from argparse import ArgumentDefaultsHelpFormatter
+from argparse import ArgumentParser
+import array
+import collections
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessMatch
+from maverick.data.structs import ChessPosn
+from maverick.data.utils import enumMoves
+from maverick.server import MaverickServerProtocol
+from maverick.wire import MaverickWireException
+from maverick.wire import WIRE_FORMAT_BINARY
+from maverick.wire import decodeResponse
+from maverick.wire import encodeFrame
+from maverick.wire import encodeRequest
+from maverick.wire import splitFrames
+
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.protocols import basic as basicProtocols
+
+__all__ = ["LoadStats",
+           "SimulatedClient",
+           "runLoad"]
+
+# Overview of a load run
+#
+# Each simulated client registers, joins a game (always asking for a fresh
+# start, so that it can mirror the board locally) and then loops: it picks a
+# polling verb at random according to the request mix, and whenever it finds
+# that it is its turn it fetches the plies made since its last look and plays
+# a random move from enumMoves. Clients are multiplexed over a smaller number
+# of persistent binary connections, on which requests are pipelined.
+
+DEFAULT_MIX = {"IS_MY_TURN": 4, "GET_STATUS": 1, "GET_STATE": 1}
+"""Default relative frequencies of the verbs clients poll with"""
+
+
+class LoadStats(object):
+    """Latencies and error counts of the requests made during a run"""
+
+    def __init__(self):
+        # Dict from verb to array of latencies (in seconds) of its requests
+        self._latencies = collections.defaultdict(lambda: array.array("d"))
+
+        # Dict from verb to number of its requests that gave an error
+        self._errors = collections.defaultdict(int)
+
+        self.gamesFinished = 0
+        self.gamesAbandoned = 0
+        self.pliesMade = 0
+
+    def record(self, verb, errMsg, seconds):
+        """Note that a request was answered after the given time"""
+        self._latencies[verb].append(seconds)
+        if errMsg is not None:
+            self._errors[verb] += 1
+
+    @staticmethod
+    def _percentile(sortedValues, fraction):
+        """Return the given percentile of a sorted, non-empty sequence"""
+        index = int(round(fraction * (len(sortedValues) - 1)))
+        return sortedValues[index]
+
+    def toDict(self, elapsed):
+        """Summarize the run, which lasted the given number of seconds
+
+        @return: a JSON-serializable dict, with latencies in milliseconds"""
+
+        verbs = {}
+        numRequests = 0
+        numErrors = 0
+        for (verb, latencies) in self._latencies.iteritems():
+            latencies = sorted(latencies)
+            count = len(latencies)
+            errors = self._errors.get(verb, 0)
+            numRequests += count
+            numErrors += errors
+            verbs[verb] = {
+                "count": count,
+                "throughput": round(count / elapsed, 1),
+                "errors": errors,
+                "errorRate": round(float(errors) / count, 4),
+                "meanMs": round(sum(latencies) / count * 1e3, 3),
+                "p50Ms": round(LoadStats._percentile(latencies, 0.5) * 1e3,
+                               3),
+                "p99Ms": round(LoadStats._percentile(latencies, 0.99) * 1e3,
+                               3),
+                "maxMs": round(latencies[-1] * 1e3, 3)}
+
+        return {"durationS": round(elapsed, 3),
+                "requests": numRequests,
+                "throughput": round(numRequests / elapsed, 1),
+                "errors": numErrors,
+                "errorRate": (round(float(numErrors) / numRequests, 4)
+                              if numRequests else 0.0),
+                "gamesFinished": self.gamesFinished,
+                "gamesAbandoned": self.gamesAbandoned,
+                "pliesMade": self.pliesMade,
+                "verbs": verbs}
+
+
+class _LoadConnection(basicProtocols.LineReceiver):
+    """Persistent binary connection shared by several simulated clients
+
+    Requests are pipelined; the server answers them in order."""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.tools.loadgen._LoadConnection")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, stats):
+        self._stats = stats
+        self._welcomedP = False
+        self._frameBuffer = ""
+        self._waiting = collections.deque()  # (verb, Deferred, sentAt)
+        self.ready = defer.Deferred()  # Fires once in binary mode
+
+    def lineReceived(self, line):
+        if not self._welcomedP:
+            self._welcomedP = True
+            args = json.dumps({"format": WIRE_FORMAT_BINARY})
+            self.sendLine("{0} {1}".format(
+                                    MaverickServerProtocol.WIRE_FORMAT_VERB,
+                                    args))
+        elif line.startswith("SUCCESS"):
+            self.setRawMode()
+            self.ready.callback(self)
+        else:
+            _LoadConnection._logger.error("Binary format refused: %s", line)
+            self.transport.loseConnection()
+
+    def request(self, verb, args):
+        """Send a request, returning a Deferred firing with (errMsg, result)
+
+        The time until the response arrives is recorded in the stats."""
+        d = defer.Deferred()
+        self._waiting.append((verb, d, time.time()))
+        self.transport.write(encodeFrame(encodeRequest(verb, args)))
+        return d
+
+    def rawDataReceived(self, data):
+        try:
+            (payloads, self._frameBuffer) = splitFrames(self._frameBuffer +
+                                                        data)
+        except MaverickWireException:
+            _LoadConnection._logger.error("Bad frame stream from server")
+            self.transport.loseConnection()
+            return
+
+        now = time.time()
+        for payload in payloads:
+            (verb, d, sentAt) = self._waiting.popleft()
+            try:
+                response = decodeResponse(verb, payload)
+            except MaverickWireException, e:
+                response = (e.message, None)
+            self._stats.record(verb, response[0], now - sentAt)
+            d.callback(response)
+
+    def connectionLost(self, reason=None):
+        while self._waiting:
+            (_, d, _) = self._waiting.popleft()
+            d.callback(("Connection lost", None))
+
+
+class SimulatedClient(object):
+    """A player that registers, joins games, polls and plays random moves"""
+
+    MAX_ILLEGAL_PLIES = 3
+    """Number of rejected plies in a row after which a game is abandoned"""
+
+    STALL_TIMEOUT = 10
+    """Seconds without the opponent moving after which a game is abandoned"""
+
+    def __init__(self, name, connection, stats, mix, thinkTime, rng):
+        """Initialize a client that has not yet registered
+
+        @param connection: the _LoadConnection to send requests on
+        @param stats: the LoadStats in which to count games and plies
+        @param mix: dict from polling verb to relative frequency
+        @param thinkTime: seconds to wait between requests
+        @param rng: the random.Random to make choices with"""
+        self.name = name
+        self._connection = connection
+        self._stats = stats
+        self._verbs = mix.keys()
+        self._cumWeights = []
+        total = 0
+        for verb in self._verbs:
+            total += mix[verb]
+            self._cumWeights.append(total)
+        self._thinkTime = thinkTime
+        self._rng = rng
+        self.stoppedP = False
+
+        self.playerID = None
+        self.__resetGame()
+
+    def __resetGame(self):
+        """Forget the current game"""
+        self.gameID = None
+        self._ongoingP = False
+        self._color = None
+        self._board = ChessBoard()
+        self._numPliesSeen = 0
+        self._stateVersion = None
+        self._illegalPlies = 0
+        self._lastProgress = time.time()
+
+    def start(self):
+        """Register and start playing"""
+        d = self._connection.request("REGISTER", {"name": self.name})
+        d.addCallback(self.__registered)
+
+    def stop(self):
+        """Stop making requests"""
+        self.stoppedP = True
+
+    def __registered(self, (errMsg, result)):
+        if errMsg is None:
+            self.playerID = result["playerID"]
+        self.__next()
+
+    def __next(self, _=None):
+        """Schedule the next step (with an empty stack)"""
+        if not self.stoppedP:
+            reactor.callLater(self._thinkTime, self.__step)
+
+    def __request(self, verb, args, callback):
+        """Make a request, then call callback with (errMsg, result)"""
+        d = self._connection.request(verb, args)
+        d.addCallback(callback)
+        d.addCallback(self.__next)
+
+    def __step(self):
+        if self.stoppedP:
+            return
+        elif self.playerID is None:
+            self.start()
+        elif self.gameID is None:
+            self.__request("JOIN_GAME", {"playerID": self.playerID,
+                                         "startFreshP": True},
+                           self.__joined)
+        elif (self._ongoingP and time.time() - self._lastProgress >
+              SimulatedClient.STALL_TIMEOUT):
+            # The opponent seems to have given up
+            self._stats.gamesAbandoned += 1
+            self.__resetGame()
+            self.__next()
+        elif not self._ongoingP:
+            self.__request("GET_STATUS", {"gameID": self.gameID},
+                           self.__gotStatus)
+        else:
+            verb = self.__pickVerb()
+            if verb == "IS_MY_TURN":
+                self.__request(verb, {"gameID": self.gameID,
+                                      "playerID": self.playerID},
+                               self.__gotIsMyTurn)
+            elif verb == "GET_STATE":
+                self.__request(verb, self.__getStateArgs(), self.__gotState)
+            else:
+                self.__request(verb, {"gameID": self.gameID},
+                               self.__gotStatus)
+
+    def __pickVerb(self):
+        """Pick a polling verb according to the request mix"""
+        point = self._rng.random() * self._cumWeights[-1]
+        for (verb, cumWeight) in zip(self._verbs, self._cumWeights):
+            if point < cumWeight:
+                return verb
+        return self._verbs[-1]
+
+    def __getStateArgs(self):
+        """Return GET_STATE arguments asking for plies not yet seen"""
+        args = {"playerID": self.playerID, "gameID": self.gameID}
+        if self._stateVersion is not None:
+            args["sinceVersion"] = self._stateVersion
+        return args
+
+    def __joined(self, (errMsg, result)):
+        if errMsg is None:
+            self.__resetGame()
+            self.gameID = result["gameID"]
+
+    def __gotStatus(self, (errMsg, result)):
+        if errMsg is not None:
+            return
+        status = result["status"]
+        if status == ChessMatch.STATUS_ONGOING:
+            if not self._ongoingP:
+                self._ongoingP = True
+                self._lastProgress = time.time()
+        elif status != ChessMatch.STATUS_PENDING:
+            self._stats.gamesFinished += 1
+            self.__resetGame()
+
+    def __gotIsMyTurn(self, (errMsg, result)):
+        if errMsg is None and result["isMyTurn"]:
+            # Play now, rather than on a later step
+            d = self._connection.request("GET_STATE", self.__getStateArgs())
+            d.addCallback(self.__play)
+            return d  # The next step waits for the ply to be answered
+
+    def __gotState(self, (errMsg, result)):
+        """Bring the local mirror of the board up to date"""
+        if errMsg is not None or self.gameID is None:
+            return
+        self._color = result["youAreColor"]
+        self._stateVersion = result["stateVersion"]
+        history = result["history"]
+        for (i, ply) in enumerate(history):
+            plyN = result["historyStart"] + i
+            if plyN < self._numPliesSeen:
+                continue
+            color = ChessBoard.WHITE if plyN % 2 == 0 else ChessBoard.BLACK
+            self._board.makePly(color,
+                                ChessPosn(ply["fromRank"], ply["fromFile"]),
+                                ChessPosn(ply["toRank"], ply["toFile"]))
+            self._numPliesSeen = plyN + 1
+            self._lastProgress = time.time()
+
+    def __play(self, response):
+        """Update the mirror, then make a random legal move
+
+        @return: a Deferred firing once the ply is answered, if one is made"""
+        self.__gotState(response)
+        if self.gameID is None or self._color is None:
+            return
+
+        moves = enumMoves(self._board, self._color)
+        if not moves:
+            self._stats.gamesAbandoned += 1
+            self.__resetGame()
+            return
+        (fromPosn, toPosn) = self._rng.choice(moves)
+        d = self._connection.request("MAKE_PLY", {"playerID": self.playerID,
+                                                  "gameID": self.gameID,
+                                                  "fromRank": fromPosn.rankN,
+                                                  "fromFile": fromPosn.fileN,
+                                                  "toRank": toPosn.rankN,
+                                                  "toFile": toPosn.fileN})
+        d.addCallback(self.__madePly, fromPosn, toPosn)
+        return d
+
+    def __madePly(self, (errMsg, result), fromPosn, toPosn):
+        if self.gameID is None:
+            return
+        if errMsg is None:
+            self._stats.pliesMade += 1
+            self._illegalPlies = 0
+            self._board.makePly(self._color, fromPosn, toPosn)
+            self._numPliesSeen += 1
+            self._lastProgress = time.time()
+        elif errMsg == "Game not in progress":
+            self._stats.gamesFinished += 1
+            self.__resetGame()
+        else:
+            self._illegalPlies += 1
+            if self._illegalPlies >= SimulatedClient.MAX_ILLEGAL_PLIES:
+                self._stats.gamesAbandoned += 1
+                self.__resetGame()
+
+
+def _connect(host, port, stats):
+    """Open a _LoadConnection, returning a Deferred firing once it is ready"""
+    creator = protocol.ClientCreator(reactor, _LoadConnection, stats)
+    d = creator.connectTCP(host, port)
+    d.addCallback(lambda connection: connection.ready)
+    return d
+
+
+def runLoad(host, port, numClients, numConnections, duration, mix=None,
+            thinkTime=0, seed=None):
+    """Run simulated clients against a server and summarize their requests
+
+    Runs (and then stops) the reactor, so may only be called once per
+    process.
+
+    @param numClients: the number of simulated clients
+    @param numConnections: the number of connections they share
+    @param duration: the number of seconds to generate load for
+    @param mix: dict from polling verb to relative frequency (default:
+                DEFAULT_MIX)
+    @param thinkTime: seconds each client waits between requests
+    @param seed: seed for the clients' random choices
+    @return: a dict as returned by LoadStats.toDict"""
+
+    if mix is None:
+        mix = DEFAULT_MIX
+    stats = LoadStats()
+    rng = random.Random(seed)
+    clients = []
+    timing = {}
+
+    def connected(results):
+        connections = []
+        for (successP, result) in results:
+            if not successP:
+                raise result.value
+            connections.append(result)
+
+        runID = "{0:x}".format(rng.getrandbits(32))
+        for clientN in xrange(numClients):
+            client = SimulatedClient(
+                            "load-{0}-{1}".format(runID, clientN),
+                            connections[clientN % numConnections],
+                            stats, mix, thinkTime,
+                            random.Random(rng.getrandbits(32)))
+            clients.append(client)
+            client.start()
+        timing["start"] = time.time()
+        reactor.callLater(duration, finish)
+
+    def finish():
+        timing["end"] = time.time()
+        for client in clients:
+            client.stop()
+        reactor.stop()
+
+    def failed(failure):
+        logging.getLogger("maverick.tools.loadgen").error(
+                            "Could not connect: %s", failure.getErrorMessage())
+        reactor.stop()
+
+    ds = [_connect(host, port, stats) for _ in xrange(numConnections)]
+    d = defer.DeferredList(ds, consumeErrors=True)
+    d.addCallback(connected)
+    d.addErrback(failed)
+    reactor.run()  # @UndefinedVariable
+
+    if "end" not in timing:
+        raise RuntimeError("Load run did not complete")
+    return stats.toDict(timing["end"] - timing["start"])
+
+
+def _fetchServerStats(host, port):
+    """Return the server's STATS response, or None if it has none"""
+    try:
+        sock = socket.create_connection((host, port), 5)
+        reader = sock.makefile("rb")
+        reader.readline()
+        sock.sendall("STATS {}\r\n")
+        (status, _, value) = reader.readline().partition(" ")
+        sock.close()
+    except socket.error:
+        return None
+    return json.loads(value) if status == "SUCCESS" else None
+
+
+def _spawnServer(port):
+    """Start a quiet local server listening on the given port"""
+    env = dict(os.environ)
+    srcDir = os.path.dirname(os.path.dirname(os.path.dirname(
+                                                os.path.abspath(__file__))))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [srcDir,
+                                                      env.get("PYTHONPATH")]))
+    server = subprocess.Popen([sys.executable, "-m", "maverick.server",
+                               "--port", str(port), "--quiet"], env=env)
+
+    deadline = time.time() + 30
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), 1).close()
+            return server
+        except socket.error:
+            if time.time() > deadline or server.poll() is not None:
+                server.terminate()
+                raise
+            time.sleep(0.1)
+
+
+def _parseMix(mixStr):
+    """Parse a request mix of form VERB=WEIGHT,VERB=WEIGHT,..."""
+    mix = {}
+    for item in mixStr.split(","):
+        (verb, _, weight) = item.partition("=")
+        if verb not in DEFAULT_MIX:
+            raise ValueError("Cannot poll with verb " + verb)
+        mix[verb] = float(weight)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("The request mix must have a positive weight")
+    return mix
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="host of the server to load")
+    parser.add_argument("--port", default=7790, type=int,
+                        help="port of the server to load")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start a local server on --port for the run")
+    parser.add_argument("--clients", default=1000, type=int,
+                        help="number of simulated clients")
+    parser.add_argument("--connections", default=16, type=int,
+                        help="number of connections the clients share")
+    parser.add_argument("--duration", default=30, type=float,
+                        help="seconds to generate load for")
+    parser.add_argument("--mix", default="IS_MY_TURN=4,GET_STATUS=1,"
+                                         "GET_STATE=1",
+                        help="relative frequencies of polling verbs")
+    parser.add_argument("--think", default=0, type=float, metavar="SECONDS",
+                        help="time each client waits between requests")
+    parser.add_argument("--seed", default=None, type=int,
+                        help="seed for the clients' random choices")
+    parser.add_argument("--output", default=None, metavar="PATH",
+                        help="also save the results as JSON to this file")
+    args = parser.parse_args()
+
+    mix = _parseMix(args.mix)
+    server = _spawnServer(args.port) if args.spawn else None
+    try:
+        results = runLoad(args.host, args.port, args.clients,
+                          args.connections, args.duration, mix=mix,
+                          thinkTime=args.think, seed=args.seed)
+        results["config"] = {"clients": args.clients,
+                             "connections": args.connections,
+                             "duration": args.duration,
+                             "mix": mix,
+                             "thinkTime": args.think,
+                             "seed": args.seed}
+        results["serverStats"] = _fetchServerStats(args.host, args.port)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print "{0:>12} {1:>9} {2:>9} {3:>7} {4:>9} {5:>9}".format(
+                    "verb", "requests", "req/s", "errors", "p50 ms", "p99 ms")
+    for (verb, verbStats) in sorted(results["verbs"].iteritems()):
+        print "{0:>12} {1:>9} {2:>9.1f} {3:>7.2%} {4:>9.3f} {5:>9.3f}".format(
+                    verb, verbStats["count"], verbStats["throughput"],
+                    verbStats["errorRate"], verbStats["p50Ms"],
+                    verbStats["p99Ms"])
+    print "{0:>12} {1:>9} {2:>9.1f} {3:>7.2%}".format(
+                    "total", results["requests"], results["throughput"],
+                    results["errorRate"])
+
+    if args.output is not None:
+        with open(args.output, "w") as fd:
+            json.dump(results, fd, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
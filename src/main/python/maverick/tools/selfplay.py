@@ -0,0 +1,380 @@
+#!/usr/bin/python
+
+"""selfplay.py: In-process tournaments between Maverick AIs"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+from argparse import ArgumentDefaultsHelpFormatter
+from argparse import ArgumentParser
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+from maverick.data import pgn
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessMatch
+from maverick.data.structs import ChessPosn
+from maverick.data.utils import enumMoves
+from maverick.players.ais.common import MaverickAI
+
+__all__ = ["loadPlayer",
+           "playGame",
+           "roundRobin",
+           "gauntlet",
+           "runTournament",
+           "formatRecordPGN"]
+
+# Overview of self-play
+#
+# Players are given as specs of form "package.module.ClassName" or
+# "package.module.ClassName:arg=value,arg=value", naming a MaverickAI
+# subclass and keyword arguments for its constructor (values are parsed as
+# JSON where possible, e.g., "pieceValWgt=0.5").
+#
+# Games are played directly on a ChessMatch, calling getNextMove on each AI
+# in turn, with no server involved. Each game's record is written as one line
+# of JSON to the output file as soon as it finishes (and, optionally, as PGN
+# to a second file).
+
+DEFAULT_MAX_PLIES = 200
+"""Default number of plies after which a game is declared a draw"""
+
+RESULT_WHITE_WON = "1-0"
+RESULT_BLACK_WON = "0-1"
+RESULT_DRAWN = "1/2-1/2"
+
+
+def loadPlayer(spec):
+    """Construct the AI described by the given player spec
+
+    @return: a MaverickAI instance (not connected to any server)"""
+
+    (path, _, argStr) = spec.partition(":")
+    (moduleName, _, className) = path.rpartition(".")
+    if not moduleName:
+        raise ValueError("Player spec must name a module and class: " + spec)
+    playerClass = getattr(importlib.import_module(moduleName), className)
+    if not (isinstance(playerClass, type) and
+            issubclass(playerClass, MaverickAI)):
+        raise ValueError("Not a MaverickAI subclass: " + path)
+
+    kwargs = {}
+    if argStr:
+        for item in argStr.split(","):
+            (key, _, value) = item.partition("=")
+            try:
+                kwargs[key] = json.loads(value)
+            except ValueError:
+                kwargs[key] = value
+    return playerClass(**kwargs)
+
+
+def _copyBoard(board):
+    """Return a copy of the given board, to be handed to a player"""
+    return ChessBoard(startLayout=board.layout,
+                      startEnpassantFlags=board.flag_enpassant,
+                      startCanCastleFlags=board.flag_canCastle,
+                      drawCounter=board.drawCounter,
+                      positionHistory=board.positionHistory)
+
+
+def playGame(whiteSpec, blackSpec, maxPlies=DEFAULT_MAX_PLIES,
+             openingSeed=None, freshStartP=True):
+    """Play one game between the given players
+
+    @param openingSeed: seed for the players' random choices and for the
+                        starting board (if not a fresh start)
+    @param freshStartP: if False, start from a random mid-game board
+    @return: a dict of form
+        {"white": whiteSpec, "black": blackSpec,
+         "result": RESULT_WHITE_WON, RESULT_BLACK_WON or RESULT_DRAWN,
+         "reason": why the game ended (e.g., "checkmate", "maxPlies"),
+         "plies": list of [fromRank, fromFile, toRank, toFile] lists,
+         "moveTimes": seconds taken to choose each ply,
+         "openingSeed": openingSeed,
+         "freshStartP": freshStartP,
+         "startFEN": FEN of the starting board}"""
+
+    random.seed(openingSeed)
+    players = {ChessBoard.WHITE: loadPlayer(whiteSpec),
+               ChessBoard.BLACK: loadPlayer(blackSpec)}
+    playerIDs = {ChessBoard.WHITE: 1, ChessBoard.BLACK: 2}
+    for (color, player) in players.iteritems():
+        player.playerID = playerIDs[color]
+        player.isWhite = (color == ChessBoard.WHITE)
+
+    match = ChessMatch(firstPlayerID=1, p1ReqFreshStart=freshStartP,
+                       firstPlayerColor=ChessBoard.WHITE)
+    match.join(2, p2ReqFreshStart=freshStartP)
+
+    plies = []
+    moveTimes = []
+    result = None
+    while match.status == ChessMatch.STATUS_ONGOING:
+        color = match.whoseTurn()
+        loser = RESULT_BLACK_WON if color == ChessBoard.WHITE \
+            else RESULT_WHITE_WON
+
+        if len(plies) >= maxPlies:
+            (result, reason) = (RESULT_DRAWN, "maxPlies")
+            break
+
+        startTime = time.time()
+        try:
+            (fromPosn, toPosn) = players[color].getNextMove(
+                                                    _copyBoard(match.board))
+        except Exception, e:
+            # Players fail when they have no moves; otherwise it is a bug
+            if enumMoves(match.board, color):
+                logging.getLogger("maverick.tools.selfplay").warning(
+                        "%s failed to move: %s", players[color].__class__, e)
+                (result, reason) = (loser, "error")
+            elif match.board.pieceCheckingKing(color) is not None:
+                (result, reason) = (loser, "checkmate")
+            else:
+                (result, reason) = (RESULT_DRAWN, "stalemate")
+            break
+        moveTimes.append(round(time.time() - startTime, 6))
+
+        if match.makePly(playerIDs[color], fromPosn, toPosn) != "SUCCESS":
+            (result, reason) = (loser, "illegalMove")
+            break
+        plies.append([fromPosn.rankN, fromPosn.fileN,
+                      toPosn.rankN, toPosn.fileN])
+
+    if result is None:
+        if match.status == ChessMatch.STATUS_WHITE_WON:
+            (result, reason) = (RESULT_WHITE_WON, "checkmate")
+        elif match.status == ChessMatch.STATUS_BLACK_WON:
+            (result, reason) = (RESULT_BLACK_WON, "checkmate")
+        else:
+            (result, reason) = (RESULT_DRAWN, "drawRule")
+
+    return {"white": whiteSpec,
+            "black": blackSpec,
+            "result": result,
+            "reason": reason,
+            "plies": plies,
+            "moveTimes": moveTimes,
+            "openingSeed": openingSeed,
+            "freshStartP": freshStartP,
+            "startFEN": match.startFEN}
+
+
+def roundRobin(specs, gamesPerPair, seed=0):
+    """Schedule every player against every other player
+
+    Each pair plays gamesPerPair openings, once with each color.
+
+    @return: a list of game tasks (dicts of playGame keyword arguments)"""
+    tasks = []
+    for (i, spec1) in enumerate(specs):
+        for spec2 in specs[i + 1:]:
+            tasks.extend(_pairTasks(spec1, spec2, gamesPerPair, seed))
+    return tasks
+
+
+def gauntlet(challenger, opponents, gamesPerPair, seed=0):
+    """Schedule one player against each of the others
+
+    @return: a list of game tasks (dicts of playGame keyword arguments)"""
+    tasks = []
+    for opponent in opponents:
+        tasks.extend(_pairTasks(challenger, opponent, gamesPerPair, seed))
+    return tasks
+
+
+def _pairTasks(spec1, spec2, gamesPerPair, seed):
+    """Return tasks for gamesPerPair openings, played with both colors"""
+    tasks = []
+    for gameN in xrange(gamesPerPair):
+        for (white, black) in [(spec1, spec2), (spec2, spec1)]:
+            tasks.append({"whiteSpec": white,
+                          "blackSpec": black,
+                          "openingSeed": seed + gameN})
+    return tasks
+
+
+_PGN_TERMINATIONS = {"checkmate": "normal",
+                     "stalemate": "normal",
+                     "drawRule": "normal",
+                     "maxPlies": "adjudication",
+                     "illegalMove": "rules infraction",
+                     "error": "abandoned"}
+"""Mapping of game end reasons to PGN Termination tag values"""
+
+
+def formatRecordPGN(record, event="Maverick self-play"):
+    """Return the PGN text of a game record returned by playGame"""
+    plies = [(ChessPosn(fromRank, fromFile), ChessPosn(toRank, toFile))
+             for (fromRank, fromFile, toRank, toFile) in record["plies"]]
+    tags = {"Event": event,
+            "White": record["white"],
+            "Black": record["black"],
+            "Result": record["result"],
+            "Termination": _PGN_TERMINATIONS[record["reason"]],
+            "PlyCount": str(len(plies))}
+    return pgn.formatGame(tags, plies, startFEN=record.get("startFEN"),
+                          moveTimes=record["moveTimes"])
+
+
+def _initWorker():
+    """Keep worker processes from printing boards and per-move logs"""
+    sys.stdout = open(os.devnull, "w")
+    logging.disable(logging.INFO)
+
+
+def _playTask(task):
+    """Play a game task (run in a worker process)"""
+    return playGame(**task)
+
+
+def _summarize(records):
+    """Tally the score of each player over the given game records
+
+    @return: a dict from player spec to a dict of form
+             {"games": n, "wins": n, "draws": n, "losses": n,
+              "score": wins + draws / 2, "meanMoveTime": seconds}"""
+
+    standings = {}
+    for record in records:
+        for (color, spec) in [(ChessBoard.WHITE, record["white"]),
+                              (ChessBoard.BLACK, record["black"])]:
+            entry = standings.setdefault(spec, {"games": 0, "wins": 0,
+                                                "draws": 0, "losses": 0,
+                                                "moveTime": 0.0,
+                                                "moves": 0})
+            entry["games"] += 1
+            if record["result"] == RESULT_DRAWN:
+                entry["draws"] += 1
+            elif ((record["result"] == RESULT_WHITE_WON) ==
+                  (color == ChessBoard.WHITE)):
+                entry["wins"] += 1
+            else:
+                entry["losses"] += 1
+
+            # White chose the even-numbered plies
+            offset = 0 if color == ChessBoard.WHITE else 1
+            times = record["moveTimes"][offset::2]
+            entry["moveTime"] += sum(times)
+            entry["moves"] += len(times)
+
+    for entry in standings.itervalues():
+        entry["score"] = entry["wins"] + entry["draws"] / 2.0
+        moves = entry.pop("moves")
+        moveTime = entry.pop("moveTime")
+        entry["meanMoveTime"] = moveTime / moves if moves else None
+    return standings
+
+
+def runTournament(tasks, outputPath, processes=None,
+                  maxPlies=DEFAULT_MAX_PLIES, freshStartP=True, pgnPath=None):
+    """Play the given game tasks across a pool of processes
+
+    Each game's record (see playGame) is appended to outputPath as a line of
+    JSON as soon as it finishes.
+
+    @param processes: the number of worker processes (default: one per CPU)
+    @param pgnPath: if given, a file to also append each game to as PGN
+    @return: the standings, as returned by _summarize"""
+
+    for task in tasks:
+        task["maxPlies"] = maxPlies
+        task["freshStartP"] = freshStartP
+
+    records = []
+    pool = multiprocessing.Pool(processes, initializer=_initWorker)
+    pgnFD = None
+    try:
+        if pgnPath is not None:
+            pgnFD = open(pgnPath, "a")
+        with open(outputPath, "a") as fd:
+            for record in pool.imap_unordered(_playTask, tasks):
+                fd.write(json.dumps(record, sort_keys=True) + "\n")
+                fd.flush()
+                if pgnFD is not None:
+                    try:
+                        pgnFD.write(formatRecordPGN(record))
+                        pgnFD.flush()
+                    except pgn.MaverickPGNException, e:
+                        logging.getLogger("maverick.tools.selfplay").warning(
+                                "Cannot write game as PGN: %s", e)
+                records.append(record)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if pgnFD is not None:
+            pgnFD.close()
+    return _summarize(records)
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("players", nargs="+", metavar="SPEC",
+                        help="players, as module.Class[:arg=value,...]")
+    parser.add_argument("--schedule", default="roundrobin",
+                        choices=["roundrobin", "gauntlet"],
+                        help="gauntlet plays the first player against the "
+                             "others")
+    parser.add_argument("--games", default=10, type=int,
+                        help="openings per pair (each played as both colors)")
+    parser.add_argument("--processes", default=None, type=int,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--max-plies", default=DEFAULT_MAX_PLIES, type=int,
+                        help="plies after which a game is drawn")
+    parser.add_argument("--midgame", action="store_true",
+                        help="start games from random mid-game boards")
+    parser.add_argument("--seed", default=0, type=int,
+                        help="seed of the first opening")
+    parser.add_argument("--output", default="selfplay.jsonl", metavar="PATH",
+                        help="file to append game records to")
+    parser.add_argument("--pgn", default=None, metavar="PATH",
+                        help="file to also append games to as PGN")
+    args = parser.parse_args()
+
+    if len(args.players) < 2:
+        parser.error("At least two players are needed")
+    for spec in args.players:
+        loadPlayer(spec)  # Fail early on bad specs
+
+    if args.schedule == "roundrobin":
+        tasks = roundRobin(args.players, args.games, seed=args.seed)
+    else:
+        tasks = gauntlet(args.players[0], args.players[1:], args.games,
+                         seed=args.seed)
+
+    startTime = time.time()
+    standings = runTournament(tasks, args.output, processes=args.processes,
+                              maxPlies=args.max_plies,
+                              freshStartP=not args.midgame,
+                              pgnPath=args.pgn)
+    elapsed = time.time() - startTime
+
+    print "Played {0} games in {1:.1f}s ({2:.0f} games/hour)".format(
+                len(tasks), elapsed, len(tasks) / elapsed * 3600)
+    print "{0:>6} {1:>5} {2:>5} {3:>5} {4:>5} {5:>9}  {6}".format(
+                "score", "games", "won", "drawn", "lost", "s/move", "player")
+    for (spec, entry) in sorted(standings.iteritems(),
+                                key=lambda (_, e): -e["score"]):
+        print "{0:>6.1f} {1:>5} {2:>5} {3:>5} {4:>5} {5:>9.4f}  {6}".format(
+                entry["score"], entry["games"], entry["wins"],
+                entry["draws"], entry["losses"],
+                entry["meanMoveTime"] or 0.0, spec)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/python
+
+"""tablebase.py: Generation of endgame tablebases by retrograde analysis"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+from argparse import ArgumentDefaultsHelpFormatter
+from argparse import ArgumentParser
+from array import array
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPiece
+from maverick.data.structs import ChessPosn
+from maverick.data.utils import enumPossPieceMoves
+from maverick.players.ais.tablebase import CODE_DECIDED
+from maverick.players.ais.tablebase import CODE_DRAW
+from maverick.players.ais.tablebase import CODE_INVALID
+from maverick.players.ais.tablebase import MaverickTablebaseException
+from maverick.players.ais.tablebase import RESULT_DRAW
+from maverick.players.ais.tablebase import TABLE_MAGIC
+from maverick.players.ais.tablebase import TABLE_SUFFIX
+from maverick.players.ais.tablebase import TableLayout
+from maverick.players.ais.tablebase import Tablebases
+
+__all__ = ["generateTable",
+           "solveTable"]
+
+# Overview of tablebase generation
+#
+# Generating the table of a material balance takes two passes.
+#
+# Expansion (in parallel, in chunks of positions): each position is set up on
+# a ChessBoard and its legal moves are found with enumPossPieceMoves. Moves
+# that capture lead to a smaller material balance, whose table (which must
+# already have been generated) gives their value directly; other moves lead
+# to positions of the same table, which are recorded by number.
+#
+# Solving (see solveTable): with all moves known, positions are resolved one
+# ply count at a time, as in retrograde analysis: a position is won in n
+# plies if a move leads to a position lost in n - 1 plies, and lost in n
+# plies if every move leads to a position won in fewer. Positions still
+# unresolved once no more can be are drawn.
+#
+# Generation time is dominated by expansion, about 1ms per position, so
+# 3-piece tables take a few minutes on one CPU and 4-piece tables (64 times
+# as many positions) take hours.
+
+DEFAULT_MATERIALS = ["KQvK", "KRvK", "KPvK"]
+"""Material balances generated by default"""
+
+_CHUNK_SIZE = 4096
+"""Number of positions expanded by each worker task"""
+
+_DRAWN = -1
+"""Value of a capture into a drawn position, in the moves of _expandChunk"""
+
+_UNRESOLVED = -1
+"""Plies to mate of positions not (yet) known to be decided, in solveTable"""
+
+# State of the worker process: the tablebases of the smaller material
+# balances, and a board to set positions up on
+_workerState = {}
+
+
+def _initWorker(directory):
+    """Set up the state of an expansion worker process"""
+    emptyLayout = [[None] * ChessBoard.BOARD_LAYOUT_SIZE
+                   for _ in xrange(ChessBoard.BOARD_LAYOUT_SIZE)]
+    noCastle = {ChessBoard.WHITE: (False, False),
+                ChessBoard.BLACK: (False, False)}
+    _workerState["board"] = ChessBoard(startLayout=emptyLayout,
+                                       startCanCastleFlags=noCastle)
+    _workerState["tablebases"] = Tablebases(directory)
+
+
+def __expandChunk_isPlausible(layout, squares):
+    """Return False for positions with overlapping pieces or pawns on ranks
+    they can never reach"""
+    if len(set(squares)) != len(squares):
+        return False
+    for ((color, pieceType), squareN) in zip(layout.pieces, squares):
+        if pieceType == ChessBoard.PAWN:
+            rankN = squareN // ChessBoard.BOARD_LAYOUT_SIZE
+            if rankN == ChessBoard.PAWN_STARTING_RANKS[color] - \
+                    (1 if color == ChessBoard.WHITE else -1):
+                return False
+    return True
+
+
+def _expandChunk((name, start, stop)):
+    """Find the moves of a chunk of the positions of a table (in a worker)
+
+    @return: a tuple of form (states, moveCounts, moves) where states holds,
+             for each position, CODE_INVALID, CODE_DRAW (stalemate),
+             CODE_DECIDED (checkmated) or None (has moves); moveCounts holds
+             the number of moves of each position; and moves holds, for each
+             move, the number of the position it leads to or, for captures,
+             -2 - the plies to mate in the position it leads to (_DRAWN if
+             that is drawn)"""
+
+    layout = TableLayout(name)
+    board = _workerState["board"]
+    tablebases = _workerState["tablebases"]
+    size = ChessBoard.BOARD_LAYOUT_SIZE
+    pieceObjects = [ChessPiece(color, pieceType)
+                    for (color, pieceType) in layout.pieces]
+
+    states = []
+    moveCounts = []
+    moves = []
+    for index in xrange(start, stop):
+        (squares, color) = layout.getPosition(index)
+        if not __expandChunk_isPlausible(layout, squares):
+            states.append(CODE_INVALID)
+            moveCounts.append(0)
+            continue
+
+        otherColor = ChessBoard.getOtherColor(color)
+        for (piece, squareN) in zip(pieceObjects, squares):
+            board[ChessPosn(squareN // size, squareN % size)] = piece
+
+        numMoves = 0
+        if board.pieceCheckingKing(otherColor) is not None:
+            state = CODE_INVALID  # The side not to move is in check
+        else:
+            state = None
+            for (pieceN, ((pieceColor, _), squareN)) in \
+                    enumerate(zip(layout.pieces, squares)):
+                if pieceColor != color:
+                    continue
+                fromPosn = ChessPosn(squareN // size, squareN % size)
+                for toPosn in enumPossPieceMoves(board, fromPosn):
+                    numMoves += 1
+                    toSquareN = toPosn.rankN * size + toPosn.fileN
+                    if board[toPosn] is None:
+                        childSquares = list(squares)
+                        childSquares[pieceN] = toSquareN
+                        moves.append(layout.getIndex(childSquares,
+                                                     otherColor))
+                        continue
+
+                    ########## MUTATE THE BOARD STATE - MUST BE UNDONE: ######
+                    undoDict = board.getPlyResult(fromPosn, toPosn)
+                    probed = tablebases.probe(board, otherColor)
+                    ########## RESTORE THE OLD BOARD STATE - VERY IMPORTANT: #
+                    board.undoPlyResult(undoDict)
+                    if probed is None:
+                        raise MaverickTablebaseException(
+                                "No table for a capture from " + name)
+                    (result, plies) = probed
+                    moves.append(_DRAWN if result == RESULT_DRAW
+                                 else -2 - plies)
+
+            if numMoves == 0:
+                if board.pieceCheckingKing(color) is not None:
+                    state = CODE_DECIDED  # Checkmated
+                else:
+                    state = CODE_DRAW  # Stalemated
+
+        for squareN in squares:
+            board[ChessPosn(squareN // size, squareN % size)] = None
+        states.append(state)
+        moveCounts.append(numMoves)
+
+    return (states, moveCounts, moves)
+
+
+def solveTable(states, moveCounts, moves):
+    """Find the value of every position from the moves of each
+
+    @param states: as returned by _expandChunk, for every position
+    @param moveCounts: as returned by _expandChunk, for every position
+    @param moves: as returned by _expandChunk, for every move of every
+                  position, in order
+
+    @return: an array of the codes of the positions, as stored in tables"""
+
+    states = list(states)
+    moveCounts = np.asarray(moveCounts, dtype=np.int64)
+    moves = np.asarray(moves, dtype=np.int64)
+
+    # Plies to mate of each position, or _UNRESOLVED
+    plies = np.array([_UNRESOLVED if state in (None, CODE_INVALID, CODE_DRAW)
+                      else state - CODE_DECIDED for state in states],
+                     dtype=np.int64)
+
+    # Positions with moves, and the offsets of their first moves
+    openNs = np.flatnonzero(moveCounts)
+    offsets = np.concatenate([[0], np.cumsum(moveCounts)[:-1]])[openNs]
+
+    internalP = moves >= 0
+    capturePlies = np.where(moves <= -2, -2 - moves, _UNRESOLVED)
+    lastCapturePlies = max([0] + list(capturePlies[capturePlies >= 0]))
+
+    n = 1
+    quietPlies = 0
+    while len(openNs) and (quietPlies < 2 or n <= lastCapturePlies + 1):
+        movePlies = np.where(internalP, plies[np.where(internalP, moves, 0)],
+                             capturePlies)
+        if n % 2:
+            # Won if some move leads to a position lost in n - 1 plies
+            decidedP = np.logical_or.reduceat(movePlies == n - 1, offsets)
+        else:
+            # Lost if every move leads to a position won in under n plies
+            decidedP = np.logical_and.reduceat(
+                    (movePlies >= 0) & (movePlies < n) & (movePlies % 2 == 1),
+                    offsets)
+        newNs = openNs[decidedP & (plies[openNs] == _UNRESOLVED)]
+        plies[newNs] = n
+        quietPlies = 0 if len(newNs) else quietPlies + 1
+        n += 1
+
+    if plies.max() + CODE_DECIDED > 255:
+        raise MaverickTablebaseException("Mates too long to store")
+    codes = np.where(plies >= 0, plies + CODE_DECIDED, CODE_DRAW)
+    codes[np.array([state == CODE_INVALID for state in states])] = \
+        CODE_INVALID
+    return codes.astype(np.uint8)
+
+
+def generateTable(name, directory, processes=None):
+    """Generate the table of the given material balance
+
+    The tables of the material balances its captures lead to must already be
+    in the directory (except for bare kings).
+
+    @param name: a material name (e.g., "KRvK")
+    @param directory: the directory to read smaller tables from and write
+                      the new one to
+    @param processes: the number of worker processes (default: one per CPU)
+
+    @return: a dict counting the positions of the table, of form
+             {"wins": n, "draws": n, "losses": n, "invalid": n,
+              "maxPlies": longest mate in plies}"""
+
+    layout = TableLayout(name)
+    tasks = [(name, start, min(start + _CHUNK_SIZE, layout.size))
+             for start in xrange(0, layout.size, _CHUNK_SIZE)]
+
+    states = []
+    moveCounts = []
+    moves = array("l")
+    pool = multiprocessing.Pool(processes, initializer=_initWorker,
+                                initargs=(directory,))
+    try:
+        for (chunkStates, chunkCounts, chunkMoves) in \
+                pool.imap(_expandChunk, tasks):
+            states.extend(chunkStates)
+            moveCounts.extend(chunkCounts)
+            moves.extend(chunkMoves)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    codes = solveTable(states, moveCounts, moves)
+    path = os.path.join(directory, name + TABLE_SUFFIX)
+    with open(path + ".tmp", "wb") as fd:
+        fd.write(TABLE_MAGIC)
+        fd.write(codes.tostring())
+    os.rename(path + ".tmp", path)
+
+    decided = codes[codes >= CODE_DECIDED].astype(np.int64) - CODE_DECIDED
+    return {"wins": int((decided % 2 == 1).sum()),
+            "losses": int((decided % 2 == 0).sum()),
+            "draws": int((codes == CODE_DRAW).sum()),
+            "invalid": int((codes == CODE_INVALID).sum()),
+            "maxPlies": int(decided.max()) if len(decided) else 0}
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("materials", nargs="*", default=DEFAULT_MATERIALS,
+                        metavar="MATERIAL",
+                        help="material balances to generate, such as KRvK "
+                             "(smaller ones first)")
+    parser.add_argument("--directory", default="tablebases", metavar="PATH",
+                        help="directory to write tables to")
+    parser.add_argument("--processes", default=None, type=int,
+                        help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        os.makedirs(args.directory)
+    for name in sorted(args.materials, key=len):
+        startTime = time.time()
+        stats = generateTable(name, args.directory,
+                              processes=args.processes)
+        print ("{0}: {1[wins]} won, {1[draws]} drawn, {1[losses]} lost, "
+               "longest mate {1[maxPlies]} plies ({2:.0f}s)").format(
+                    name, stats, time.time() - startTime)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,467 @@
+#!/usr/bin/python
+
+"""tune.py: Tuning of the heuristic weights of the quiescence search AI"""
+
+from __future__ import division
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+from argparse import ArgumentDefaultsHelpFormatter
+from argparse import ArgumentParser
+import json
+import logging
+import multiprocessing
+
+import numpy as np
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessPosn
+from maverick.players.ais.analyzers.batchLikability import BoardBatch
+from maverick.players.ais.analyzers.batchLikability import \
+    evaluateGameOverBatch
+from maverick.players.ais.analyzers.batchLikability import \
+    evaluateHeuristicsBatch
+from maverick.players.ais.analyzers.likability import HEURISTIC_WEIGHT_KEYS
+from maverick.players.ais.quiescenceSearchAI import QLAI
+from maverick.tools import selfplay
+
+__all__ = ["getQLAISpec",
+           "readRecords",
+           "buildDataset",
+           "saveDataset",
+           "loadDataset",
+           "texelLoss",
+           "fitScale",
+           "fitTexel",
+           "runSpsa"]
+
+# Overview of tuning
+#
+# evaluateBoardLikability is the weighted average of the heuristic values
+# returned by evaluateHeuristics, so the weights can be tuned in two ways:
+#
+# Texel-style fitting: positions are sampled from self-play game records
+# (see maverick.tools.selfplay) and their heuristic values are computed once,
+# in parallel and in batches (see batchLikability), into a feature matrix
+# (one row per position, one column per heuristic, as seen by white). The
+# weights are then fit so that sigmoid(scale * likability) predicts each
+# game's result for white (1, 0.5 or 0), minimizing the mean squared error.
+# Every evaluation of the objective is a single matrix product, so fitting
+# takes seconds.
+#
+# SPSA: each iteration perturbs all weights at once in a random direction,
+# plays a match between the two perturbed AIs (across a pool of processes)
+# and steps the weights toward the side that scored better.
+#
+# Only the weights in HEURISTIC_WEIGHT_KEYS are tuned; the others have no
+# effect on the evaluation and are left as they are.
+
+QLAI_CLASS_PATH = "maverick.players.ais.quiescenceSearchAI.QLAI"
+"""Path of the AI whose weights are tuned, as used in player specs"""
+
+WEIGHT_KWARGS = {'pieceValWeight': 'pieceValWgt',
+                 'inCheckWeight': 'inCheckWgt',
+                 'pcsUnderAttackWeight': 'piecesUnderAttackWgt',
+                 'emptySpaceCvgWeight': 'emptySpaceCoverageWgt',
+                 'piecesCoveredWeight': 'piecesCoveredWgt'}
+"""Mapping from weight keys to keyword arguments of the QLAI constructor"""
+
+MIN_WEIGHT = 0.01
+"""Smallest value a tuned weight may take (weights must stay positive)"""
+
+RESULT_SCORES = {selfplay.RESULT_WHITE_WON: 1.0,
+                 selfplay.RESULT_DRAWN: 0.5,
+                 selfplay.RESULT_BLACK_WON: 0.0}
+"""Score of white for each game result"""
+
+
+def getQLAISpec(weights):
+    """Return the self-play player spec of a QLAI with the given weights
+
+    @param weights: a dict of form QLAI.defaultWeights"""
+    args = ["{0}={1!r}".format(WEIGHT_KWARGS[key], float(value))
+            for (key, value) in sorted(weights.iteritems())]
+    return QLAI_CLASS_PATH + ":" + ",".join(args)
+
+
+def _toVector(weights):
+    """Return the tuned weights of the given weight dict, as an array"""
+    return np.array([weights[key] for key in HEURISTIC_WEIGHT_KEYS],
+                    dtype=np.float64)
+
+
+def _toDict(vector, baseWeights):
+    """Return a copy of baseWeights with the tuned weights set from vector"""
+    weights = dict(baseWeights)
+    for (key, value) in zip(HEURISTIC_WEIGHT_KEYS, vector):
+        weights[key] = round(float(value), 4)
+    return weights
+
+
+def readRecords(paths):
+    """Yield the game records in the given self-play output files"""
+    for path in paths:
+        with open(path) as fd:
+            for line in fd:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _gamePositions((record, skipPlies, sampleEvery)):
+    """Return the sampled positions of a game record (run in a worker)
+
+    @return: a tuple of form (array of heuristic values of the positions, as
+             seen by white, score of white)"""
+
+    board = ChessBoard()
+    samples = []
+    blackToMoveP = []
+    for (plyN, (fromRank, fromFile, toRank, toFile)) in \
+            enumerate(record["plies"], 1):
+        board.getPlyResult(ChessPosn(fromRank, fromFile),
+                           ChessPosn(toRank, toFile))
+        if plyN >= skipPlies and (plyN - skipPlies) % sampleEvery == 0:
+            samples.append(ChessBoard(
+                    startLayout=board.layout,
+                    startEnpassantFlags=board.flag_enpassant,
+                    startCanCastleFlags=board.flag_canCastle))
+            blackToMoveP.append(plyN % 2 == 1)
+
+    batch = BoardBatch.fromBoards(samples)
+    features = evaluateHeuristicsBatch(ChessBoard.WHITE, batch)
+
+    # The likability of finished games does not depend on the weights
+    gameOverP = np.where(
+            blackToMoveP,
+            ~np.isnan(evaluateGameOverBatch(ChessBoard.BLACK, batch)),
+            ~np.isnan(evaluateGameOverBatch(ChessBoard.WHITE, batch)))
+    return (features[~gameOverP], RESULT_SCORES[record["result"]])
+
+
+def buildDataset(records, skipPlies=8, sampleEvery=4, processes=None):
+    """Compute the feature matrix of positions sampled from game records
+
+    Games not played from the standard starting board are skipped, as their
+    plies cannot be replayed.
+
+    @param skipPlies: the number of opening plies not to sample
+    @param sampleEvery: the number of plies between sampled positions
+    @param processes: the number of worker processes (default: one per CPU)
+    @return: a tuple of form (features, results), where features is an array
+             with a row of heuristic values (see evaluateHeuristics) per
+             position and results is an array of white's score in the game
+             each position came from"""
+
+    tasks = [(record, skipPlies, sampleEvery) for record in records
+             if record.get("freshStartP", True)]
+
+    featureParts = [np.empty((0, len(HEURISTIC_WEIGHT_KEYS)))]
+    resultParts = []
+    pool = multiprocessing.Pool(processes)
+    try:
+        for (features, score) in pool.imap(_gamePositions, tasks,
+                                           chunksize=4):
+            featureParts.append(features)
+            resultParts.append(np.repeat(score, len(features)))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    return (np.concatenate(featureParts),
+            np.concatenate(resultParts or [np.empty(0)]))
+
+
+def saveDataset(path, features, results):
+    """Save a dataset built by buildDataset to the given .npz file"""
+    np.savez_compressed(path, features=features, results=results,
+                        weightKeys=np.array(HEURISTIC_WEIGHT_KEYS))
+
+
+def loadDataset(path):
+    """Load a dataset saved by saveDataset
+
+    @return: a tuple of form (features, results)"""
+    data = np.load(path)
+    if list(data["weightKeys"]) != HEURISTIC_WEIGHT_KEYS:
+        raise ValueError("Dataset was built for different heuristics: " +
+                         path)
+    return (data["features"], data["results"])
+
+
+def _predict(features, weights, scale):
+    """Return the predicted scores of white (see texelLoss)
+
+    @return: a tuple of form (predicted scores, likabilities for white)"""
+    likabilities = features.dot(weights) / weights.sum()
+    return (1 / (1 + np.exp(-scale * likabilities)), likabilities)
+
+
+def texelLoss(features, results, weights, scale):
+    """Return the mean squared error of the predicted results of a dataset
+
+    The predicted score of white for a position is
+    sigmoid(scale * likability for white).
+
+    @param weights: an array of the tuned weights, in the order of
+                    HEURISTIC_WEIGHT_KEYS"""
+    (predictions, _) = _predict(features, weights, scale)
+    return np.mean((predictions - results) ** 2)
+
+
+def _texelGradient(features, results, weights, scale):
+    """Return the gradient of texelLoss with respect to the weights"""
+    (predictions, likabilities) = _predict(features, weights, scale)
+    dLossDLikability = (2 * (predictions - results) * scale *
+                        predictions * (1 - predictions))
+    return ((features.T.dot(dLossDLikability) -
+             likabilities.dot(dLossDLikability)) /
+            (len(results) * weights.sum()))
+
+
+def fitScale(features, results, weights, low=0.01, high=100.0,
+             iterations=60):
+    """Return the scale minimizing texelLoss for the given weights
+
+    Uses a golden-section search over the logarithm of the scale."""
+
+    invPhi = (np.sqrt(5) - 1) / 2
+    (a, b) = (np.log(low), np.log(high))
+    lossAt = lambda x: texelLoss(features, results, weights, np.exp(x))
+    c = b - invPhi * (b - a)
+    d = a + invPhi * (b - a)
+    (lossC, lossD) = (lossAt(c), lossAt(d))
+    for _ in xrange(iterations):
+        if lossC < lossD:
+            (b, d, lossD) = (d, c, lossC)
+            c = b - invPhi * (b - a)
+            lossC = lossAt(c)
+        else:
+            (a, c, lossC) = (c, d, lossD)
+            d = a + invPhi * (b - a)
+            lossD = lossAt(d)
+    return float(np.exp((a + b) / 2))
+
+
+def _descend(features, results, vector, scale, iterations, learningRate,
+             tolerance):
+    """Minimize texelLoss over the weights by gradient descent
+
+    The step is halved whenever it fails to lower the loss. The weights are
+    kept at least MIN_WEIGHT and, since likability does not depend on their
+    scale, with (about) the same sum as the given weights.
+
+    @return: a tuple of form (fitted weight array, loss)"""
+
+    total = vector.sum()
+    loss = texelLoss(features, results, vector, scale)
+    for _ in xrange(iterations):
+        gradient = _texelGradient(features, results, vector, scale)
+        candidate = np.maximum(vector - learningRate * gradient, MIN_WEIGHT)
+        candidate = np.maximum(candidate * (total / candidate.sum()),
+                               MIN_WEIGHT)
+        candidateLoss = texelLoss(features, results, candidate, scale)
+        if candidateLoss < loss:
+            improvement = loss - candidateLoss
+            (vector, loss) = (candidate, candidateLoss)
+            learningRate *= 1.5
+            if improvement < tolerance:
+                break
+        else:
+            learningRate /= 2
+            if learningRate < 1e-12:
+                break
+    return (vector, loss)
+
+
+def fitTexel(features, results, weights, scale=None, iterations=1000,
+             learningRate=1.0, tolerance=1e-12, scaleRounds=5):
+    """Fit the tuned weights to a dataset, minimizing texelLoss
+
+    @param weights: a dict of form QLAI.defaultWeights to start from
+    @param scale: the scale of the predictions (default: fit along with the
+                  weights, alternating between fitScale and scaleRounds
+                  rounds of gradient descent)
+    @return: a tuple of form (fitted weight dict, scale, final loss)"""
+
+    vector = _toVector(weights)
+    if scale is not None:
+        (vector, loss) = _descend(features, results, vector, scale,
+                                  iterations, learningRate, tolerance)
+    else:
+        for _ in xrange(scaleRounds):
+            scale = fitScale(features, results, vector)
+            (vector, loss) = _descend(features, results, vector, scale,
+                                      iterations, learningRate, tolerance)
+    return (_toDict(vector, weights), scale, float(loss))
+
+
+def runSpsa(weights, iterations, gamesPerIteration, recordsPath,
+            processes=None, maxPlies=selfplay.DEFAULT_MAX_PLIES,
+            stepSize=0.5, perturbation=0.2, seed=0):
+    """Tune the weights by simultaneous perturbation stochastic approximation
+
+    Each iteration plays gamesPerIteration openings (as both colors) between
+    QLAIs with the weights perturbed up and down, using the standard SPSA
+    gain sequences.
+
+    @param weights: a dict of form QLAI.defaultWeights to start from
+    @param recordsPath: file to append the game records to (see
+                        maverick.tools.selfplay.runTournament); they may
+                        later be used to build a dataset for fitTexel
+    @param stepSize: the initial gain of the weight updates
+    @param perturbation: the initial size of the perturbations
+    @return: the tuned weight dict"""
+
+    logger = logging.getLogger("maverick.tools.tune")
+    random = np.random.RandomState(seed)
+    vector = _toVector(weights)
+    stability = iterations / 10
+
+    for k in xrange(iterations):
+        gain = stepSize / (k + 1 + stability) ** 0.602
+        size = perturbation / (k + 1) ** 0.101
+        delta = random.choice([-1.0, 1.0], size=len(vector))
+
+        plusSpec = getQLAISpec(_toDict(
+                np.maximum(vector + size * delta, MIN_WEIGHT), weights))
+        minusSpec = getQLAISpec(_toDict(
+                np.maximum(vector - size * delta, MIN_WEIGHT), weights))
+        if plusSpec == minusSpec:
+            continue
+
+        tasks = selfplay.gauntlet(plusSpec, [minusSpec], gamesPerIteration,
+                                  seed=seed + k * gamesPerIteration)
+        standings = selfplay.runTournament(tasks, recordsPath,
+                                           processes=processes,
+                                           maxPlies=maxPlies)
+
+        # Mean score of the upward perturbation over the downward one
+        advantage = (standings[plusSpec]["score"] -
+                     standings[minusSpec]["score"]) / len(tasks)
+        vector = np.maximum(vector + gain * advantage / (2 * size * delta),
+                            MIN_WEIGHT)
+        logger.info("Iteration %d: advantage %+.3f, weights %s", k + 1,
+                    advantage, _toDict(vector, weights))
+
+    return _toDict(vector, weights)
+
+
+def _writeWeights(path, weights, **extra):
+    """Write tuned weights (and their player spec) to a JSON file"""
+    output = dict(extra)
+    output["weights"] = weights
+    output["spec"] = getQLAISpec(weights)
+    with open(path, "w") as fd:
+        json.dump(output, fd, indent=2, sort_keys=True)
+        fd.write("\n")
+    print json.dumps(output, indent=2, sort_keys=True)
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    datasetParser = subparsers.add_parser(
+            "dataset", formatter_class=ArgumentDefaultsHelpFormatter,
+            help="build a dataset from self-play game records")
+    datasetParser.add_argument("records", nargs="+", metavar="PATH",
+                               help="self-play output files")
+    datasetParser.add_argument("--skip-plies", default=8, type=int,
+                               help="opening plies not to sample")
+    datasetParser.add_argument("--sample-every", default=4, type=int,
+                               help="plies between sampled positions")
+    datasetParser.add_argument("--processes", default=None, type=int,
+                               help="worker processes (default: one per CPU)")
+    datasetParser.add_argument("--output", default="tune.npz",
+                               metavar="PATH", help="dataset file to write")
+
+    texelParser = subparsers.add_parser(
+            "texel", formatter_class=ArgumentDefaultsHelpFormatter,
+            help="fit the weights to a dataset")
+    texelParser.add_argument("dataset", metavar="PATH",
+                             help="dataset file built by 'dataset'")
+    texelParser.add_argument("--iterations", default=1000, type=int,
+                             help="maximum gradient descent steps")
+    texelParser.add_argument("--scale", default=None, type=float,
+                             help="scale of predictions (default: fit)")
+
+    spsaParser = subparsers.add_parser(
+            "spsa", formatter_class=ArgumentDefaultsHelpFormatter,
+            help="tune the weights by self-play")
+    spsaParser.add_argument("--iterations", default=50, type=int,
+                            help="number of SPSA iterations")
+    spsaParser.add_argument("--games", default=4, type=int,
+                            help="openings per iteration (each played as "
+                                 "both colors)")
+    spsaParser.add_argument("--processes", default=None, type=int,
+                            help="worker processes (default: one per CPU)")
+    spsaParser.add_argument("--max-plies", default=selfplay.DEFAULT_MAX_PLIES,
+                            type=int, help="plies after which a game is drawn")
+    spsaParser.add_argument("--step", default=0.5, type=float,
+                            help="initial gain of weight updates")
+    spsaParser.add_argument("--perturbation", default=0.2, type=float,
+                            help="initial size of weight perturbations")
+    spsaParser.add_argument("--seed", default=0, type=int,
+                            help="seed of perturbations and openings")
+    spsaParser.add_argument("--records", default="tune.jsonl",
+                            metavar="PATH",
+                            help="file to append game records to")
+
+    for subparser in [texelParser, spsaParser]:
+        subparser.add_argument("--weights", default=None, metavar="PATH",
+                               help="JSON file of starting weights, as "
+                                    "written by this tool (default: "
+                                    "QLAI.defaultWeights)")
+        subparser.add_argument("--output", default="weights.json",
+                               metavar="PATH",
+                               help="JSON file to write tuned weights to")
+    args = parser.parse_args()
+
+    if args.command == "dataset":
+        (features, results) = buildDataset(readRecords(args.records),
+                                           skipPlies=args.skip_plies,
+                                           sampleEvery=args.sample_every,
+                                           processes=args.processes)
+        saveDataset(args.output, features, results)
+        print "Wrote {0} positions to {1}".format(len(results), args.output)
+        return
+
+    weights = dict(QLAI.defaultWeights)
+    if args.weights is not None:
+        with open(args.weights) as fd:
+            weights.update(json.load(fd)["weights"])
+
+    if args.command == "texel":
+        (features, results) = loadDataset(args.dataset)
+        # Loss of the starting weights, for the report only (fitTexel fits
+        # the scale itself if none was given)
+        startScale = args.scale
+        if startScale is None:
+            startScale = fitScale(features, results, _toVector(weights))
+        startLoss = texelLoss(features, results, _toVector(weights),
+                              startScale)
+        (tuned, scale, loss) = fitTexel(features, results, weights,
+                                        scale=args.scale,
+                                        iterations=args.iterations)
+        _writeWeights(args.output, tuned, scale=scale,
+                      startLoss=float(startLoss), loss=loss,
+                      positions=len(results))
+    else:
+        tuned = runSpsa(weights, args.iterations, args.games, args.records,
+                        processes=args.processes, maxPlies=args.max_plies,
+                        stepSize=args.step, perturbation=args.perturbation,
+                        seed=args.seed)
+        _writeWeights(args.output, tuned)
+
+
+if __name__ == '__main__':
+    main()
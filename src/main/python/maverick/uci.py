@@ -0,0 +1,378 @@
+#!/usr/bin/python
+
+"""uci.py: Universal Chess Interface (UCI) front-end for the QLAI engine"""
+
+from __future__ import division
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+from argparse import ArgumentDefaultsHelpFormatter
+from argparse import ArgumentParser
+import logging
+import sys
+import threading
+import time
+
+from maverick.data.pgn import MaverickPGNException
+from maverick.data.pgn import getSquarePosn
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import MaverickDataException
+from maverick.players.ais.quiescenceSearchAI import QLAI
+from maverick.players.ais.searchStats import getMoveName
+
+__all__ = ["UCIEngine",
+           "allocateMoveTime"]
+
+# Overview of the UCI front-end
+#
+# A GUI or tournament manager starts the engine ("python -m maverick.uci")
+# and talks to it in lines of text over stdin and stdout. The main thread
+# reads commands; "go" starts a search on a thread of its own, which sends
+# "info" lines after each iteration and "bestmove" at the end, so that
+# "stop", "ponderhit" and "isready" are answered during the search.
+#
+# Searches are those of QLAI (book, tablebases, then iterative deepening up
+# to QLAI.SEARCH_DEPTH or the depth given). Infinite and pondering searches
+# hold their "bestmove" until "stop" (or "ponderhit"), as UCI requires.
+#
+# The Hash option sizes the game state cache (see ChessBoard.gameState),
+# which is what QLAI has in place of a transposition table. The search runs
+# in Python, one thread at a time, so the Threads option only accepts 1.
+
+ENGINE_NAME = "Maverick QLAI"
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+
+_CACHE_ENTRY_BYTES = 256
+"""Rough memory use of an entry of the game state cache, in bytes"""
+
+DEFAULT_MOVES_TO_GO = 30
+"""Number of moves the clock is assumed to have to last for, if not told"""
+
+_NULL_MOVE = "0000"
+"""UCI name of the move sent when there is no legal move"""
+
+
+def allocateMoveTime(remainingMs, incrementMs=0, movesToGo=None):
+    """Return the seconds to spend on a move, given the state of the clock
+
+    Spreads the remaining time over the moves to go, adds most of the
+    increment, and never plans to use the time the search needs to stop
+    (QLAI.SEARCH_TIME_BUFFER, or a tenth of the remaining time if less).
+
+    @param remainingMs: milliseconds left on the clock of the side to move
+    @param incrementMs: milliseconds added to the clock after each move
+    @param movesToGo: moves until the next time control (default:
+                      DEFAULT_MOVES_TO_GO)"""
+
+    if not movesToGo:
+        movesToGo = DEFAULT_MOVES_TO_GO
+    seconds = (remainingMs / movesToGo + incrementMs * 3 / 4) / 1000
+    buffer = min(QLAI.SEARCH_TIME_BUFFER, remainingMs / 10000)
+    return max(0, min(seconds, remainingMs / 1000 - buffer))
+
+
+class _UCIQLAI(QLAI):
+    """QLAI that sends its search statistics as UCI info lines"""
+
+    def __init__(self, sendLine, **kwargs):
+        """Initialize a QLAI that calls sendLine with each info line
+
+        Other keyword arguments are as for QLAI"""
+        QLAI.__init__(self, **kwargs)
+        self.__sendLine = sendLine
+
+    def _reportSearchStats(self, stats):
+        """Send the statistics as a UCI info line, then report them as QLAI
+        does"""
+        self.__sendLine(stats.toUCI())
+        QLAI._reportSearchStats(self, stats)
+
+
+class UCIEngine(object):
+    """Speaks UCI for a QLAI, one command line at a time"""
+
+    # Initialize class logger
+    _logger = logging.getLogger("maverick.uci.UCIEngine")
+    # Initialize if not already initialized
+    logging.basicConfig(level=logging.INFO)
+
+    def __init__(self, output=None, bookPath=None, tablebasePath=None,
+                 searchLogPath=None):
+        """Initialize an engine at the starting position
+
+        @param output: the file to send lines to (default: sys.stdout)
+        Other parameters are as for QLAI."""
+
+        self._output = sys.stdout if output is None else output
+        self._outputLock = threading.Lock()
+
+        self.ai = _UCIQLAI(self.sendLine, bookPath=bookPath,
+                           tablebasePath=tablebasePath,
+                           searchLogPath=searchLogPath)
+
+        self.hashMB = DEFAULT_HASH_MB
+        self.threads = 1
+        self.__setHashSize(DEFAULT_HASH_MB)
+
+        self.board = None
+        self.colorToMove = None
+        self.__setPosition(ChessBoard(), ChessBoard.WHITE)
+
+        # State of the search in progress (if any), guarded by _searchLock
+        self._searchLock = threading.Condition()
+        self._searchThread = None
+        self._holdBestMoveP = False  # Hold "bestmove" until stop/ponderhit
+        self._infiniteP = False  # Hold "bestmove" until stop
+        self._ponderSeconds = None  # Time to search for after ponderhit
+        self._stopTimer = None
+
+    def sendLine(self, line):
+        """Send a line to the GUI (from any thread)"""
+        with self._outputLock:
+            self._output.write(line + "\n")
+            self._output.flush()
+
+    def run(self, inputFile=None):
+        """Handle command lines until "quit" or the end of input
+
+        @param inputFile: the file to read lines from (default: sys.stdin)"""
+        inputFile = sys.stdin if inputFile is None else inputFile
+        for line in iter(inputFile.readline, ""):
+            if not self.handleCommand(line):
+                break
+        self.__stopSearch()
+
+    def handleCommand(self, line):
+        """Handle a command line
+
+        Unknown commands are ignored, as UCI requires.
+
+        @return: False if the engine should quit, True otherwise"""
+
+        tokens = line.split()
+        if not tokens:
+            return True
+        (command, args) = (tokens[0], tokens[1:])
+        UCIEngine._logger.debug("Received %s", line.strip())
+
+        if command == "uci":
+            self.sendLine("id name " + ENGINE_NAME)
+            self.sendLine("id author " + __author__)
+            self.sendLine("option name Hash type spin default {0} min 1 "
+                          "max {1}".format(DEFAULT_HASH_MB, MAX_HASH_MB))
+            self.sendLine("option name Threads type spin default 1 min 1 "
+                          "max 1")
+            self.sendLine("option name Ponder type check default true")
+            self.sendLine("uciok")
+        elif command == "isready":
+            self.sendLine("readyok")
+        elif command == "setoption":
+            self.__handleSetOption(args)
+        elif command == "ucinewgame":
+            self.__stopSearch()
+            self.__setPosition(ChessBoard(), ChessBoard.WHITE)
+        elif command == "position":
+            self.__stopSearch()
+            self.__handlePosition(args)
+        elif command == "go":
+            self.__stopSearch()
+            self.__handleGo(args)
+        elif command == "stop":
+            self.__stopSearch()
+        elif command == "ponderhit":
+            self.__handlePonderHit()
+        elif command == "quit":
+            return False
+        return True
+
+    def __setPosition(self, board, colorToMove):
+        """Make the given board the one to search from"""
+        board.resetPositionHistory(colorToMove)
+        self.board = board
+        self.colorToMove = colorToMove
+
+    def __setHashSize(self, megabytes):
+        """Size the game state cache to use about the given memory"""
+        self.hashMB = megabytes
+        ChessBoard.GAME_STATE_CACHE_SIZE = max(
+                1, megabytes * (1 << 20) // _CACHE_ENTRY_BYTES)
+
+    def __handleSetOption(self, args):
+        """Handle "setoption name <name> [value <value>]" """
+        if "name" not in args:
+            return
+        nameEnd = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:nameEnd]).lower()
+        value = " ".join(args[nameEnd + 1:])
+
+        try:
+            if name == "hash":
+                self.__setHashSize(min(max(int(value), 1), MAX_HASH_MB))
+            elif name == "threads":
+                if int(value) != 1:
+                    self.sendLine("info string Threads must be 1")
+            elif name != "ponder":
+                self.sendLine("info string Unknown option " + name)
+        except ValueError:
+            self.sendLine("info string Invalid value for " + name)
+
+    def __handlePosition(self, args):
+        """Handle "position [startpos | fen <fen>] [moves <move> ...]"
+
+        Keeps the current position if the new one is invalid."""
+
+        movesN = args.index("moves") if "moves" in args else len(args)
+        try:
+            if args and args[0] == "fen":
+                fen = " ".join(args[1:movesN])
+                board = ChessBoard.fromFEN(fen)
+                color = ChessBoard.getFENColorToMove(fen)
+            else:
+                board = ChessBoard()
+                color = ChessBoard.WHITE
+        except MaverickDataException, e:
+            self.sendLine("info string Invalid position: {0}".format(e))
+            return
+
+        board.resetPositionHistory(color)
+        for moveName in args[movesN + 1:]:
+            # Maverick does not promote pawns, so promotions are ignored
+            try:
+                fromPosn = getSquarePosn(moveName[0:2])
+                toPosn = getSquarePosn(moveName[2:4])
+            except MaverickPGNException:
+                fromPosn = None
+            if fromPosn is None or not board.makePly(color, fromPosn,
+                                                     toPosn):
+                self.sendLine("info string Illegal move " + moveName)
+                return
+            color = ChessBoard.getOtherColor(color)
+
+        self.board = board
+        self.colorToMove = color
+
+    def __handleGo(self, args):
+        """Handle "go" with any of depth, movetime, wtime, btime, winc, binc,
+        movestogo, infinite and ponder (others are ignored)"""
+
+        params = {}
+        for (argN, arg) in enumerate(args):
+            if argN + 1 < len(args) and args[argN + 1].isdigit():
+                params[arg] = int(args[argN + 1])
+        infiniteP = "infinite" in args
+        ponderP = "ponder" in args
+
+        # Time to search for, once not pondering (None if unlimited)
+        if "movetime" in params:
+            seconds = params["movetime"] / 1000
+            seconds = max(seconds / 2, seconds - QLAI.SEARCH_TIME_BUFFER)
+        else:
+            (timeKey, incKey) = (("wtime", "winc")
+                                 if self.colorToMove == ChessBoard.WHITE
+                                 else ("btime", "binc"))
+            if timeKey in params:
+                seconds = allocateMoveTime(params[timeKey],
+                                           params.get(incKey, 0),
+                                           params.get("movestogo"))
+            else:
+                seconds = None
+        maxDepth = params.get("depth", QLAI.SEARCH_DEPTH)
+
+        with self._searchLock:
+            self.ai.stopRequested = False
+            self._holdBestMoveP = infiniteP or ponderP
+            self._infiniteP = infiniteP
+            self._ponderSeconds = seconds if ponderP else None
+            if seconds is None or ponderP:
+                stopSrchTime = float("inf")
+            else:
+                stopSrchTime = time.time() + seconds
+            self._searchThread = threading.Thread(
+                        target=self.__search,
+                        args=(self.board, self.colorToMove, maxDepth,
+                              stopSrchTime))
+            self._searchThread.daemon = True
+            self._searchThread.start()
+
+    def __handlePonderHit(self):
+        """Handle "ponderhit": the pondered move was played, so search on
+        as if for the move, for the time given with "go ponder" """
+        with self._searchLock:
+            if self._searchThread is None or self._infiniteP:
+                return
+            self._holdBestMoveP = False
+            if self._ponderSeconds is not None:
+                self._stopTimer = threading.Timer(self._ponderSeconds,
+                                                  self.__requestStop)
+                self._stopTimer.daemon = True
+                self._stopTimer.start()
+            self._searchLock.notifyAll()
+
+    def __requestStop(self):
+        """Make the search in progress stop soon, and send its best move"""
+        with self._searchLock:
+            self.ai.stopRequested = True
+            self._holdBestMoveP = False
+            self._searchLock.notifyAll()
+
+    def __stopSearch(self):
+        """Stop the search in progress, if any, and wait for its bestmove"""
+        self.__requestStop()
+        thread = self._searchThread
+        if thread is not None:
+            thread.join()
+        with self._searchLock:
+            self._searchThread = None
+            if self._stopTimer is not None:
+                self._stopTimer.cancel()
+                self._stopTimer = None
+
+    def __search(self, board, color, maxDepth, stopSrchTime):
+        """Search for a move and send it (on the search thread)"""
+        self.ai.lastSearchStats = None
+        try:
+            move = self.ai.chooseMove(board, color, maxDepth, stopSrchTime)
+        except IndexError:
+            move = None  # No legal move
+        except Exception:
+            UCIEngine._logger.exception("Search failed")
+            move = None
+
+        if move is None:
+            bestMove = "bestmove " + _NULL_MOVE
+        else:
+            bestMove = "bestmove " + getMoveName(move)
+            stats = self.ai.lastSearchStats
+            if (stats is not None and len(stats.pv) > 1 and
+                stats.pv[0] == move):
+                bestMove += " ponder " + getMoveName(stats.pv[1])
+
+        with self._searchLock:
+            while self._holdBestMoveP:
+                self._searchLock.wait()
+        self.sendLine(bestMove)
+
+
+def main():
+    parser = ArgumentParser(formatter_class=ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--book", default=None, type=str,
+                        help="specify opening book file to play from")
+    parser.add_argument("--tablebases", default=None, type=str,
+                        help="specify directory of endgame tablebases")
+    parser.add_argument("--searchlog", default=None, type=str, metavar="PATH",
+                        help="append the statistics of each search iteration "
+                             "to PATH as JSON lines")
+    args = parser.parse_args()
+    UCIEngine(bookPath=args.book, tablebasePath=args.tablebases,
+              searchLogPath=args.searchlog).run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,500 @@
+#!/usr/bin/python
+
+"""wire.py: Compact binary encodings for Maverick requests and responses"""
+
+__author__ = "Matthew Strax-Haber, James Magnarelli, and Brad Fournier"
+__version__ = "1.0"
+
+###############################################################################
+# Code written by Matthew Strax-Haber, James Magnarelli, and Brad Fournier.
+# All Rights Reserved. Not licensed for use without express permission.
+###############################################################################
+
+import json
+import struct
+
+from maverick.data.structs import ChessBoard
+from maverick.data.structs import ChessMatch
+from maverick.data.structs import ChessPiece
+
+__all__ = ["MaverickWireException",
+           "WIRE_FORMAT_JSON",
+           "WIRE_FORMAT_BINARY",
+           "FRAME_HEADER",
+           "encodeFrame",
+           "splitFrames",
+           "encodeBoardLayout",
+           "decodeBoardLayout",
+           "encodeMove",
+           "decodeMove",
+           "encodeFlags",
+           "decodeFlags",
+           "BOARD_ENCODING_SIZE",
+           "encodeBoard",
+           "decodeBoard",
+           "encodeRequest",
+           "decodeRequest",
+           "encodeResponse",
+           "decodeResponse"]
+
+# Overview of the binary wire format
+#
+# Each message is a frame made up of a 4-byte big-endian unsigned length
+# followed by that many bytes of payload.
+#
+# Request payloads are a 1-byte verb code followed by fixed-layout arguments.
+# Response payloads are a 1-byte status code followed by either a UTF-8 error
+# message (for errors) or fixed-layout results (for successes).
+#
+# Verbs without a fixed-layout encoding are sent with the VERB_JSON code and
+# a payload of the usual "VERB {json}" text, and answered with JSON text.
+#
+# Integer IDs are 4-byte unsigned ints. Boards are 32 bytes, with one nibble
+# per square (squares ordered by rank then file, the first of each pair in
+# the high nibble). Moves are 2 bytes: (fromSquare << 6) | toSquare.
+
+
+class MaverickWireException(Exception):
+    """Raised when a binary message cannot be encoded or decoded"""
+    pass
+
+
+WIRE_FORMAT_JSON = "json"
+"""Wire format name for the default line-based JSON format"""
+
+WIRE_FORMAT_BINARY = "binary"
+"""Wire format name for the length-prefixed binary format"""
+
+FRAME_HEADER = struct.Struct("!I")
+"""Header preceding each frame, giving the length of its payload"""
+
+MAX_FRAME_LENGTH = 2 ** 20
+"""Maximum accepted payload length, to guard against corrupt headers"""
+
+STATUS_SUCCESS = 0
+"""Response status code for successful requests"""
+
+STATUS_ERROR = 1
+"""Response status code for failed requests"""
+
+VERB_JSON = 0xFF
+"""Verb code for requests carried as JSON text inside a binary frame"""
+
+VERB_CODES = {"REGISTER": 1,
+              "JOIN_GAME": 2,
+              "GET_STATUS": 3,
+              "IS_MY_TURN": 4,
+              "GET_STATE": 5,
+              "MAKE_PLY": 6}
+"""Map of verbs with fixed-layout encodings to their 1-byte codes"""
+
+VERB_NAMES = dict((v, k) for (k, v) in VERB_CODES.iteritems())
+"""Map of 1-byte verb codes to their verbs"""
+
+_STATUS_CODES = {ChessMatch.STATUS_PENDING: 0,
+                 ChessMatch.STATUS_ONGOING: 1,
+                 ChessMatch.STATUS_BLACK_WON: 2,
+                 ChessMatch.STATUS_WHITE_WON: 3,
+                 ChessMatch.STATUS_DRAWN: 4,
+                 ChessMatch.STATUS_CANCELLED: 5}
+_STATUS_NAMES = dict((v, k) for (k, v) in _STATUS_CODES.iteritems())
+
+_COLOR_CODES = {ChessBoard.WHITE: 0, ChessBoard.BLACK: 1}
+_COLOR_NAMES = dict((v, k) for (k, v) in _COLOR_CODES.iteritems())
+
+_PIECE_CODES = {ChessBoard.PAWN: 1,
+                ChessBoard.KNGT: 2,
+                ChessBoard.BISH: 3,
+                ChessBoard.ROOK: 4,
+                ChessBoard.QUEN: 5,
+                ChessBoard.KING: 6}
+_PIECE_NAMES = dict((v, k) for (k, v) in _PIECE_CODES.iteritems())
+
+_BLACK_NIBBLE_BIT = 0x8
+"""Bit set in a square's nibble when the piece on it is black"""
+
+_U8 = struct.Struct("!B")
+_U16 = struct.Struct("!H")
+_U32 = struct.Struct("!I")
+_ID_PAIR = struct.Struct("!II")
+_JOIN_ARGS = struct.Struct("!IB")
+_STATE_ARGS = struct.Struct("!IIBI")
+_PLY_ARGS = struct.Struct("!IIH")
+_STATE_HEADER = struct.Struct("!BBII")
+
+# Bits of the flags byte in GET_STATE responses
+_STATE_WHITES_TURN = 0x1
+_STATE_IS_DELTA = 0x2
+_STATE_HAS_BOARD = 0x4
+
+
+def encodeFrame(payload):
+    """Prefix the given payload with its length, producing a frame"""
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def splitFrames(data):
+    """Split buffered data into complete frames
+
+    @param data: a string of bytes received so far
+
+    @return: a tuple of form (listOfPayloads, unconsumedData)"""
+
+    payloads = []
+    offset = 0
+    headerLen = FRAME_HEADER.size
+    while len(data) - offset >= headerLen:
+        (length,) = FRAME_HEADER.unpack_from(data, offset)
+        if length > MAX_FRAME_LENGTH:
+            raise MaverickWireException("Frame too long")
+        if len(data) - offset - headerLen < length:
+            break
+        start = offset + headerLen
+        payloads.append(data[start:start + length])
+        offset = start + length
+    return (payloads, data[offset:])
+
+
+def encodeBoardLayout(layout):
+    """Pack a board layout into 32 bytes, one nibble per square
+
+    @param layout: a list of rows of pieces, each either None or a
+                   (pieceColor, pieceType) pair or ChessPiece object"""
+
+    nibbles = []
+    for row in layout:
+        for piece in row:
+            if piece is None:
+                nibbles.append(0)
+            else:
+                if isinstance(piece, (tuple, list)):
+                    (color, pieceType) = piece
+                else:
+                    (color, pieceType) = (piece.color, piece.pieceType)
+                nibble = _PIECE_CODES[pieceType]
+                if color == ChessBoard.BLACK:
+                    nibble |= _BLACK_NIBBLE_BIT
+                nibbles.append(nibble)
+
+    return "".join(chr((nibbles[i] << 4) | nibbles[i + 1])
+                   for i in xrange(0, len(nibbles), 2))
+
+
+def decodeBoardLayout(data, offset=0):
+    """Unpack a 32-byte board into rows of (pieceColor, pieceType) or None"""
+
+    size = ChessBoard.BOARD_LAYOUT_SIZE
+    squares = []
+    for byte in data[offset:offset + (size * size) // 2]:
+        byte = ord(byte)
+        squares.append(byte >> 4)
+        squares.append(byte & 0xF)
+
+    layout = []
+    for rankN in xrange(size):
+        row = []
+        for nibble in squares[rankN * size:(rankN + 1) * size]:
+            if nibble == 0:
+                row.append(None)
+            else:
+                color = [ChessBoard.WHITE,
+                         ChessBoard.BLACK][bool(nibble & _BLACK_NIBBLE_BIT)]
+                row.append((color, _PIECE_NAMES[nibble & 0x7]))
+        layout.append(row)
+    return layout
+
+
+def encodeMove(fromRank, fromFile, toRank, toFile):
+    """Pack a move into a 2-byte unsigned int"""
+    size = ChessBoard.BOARD_LAYOUT_SIZE
+    return ((fromRank * size + fromFile) << 6) | (toRank * size + toFile)
+
+
+def decodeMove(move):
+    """Unpack a 2-byte move into (fromRank, fromFile, toRank, toFile)"""
+    size = ChessBoard.BOARD_LAYOUT_SIZE
+    (fromSq, toSq) = (move >> 6, move & 0x3F)
+    return (fromSq // size, fromSq % size, toSq // size, toSq % size)
+
+
+def encodeFlags(enPassantFlags, canCastleFlags):
+    """Pack en passant and castle flags into 3 bytes"""
+    epBytes = ""
+    for color in [ChessBoard.WHITE, ChessBoard.BLACK]:
+        bits = 0
+        for (fileN, flag) in enumerate(enPassantFlags[color]):
+            if flag:
+                bits |= 1 << fileN
+        epBytes += chr(bits)
+
+    castleBits = 0
+    for (i, color) in enumerate([ChessBoard.WHITE, ChessBoard.BLACK]):
+        (queenSide, kingSide) = canCastleFlags[color]
+        castleBits |= (bool(queenSide) << (2 * i)) | (bool(kingSide) <<
+                                                      (2 * i + 1))
+    return epBytes + chr(castleBits)
+
+
+def decodeFlags(data, offset):
+    """Unpack 3 bytes of flags into (enPassantFlags, canCastleFlags)"""
+    size = ChessBoard.BOARD_LAYOUT_SIZE
+    enPassantFlags = {}
+    canCastleFlags = {}
+    for (i, color) in enumerate([ChessBoard.WHITE, ChessBoard.BLACK]):
+        bits = ord(data[offset + i])
+        enPassantFlags[color] = [bool(bits & (1 << f)) for f in xrange(size)]
+
+        castleBits = ord(data[offset + 2]) >> (2 * i)
+        canCastleFlags[color] = (bool(castleBits & 1), bool(castleBits & 2))
+    return (enPassantFlags, canCastleFlags)
+
+
+BOARD_ENCODING_SIZE = ChessBoard.BOARD_LAYOUT_SIZE ** 2 // 2 + 3
+"""Size in bytes of a board encoded by encodeBoard"""
+
+
+def encodeBoard(board):
+    """Pack a ChessBoard's layout and flags (but not draw counter)"""
+    return (encodeBoardLayout(board.layout) +
+            encodeFlags(board.flag_enpassant, board.flag_canCastle))
+
+
+def decodeBoard(data, offset=0, drawCounter=0):
+    """Unpack a board packed by encodeBoard into a new ChessBoard"""
+    rows = decodeBoardLayout(data, offset)
+    layout = [[None if sq is None else ChessPiece(sq[0], sq[1])
+               for sq in row] for row in rows]
+    (enPassantFlags, canCastleFlags) = \
+        decodeFlags(data, offset + BOARD_ENCODING_SIZE - 3)
+    return ChessBoard(startLayout=layout,
+                      startEnpassantFlags=enPassantFlags,
+                      startCanCastleFlags=canCastleFlags,
+                      drawCounter=drawCounter)
+
+
+def encodeRequest(verb, args):
+    """Encode a request as a binary payload (without the frame header)
+
+    @param verb: a request verb, e.g., "REGISTER"
+    @param args: a dictionary of the request's arguments"""
+
+    code = VERB_CODES.get(verb)
+
+    if code == VERB_CODES["GET_STATE"]:
+        sinceVersion = args.get("sinceVersion")
+        hasSince = sinceVersion is not None
+        argBytes = _STATE_ARGS.pack(args["playerID"], args["gameID"],
+                                    hasSince,
+                                    sinceVersion if hasSince else 0)
+    elif code == VERB_CODES["REGISTER"]:
+        argBytes = args["name"].encode("utf-8")
+    elif code == VERB_CODES["JOIN_GAME"]:
+        argBytes = _JOIN_ARGS.pack(args["playerID"],
+                                   bool(args["startFreshP"]))
+    elif code == VERB_CODES["GET_STATUS"]:
+        argBytes = _U32.pack(args["gameID"])
+    elif code == VERB_CODES["IS_MY_TURN"]:
+        argBytes = _ID_PAIR.pack(args["gameID"], args["playerID"])
+    elif code == VERB_CODES["MAKE_PLY"]:
+        argBytes = _PLY_ARGS.pack(args["playerID"], args["gameID"],
+                                  encodeMove(args["fromRank"],
+                                             args["fromFile"],
+                                             args["toRank"],
+                                             args["toFile"]))
+    else:
+        # Fall back on JSON for verbs without a fixed-layout encoding
+        code = VERB_JSON
+        argBytes = "{0} {1}".format(verb, json.dumps(args, encoding="utf-8"))
+
+    return _U8.pack(code) + argBytes
+
+
+def decodeRequest(payload):
+    """Decode a binary request payload
+
+    @return: a tuple of form (verb, argsDict), where argsDict is of the same
+            form as the JSON arguments for that verb"""
+
+    if not payload:
+        raise MaverickWireException("Empty request")
+
+    code = ord(payload[0])
+    body = payload[1:]
+    try:
+        if code == VERB_JSON:
+            (verb, _, argsStr) = body.partition(" ")
+            try:
+                args = json.loads(argsStr, encoding="utf-8")
+            except ValueError:
+                raise MaverickWireException("Invalid JSON for arguments")
+            return (verb, args)
+        elif code not in VERB_NAMES:
+            raise MaverickWireException("Unrecognized verb code")
+
+        verb = VERB_NAMES[code]
+        if verb == "REGISTER":
+            args = {"name": body.decode("utf-8")}
+        elif verb == "JOIN_GAME":
+            (playerID, startFreshP) = _JOIN_ARGS.unpack(body)
+            args = {"playerID": playerID, "startFreshP": bool(startFreshP)}
+        elif verb == "GET_STATUS":
+            args = {"gameID": _U32.unpack(body)[0]}
+        elif verb == "IS_MY_TURN":
+            (gameID, playerID) = _ID_PAIR.unpack(body)
+            args = {"gameID": gameID, "playerID": playerID}
+        elif verb == "GET_STATE":
+            (playerID, gameID, hasSince, since) = _STATE_ARGS.unpack(body)
+            args = {"playerID": playerID, "gameID": gameID}
+            if hasSince:
+                args["sinceVersion"] = since
+        elif verb == "MAKE_PLY":
+            (playerID, gameID, move) = _PLY_ARGS.unpack(body)
+            (fromRank, fromFile, toRank, toFile) = decodeMove(move)
+            args = {"playerID": playerID, "gameID": gameID,
+                    "fromRank": fromRank, "fromFile": fromFile,
+                    "toRank": toRank, "toFile": toFile}
+    except (struct.error, UnicodeDecodeError):
+        raise MaverickWireException("Malformed arguments")
+
+    return (verb, args)
+
+
+def _encodeStateResult(result):
+    """Encode the result of a GET_STATE request"""
+
+    board = result["board"]
+    layout = board.get("layout")
+    hasBoard = layout is not None and layout != "BOARD NOT INITIALIZED"
+
+    flagsByte = ((_STATE_WHITES_TURN if result["isWhitesTurn"] else 0) |
+                 (_STATE_IS_DELTA if result["isDelta"] else 0) |
+                 (_STATE_HAS_BOARD if hasBoard else 0))
+
+    if board["enPassantFlags"] is None:
+        flagBytes = "\x00" * 3
+    else:
+        flagBytes = encodeFlags(board["enPassantFlags"],
+                                 board["canCastleFlags"])
+
+    history = result["history"]
+    parts = [_STATE_HEADER.pack(_COLOR_CODES[result["youAreColor"]],
+                                flagsByte,
+                                result["stateVersion"],
+                                result["historyStart"]),
+             flagBytes]
+    if hasBoard and not result["isDelta"]:
+        parts.append(encodeBoardLayout(layout))
+    parts.append(_U32.pack(len(history)))
+    parts.extend(_U16.pack(encodeMove(p['fromRank'], p['fromFile'],
+                                      p['toRank'], p['toFile']))
+                 for p in history)
+    return "".join(parts)
+
+
+def _decodeStateResult(body):
+    """Decode the result of a GET_STATE request into its JSON form"""
+
+    (colorCode, flagsByte, stateVersion, historyStart) = \
+        _STATE_HEADER.unpack_from(body)
+    offset = _STATE_HEADER.size
+
+    isDelta = bool(flagsByte & _STATE_IS_DELTA)
+    hasBoard = bool(flagsByte & _STATE_HAS_BOARD)
+
+    if hasBoard or isDelta:
+        (enPassantFlags, canCastleFlags) = decodeFlags(body, offset)
+    else:
+        (enPassantFlags, canCastleFlags) = (None, None)
+    offset += 3
+
+    board = {"enPassantFlags": enPassantFlags,
+             "canCastleFlags": canCastleFlags}
+    if not isDelta:
+        if hasBoard:
+            board["layout"] = decodeBoardLayout(body, offset)
+            offset += (ChessBoard.BOARD_LAYOUT_SIZE ** 2) // 2
+        else:
+            board["layout"] = "BOARD NOT INITIALIZED"
+
+    (numPlies,) = _U32.unpack_from(body, offset)
+    offset += _U32.size
+    history = []
+    for i in xrange(numPlies):
+        (move,) = _U16.unpack_from(body, offset + i * _U16.size)
+        (fromRank, fromFile, toRank, toFile) = decodeMove(move)
+        history.append({'fromRank': fromRank, 'fromFile': fromFile,
+                        'toRank': toRank, 'toFile': toFile})
+
+    return {"youAreColor": _COLOR_NAMES[colorCode],
+            "isWhitesTurn": bool(flagsByte & _STATE_WHITES_TURN),
+            "stateVersion": stateVersion,
+            "isDelta": isDelta,
+            "historyStart": historyStart,
+            "board": board,
+            "history": history}
+
+
+def encodeResponse(verb, errMsg, result):
+    """Encode a response as a binary payload (without the frame header)
+
+    @param verb: the verb of the request being responded to
+    @param errMsg: None if successful, an error message otherwise
+    @param result: the dictionary of results, if successful"""
+
+    if errMsg is not None:
+        return _U8.pack(STATUS_ERROR) + errMsg.encode("utf-8")
+
+    if verb == "REGISTER":
+        body = _U32.pack(result["playerID"])
+    elif verb == "JOIN_GAME":
+        body = _U32.pack(result["gameID"])
+    elif verb == "GET_STATUS":
+        body = _U8.pack(_STATUS_CODES[result["status"]])
+    elif verb == "IS_MY_TURN":
+        body = _U8.pack(bool(result["isMyTurn"]))
+    elif verb == "GET_STATE":
+        body = _encodeStateResult(result)
+    elif verb == "MAKE_PLY":
+        body = ""
+    else:
+        body = json.dumps(result, ensure_ascii=True, encoding="utf-8")
+
+    return _U8.pack(STATUS_SUCCESS) + body
+
+
+def decodeResponse(verb, payload):
+    """Decode a binary response payload for a request with the given verb
+
+    @return: a tuple of form (errMsg, resultDict); errMsg is None on success
+            and resultDict is of the same form as JSON responses"""
+
+    if not payload:
+        raise MaverickWireException("Empty response")
+
+    status = ord(payload[0])
+    body = payload[1:]
+    if status == STATUS_ERROR:
+        return (body.decode("utf-8"), None)
+    elif status != STATUS_SUCCESS:
+        raise MaverickWireException("Invalid status code")
+
+    try:
+        if verb == "REGISTER":
+            result = {"playerID": _U32.unpack(body)[0]}
+        elif verb == "JOIN_GAME":
+            result = {"gameID": _U32.unpack(body)[0]}
+        elif verb == "GET_STATUS":
+            result = {"status": _STATUS_NAMES[ord(body)]}
+        elif verb == "IS_MY_TURN":
+            result = {"isMyTurn": bool(ord(body))}
+        elif verb == "GET_STATE":
+            result = _decodeStateResult(body)
+        elif verb == "MAKE_PLY":
+            result = {}
+        else:
+            result = json.loads(body, encoding="utf-8")
+    except (struct.error, KeyError, IndexError, TypeError, ValueError):
+        raise MaverickWireException("Malformed response")
+
+    return (None, result)
+